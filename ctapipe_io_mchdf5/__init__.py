@@ -8,6 +8,10 @@ try:
 	from .mchdf5eventsource import MCHDF5EventSource
 	from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
 	from .mchdf5eventsource_V2Transpose import MCHDF5EventSourceV2Transpose
+	from .mchdf5eventsource_R0V2 import MCHDF5EventSourceR0V2
+	from .mchdf5eventsource_DL0V2 import MCHDF5EventSourceDL0V2
+	from .mchdf5eventsource_DL0V1 import MCHDF5EventSourceDL0V1
+	from .mchdf5eventsource_multifile import MCHDF5MultiFileEventSource
 	from .tools import *
 except:
 	pass
@@ -7,21 +7,15 @@
 	Licence : CeCILL-C
 """
 
+import os
 import tables
-from ctapipe.io import event_source
 import argparse
 
-from ..tools.get_nb_tel import getNbTel
-from ..tools.r0_file import (create_file_structure,
-							 open_output_file)
-from ..tools.r0_utils import (append_event_telescope_data,
-							  flush_r0_tables)
-from ..tools.get_telescope_info import (get_telescope_info_from_event,
-										check_is_simulation_file)
-from ..tools.simulation_utils import (append_corsika_event,
-									  fill_simulation_header_info)
-from ..tools.instrument_utils import (fill_subarray_layout,
-									  fill_optic_description)
+from ..tools.r0_pipeline import convert_simtel_to_r0, DEFAULT_QUEUE_DEPTH
+from ..tools.table_buffer import DEFAULT_NB_BYTE_PER_BLOCK
+from ..tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
+from ..tools.compression_policy import add_compression_policy_arguments, set_compression_policy_from_arguments, \
+	format_filters_selection
 
 
 def main():
@@ -35,57 +29,36 @@ def main():
 	parser.add_argument('-c', '--compression',
 						help="compression level for the output file [0 (No compression), 1 - 9]. Default = 6",
 						required=False, type=int, default='6')
+	parser.add_argument('-q', '--queue_depth',
+						help="number of blocks of rows in the queue between the decode process and the writer "
+						"(0 to decode and write in one process). Default = " + str(DEFAULT_QUEUE_DEPTH),
+						required=False, type=int, default=DEFAULT_QUEUE_DEPTH)
+	parser.add_argument('-t', '--blosc_threads',
+						help="number of threads used by blosc to compress the output file. Default = number of CPUs",
+						required=False, type=int, default=os.cpu_count() or 1)
+	parser.add_argument('-b', '--block_size',
+						help="size in bytes of the blocks of rows of each table. Default = " +
+						str(DEFAULT_NB_BYTE_PER_BLOCK), required=False, type=int, default=DEFAULT_NB_BYTE_PER_BLOCK)
+	add_chunk_policy_arguments(parser)
+	add_compression_policy_arguments(parser)
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
+	set_compression_policy_from_arguments(args)
 
-	inputFileName = args.input
-	nbTel = getNbTel(inputFileName)
-	print("Number of telescope : ", nbTel)
-
-	# Increase the number of nodes in cache if necessary (avoid warning about nodes reopening)
-	tables.parameters.NODE_CACHE_SLOTS = max(tables.parameters.NODE_CACHE_SLOTS, 3*nbTel + 20)
-
-	telInfo_from_evt, nbEvent = get_telescope_info_from_event(inputFileName, nbTel)
-	print("Found", nbEvent, "events")
-	hfile = open_output_file(args.output, compressionLevel=args.compression)
-
-	print('Create file structure')
-	tableMcCorsikaEvent = create_file_structure(hfile, telInfo_from_evt)
-
-	print('Fill the subarray layout information')
-	fill_subarray_layout(hfile, telInfo_from_evt, nbTel)
-
-	isSimulationMode = check_is_simulation_file(telInfo_from_evt)
-
-	if isSimulationMode:
-		print('Fill the optic description of the telescopes')
-		fill_optic_description(hfile, telInfo_from_evt, nbTel)
-
-		print('Fill the simulation header information')
-		fill_simulation_header_info(hfile, inputFileName)
-
-	source = event_source(inputFileName)
-
-	nb_event = 0
-	max_event = 10000000
+	max_event = None
 	if args.max_event != None:
 		max_event = int(args.max_event)
-	else:
-		max_event = nbEvent
+	# The writer compresses the blocks sent by the decode process with several threads
+	tables.parameters.MAX_BLOSC_THREADS = max(1, args.blosc_threads)
 	print("\n")
-	for event in source:
-		if isSimulationMode:
-			append_corsika_event(tableMcCorsikaEvent, event)
-		append_event_telescope_data(hfile, event)
-		nb_event += 1
-		print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r{} / {}".format(nb_event, max_event), end="")
-		if nb_event >= max_event:
-			break
-	print("\nFlushing tables")
-	if isSimulationMode:
-		tableMcCorsikaEvent.flush()
-
-	flush_r0_tables(hfile)
-	hfile.close()
+	writer = convert_simtel_to_r0(args.input, args.output, compressionLevel=args.compression, maxEvent=max_event,
+								  queueDepth=args.queue_depth, nbBytePerBlock=args.block_size)
+	# The number of events is only known once the run is read
+	print("\nFound", writer.nbEvent, "events")
+	for telId in sorted(writer.dicoNbEvent.keys()):
+		print("Telescope", telId, ":", writer.dicoNbEvent[telId], "events")
+	for tablePath, (filters, compressionRatio) in writer.dicoAutoFilters.items():
+		print(format_filters_selection(tablePath, filters, compressionRatio))
 	print('\nDone')
 
 
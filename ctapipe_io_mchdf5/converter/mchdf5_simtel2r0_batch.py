@@ -0,0 +1,72 @@
+# coding: utf-8
+
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import os
+import argparse
+
+from ..mchdf5eventsource_multifile import expand_input_urls
+from ..tools.simtel_batch import convert_simtel_files, merge_converted_files
+from ..tools.table_buffer import DEFAULT_NB_BYTE_PER_BLOCK
+from ..tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
+from ..tools.compression_policy import add_compression_policy_arguments, set_compression_policy_from_arguments
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Convert many simtel files into R0-V2 files with a pool of processes "
+									 "and optionally merge them")
+	parser.add_argument('-i', '--input', help="simtel input files (paths or glob patterns)", nargs='+',
+						required=True)
+	parser.add_argument('-d', '--output_dir', help="directory of the hdf5 r0 files (one per simtel file)",
+						required=True)
+	parser.add_argument('-m', '--max_event', help="maximum event to reconstruct per file",
+						required=False, type=int)
+	parser.add_argument('-c', '--compression',
+						help="compression level for the output files [0 (No compression), 1 - 9]. Default = 6",
+						required=False, type=int, default=6)
+	parser.add_argument('-j', '--nbworker', help="number of processes which convert the files. Default = number of CPUs",
+						required=False, type=int, default=os.cpu_count() or 1)
+	parser.add_argument('-t', '--blosc_threads',
+						help="number of threads used by blosc to compress each output file. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('-b', '--block_size',
+						help="size in bytes of the blocks of rows of each table. Default = " +
+						str(DEFAULT_NB_BYTE_PER_BLOCK), required=False, type=int, default=DEFAULT_NB_BYTE_PER_BLOCK)
+	parser.add_argument('-o', '--merge', help="merge the r0 files into this file (NAME_XXX.h5 if there are several "
+						"merged files)", required=False)
+	parser.add_argument('-n', '--nb_merged_file', help="number of merged files. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('-r', '--remove', help="remove the r0 files of each simtel file once they are merged",
+						required=False, action='store_true')
+	add_chunk_policy_arguments(parser)
+	add_compression_policy_arguments(parser)
+	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
+	set_compression_policy_from_arguments(args)
+
+	listInputFileName = expand_input_urls(args.input)
+	print("Convert", len(listInputFileName), "simtel files with", args.nbworker, "processes")
+	listConverted = convert_simtel_files(listInputFileName, args.output_dir, compressionLevel=args.compression,
+										 maxEvent=args.max_event, nbWorker=args.nbworker,
+										 nbBloscThread=args.blosc_threads, nbBytePerBlock=args.block_size)
+	print("")
+	for outputFileName, nbEvent in listConverted:
+		print(outputFileName, ":", nbEvent, "events")
+	if args.merge is not None:
+		listFileName = [outputFileName for outputFileName, nbEvent in listConverted]
+		listMerged = merge_converted_files(listFileName, args.merge, nbMergedFile=args.nb_merged_file,
+										   nbWorker=args.nbworker, nbBytePerBlock=args.block_size)
+		for mergedFileName, listMergedInput in listMerged:
+			print("Merged", len(listMergedInput), "files into", mergedFileName)
+		if args.remove:
+			for fileName in listFileName:
+				os.remove(fileName)
+	print('\nDone')
+
+
+if __name__ == '__main__':
+	main()
@@ -14,7 +14,31 @@ import tables
 import hipecta.hdf5_utils as hdu
 import hipecta.pixelselection as pixselec
 import hipecta.core as core
-from ctapipe_io_mchdf5.tools import copy_all_tel_without_waveform, create_event_tel_waveform
+from ctapipe_io_mchdf5.tools import copy_all_tel_without_waveform
+from ctapipe_io_mchdf5.tools.r1_layout import set_file_layout, LAYOUT_DL0_V1
+from ctapipe_io_mchdf5.tools.chunk_policy import get_table_options, add_chunk_policy_arguments, \
+    set_chunk_policy_from_arguments, DATASET_WAVEFORM
+from ctapipe_io_mchdf5.tools.compression_policy import create_filters, get_dataset_filters, get_file_filters, \
+    add_compression_policy_arguments, set_compression_policy_from_arguments, SHUFFLE_NONE
+
+
+def createWaveformTable(fileOut, telNodeOut, nameWaveform, image_shape, chunkshape=None, expectedrows=0):
+    '''
+    Create the table of the waveforms of a gain, with the R1-V2 layout
+    Parameters:
+    -----------
+        fileOut : HDF5 file to be used
+        telNodeOut : telescope group in which to put the table
+        nameWaveform : name of the table and of its column (waveformHi or waveformLo)
+        image_shape : shape of the waveforms (number of slices, number of pixels)
+        chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
+        expectedrows : expected number of waveforms (0 if unknown)
+    '''
+    columns_dict_waveform = {nameWaveform: tables.UInt16Col(shape=image_shape)}
+    description_waveform = type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
+    fileOut.create_table(telNodeOut, nameWaveform, description_waveform, "Table of waveform of the signal",
+                         filters=get_dataset_filters(DATASET_WAVEFORM),
+                         **get_table_options(DATASET_WAVEFORM, description_waveform, expectedrows, chunkshape))
 
 
 def computeSelectionTailCutDilation(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center=4, neighbours=2,
@@ -113,7 +137,10 @@ def tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabFocalTel, cen
     image_shape = (nbSlice, nbPixel)
 
     nbGain = np.uint64(telNodeOut.nbGain.read())
-    create_event_tel_waveform(fileOut, telNodeOut, nbGain, image_shape)
+    nbEvent = telNodeIn.waveformHi.nrows
+    createWaveformTable(fileOut, telNodeOut, "waveformHi", image_shape, expectedrows=nbEvent)
+    if nbGain > 1:
+        createWaveformTable(fileOut, telNodeOut, "waveformLo", image_shape, expectedrows=nbEvent)
 
     computeSelectionTailCutDilation(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center, neighbours,
                                     min_number_picture_neighbors, dilation)
@@ -190,13 +217,15 @@ def tailcutDilationSelectionRunFile(fileNameOut, fileNameIn, center, neighbours,
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
-		compression_level : compression level to be used with zstd
+		compression_level : compression level to be used with zstd (if the compression policy does not override the
+			filters of the metadata)
 	'''
     fileIn = tables.open_file(fileNameIn, "r")
 
-    zstdFilter = tables.Filters(complevel=compression_level, complib='blosc:zstd', shuffle=False,
-                                bitshuffle=False, fletcher32=False)
-    fileOut = tables.open_file(fileNameOut, mode="w", filters=zstdFilter)
+    zstdFilter = create_filters(compression_level, 'blosc:zstd', SHUFFLE_NONE)
+    fileOut = tables.open_file(fileNameOut, mode="w", filters=get_file_filters(zstdFilter))
+    fileOut.title = "DL0-V1"
+    set_file_layout(fileOut, LAYOUT_DL0_V1)
 
     # Copy the instrument and simulation groups
     try:
@@ -233,8 +262,13 @@ def main():
                         help="Minimum number of neighbours to be consider around a pixel", required=True, type=int)
     parser.add_argument('-z', '--compressionlevel', help="Compression level to be used (from 1 to 9). Default=1",
                         required=False, type=int, default=1)
+    add_chunk_policy_arguments(parser)
+    # The waveforms are written by hipecta, their filters cannot be chosen on their first rows
+    add_compression_policy_arguments(parser, isAutoAllowed=False)
 
     args = parser.parse_args()
+    set_chunk_policy_from_arguments(args)
+    set_compression_policy_from_arguments(args)
 
     inputFileName = args.input
     outputFileName = args.output
@@ -16,6 +16,9 @@ import hipecta.pixelselection as pixselec
 import hipecta.core as core
 from ctapipe_io_mchdf5.tools import copy_all_tel_without_waveform
 from ctapipe_io_mchdf5.tools.dl0_utils import create_dl0_table_tel
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
+from ctapipe_io_mchdf5.tools.compression_policy import create_filters, get_file_filters, add_compression_policy_arguments, \
+	set_compression_policy_from_arguments, SHUFFLE_BIT
 
 
 def computeSelectionTailCutDilationDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center = 4, neighbours = 2,
@@ -83,7 +86,7 @@ def computeSelectionTailCutDilationDl0(fileOut, telNodeOut, telNodeIn, tabFocalT
 
 
 def tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, center, neighbours,
-								   min_number_picture_neighbors, dilation, chunkshape=1):
+								   min_number_picture_neighbors, dilation, chunkshape=None):
 	'''
 	Select the pixel, with a tailcut/dilation method, of the current telescope
 	-----------------
@@ -96,14 +99,15 @@ def tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel,
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
 	'''
 	nbSlice = np.uint64(telNodeOut.nbSlice.read())
 	nbPixel = np.uint64(telNodeOut.nbPixel.read())
 	
 	nbGain = np.uint64(telNodeOut.nbGain.read())
 	
-	create_dl0_table_tel(fileOut, telNodeOut, nbGain, nbPixel, nbSlice, chunkshape=chunkshape)
+	create_dl0_table_tel(fileOut, telNodeOut, nbGain, nbPixel, nbSlice, chunkshape=chunkshape,
+						 expectedrows=telNodeIn.waveformHi.nrows)
 	
 	computeSelectionTailCutDilationDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center, neighbours,
 									   min_number_picture_neighbors, dilation)
@@ -180,14 +184,13 @@ def tailcutDilationSelectionRunFileDl0(fileNameOut, fileNameIn, center, neighbou
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
-		compression_level : compression level to be used with zstd
+		compression_level : compression level to be used with zstd (if the compression policy does not override the
+			filters of the metadata)
 	'''
 	fileIn = tables.open_file(fileNameIn, "r")
 	
-	zstdFilter = tables.Filters(complevel=compression_level, complib='blosc:zstd', shuffle=False, bitshuffle=True,
-								fletcher32=False  #, least_significant_digit=2
-								)
-	fileOut = tables.open_file(fileNameOut, mode="w", filters=zstdFilter)
+	zstdFilter = create_filters(compression_level, 'blosc:zstd', SHUFFLE_BIT)
+	fileOut = tables.open_file(fileNameOut, mode="w", filters=get_file_filters(zstdFilter))
 	
 	fileOut.title = "DL0-V2"
 	
@@ -227,8 +230,13 @@ def main():
 						help="Minimum number of neighbours to be consider around a pixel", required=True, type=int)
 	parser.add_argument('-z', '--compressionlevel', help="Compression level to be used (from 1 to 9). Default = 1",
 						required=False, type=int, default=1)
+	add_chunk_policy_arguments(parser)
+	# The waveforms are written by hipecta, their filters cannot be chosen on their first rows
+	add_compression_policy_arguments(parser, isAutoAllowed=False)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
+	set_compression_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
@@ -4,50 +4,24 @@
 	Licence : CeCILL-C
 '''
 
-from ctapipe.io.eventsource import EventSource
-from ctapipe.io.containers import DataContainer
-from numpy import stack, zeros, swapaxes, array, int16, uint64
-from ctapipe.instrument import TelescopeDescription, SubarrayDescription, \
-    OpticsDescription
-from ctapipe.instrument.camera import CameraGeometry
+from numpy import uint64
+from ctapipe.instrument import SubarrayDescription
 from astropy import units as u
 from astropy.coordinates import Angle
 import numpy as np
 import tables
 
+from .mchdf5eventsource_base import MCHDF5IndexedEventSource
+from .tools.mc_truth import create_mc_truth_columns
+from .tools.event_index import create_event_index_tel
+from .tools.subarray_cache import TelescopeDescriptionCache
+
 __all__ = ['MCHDF5EventSource']
 HI_GAIN = 0
 LO_GAIN = 1
+MC_EVENT_COLUMNS = ["energy", "alt", "az", "coreX", "coreY", "h_first_int", "xmax", "showerPrimaryId"]
 
-def _convert_per_events_to_per_telescope(hfile):
-    '''
-    Concert the telescope storage into a event storage
-    Parameters:
-    -----------
-        hfile : HDF5 file to be used
-    Return:
-    -------
-        dictionary which contains the events with the proper telescopes
-    '''
-    events=dict()
-    for telNode in hfile.walk_nodes('/Tel', 'Group'):
-        try:
-            tabEventId = telNode.eventId.read()
-            tabEventId = tabEventId["eventId"]
-            telescopeIndex = uint64(telNode.telIndex.read())
-            telescopeId = uint64(telNode.telId.read())
-            for i,eventId in enumerate(tabEventId):
-                try:
-                    events[eventId].append((telescopeId, telescopeIndex, i))
-                except KeyError:
-                    events[eventId] = [(telescopeId, telescopeIndex, i)]
-        except tables.exceptions.NoSuchNodeError as e:
-            #For the Tel dataset only
-            pass
-    return events
-
-
-class MCHDF5EventSource(EventSource):
+class MCHDF5EventSource(MCHDF5IndexedEventSource):
     """
     EventSource for the hiPeHDF5 file format.
     hiPeHDF5 is a data format for Cherenkov Telescope Array (CTA)
@@ -64,14 +38,14 @@ class MCHDF5EventSource(EventSource):
     
     You can get the converter from simtel to hdf5 at : https://gitlab.in2p3.fr/CTA-LAPP/simtel2r1_hdf5.git
     """
+    origin = "hipehdf5"
+    mc_event_table = "/Corsika/tabCorsikaEvent"
+    mc_event_id_column = "eventId"
 
     def __init__(self, config=None, parent=None, **kwargs):
         super().__init__(config=config, parent=parent, **kwargs)
 
-        self.metadata['is_simulation'] = True
-
-        # Create MCRun isntance and load file into memory
-        self.run = tables.open_file(self.input_url, "r")
+        self._mcEvent = None
     
     @staticmethod
     def is_compatible(file_path):
@@ -85,125 +59,60 @@ class MCHDF5EventSource(EventSource):
         except Exception:
             return False
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-    def _generator(self):
-        # HiPeData arranges data per telescope and not by event like simtel
-        # We need to first create a dictionary.
-        #   key -> EventId, value -> List of event from triggered telescopes
-        self.events = _convert_per_events_to_per_telescope(self.run)
+    def _create_event_index(self, allowedTelId, nbMaxEvent=None):
+        return create_event_index_tel(self.run, '/Tel', allowedTelId, nbMaxEvent)
 
-        # the container is initialized once, and data is replaced within
-        # it after each yield
-        counter = 0
-        data = DataContainer()
-        data.meta['origin'] = "hipehdf5"
-
-        # some hessio_event_source specific parameters
-        data.meta['input_url'] = self.input_url
-        data.meta['max_events'] = self.max_events
-
-        '''
-        MC data are valid for the whole run
-        '''
-        data.mc.tel.clear()  # clear the previous telescopes
+    def _fill_run_data(self, data):
+        allowedTelId = self._get_allowed_tel_ids()
         for telNode in self.run.walk_nodes('/Tel', 'Group'):
             try:
                 tel_id = uint64(telNode.telId.read())
+                if allowedTelId is not None and int(tel_id) not in allowedTelId:
+                    continue
                 data.mc.tel[tel_id].dc_to_pe = telNode.tabGain.read()
                 data.mc.tel[tel_id].pedestal = telNode.tabPed.read()
                 data.mc.tel[tel_id].reference_pulse_shape = telNode.tabRefShape.read()
             except tables.exceptions.NoSuchNodeError as e:
                 pass
         
-        corsika = self.run.root.Corsika
-        tabEvent = corsika.tabCorsikaEvent.read()
-        tabEventId = tabEvent["eventId"]
-        
         runHeader = self.run.root.RunHeader
         azimuth = runHeader.azimuth.read()
+        data.mcheader.run_array_direction = Angle(azimuth * u.rad)
+
+    def _fill_mc_event(self, data, position):
+        if self._mcEvent is None:
+            corsika = self.run.root.Corsika
+            # Monte-Carlo truth of each event, in the order of the event index
+            self._mcEvent = create_mc_truth_columns(corsika.tabCorsikaEvent.read(), "eventId", MC_EVENT_COLUMNS,
+                                                    self.events.event_id)
+        mcEvent = self._mcEvent
+        data.mc.energy = mcEvent["energy"][position] * u.TeV
+        data.mc.alt = Angle(mcEvent["alt"][position], u.rad)
+        data.mc.az = Angle(mcEvent["az"][position], u.rad)
+        data.mc.core_x = mcEvent["coreX"][position] * u.m
+        data.mc.core_y = mcEvent["coreY"][position] * u.m
+        data.mc.h_first_int = mcEvent["h_first_int"][position] * u.m
+        data.mc.x_max = mcEvent["xmax"][position] * u.g / (u.cm**2)
+        data.mc.shower_primary_id = mcEvent["showerPrimaryId"][position]
+
+    def _read_telescope_event(self, telescopeId, telescopeIndex, event, isRandomAccess):
+        telNode = self.run.get_node("/Tel", 'Tel_' + str(telescopeIndex))
         
-        for event_id, event_list in self.events.items():
-            if counter == 0:
-                # subarray info is only available when an event is loaded,
-                # so load it on the first event.
-                data.inst.subarray = self._build_subarray_info(self.run)
-
-            obs_id = 0
-            tels_with_data = set([info[0] for info in event_list])
-            data.count = counter
-            data.r0.obs_id = obs_id
-            data.r0.event_id = event_id
-            data.r0.tels_with_data = tels_with_data
-            data.r1.obs_id = obs_id
-            data.r1.event_id = event_id
-            data.r1.tels_with_data = tels_with_data
-            data.dl0.obs_id = obs_id
-            data.dl0.event_id = event_id
-            data.dl0.tels_with_data = tels_with_data
-
-            # handle telescope filtering by taking the intersection of
-            # tels_with_data and allowed_tels
-            if len(self.allowed_tels) > 0:
-                selected = tels_with_data & self.allowed_tels
-                if len(selected) == 0:
-                    continue  # skip event
-                data.r0.tels_with_data = selected
-                data.r1.tels_with_data = selected
-                data.dl0.tels_with_data = selected
+        matWaveform = telNode.waveform.read(event, event + 1)
+        return matWaveform["waveform"][0]
 
-            #data.trig.tels_with_trigger = set(tels_with_data)
-            data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
-            
-            # indexSimu = np.where(tabEventId == 2498406)
-            '''
-            time_s, time_ns = file.get_central_event_gps_time()
-            data.trig.gps_time = Time(time_s * u.s, time_ns * u.ns, format='unix', scale='utc')
-            '''
-            data.mc.energy = tabEvent["energy"] * u.TeV
-            data.mc.alt = Angle(tabEvent["alt"], u.rad)
-            data.mc.az = Angle(tabEvent["az"], u.rad)
-            data.mc.core_x = tabEvent["coreX"] * u.m
-            data.mc.core_y = tabEvent["coreY"] * u.m
-            data.mc.h_first_int = tabEvent["h_first_int"] * u.m
-            data.mc.x_max = tabEvent["xmax"] * u.g / (u.cm**2)
-            data.mc.shower_primary_id = tabEvent["showerPrimaryId"]
-            
-            data.mcheader.run_array_direction = Angle(azimuth * u.rad)
-            
-            # this should be done in a nicer way to not re-allocate the
-            # data each time (right now it's just deleted and garbage
-            # collected)
+    def _fill_telescope_waveform(self, data, telescopeId, matWaveform, isRandomAccess):
+        matSignalPS = matWaveform.swapaxes(1, 2)
+        data.r0.tel[telescopeId].waveform = matSignalPS
 
-            data.r0.tel.clear()
-            data.r1.tel.clear()
-            data.dl0.tel.clear()
-            data.dl1.tel.clear()
+        _, _, n_samples = matSignalPS.shape
+        ped = data.mc.tel[telescopeId].pedestal[..., np.newaxis] / n_samples
+        gain = data.mc.tel[telescopeId].dc_to_pe[..., np.newaxis]
+        data.r1.tel[telescopeId].waveform = (matSignalPS - ped) * gain
 
-            for telescopeId, telescopeIndex, event in event_list:
-                
-                telNode = self.run.get_node("/Tel", 'Tel_' + str(telescopeIndex))
-                
-                matWaveform = telNode.waveform.read(event, event + 1)
-                matWaveform = matWaveform["waveform"]
-                
-                matSignalPS = matWaveform[0].swapaxes(1, 2)
-                data.r0.tel[telescopeId].waveform = matSignalPS
-
-                _, _, n_samples = matSignalPS.shape
-                ped = data.mc.tel[telescopeId].pedestal[..., np.newaxis] / n_samples
-                gain = data.mc.tel[telescopeId].dc_to_pe[..., np.newaxis]
-                data.r1.tel[telescopeId].waveform = (matSignalPS - ped) * gain
-
-                #data.r0.tel[telescopeId].image= matSignalPS.sum(axis=2)
-                #data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
-                #data.r0.tel[telescopeId].trig_pix_id = file.get_trig_pixels(telescopeId)
-                
-                
-            yield data
-            counter += 1
-        return
+        #data.r0.tel[telescopeId].image= matSignalPS.sum(axis=2)
+        #data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
+        #data.r0.tel[telescopeId].trig_pix_id = file.get_trig_pixels(telescopeId)
 
     def _build_subarray_info(self, run):
         """
@@ -229,38 +138,18 @@ class MCHDF5EventSource(EventSource):
         
         tabPoslXYZ = np.ascontiguousarray(np.vstack((tabPosTelX, tabPosTelY, tabPosTelZ)).T)
         
-        '''
-        # Correspance HiPeData.Telscope.Type and camera name
-        # 0  LSTCam, 1 NectarCam, 2 FlashCam, 3 SCTCam,
-        # 4 ASTRICam, 5 DigiCam, 6 CHEC
-        '''
-        mapping_camera = {0: 'LSTCam', 1: 'NectarCam', 2: 'FlashCam',
-                        3: 'SCTCam', 4: 'ASTRICam', 5: 'DigiCam',
-                        6: 'CHEC'}
-        
-        mapping_telName = {0:'LST', 1:'MST', 2:'MST', 3:'MST', 4:'SST-ASTRI', 5:'SST-1M', 6:'SST-2M'}
-        
+        telescopeCache = TelescopeDescriptionCache()
         for telNode in self.run.walk_nodes('/Tel', 'Group'):
             try:
-                telType = uint64(telNode.telType.read())
+                telType = int(telNode.telType.read())
                 telIndex = uint64(telNode.telIndex.read())
                 telId = uint64(telNode.telId.read())
                 
-                cameraName = mapping_camera[telType]
-                telName = mapping_telName[telType]
-                camera = CameraGeometry.from_name(cameraName)
-                camera.cam_id = cameraName
-                
-                foclen = tabFocalTel[telIndex] * u.m
-                
                 tel_pos = tabPoslXYZ[telIndex] * u.m
                 
-                camera.pix_x = telNode.tabPixelX.read() * u.m
-                camera.pix_y = telNode.tabPixelY.read() * u.m
                 #camera.rotate(-90.0*u.deg)
-                optic = OpticsDescription.from_name(telName)
-                optic.equivalent_focal_length = foclen
-                telescope_description = TelescopeDescription(telName, telName, optics=optic, camera=camera)
+                telescope_description = telescopeCache.get_telescope(telType, tabFocalTel[telIndex],
+                    lambda telNode=telNode: (telNode.tabPixelX.read(), telNode.tabPixelY.read()))
 
                 #tel.optics.mirror_area = mirror_area
                 #tel.optics.num_mirror_tiles = num_tiles
@@ -0,0 +1,31 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import tables
+
+from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
+
+__all__ = ['MCHDF5EventSourceDL0V1']
+
+
+class MCHDF5EventSourceDL0V1(MCHDF5EventSourceV2):
+	"""
+	EventSource for the DL0-V1 files written by mchdf5_tailcut_dilation_dl0v1.
+	The waveforms have the R1-V2 layout : the selected pixels keep their
+	waveform and the other pixels are averaged over the slices, so they
+	are read by blocks and calibrated like the R1-V2 waveforms.
+	"""
+	origin = "mchdf5dl0v1"
+
+	@staticmethod
+	def is_compatible(file_path):
+		try:
+			hfile = tables.open_file(file_path, "r")
+			isCompatible = hfile.title == "DL0-V1"
+			hfile.close()
+			return isCompatible
+		except Exception:
+			return False
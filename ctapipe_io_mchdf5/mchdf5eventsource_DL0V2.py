@@ -0,0 +1,156 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
+from .tools.event_index import iter_telescope_groups
+from .tools.dl0_reader import DL0TelescopeReaderCache, DL0WaveformReconstruction, DL0TelescopeR1Calibration, \
+	iter_dl0_telescope_batches
+
+__all__ = ['MCHDF5EventSourceDL0V2']
+
+
+class MCHDF5EventSourceDL0V2(MCHDF5EventSourceV2):
+	"""
+	EventSource for the DL0-V2 files written by mchdf5_tailcut_dilation_dl0v2.
+	Only the waveforms of the selected pixels are stored, the other pixels
+	are reconstructed from their integrated signal, so the waveforms of the
+	containers are dense (one gain selected per pixel). The sparse
+	waveforms can be read with get_sparse_event.
+	"""
+	origin = "mchdf5dl0v2"
+	telescope_node = "/dl0"
+
+	def __init__(self, config=None, parent=None, **kwargs):
+		super().__init__(config=config, parent=parent, **kwargs)
+		self._reconstruction = dict()
+		self._dl0Calibration = dict()
+
+	@staticmethod
+	def is_compatible(file_path):
+		try:
+			hfile = tables.open_file(file_path, "r")
+			isCompatible = hfile.title == "DL0-V2"
+			hfile.close()
+			return isCompatible
+		except Exception:
+			return False
+
+	def _create_reader_cache(self, nbEventPerBlock, nbBytePerBlock=0):
+		return DL0TelescopeReaderCache(self.run, self.telescope_node, nbEventPerBlock, nbBytePerBlock,
+									   self.block_cache)
+
+	def get_reconstruction(self, tel_id):
+		"""
+		Reconstruction of the dense waveforms of a telescope, computed once per run
+		Parameters
+		----------
+		tel_id: id of the telescope
+
+		Returns
+		-------
+		DL0WaveformReconstruction of the telescope
+		"""
+		try:
+			return self._reconstruction[tel_id]
+		except KeyError:
+			reader = self.telescope_readers.get_reader(tel_id)
+			dc_to_pe, pedestal = self._get_mc_telescopes().get(tel_id, (None, None))[:2]
+			reconstruction = DL0WaveformReconstruction(dc_to_pe, pedestal, reader.nbPixel, reader.nbSlice,
+													   self.r1_dtype)
+			self._reconstruction[tel_id] = reconstruction
+			return reconstruction
+
+	def get_r1_calibration(self, tel_id):
+		"""
+		R1 calibration of a telescope, computed once per run.
+		The DL0-V2 waveforms have one gain selected per pixel, so the
+		calibration takes the gain of each pixel (all the pixels are
+		calibrated with the high gain if it is not given)
+		Parameters
+		----------
+		tel_id: id of the telescope
+
+		Returns
+		-------
+		DL0TelescopeR1Calibration of the telescope
+		"""
+		try:
+			return self._dl0Calibration[tel_id]
+		except KeyError:
+			calibration = DL0TelescopeR1Calibration(self.get_reconstruction(tel_id))
+			self._dl0Calibration[tel_id] = calibration
+			return calibration
+
+	def get_sparse_event(self, position):
+		"""
+		Get the sparse waveforms of the event at the given position, without
+		reconstructing the waveforms of the pixels which are not selected
+		Parameters
+		----------
+		position: position of the event in the source
+
+		Returns
+		-------
+		dictionary of (pixel_waveform, waveform, signal, pixel_lo) with the telescope id as key.
+		pixel_waveform are the pixels with a waveform, waveform their waveforms with
+		shape (nb_selected_pixel, nb_slice), signal the integrated signal of all the pixels
+		and pixel_lo the pixels in low gain
+		"""
+		tabTelId, tabTelIndex, tabRow = self.events.get_event_telescopes(position)
+		dicoSparse = dict()
+		with self._readLock:
+			for telescopeId, row in zip(tabTelId.tolist(), tabRow.tolist()):
+				dicoSparse[telescopeId] = self.random_access_readers.get_reader(telescopeId).read_sparse(row)
+		return dicoSparse
+
+	def iter_telescope_batches(self, tel_ids=None, batch_size=1000):
+		"""
+		Iterate over the dense waveforms telescope by telescope, by batches of consecutive events.
+		The pixels which are not selected are reconstructed for the whole batch at once
+		Parameters
+		----------
+		tel_ids: ids of the telescopes to be read (allowed_tels or all the telescopes if None)
+		batch_size: expected number of events per batch
+
+		Returns
+		-------
+		generator of (tel_id, event_id, waveform) with event_id the ids of the events of the batch
+		and waveform the uncalibrated waveforms with shape (nb_event, 1, nb_pixel, nb_slice)
+		"""
+		if tel_ids is None:
+			allowedTelId = self._get_allowed_tel_ids()
+			if allowedTelId is None:
+				tel_ids = self.get_telescope_ids()
+			else:
+				tel_ids = sorted(int(telNode.telId.read()) for telNode in
+								 iter_telescope_groups(self.run, self.telescope_node, 'Tel_', allowedTelId))
+		for telId in tel_ids:
+			telNode = self.run.get_node(self.telescope_node, 'Tel_' + str(telId))
+			reconstruction = self.get_reconstruction(telId)
+			for tabEventId, tabWaveform, tabGainSelection in iter_dl0_telescope_batches(telNode, reconstruction,
+																						 batch_size):
+				yield telId, tabEventId, tabWaveform[:, np.newaxis]
+
+	def _get_lazy_telescope_maps(self, data, telescopeId):
+		return [data.r0.tel, data.r1.tel]
+
+	def _read_telescope_event(self, telescopeId, telescopeIndex, event, isRandomAccess):
+		return self._get_telescope_reader(telescopeId, isRandomAccess).read_sparse(event)
+
+	def _fill_telescope_waveform(self, data, telescopeId, waveforms, isRandomAccess):
+		reconstruction = self.get_reconstruction(telescopeId)
+		tabWaveform, tabGainSelection = reconstruction.reconstruct_event(*waveforms)
+		data.r0.tel[telescopeId].waveform = tabWaveform[np.newaxis]
+		calibration = self.get_r1_calibration(telescopeId)
+		if isRandomAccess:
+			# The containers of the random access are not reused
+			data.r1.tel[telescopeId].waveform = calibration.calibrate(tabWaveform[np.newaxis], None, tabGainSelection)
+		else:
+			data.r1.tel[telescopeId].waveform = calibration.calibrate_in_buffer(tabWaveform[np.newaxis],
+																				tabGainSelection)
@@ -0,0 +1,269 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.instrument import SubarrayDescription
+from astropy import units as u
+from astropy.coordinates import Angle
+from numpy import uint64
+import numpy as np
+import tables
+
+from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
+from .tools.mc_truth import create_mc_truth_columns, find_event_rows
+from .tools.event_index import create_event_index_r0, iter_telescope_tables, get_telescope_table_name
+from .tools.waveform_reader import TelescopeTableReaderCache, iter_telescope_table_waveform_batches
+from .tools.subarray_cache import TelescopeDescriptionCache, MAPPING_CAMERA
+from .tools.r1_calibration import R1CalibrationCache, PedestalSelection
+from .tools.r0_merge import MERGED_INPUT_PATH
+
+__all__ = ['MCHDF5EventSourceR0V2']
+WAVEFORM_NODE = '/r0/event/telescope/waveform'
+TRIGGER_TABLE = '/r0/event/subarray/trigger'
+TELS_WITH_TRIGGER_ARRAY = '/r0/event/subarray/tels_with_trigger'
+MONITORING_NODE = '/r0/monitoring/telescope'
+CAMERA_NODE = '/configuration/instrument/telescope/camera'
+MC_EVENT_COLUMNS = ["true_energy", "true_alt", "true_az", "true_core_x", "true_core_y", "true_h_first_int", "true_x_max",
+					"true_shower_primary_id"]
+
+
+class MCHDF5EventSourceR0V2(MCHDF5EventSourceV2):
+	"""
+	EventSource for the R0-V2 files written by mchdf5_simtel2r0.
+	The waveforms of a telescope are stored in one table
+	(/r0/event/telescope/waveform/tel_XXX) with the event_id, waveformHi
+	and waveformLo columns, read by blocks of rows. The events are in the
+	order of the subarray trigger table and the monitoring of the
+	telescopes (gain, pedestal, information) is read once per run.
+	The pedestal table of a merged file has one row per input run :
+	the pedestal of an event is the one whose obs_id and range of event
+	ids contain the event (the first row if there is none).
+	"""
+	origin = "mchdf5r0v2"
+	mc_event_table = "/simulation/event/subarray/shower"
+	run_config_table = "/configuration/simulation/run"
+
+	@staticmethod
+	def is_compatible(file_path):
+		try:
+			hfile = tables.open_file(file_path, "r")
+			isCompatible = hfile.title == "R0-V2"
+			hfile.close()
+			return isCompatible
+		except Exception:
+			return False
+
+	def __init__(self, config=None, parent=None, **kwargs):
+		super().__init__(config=config, parent=parent, **kwargs)
+
+		# Row of each event of the index in the subarray trigger table, found on the first access
+		self._triggerRow = None
+		# obs_id column of the subarray trigger table, read on the first access
+		self._triggerObsId = None
+		# PedestalSelection of the telescopes which have several pedestals (merged runs), with the telescope id as key
+		self._pedestalSelection = dict()
+		# R1 calibrations of the pedestals of the merged runs, with (telescope id, pedestal row) as key
+		self._pedestalCalibration = None
+
+	def _create_reader_cache(self, nbEventPerBlock, nbBytePerBlock=0):
+		# The columns of a telescope table are read at once, by blocks of rows
+		return TelescopeTableReaderCache(self.run, WAVEFORM_NODE, nbEventPerBlock, nbBytePerBlock, self.block_cache)
+
+	def _create_event_index(self, allowedTelId, nbMaxEvent=None):
+		if MERGED_INPUT_PATH in self.run:
+			# The telescope tables have no obs_id : the events of the merged runs are found by their event_id only
+			tabEventId = self.run.get_node(TRIGGER_TABLE).col("event_id")
+			if np.unique(tabEventId).size != tabEventId.size:
+				raise ValueError("The merged runs of {} have the same event ids with different obs_id, read their input "
+								 "files (/r0/service/merged_input) with MCHDF5MultiFileEventSource".format(self.input_url))
+		return create_event_index_r0(self.run, WAVEFORM_NODE, TRIGGER_TABLE, allowedTelId, nbMaxEvent)
+
+	def _get_trigger_row(self, position):
+		# Row of the event in the subarray trigger table (-1 if the event is not triggered)
+		if self._triggerRow is None:
+			self._triggerRow = find_event_rows(self.run.get_node(TRIGGER_TABLE).col("event_id"), self.events.event_id)
+		return int(self._triggerRow[position])
+
+	def _read_tels_with_trigger(self, position, tabTelId):
+		# The telescopes which have triggered are stored per event with the subarray trigger
+		row = self._get_trigger_row(position)
+		if row < 0 or TELS_WITH_TRIGGER_ARRAY not in self.run:
+			return super()._read_tels_with_trigger(position, tabTelId)
+		return self.run.get_node(TELS_WITH_TRIGGER_ARRAY)[row]
+
+	def _read_mc_telescopes(self):
+		"""
+		Read the monitoring of the telescopes (dc_to_pe, pedestal, reference_pulse_shape)
+		Returns
+		-------
+		dictionary of (dc_to_pe, pedestal, reference_pulse_shape) with the telescope id as key
+		"""
+		monitoringNode = self.run.get_node(MONITORING_NODE)
+		cameraNode = self.run.get_node(CAMERA_NODE)
+		# The reference pulse shape is shared by the telescopes of a camera type
+		dicoRefShape = dict()
+		dicoMcTel = dict()
+		for telId, table in iter_telescope_tables(self.run, WAVEFORM_NODE, self._get_allowed_tel_ids()):
+			tableName = get_telescope_table_name(telId)
+			try:
+				dc_to_pe = monitoringNode.gain._f_get_child(tableName).read()
+				tabPedestal = monitoringNode.pedestal._f_get_child(tableName).read()
+				information = monitoringNode.information._f_get_child(tableName).read()
+			except tables.exceptions.NoSuchNodeError as e:
+				continue
+			telType = int(information["tel_type"][0])
+			nbGain = int(information["nb_gain"][0])
+			key = (telType, nbGain)
+			if key not in dicoRefShape:
+				dicoRefShape[key] = self._read_reference_pulse_shape(cameraNode, MAPPING_CAMERA[telType], nbGain)
+			if tabPedestal.size > 1:
+				# The pedestal of each merged run is selected per event
+				self._pedestalSelection[uint64(telId)] = PedestalSelection(tabPedestal)
+			dicoMcTel[uint64(telId)] = (dc_to_pe, tabPedestal["pedestal"][0], dicoRefShape[key])
+		return dicoMcTel
+
+	def _fill_event_pedestal(self, data, position):
+		"""
+		Set the pedestal of the event of the telescopes which have several pedestals
+		Parameters
+		----------
+		data: DataContainer of the event
+		position: position of the event in the EventIndex
+		"""
+		self._get_mc_telescopes()
+		if len(self._pedestalSelection) == 0:
+			return
+		obsId = None
+		row = self._get_trigger_row(position)
+		if row >= 0:
+			if self._triggerObsId is None:
+				self._triggerObsId = self.run.get_node(TRIGGER_TABLE).col("obs_id")
+			obsId = self._triggerObsId[row]
+		eventId = self.events.event_id[position]
+		for telId, pedestalSelection in self._pedestalSelection.items():
+			data.mc.tel[telId].pedestal = pedestalSelection.listPedestal[pedestalSelection.find_row(eventId, obsId)]
+
+	def _get_event_r1_calibration(self, data, telescopeId):
+		pedestalSelection = self._pedestalSelection.get(uint64(telescopeId))
+		if pedestalSelection is None:
+			return self.get_r1_calibration(telescopeId)
+		# The pedestal of the event is set by _fill_event_pedestal
+		key = (telescopeId, pedestalSelection.get_row(data.mc.tel[telescopeId].pedestal))
+		if self._pedestalCalibration is None:
+			dicoPedestal = dict()
+			for telId, selection in self._pedestalSelection.items():
+				dc_to_pe = self._get_mc_telescopes()[telId][0]
+				for pedestalRow, pedestal in enumerate(selection.listPedestal):
+					dicoPedestal[(int(telId), pedestalRow)] = (dc_to_pe, pedestal)
+			self._pedestalCalibration = R1CalibrationCache(dicoPedestal, self.r1_dtype)
+		nbSlice = self.telescope_readers.get_reader(telescopeId).waveformHi.table.coldtypes["waveformHi"].shape[0]
+		return self._pedestalCalibration.get_calibration(key, nbSlice)
+
+	@staticmethod
+	def _read_reference_pulse_shape(cameraNode, cameraName, nbGain):
+		"""
+		Read the reference pulse shape of a camera
+		Parameters
+		----------
+		cameraNode: group of the cameras
+		cameraName: name of the camera
+		nbGain: number of gains of the camera
+
+		Returns
+		-------
+		reference pulse shape with shape (nb_gain, nb_sample), None if the file does not store it
+		"""
+		try:
+			readout = cameraNode._f_get_child('readout_' + cameraName).read()
+		except tables.exceptions.NoSuchNodeError as e:
+			return None
+		listChannel = ["reference_pulse_shape_channel" + str(gain) for gain in range(nbGain)]
+		return np.stack([readout[channelName] for channelName in listChannel])
+
+	def _fill_mc_event(self, data, position):
+		if self._mcEvent is None:
+			# Monte-Carlo truth of each event, in the order of the event index
+			self._mcEvent = create_mc_truth_columns(self.run.get_node(self.mc_event_table).read(), "event_id",
+													MC_EVENT_COLUMNS, self.events.event_id)
+		mcEvent = self._mcEvent
+		data.mc.energy = mcEvent["true_energy"][position] * u.TeV
+		# The directions of the showers are stored in degrees
+		data.mc.alt = Angle(mcEvent["true_alt"][position], u.deg)
+		data.mc.az = Angle(mcEvent["true_az"][position], u.deg)
+		data.mc.core_x = mcEvent["true_core_x"][position] * u.m
+		data.mc.core_y = mcEvent["true_core_y"][position] * u.m
+		data.mc.h_first_int = mcEvent["true_h_first_int"][position] * u.m
+		data.mc.x_max = mcEvent["true_x_max"][position] * u.g / (u.cm**2)
+		data.mc.shower_primary_id = mcEvent["true_shower_primary_id"][position]
+		self._fill_event_pedestal(data, position)
+
+	def get_telescope_ids(self):
+		"""
+		Ids of the telescopes stored in the file
+		"""
+		return [telId for telId, table in iter_telescope_tables(self.run, WAVEFORM_NODE)]
+
+	def iter_telescope_batches(self, tel_ids=None, batch_size=1000):
+		"""
+		Iterate over the waveforms telescope by telescope, by batches of consecutive events.
+		The batches are read directly from the tables, without any DataContainer,
+		and their size is rounded to a multiple of the chunk size of the tables
+		Parameters
+		----------
+		tel_ids: ids of the telescopes to be read (allowed_tels or all the telescopes if None)
+		batch_size: expected number of events per batch
+
+		Returns
+		-------
+		generator of (tel_id, event_id, waveform) with event_id the ids of the events of the batch
+		and waveform the uncalibrated waveforms with shape (nb_event, nb_gain, nb_pixel, nb_slice)
+		"""
+		if tel_ids is None:
+			tel_ids = [telId for telId, table in iter_telescope_tables(self.run, WAVEFORM_NODE,
+																		self._get_allowed_tel_ids())]
+		for telId in tel_ids:
+			table = self.run.get_node(WAVEFORM_NODE, get_telescope_table_name(telId))
+			for tabEventId, tabWaveform in iter_telescope_table_waveform_batches(table, batch_size,
+																				  self.is_slice_pixel):
+				yield telId, tabEventId, tabWaveform
+
+	def _get_instrument_nodes(self):
+		return ['/configuration/instrument']
+
+	def _build_subarray_info(self, run):
+		"""
+		constructs a SubarrayDescription object from the
+		/configuration/instrument group of the file
+
+		Parameters
+		----------
+		run: HDF5 file
+
+		Returns
+		-------
+		SubarrayDescription :
+			instrumental information
+		"""
+		subarray = SubarrayDescription("MonteCarloArray")
+
+		tabLayout = run.root.configuration.instrument.subarray.layout.read()
+		tabFocalTel = run.root.configuration.instrument.telescope.optics.col("equivalent_focal_length")
+		tabPoslXYZ = np.ascontiguousarray(np.vstack((tabLayout["pos_x"], tabLayout["pos_y"], tabLayout["pos_z"])).T)
+
+		cameraNode = run.get_node(CAMERA_NODE)
+		telescopeCache = TelescopeDescriptionCache()
+		for telIndex, layout in enumerate(tabLayout):
+			telType = int(layout["type_id"])
+			if telType not in MAPPING_CAMERA:
+				# The telescopes which are not in the run have an unknown type
+				continue
+			telId = uint64(layout["tel_id"])
+			geometry = cameraNode._f_get_child('geometry_' + MAPPING_CAMERA[telType])
+			telescope_description = telescopeCache.get_telescope(telType, tabFocalTel[telIndex],
+				lambda geometry=geometry: (geometry.col("pix_x"), geometry.col("pix_y")))
+			subarray.tels[telId] = telescope_description
+			subarray.positions[telId] = tabPoslXYZ[telIndex] * u.m
+
+		return subarray
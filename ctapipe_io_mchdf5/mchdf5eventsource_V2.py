@@ -4,48 +4,30 @@
 	Licence : CeCILL-C
 '''
 
-from ctapipe.io.eventsource import EventSource
-from ctapipe.io.containers import DataContainer
-from numpy import stack, zeros, swapaxes, array, int16, uint64
-from ctapipe.instrument import TelescopeDescription, SubarrayDescription, OpticsDescription
-from ctapipe.instrument.camera import CameraGeometry
+from ctapipe.core.traits import Int, Enum, Bool
+from numpy import uint64
+from ctapipe.instrument import SubarrayDescription
 from astropy import units as u
 from astropy.coordinates import Angle
 import numpy as np
 import tables
 
+from .mchdf5eventsource_base import MCHDF5IndexedEventSource
+from .tools.mc_truth import create_mc_truth_columns
+from .tools.event_index import create_event_index_r1, iter_telescope_groups
+from .tools.waveform_reader import TelescopeReaderCache, DecodedBlockCache, iter_telescope_waveform_batches
+from .tools.r1_calibration import R1CalibrationCache
+from .tools.r1_layout import get_file_layout, MinSelectedReaderCache, iter_min_selected_waveform_batches, \
+	LAYOUT_MIN_SELECTION, LAYOUT_SLICE_SELECTION
+from .tools.subarray_cache import TelescopeDescriptionCache, MAPPING_CAMERA
+
 __all__ = ['MCHDF5EventSourceV2']
 HI_GAIN = 0
 LO_GAIN = 1
+CAMERA_NODE = '/instrument/subarray/telescope/camera'
+MC_EVENT_COLUMNS = ["mc_energy", "mc_alt", "mc_az", "mc_core_x", "mc_core_y", "mc_h_first_int", "mc_x_max", "mc_shower_primary_id"]
 	
-def _convert_per_events_to_per_telescope(hfile):
-	'''
-	Concert the telescope storage into a event storage
-	Parameters:
-	-----------
-		hfile : HDF5 file to be used
-	Return:
-	-------
-		dictionary which contains the events with the proper telescopes
-	'''
-	events=dict()
-	for telNode in hfile.walk_nodes('/r1', 'Group'):
-		try:
-			tabEventId = telNode.trigger.col("event_id")
-			telescopeIndex = uint64(telNode.telIndex.read())
-			telescopeId = uint64(telNode.telId.read())
-			for i,eventId in enumerate(tabEventId):
-				try:
-					events[eventId].append((telescopeId, telescopeIndex, i))
-				except KeyError:
-					events[eventId] = [(telescopeId, telescopeIndex, i)]
-		except tables.exceptions.NoSuchNodeError as e:
-			#For the r1 dataset only
-			pass
-	return events
-
-
-class MCHDF5EventSourceV2(EventSource):
+class MCHDF5EventSourceV2(MCHDF5IndexedEventSource):
 	"""
 	EventSource for the MCHDF5 file format version 2.
 	MCHDF5 is a data format for Cherenkov Telescope Array (CTA)
@@ -54,15 +36,68 @@ class MCHDF5EventSourceV2(EventSource):
 	It allows algorithms to take advantage of the latest SIMD
 	(Single input multiple data) operations included in modern processors,
 	for native vectorized optimization of analytical data processing.
+
+	In the iteration, data.r1.tel[tel_id].waveform is by default the same
+	buffer of the telescope for every event (it is overwritten by the next
+	event of the telescope) : copy it to keep it, or set reuse_r1_buffer to
+	False to get a new array per event. The events of get_event and of the
+	random access are never reused.
 	"""
+	origin = "mchdf5v2"
+	mc_event_table = "/simulation/mc_event"
+	# Table of the configuration of the run
+	run_config_table = "/simulation/run_config"
+	# Group of the telescope groups (Tel_<id>)
+	telescope_node = "/r1"
+	# The waveforms are stored per slice and pixel
+	is_slice_pixel = True
+
+	read_ahead_events = Int(
+		100,
+		help='Number of consecutive events of a telescope read at once'
+	).tag(config=True)
+
+	read_ahead_bytes = Int(
+		0,
+		help='Size in bytes of the waveform block read at once per telescope and gain '
+			 '(overrides read_ahead_events if > 0)'
+	).tag(config=True)
+
+	block_cache_bytes = Int(
+		0,
+		help='Size in bytes of the cache of the decoded waveform blocks shared by the telescopes, which '
+			 'avoids decompressing again the blocks of the events accessed several times (0 to disable it)'
+	).tag(config=True)
+
+	r1_dtype = Enum(
+		['float32', 'float64'],
+		default_value='float32',
+		help='Type of the calibrated R1 waveforms'
+	).tag(config=True)
+
+	reuse_r1_buffer = Bool(
+		True,
+		help='Calibrate the R1 waveforms of the iteration in one buffer per telescope, which is '
+			 'overwritten by the next event of the telescope (False to allocate a new array per event)'
+	).tag(config=True)
 
 	def __init__(self, config=None, parent=None, **kwargs):
 		super().__init__(config=config, parent=parent, **kwargs)
 
-		self.metadata['is_simulation'] = True
-
-		# Create MCRun isntance and load file into memory
-		self.run = tables.open_file(self.input_url, "r")
+		# Layout of the waveforms (raw, min selection, slice selection, ...), the readers depend on it
+		self.layout = get_file_layout(self.run, self.telescope_node)
+		# Decoded waveform blocks of all the telescopes, kept under a byte budget
+		self.block_cache = None
+		if self.block_cache_bytes > 0:
+			self.block_cache = DecodedBlockCache(self.block_cache_bytes)
+		# Waveform readers of the telescopes, created on the first event of each telescope
+		self.telescope_readers = self._create_reader_cache(self.read_ahead_events, self.read_ahead_bytes)
+		# Random access reads only the rows of the requested event, or the rows of its chunk (decompressed anyway)
+		# if the blocks are cached, so the next events of the chunk are served by the cache
+		self.random_access_readers = self._create_reader_cache(1 if self.block_cache is None else 0)
+		self._mcTel = None
+		self._mcEvent = None
+		self._r1Calibration = None
 	
 	
 	@staticmethod
@@ -75,137 +110,218 @@ class MCHDF5EventSourceV2(EventSource):
 		except Exception:
 			return False
 
-	def __exit__(self, exc_type, exc_val, exc_tb):
-		pass
 
+	def _create_reader_cache(self, nbEventPerBlock, nbBytePerBlock=0):
+		"""
+		Create the cache of the waveform readers of the telescopes
+		Parameters
+		----------
+		nbEventPerBlock: number of events read at once per telescope (used if nbBytePerBlock is 0, 0 for the
+			events of one chunk)
+		nbBytePerBlock: size in bytes of the blocks read at once (0 to use nbEventPerBlock)
+		"""
+		if self.layout == LAYOUT_MIN_SELECTION:
+			# The minimum of the blocks of events are added back to the waveforms read
+			return MinSelectedReaderCache(self.run, self.telescope_node, 'Tel_', nbEventPerBlock, nbBytePerBlock,
+										  self.is_slice_pixel, self.block_cache)
+		return TelescopeReaderCache(self.run, self.telescope_node, 'Tel_', nbEventPerBlock, nbBytePerBlock,
+									self.block_cache)
 
-	def _generator(self):
-		# HiPeData arranges data per telescope and not by event like simtel
-		# We need to first create a dictionary.
-		#   key -> EventId, value -> List of event from triggered telescopes
-		self.events = _convert_per_events_to_per_telescope(self.run)
 
-		# the container is initialized once, and data is replaced within
-		# it after each yield
-		counter = 0
-		data = DataContainer()
-		data.meta['origin'] = "mchdf5v2"
+	def _create_event_index(self, allowedTelId, nbMaxEvent=None):
+		return create_event_index_r1(self.run, self.telescope_node, allowedTelId, nbMaxEvent)
 
-		# some hessio_event_source specific parameters
-		data.meta['input_url'] = self.input_url
-		data.meta['max_events'] = self.max_events
 
-		'''
-		MC data are valid for the whole run
-		'''
-		data.mc.tel.clear()  # clear the previous telescopes
-		for telNode in self.run.walk_nodes('/r1', 'Group'):
+	def _read_mc_telescopes(self):
+		"""
+		Read the calibration of the telescopes (dc_to_pe, pedestal, reference_pulse_shape)
+		Returns
+		-------
+		dictionary of (dc_to_pe, pedestal, reference_pulse_shape) with the telescope id as key
+		"""
+		dicoMcTel = dict()
+		for telNode in iter_telescope_groups(self.run, self.telescope_node, 'Tel_', self._get_allowed_tel_ids()):
 			try:
 				tel_id = uint64(telNode.telId.read())
-				data.mc.tel[tel_id].dc_to_pe = telNode.tabGain.read()
+				dc_to_pe = telNode.tabGain.read()
 				
 				pedestal = telNode.pedestal.read()
 				pedestal = pedestal["pedestal"]
 				
-				data.mc.tel[tel_id].pedestal = pedestal[0]
-				data.mc.tel[tel_id].reference_pulse_shape = telNode.tabRefShape.read()
+				dicoMcTel[tel_id] = (dc_to_pe, pedestal[0], telNode.tabRefShape.read())
 			except tables.exceptions.NoSuchNodeError as e:
 				pass
+		return dicoMcTel
+
+
+	def _get_mc_telescopes(self):
+		if self._mcTel is None:
+			self._mcTel = self._read_mc_telescopes()
+		return self._mcTel
+
+
+	def get_r1_calibration(self, tel_id):
+		"""
+		R1 calibration of a telescope, computed once per run.
+		It can also calibrate the blocks of waveforms of iter_telescope_batches
+		in one operation
+		Parameters
+		----------
+		tel_id: id of the telescope
+
+		Returns
+		-------
+		TelescopeR1Calibration of the telescope
+		"""
+		if self._r1Calibration is None:
+			self._r1Calibration = R1CalibrationCache(self._get_mc_telescopes(), self.r1_dtype)
+		tableHi = self.telescope_readers.get_reader(tel_id).waveformHi.table
+		if self.layout == LAYOUT_SLICE_SELECTION:
+			# The pedestal is integrated over all the slices of the file the slices were selected from
+			nbSlice = int(tableHi._v_parent.nbSlice.read())
+		else:
+			nbSlice = tableHi.coldtypes["waveformHi"].shape[0]
+		return self._r1Calibration.get_calibration(tel_id, nbSlice)
+
+
+	def _get_event_r1_calibration(self, data, telescopeId):
+		"""
+		R1 calibration of a telescope for the event of data (the calibration of the run)
+		"""
+		return self.get_r1_calibration(telescopeId)
+
+
+	def _fill_run_data(self, data):
+		for tel_id, (dc_to_pe, pedestal, reference_pulse_shape) in self._get_mc_telescopes().items():
+			data.mc.tel[tel_id].dc_to_pe = dc_to_pe
+			data.mc.tel[tel_id].pedestal = pedestal
+			data.mc.tel[tel_id].reference_pulse_shape = reference_pulse_shape
 		
-		tabEvent = self.run.root.simulation.mc_event.read()
-		tabEventId = tabEvent["event_id"]
-		
-		azimuth = self.run.root.simulation.run_config.col("run_array_direction")[0]
-		
-		for event_id, event_list in self.events.items():
-			if counter == 0:
-				# subarray info is only available when an event is loaded,
-				# so load it on the first event.
-				data.inst.subarray = self._build_subarray_info(self.run)
-
-			obs_id = 0
-			tels_with_data = set([info[0] for info in event_list])
-			data.count = counter
-			data.r0.obs_id = obs_id
-			data.r0.event_id = event_id
-			data.r0.tels_with_data = tels_with_data
-			data.r1.obs_id = obs_id
-			data.r1.event_id = event_id
-			data.r1.tels_with_data = tels_with_data
-			data.dl0.obs_id = obs_id
-			data.dl0.event_id = event_id
-			data.dl0.tels_with_data = tels_with_data
-
-			# handle telescope filtering by taking the intersection of
-			# tels_with_data and allowed_tels
-			if len(self.allowed_tels) > 0:
-				selected = tels_with_data & self.allowed_tels
-				if len(selected) == 0:
-					continue  # skip event
-				data.r0.tels_with_data = selected
-				data.r1.tels_with_data = selected
-				data.dl0.tels_with_data = selected
-
-			#data.trig.tels_with_trigger = set(tels_with_data)
-			data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
-			
-			#TODO : replace this by an astropy join
-			indexSimu = np.where(tabEventId == event_id)
-			'''
-			time_s, time_ns = file.get_central_event_gps_time()
-			data.trig.gps_time = Time(time_s * u.s, time_ns * u.ns, format='unix', scale='utc')
-			'''
-			data.mc.energy = tabEvent["mc_energy"][indexSimu] * u.TeV
-			data.mc.alt = Angle(tabEvent["mc_alt"][indexSimu], u.rad)
-			data.mc.az = Angle(tabEvent["mc_az"][indexSimu], u.rad)
-			data.mc.core_x = tabEvent["mc_core_x"][indexSimu] * u.m
-			data.mc.core_y = tabEvent["mc_core_y"][indexSimu] * u.m
-			data.mc.h_first_int = tabEvent["mc_h_first_int"][indexSimu] * u.m
-			data.mc.x_max = tabEvent["mc_x_max"][indexSimu] * u.g / (u.cm**2)
-			data.mc.shower_primary_id = tabEvent["mc_shower_primary_id"][indexSimu]
-			
-			data.mcheader.run_array_direction = Angle(azimuth * u.rad)
-			
-			# this should be done in a nicer way to not re-allocate the
-			# data each time (right now it's just deleted and garbage
-			# collected)
+		azimuth = self.run.get_node(self.run_config_table).col("run_array_direction")[0]
+		data.mcheader.run_array_direction = Angle(azimuth * u.rad)
 
-			data.r0.tel.clear()
-			data.r1.tel.clear()
-			data.dl0.tel.clear()
-			data.dl1.tel.clear()
 
-			for telescopeId, telescopeIndex, event in event_list:
-				
-				telNode = self.run.get_node("/r1", 'Tel_' + str(telescopeId))
-				
-				matWaveform = telNode.waveformHi.read(event, event + 1)
-				matWaveform = matWaveform["waveformHi"][0]
-				matSignalPSHi = matWaveform.swapaxes(0, 1)
-				try:
-					waveformLo = telNode.waveformLo.read(event, event + 1)
-					waveformLo = waveformLo["waveformLo"][0]
-					
-					matSignalPSLo = waveformLo.swapaxes(0, 1)
-					tabHiLo = np.stack((matSignalPSHi, matSignalPSLo))
-					data.r0.tel[telescopeId].waveform = tabHiLo
-
-					_, _, n_samples = tabHiLo.shape
-					ped = data.mc.tel[telescopeId].pedestal[..., np.newaxis] / n_samples
-					gain = data.mc.tel[telescopeId].dc_to_pe[..., np.newaxis]
-					data.r1.tel[telescopeId].waveform = (tabHiLo - ped) * gain
-
-				except Exception as e:
-					print(e)
-					data.r0.tel[telescopeId].waveform = np.expand_dims(matSignalPSHi, axis=0)
-				
-				#data.r0.tel[telescopeId].image= matSignalPSHi.sum(axis=2)
-				#data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
-				#data.r0.tel[telescopeId].trig_pix_id = file.get_trig_pixels(telescopeId)
-				
-			yield data
-			counter += 1
-		return
+	def _fill_mc_event(self, data, position):
+		if self._mcEvent is None:
+			# Monte-Carlo truth of each event, in the order of the event index
+			self._mcEvent = create_mc_truth_columns(self.run.root.simulation.mc_event.read(), "event_id",
+													MC_EVENT_COLUMNS, self.events.event_id)
+		mcEvent = self._mcEvent
+		data.mc.energy = mcEvent["mc_energy"][position] * u.TeV
+		data.mc.alt = Angle(mcEvent["mc_alt"][position], u.rad)
+		data.mc.az = Angle(mcEvent["mc_az"][position], u.rad)
+		data.mc.core_x = mcEvent["mc_core_x"][position] * u.m
+		data.mc.core_y = mcEvent["mc_core_y"][position] * u.m
+		data.mc.h_first_int = mcEvent["mc_h_first_int"][position] * u.m
+		data.mc.x_max = mcEvent["mc_x_max"][position] * u.g / (u.cm**2)
+		data.mc.shower_primary_id = mcEvent["mc_shower_primary_id"][position]
+
+
+	def _get_telescope_reader(self, telescopeId, isRandomAccess):
+		if isRandomAccess:
+			return self.random_access_readers.get_reader(telescopeId)
+		return self.telescope_readers.get_reader(telescopeId)
+
+
+	def get_block_cache_statistics(self):
+		"""
+		Statistics of the cache of the decoded waveform blocks
+		Returns
+		-------
+		dictionary with the number of hits, misses and evictions, the hit rate, the number of cached blocks and their
+		size in bytes, None if the cache is disabled (block_cache_bytes = 0)
+		"""
+		if self.block_cache is None:
+			return None
+		return self.block_cache.get_statistics()
+
+
+	def get_telescope_ids(self):
+		"""
+		Ids of the telescopes stored in the file
+		"""
+		listTelId = []
+		for telNode in self.run.walk_nodes(self.telescope_node, 'Group'):
+			try:
+				listTelId.append(int(telNode.telId.read()))
+			except tables.exceptions.NoSuchNodeError as e:
+				continue
+		return sorted(listTelId)
+
+
+	def iter_telescope_batches(self, tel_ids=None, batch_size=1000):
+		"""
+		Iterate over the waveforms telescope by telescope, by batches of consecutive events.
+		The batches are read directly from the tables, without any DataContainer,
+		and their size is rounded to a multiple of the chunk size of the tables
+		Parameters
+		----------
+		tel_ids: ids of the telescopes to be read (allowed_tels or all the telescopes if None)
+		batch_size: expected number of events per batch
+
+		Returns
+		-------
+		generator of (tel_id, event_id, waveform) with event_id the ids of the events of the batch
+		and waveform the uncalibrated waveforms with shape (nb_event, nb_gain, nb_pixel, nb_slice)
+		"""
+		if tel_ids is None:
+			allowedTelId = self._get_allowed_tel_ids()
+			if allowedTelId is None:
+				tel_ids = self.get_telescope_ids()
+			else:
+				tel_ids = sorted(int(telNode.telId.read()) for telNode in
+								 iter_telescope_groups(self.run, self.telescope_node, 'Tel_', allowedTelId))
+		if self.layout == LAYOUT_MIN_SELECTION:
+			iterBatches = iter_min_selected_waveform_batches
+		else:
+			iterBatches = iter_telescope_waveform_batches
+		for telId in tel_ids:
+			telNode = self.run.get_node(self.telescope_node, 'Tel_' + str(telId))
+			for tabEventId, tabWaveform in iterBatches(telNode, batch_size, self.is_slice_pixel):
+				yield telId, tabEventId, tabWaveform
+
+
+	def _get_lazy_telescope_maps(self, data, telescopeId):
+		# The R1 waveform is computed only for the cameras with two gains
+		if self._get_telescope_reader(telescopeId, False).waveformLo is None:
+			return [data.r0.tel]
+		return [data.r0.tel, data.r1.tel]
+
+
+	def _read_telescope_event(self, telescopeId, telescopeIndex, event, isRandomAccess):
+		telReader = self._get_telescope_reader(telescopeId, isRandomAccess)
+		return telReader.read_hi(event), telReader.read_lo(event)
+
+
+	def _fill_telescope_waveform(self, data, telescopeId, waveforms, isRandomAccess):
+		matWaveform, waveformLo = waveforms
+		matSignalPSHi = matWaveform.swapaxes(0, 1)
+		if waveformLo is not None:
+			matSignalPSLo = waveformLo.swapaxes(0, 1)
+			tabHiLo = np.stack((matSignalPSHi, matSignalPSLo))
+			data.r0.tel[telescopeId].waveform = tabHiLo
+
+			calibration = self._get_event_r1_calibration(data, telescopeId)
+			if isRandomAccess or not self.reuse_r1_buffer:
+				# The containers of the random access are not reused
+				data.r1.tel[telescopeId].waveform = calibration.calibrate(tabHiLo)
+			else:
+				data.r1.tel[telescopeId].waveform = calibration.calibrate_in_buffer(tabHiLo)
+
+		else:
+			data.r0.tel[telescopeId].waveform = np.expand_dims(matSignalPSHi, axis=0)
+		
+		#data.r0.tel[telescopeId].image= matSignalPSHi.sum(axis=2)
+		#data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
+		#data.r0.tel[telescopeId].trig_pix_id = file.get_trig_pixels(telescopeId)
+
+	def _get_instrument_nodes(self):
+		# The subarray also depends on the type, index and id of the telescope groups
+		listNode = ['/instrument']
+		for telNode in self.run.walk_nodes(self.telescope_node, 'Group'):
+			if 'telType' in telNode:
+				listNode += [telNode.telType, telNode.telIndex, telNode.telId]
+		return listNode
 
 	def _build_subarray_info(self, run):
 		"""
@@ -230,44 +346,28 @@ class MCHDF5EventSourceV2(EventSource):
 		
 		tabPoslXYZ = np.ascontiguousarray(np.vstack((tabPosTelX, tabPosTelY, tabPosTelZ)).T)
 		
-		'''
-		# Correspance HiPeData.Telscope.Type and camera name
-		# 0  LSTCam, 1 NectarCam, 2 FlashCam, 3 SCTCam,
-		# 4 ASTRICam, 5 DigiCam, 6 CHEC
-		'''
-		mapping_camera = {0: 'LSTCam', 1: 'NectarCam', 2: 'FlashCam',
-				3: 'SCTCam', 4: 'ASTRICam', 5: 'DigiCam',
-				6: 'CHEC'}
-		
-		mapping_telName = {0:'LST', 1:'MST', 2:'MST', 3:'MST', 4:'SST-ASTRI', 5:'SST-1M', 6:'SST-2M'}
-		
-		for telNode, camNode in zip(self.run.walk_nodes('/r1', 'Group'), self.run.walk_nodes('/instrument/subarray/telescope/camera', 'Group')):
-			try:
-				telType = uint64(telNode.telType.read())
-				telIndex = uint64(telNode.telIndex.read())
-				telId = uint64(telNode.telId.read())
-				
-				cameraName = mapping_camera[telType]
-				telName = mapping_telName[telType]
-				camera = CameraGeometry.from_name(cameraName)
-				camera.cam_id = cameraName
-				
-				foclen = tabFocalTel[telIndex] * u.m
-				
-				tel_pos = tabPoslXYZ[telIndex] * u.m
-				
-				camera.pix_x = camNode.pix_x.read() * u.m
-				camera.pix_y = camNode.pix_y.read() * u.m
-				
-				optic = OpticsDescription.from_name(telName)
-				optic.equivalent_focal_length = foclen
-				telescope_description = TelescopeDescription(telName, telName, optics=optic, camera=camera)
-
-				#tel.optics.mirror_area = mirror_area
-				#tel.optics.num_mirror_tiles = num_tiles
-				subarray.tels[telId] = telescope_description
-				subarray.positions[telId] = tel_pos
-			except tables.exceptions.NoSuchNodeError as e:
-				pass
+		cameraNode = run.get_node(CAMERA_NODE)
+		# Camera groups with the pixel positions, in the same order as the telescope groups
+		listCamNode = [camNode for camNode in run.walk_nodes(cameraNode, 'Group') if 'pix_x' in camNode]
+		listTelNode = [telNode for telNode in run.walk_nodes(self.telescope_node, 'Group') if 'telType' in telNode]
+		telescopeCache = TelescopeDescriptionCache()
+		for telPosition, telNode in enumerate(listTelNode):
+			telType = int(telNode.telType.read())
+			telIndex = int(telNode.telIndex.read())
+			telId = uint64(telNode.telId.read())
+			
+			cameraName = MAPPING_CAMERA[telType]
+			if cameraName in cameraNode:
+				camNode = cameraNode._f_get_child(cameraName)
+			else:
+				camNode = listCamNode[telPosition]
+			
+			telescope_description = telescopeCache.get_telescope(telType, tabFocalTel[telIndex],
+				lambda camNode=camNode: (camNode.pix_x.read(), camNode.pix_y.read()))
+			
+			#tel.optics.mirror_area = mirror_area
+			#tel.optics.num_mirror_tiles = num_tiles
+			subarray.tels[telId] = telescope_description
+			subarray.positions[telId] = tabPoslXYZ[telIndex] * u.m
 
 		return subarray
@@ -0,0 +1,610 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.io.eventsource import EventSource
+from ctapipe.io.containers import DataContainer
+from ctapipe.core.traits import Bool, Int, Unicode
+from numpy import array, int16
+import threading
+import tables
+
+from .tools.lazy_telescope_map import LazyTelescopeMap
+from .tools.prefetch import PrefetchReader
+from .tools.async_reader import ExecutorReader, ReadAheadIterator
+from .tools.event_index import get_shard_range
+from .tools.subarray_cache import get_cached_subarray, get_shared_subarray, read_subarray_blob, get_instrument_key
+from .tools.mc_selection import create_condition_index, read_selected_event_ids
+
+__all__ = ['MCHDF5IndexedEventSource']
+
+
+class MCHDF5IndexedEventSource(EventSource):
+	"""
+	Base of the MCHDF5 event sources which store the data per telescope.
+	The events are accessed through an EventIndex, so they can be
+	iterated but also accessed by position (source[i]) or by id
+	(source.get_event(event_id)) without reading the previous events.
+	The events can be restricted to a range of positions (event_start,
+	event_stop) and split into shards (shard_index, num_shards) to share a
+	run between several processes : only the waveforms of the selected
+	events are read.
+	The events can also be iterated from asyncio (async for event in
+	source) : the reads run in an executor and never block the event loop.
+
+	The derived classes have to define :
+		_create_event_index : create the EventIndex of the run (of the given telescopes, stopped after the first events)
+		_build_subarray_info : create the SubarrayDescription of the run
+		_get_instrument_nodes : nodes used by _build_subarray_info
+		_fill_run_data : fill the information valid for the whole run
+		_fill_mc_event : fill the Monte-Carlo truth of an event
+		_read_telescope_event : read the waveforms of a telescope event
+		_fill_telescope_waveform : fill the container with the read waveforms
+	"""
+	origin = "mchdf5"
+	# Table of the Monte-Carlo truth of the events and its event id column
+	mc_event_table = None
+	mc_event_id_column = "event_id"
+	# Table of the configuration of the run (with the obs_id column if the file stores it)
+	run_config_table = None
+
+	lazy_waveform = Bool(
+		False,
+		help='Read and calibrate the waveforms of a telescope only when '
+			 'data.r0.tel[tel_id] or data.r1.tel[tel_id] is accessed'
+	).tag(config=True)
+
+	prefetch_events = Int(
+		0,
+		help='Number of events read in advance by a background thread during the '
+			 'iteration (0 to read the events in the consumer thread). '
+			 'Not used with lazy_waveform. The asynchronous iteration (async for) '
+			 'reads max(1, prefetch_events) events in advance'
+	).tag(config=True)
+
+	prefetch_bytes = Int(
+		0,
+		help='Maximum size in bytes of the waveforms read in advance (0 for no limit)'
+	).tag(config=True)
+
+	mc_selection = Unicode(
+		None,
+		allow_none=True,
+		help='PyTables condition on the columns of the Monte-Carlo event table '
+			 '(ex: "mc_energy > 1.0"), only the matching events are read'
+	).tag(config=True)
+
+	mc_selection_index = Bool(
+		True,
+		help='Create the index of the columns used by mc_selection if they are '
+			 'not indexed (needs write access to the file, the events are selected '
+			 'without index otherwise). A file whose columns are indexed is not modified'
+	).tag(config=True)
+
+	full_trigger_pattern = Bool(
+		False,
+		help='With allowed_tels, fill data.trig.tels_with_trigger with all the telescopes which '
+			 'have triggered on the event : the index of all the telescopes is built on the first '
+			 'event. Otherwise only the allowed telescopes of the event are given. The R0-V2 files '
+			 'store the trigger pattern of the events, it is always complete'
+	).tag(config=True)
+
+	subarray_blob = Bool(
+		False,
+		help='Read the subarray stored in the file by tools.subarray_cache.write_subarray_blob '
+			 'if it exists (the blob is pickled, use it only with trusted files)'
+	).tag(config=True)
+
+	event_start = Int(
+		0,
+		help='Position of the first event of the run to be read'
+	).tag(config=True)
+
+	event_stop = Int(
+		None,
+		allow_none=True,
+		help='Position of the last event of the run to be read (excluded, None for the end of the run)'
+	).tag(config=True)
+
+	shard_index = Int(
+		0,
+		help='Index of the shard of events to be read, in [0, num_shards)'
+	).tag(config=True)
+
+	num_shards = Int(
+		1,
+		help='Number of shards the events (between event_start and event_stop) are split into. '
+			 'The shards are consecutive ranges of events and their union is the whole selection'
+	).tag(config=True)
+
+	def __init__(self, config=None, parent=None, **kwargs):
+		super().__init__(config=config, parent=parent, **kwargs)
+
+		self.metadata['is_simulation'] = True
+
+		# Create MCRun isntance and load file into memory
+		get_shard_range(0, self.shard_index, self.num_shards)  # check the shard before opening the file
+		if self.mc_selection and self.mc_selection_index:
+			# The index has to be created before the file is opened in read mode, the file is modified only if an
+			# index is missing
+			if not create_condition_index(self.input_url, self.mc_event_table, self.mc_selection):
+				self.log.warning("The columns of mc_selection are not indexed in %s and the file cannot be modified, "
+								 "the events are selected without index", self.input_url)
+		self.run = tables.open_file(self.input_url, "r")
+		self._events = None
+		self._triggerEvents = None
+		self._subarray = None
+		self._obsId = None
+		# PyTables is not thread safe, the prefetch thread and the consumer never read at the same time
+		self._readLock = threading.RLock()
+
+	@staticmethod
+	def is_compatible(file_path):
+		return False
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		pass
+
+	def close(self):
+		"""
+		Close the file of the source
+		"""
+		self.run.close()
+
+	@property
+	def obs_id(self):
+		"""
+		Id of the observation of the run (0 if the file does not store it)
+		"""
+		if self._obsId is None:
+			obsId = self._read_obs_id()
+			self._obsId = 0 if obsId is None else obsId
+		return self._obsId
+
+	def _read_obs_id(self):
+		"""
+		Read the id of the observation in the configuration of the run
+		Returns
+		-------
+		obs_id of the run, None if the file does not store it
+		"""
+		if self.run_config_table is None or self.run_config_table not in self.run:
+			return None
+		table = self.run.get_node(self.run_config_table)
+		if "obs_id" not in table.colnames or table.nrows == 0:
+			return None
+		return int(table.col("obs_id")[0])
+
+	@property
+	def events(self):
+		"""
+		EventIndex of the run, created on the first access
+		"""
+		if self._events is None:
+			# HiPeData arranges data per telescope and not by event like simtel
+			# We need to first create an index of the events.
+			#   event -> ids, indexes and rows of the triggered telescopes
+			events = self._create_event_index(self._get_allowed_tel_ids(), self._get_event_limit())
+			if self.mc_selection:
+				events = events.select_event_ids(read_selected_event_ids(self.run.get_node(self.mc_event_table),
+																		  self.mc_selection, self.mc_event_id_column))
+			events = self._select_shard(events)
+			if self.max_events:
+				events = events.select(0, self.max_events)
+			self._events = events
+		return self._events
+
+	def _get_event_limit(self):
+		"""
+		Number of events of the run needed by the source (None for all the events).
+		The event index is built only until these events are found, unless the
+		events are selected by mc_selection or split into shards
+		"""
+		if self.mc_selection or self.num_shards > 1:
+			return None
+		nbMaxEvent = self.event_stop
+		if self.max_events:
+			nbMaxEvent = self.event_start + self.max_events if nbMaxEvent is None else \
+				min(nbMaxEvent, self.event_start + self.max_events)
+		return nbMaxEvent
+
+	def _get_allowed_tel_ids(self):
+		"""
+		Ids of the telescopes to be read (None for all the telescopes).
+		The event index is built only with these telescopes, so the events
+		without any of them are not read at all
+		"""
+		if len(self.allowed_tels) > 0:
+			return set(int(telId) for telId in self.allowed_tels)
+		return None
+
+	def _select_shard(self, events):
+		"""
+		Keep the events of the shard in the event range of the source
+		"""
+		first = self.event_start
+		last = len(events) if self.event_stop is None else self.event_stop
+		if first == 0 and last >= len(events) and self.num_shards == 1:
+			return events
+		events = events.select(first, last)
+		first, last = get_shard_range(len(events), self.shard_index, self.num_shards)
+		return events.select(first, last)
+
+	@property
+	def subarray_info(self):
+		"""
+		SubarrayDescription of the run, created on the first access
+		"""
+		if self._subarray is None:
+			# The subarray is built once per file and shared by the sources of the file
+			self._subarray = get_cached_subarray(self.input_url, self._load_subarray_info)
+		return self._subarray
+
+	def get_instrument_key(self):
+		"""
+		Key of the instrument description of the file : the files with the
+		same key have the same SubarrayDescription, so it can be shared
+		"""
+		return get_instrument_key(self.run, self._get_instrument_nodes())
+
+	def set_run_description(self, events=None, obs_id=None, instrument_key=None):
+		"""
+		Use a description of the run read elsewhere (by the multi-file source for
+		example) instead of reading it from the file
+		Parameters
+		----------
+		events: EventIndex of the run, used instead of building it (None to build it on the first access)
+		obs_id: id of the observation of the run (None to read it from the file)
+		instrument_key: key of the instrument description of the file (see get_instrument_key),
+			the SubarrayDescription is shared by the sources with the same key (None to use the cache per file)
+		"""
+		if events is not None:
+			self._events = events
+		if obs_id is not None:
+			self._obsId = int(obs_id)
+		if instrument_key is not None:
+			self._subarray = get_shared_subarray(instrument_key, self._load_subarray_info)
+
+	def _get_instrument_nodes(self):
+		raise NotImplementedError()
+
+	def _load_subarray_info(self):
+		if self.subarray_blob:
+			subarray = read_subarray_blob(self.run)
+			if subarray is not None:
+				return subarray
+		return self._build_subarray_info(self.run)
+
+	def __len__(self):
+		"""
+		Number of events of the source (the event index is limited by max_events).
+		Events without any of the allowed_tels are not in the source
+		"""
+		return len(self.events)
+
+	def __getitem__(self, position):
+		"""
+		Get the event at the given position, without reading the previous ones
+		Parameters
+		----------
+		position: position of the event in the source (negative values count from the end)
+
+		Returns
+		-------
+		DataContainer of the event (a new container for each call)
+		"""
+		nbEvent = len(self)
+		if position < 0:
+			position += nbEvent
+		if position < 0 or position >= nbEvent:
+			raise IndexError("Event position {} out of range [0, {})".format(position, nbEvent))
+		data = self._create_data_container()
+		with self._readLock:
+			self._fill_event(data, position, position, True)
+		return data
+
+	def get_event(self, event_id):
+		"""
+		Get the event with the given id, without reading the previous ones
+		Parameters
+		----------
+		event_id: id of the event
+
+		Returns
+		-------
+		DataContainer of the event (a new container for each call)
+		"""
+		position = self.events.find_event(event_id)
+		data = self._create_data_container()
+		with self._readLock:
+			self._fill_event(data, position, position, True)
+		return data
+
+	def __aiter__(self):
+		"""
+		Asynchronous iteration over the events (async for event in source),
+		with the default executor of the event loop, see iter_events_async
+		"""
+		return self.iter_events_async()
+
+	async def iter_events_async(self, executor=None):
+		"""
+		Asynchronous iteration over the events. This is a non-blocking wrapper of
+		the iteration : the waveforms of the next max(1, prefetch_events) events are
+		read in the executor and the container is filled in the executor, so the
+		event loop is never blocked by the HDF5 reads, the decompression or the
+		calibration. The file is shared by the executor threads (PyTables is not
+		thread safe), so the reads are serialized and do not overlap each other,
+		only the processing of the previous events. The waveforms are always read,
+		lazy_waveform is not used
+		Parameters
+		----------
+		executor: concurrent.futures.Executor to be used (None for the default executor of the event loop)
+
+		Returns
+		-------
+		asynchronous generator of DataContainer (the same container is filled for each event)
+		"""
+		reader = ExecutorReader(executor)
+		data = await reader.run(self._create_data_container)
+		# The event index is created in the executor on the first access
+		nbEvent = await reader.run(len, self)
+
+		async def read_event(position):
+			return await reader.run(self._read_event_waveforms, position)
+
+		counter = 0
+		readAhead = ReadAheadIterator(range(nbEvent), read_event, max(1, self.prefetch_events))
+		try:
+			async for position, listWaveform in readAhead:
+				if listWaveform is None:
+					continue  # skip event
+				if not await reader.run(self._fill_event_locked, data, position, counter, listWaveform):
+					continue  # skip event
+				yield data
+				counter += 1
+		finally:
+			# Cancel the reads in advance if the iteration is stopped
+			await readAhead.aclose()
+
+	async def get_event_async(self, event_id, executor=None):
+		"""
+		Get the event with the given id without blocking the event loop, see get_event
+		Parameters
+		----------
+		event_id: id of the event
+		executor: concurrent.futures.Executor to be used (None for the default executor of the event loop)
+
+		Returns
+		-------
+		DataContainer of the event (a new container for each call)
+		"""
+		return await ExecutorReader(executor).run(self.get_event, event_id)
+
+	def _fill_event_locked(self, data, position, counter, listWaveform):
+		with self._readLock:
+			return self._fill_event(data, position, counter, False, listWaveform)
+
+	def _create_data_container(self):
+		"""
+		Create a DataContainer with the information valid for the whole run
+		"""
+		data = DataContainer()
+		data.meta['origin'] = self.origin
+
+		# some hessio_event_source specific parameters
+		data.meta['input_url'] = self.input_url
+		data.meta['max_events'] = self.max_events
+
+		'''
+		MC data are valid for the whole run
+		'''
+		data.mc.tel.clear()  # clear the previous telescopes
+		self._fill_run_data(data)
+		if self.lazy_waveform:
+			data.r0.tel = LazyTelescopeMap(data.r0.tel.default_factory)
+			data.r1.tel = LazyTelescopeMap(data.r1.tel.default_factory)
+		data.inst.subarray = self.subarray_info
+		return data
+
+	def _generator(self):
+		# the container is initialized once, and data is replaced within
+		# it after each yield
+		counter = 0
+		data = self._create_data_container()
+		if self.prefetch_events > 0 and not self.lazy_waveform:
+			yield from self._prefetch_generator(data)
+			return
+		for position in range(len(self.events)):
+			if not self._fill_event(data, position, counter, False):
+				continue  # skip event
+			yield data
+			counter += 1
+		return
+
+	def _prefetch_generator(self, data):
+		"""
+		Iterate over the events while a background thread reads the
+		waveforms of the next events
+		"""
+		counter = 0
+		prefetchReader = PrefetchReader(range(len(self.events)), self._read_event_waveforms,
+										self.prefetch_events, self.prefetch_bytes)
+		try:
+			for position, listWaveform in prefetchReader:
+				with self._readLock:
+					isSelected = self._fill_event(data, position, counter, False, listWaveform)
+				if not isSelected:
+					continue  # skip event
+				yield data
+				counter += 1
+		finally:
+			prefetchReader.close()
+
+	def _read_event_waveforms(self, position):
+		"""
+		Read the waveforms of the telescopes of an event (called by the prefetch
+		thread and by the executor of the asynchronous iteration)
+		Parameters
+		----------
+		position: position of the event in the EventIndex
+
+		Returns
+		-------
+		list of the waveforms of the telescopes of the event,
+		None if the event has none of the allowed telescopes
+		"""
+		tabTelId, tabTelIndex, tabRow = self.events.get_event_telescopes(position)
+		if len(self.allowed_tels) > 0 and len(set(tabTelId.tolist()) & self.allowed_tels) == 0:
+			return None
+		with self._readLock:
+			return [self._read_telescope_event(telescopeId, telescopeIndex, row, False)
+					for telescopeId, telescopeIndex, row in zip(tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())]
+
+	def _fill_event(self, data, position, counter, isRandomAccess, listWaveform=None):
+		"""
+		Fill the container with the event at the given position
+		Parameters
+		----------
+		data: DataContainer to be filled
+		position: position of the event in the EventIndex
+		counter: value of data.count
+		isRandomAccess: True if the event is not read in the iteration order
+		listWaveform: waveforms of the telescopes already read by _read_event_waveforms (None to read them)
+
+		Returns
+		-------
+		False if the event has none of the allowed telescopes, True otherwise
+		"""
+		event_id = self.events.event_id[position]
+		tabTelId, tabTelIndex, tabRow = self.events.get_event_telescopes(position)
+
+		obs_id = self.obs_id
+		tels_with_data = set(tabTelId.tolist())
+		data.count = counter
+		data.r0.obs_id = obs_id
+		data.r0.event_id = event_id
+		data.r0.tels_with_data = tels_with_data
+		data.r1.obs_id = obs_id
+		data.r1.event_id = event_id
+		data.r1.tels_with_data = tels_with_data
+		data.dl0.obs_id = obs_id
+		data.dl0.event_id = event_id
+		data.dl0.tels_with_data = tels_with_data
+
+		# handle telescope filtering by taking the intersection of
+		# tels_with_data and allowed_tels
+		isSelected = True
+		if len(self.allowed_tels) > 0:
+			selected = tels_with_data & self.allowed_tels
+			isSelected = len(selected) > 0
+			if not isSelected and not isRandomAccess:
+				return False
+			data.r0.tels_with_data = selected
+			data.r1.tels_with_data = selected
+			data.dl0.tels_with_data = selected
+
+		# The index of the allowed telescopes does not give the other triggered telescopes
+		if len(self.allowed_tels) > 0:
+			tels_with_trigger = self._read_tels_with_trigger(position, tabTelId)
+		else:
+			tels_with_trigger = tabTelId
+		data.trig.tels_with_trigger = array(tels_with_trigger, dtype=int16)
+
+		'''
+		time_s, time_ns = file.get_central_event_gps_time()
+		data.trig.gps_time = Time(time_s * u.s, time_ns * u.ns, format='unix', scale='utc')
+		'''
+		self._fill_mc_event(data, position)
+
+		# this should be done in a nicer way to not re-allocate the
+		# data each time (right now it's just deleted and garbage
+		# collected)
+
+		data.r0.tel.clear()
+		data.r1.tel.clear()
+		data.dl0.tel.clear()
+		data.dl1.tel.clear()
+
+		if listWaveform is not None:
+			for telescopeId, waveforms in zip(tabTelId.tolist(), listWaveform):
+				self._fill_telescope_waveform(data, telescopeId, waveforms, isRandomAccess)
+			return isSelected
+
+		for telescopeId, telescopeIndex, row in zip(tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist()):
+			if self.lazy_waveform:
+				self._set_lazy_telescope_event(data, telescopeId, telescopeIndex, row, isRandomAccess)
+			else:
+				self._fill_telescope_event(data, telescopeId, telescopeIndex, row, isRandomAccess)
+
+		return isSelected
+
+	def _set_lazy_telescope_event(self, data, telescopeId, telescopeIndex, row, isRandomAccess):
+		"""
+		Register the telescope event in the lazy telescope maps, so it is filled
+		only on the first access to one of them
+		"""
+		listTelMap = self._get_lazy_telescope_maps(data, telescopeId)
+
+		def load_telescope_event(telId):
+			# The other maps must not load the same telescope event again
+			for telMap in listTelMap:
+				telMap.pending.pop(telId, None)
+			with self._readLock:
+				self._fill_telescope_event(data, telId, telescopeIndex, row, isRandomAccess)
+
+		for telMap in listTelMap:
+			telMap.set_loader(telescopeId, load_telescope_event)
+
+	def _get_lazy_telescope_maps(self, data, telescopeId):
+		"""
+		Telescope maps filled by _fill_telescope_event for the given telescope
+		"""
+		return [data.r0.tel, data.r1.tel]
+
+	def _read_tels_with_trigger(self, position, tabTelId):
+		"""
+		Ids of the telescopes which have triggered on the event at the given
+		position when allowed_tels is used. By default the allowed telescopes
+		of the event (tabTelId), or with full_trigger_pattern the telescopes of
+		the event in the index of all the telescopes, built on the first call
+		"""
+		if not self.full_trigger_pattern:
+			return tabTelId
+		if self._triggerEvents is None:
+			self._triggerEvents = self._create_event_index(None)
+		tabTelId, tabTelIndex, tabRow = self._triggerEvents.get_event_telescopes(
+			self._triggerEvents.find_event(self.events.event_id[position]))
+		return tabTelId
+
+	def _create_event_index(self, allowedTelId, nbMaxEvent=None):
+		"""
+		Create the EventIndex of the run
+		Parameters
+		----------
+		allowedTelId: ids of the telescopes to be used (None for all the telescopes)
+		nbMaxEvent: number of events needed (None for all the events), the index
+			can be built only until its first nbMaxEvent events are found
+		"""
+		raise NotImplementedError()
+
+	def _build_subarray_info(self, run):
+		raise NotImplementedError()
+
+	def _fill_run_data(self, data):
+		raise NotImplementedError()
+
+	def _fill_mc_event(self, data, position):
+		raise NotImplementedError()
+
+	def _fill_telescope_event(self, data, telescopeId, telescopeIndex, row, isRandomAccess):
+		waveforms = self._read_telescope_event(telescopeId, telescopeIndex, row, isRandomAccess)
+		self._fill_telescope_waveform(data, telescopeId, waveforms, isRandomAccess)
+
+	def _read_telescope_event(self, telescopeId, telescopeIndex, row, isRandomAccess):
+		raise NotImplementedError()
+
+	def _fill_telescope_waveform(self, data, telescopeId, waveforms, isRandomAccess):
+		raise NotImplementedError()
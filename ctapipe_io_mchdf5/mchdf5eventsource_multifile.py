@@ -0,0 +1,328 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
+from .mchdf5eventsource_V2Transpose import MCHDF5EventSourceV2Transpose
+from .mchdf5eventsource_R0V2 import MCHDF5EventSourceR0V2
+from .mchdf5eventsource_DL0V1 import MCHDF5EventSourceDL0V1
+from .mchdf5eventsource_DL0V2 import MCHDF5EventSourceDL0V2
+from .tools.event_index import save_event_index, load_event_index
+from .tools.subarray_cache import get_file_key
+
+__all__ = ['MCHDF5MultiFileEventSource']
+# Sources of the files which can be chained, the first compatible one reads the file
+LIST_SOURCE_CLASS = [MCHDF5EventSourceV2, MCHDF5EventSourceV2Transpose, MCHDF5EventSourceR0V2,
+					 MCHDF5EventSourceDL0V1, MCHDF5EventSourceDL0V2]
+
+
+def expand_input_urls(input_urls):
+	"""
+	Get the files of a production
+	Parameters
+	----------
+	input_urls: path or glob pattern, or list of paths and glob patterns
+
+	Returns
+	-------
+	list of the files, the files of a pattern are sorted by name
+	"""
+	if isinstance(input_urls, str):
+		input_urls = [input_urls]
+	listFileName = []
+	for url in input_urls:
+		url = os.path.expanduser(os.path.expandvars(str(url)))
+		if glob.has_magic(url):
+			listMatch = sorted(glob.glob(url))
+			if len(listMatch) == 0:
+				raise FileNotFoundError("No file matches {}".format(url))
+			listFileName += listMatch
+		else:
+			listFileName.append(url)
+	return listFileName
+
+
+def get_source_class(fileName):
+	"""
+	Get the event source which can read a file
+	"""
+	for sourceClass in LIST_SOURCE_CLASS:
+		if sourceClass.is_compatible(fileName):
+			return sourceClass
+	raise ValueError("No MCHDF5 event source can read the file {}".format(fileName))
+
+
+def get_index_cache_name(indexCacheDir, sourceClass, fileName, sourceOptions):
+	"""
+	Name of the saved event index of a file, which changes with the file and the options of its source
+	"""
+	listOption = sorted((name, repr(sorted(value)) if isinstance(value, (set, frozenset)) else repr(value))
+						for name, value in sourceOptions.items())
+	key = repr((get_file_key(fileName), sourceClass.__name__, listOption))
+	return os.path.join(indexCacheDir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+
+def read_file_description(fileName, config, sourceOptions, indexCacheDir=None):
+	"""
+	Read what the multi-file source needs to know about a file (called in the worker processes)
+	Parameters
+	----------
+	fileName: name of the file
+	config: configuration of the sources
+	sourceOptions: traits of the sources
+	indexCacheDir: directory of the saved event indexes (None to always build the index)
+
+	Returns
+	-------
+	(source class, EventIndex, key of the instrument description, obs_id or None if the file does not store it)
+	"""
+	sourceClass = get_source_class(fileName)
+	source = sourceClass(config=config, input_url=fileName, **sourceOptions)
+	try:
+		cacheName = None
+		if indexCacheDir is not None:
+			cacheName = get_index_cache_name(indexCacheDir, sourceClass, fileName, sourceOptions)
+		if cacheName is not None and os.path.exists(cacheName):
+			events = load_event_index(cacheName)
+		else:
+			events = source.events
+			if cacheName is not None:
+				# Another process never reads a partially written index
+				tmpName = cacheName[:-len(".npz")] + ".{}.tmp.npz".format(os.getpid())
+				save_event_index(tmpName, events)
+				os.replace(tmpName, cacheName)
+		return sourceClass, events, source.get_instrument_key(), source._read_obs_id()
+	finally:
+		source.close()
+
+
+def check_fallback_obs_ids(listObsId, listFileName):
+	"""
+	Check the positions in the chain given as obs_id to the files which do not store
+	their obs_id are not the obs_id stored by other files
+	Parameters
+	----------
+	listObsId: obs_id stored by each file (None if the file does not store it)
+	listFileName: names of the files
+	"""
+	dicoStoredObsId = dict()
+	for fileName, obsId in zip(listFileName, listObsId):
+		if obsId is not None:
+			dicoStoredObsId.setdefault(int(obsId), fileName)
+	for fileIndex, (fileName, obsId) in enumerate(zip(listFileName, listObsId)):
+		if obsId is None and fileIndex in dicoStoredObsId:
+			raise ValueError("The file {} has no obs_id and its position {} in the chain is the obs_id of the file {}"
+							 .format(fileName, fileIndex, dicoStoredObsId[fileIndex]))
+
+
+class MCHDF5MultiFileEventSource(object):
+	"""
+	Chain the files of a production (R1-V2, R0-V2, DL0 ...) in one source.
+	The event indexes of the files are built in parallel by worker processes
+	(or loaded from index_cache_dir) before the iteration. The files with the
+	same instrument description share one SubarrayDescription. The events are
+	iterated file after file and they can be accessed by global position
+	(source[i]) or by (obs_id, event_id) with get_event. The files which do not
+	store their obs_id get their position in the chain as obs_id, a ValueError
+	is raised if this position is also the obs_id stored by another file.
+	The files are opened on demand, at most max_open_files at once.
+	"""
+
+	def __init__(self, input_urls, nb_worker=None, index_cache_dir=None, max_open_files=16, max_events=None,
+				 config=None, **kwargs):
+		"""
+		Parameters
+		----------
+		input_urls: path or glob pattern, or list of paths and glob patterns
+		nb_worker: number of processes which build the event indexes
+			(None for the number of CPUs, 1 to build them in the current process)
+		index_cache_dir: directory where the event indexes are saved and loaded (None to always build them)
+		max_open_files: maximum number of files opened at once
+		max_events: maximum number of events of the chain (None for all the events)
+		config: configuration of the sources of the files
+		kwargs: traits of the sources of the files (allowed_tels, mc_selection, read_ahead_events, ...)
+		"""
+		self.input_urls = expand_input_urls(input_urls)
+		self.max_events = max_events
+		self.max_open_files = max(1, int(max_open_files))
+		self._config = config
+		self._sourceOptions = kwargs
+		if index_cache_dir is not None:
+			os.makedirs(index_cache_dir, exist_ok=True)
+		listDescription = self._read_file_descriptions(nb_worker, index_cache_dir)
+		self._sourceClass = [sourceClass for sourceClass, events, instrumentKey, obsId in listDescription]
+		self._events = [events for sourceClass, events, instrumentKey, obsId in listDescription]
+		self._instrumentKey = [instrumentKey for sourceClass, events, instrumentKey, obsId in listDescription]
+		self.obs_ids = np.array([fileIndex if obsId is None else obsId
+								 for fileIndex, (sourceClass, events, instrumentKey, obsId) in
+								 enumerate(listDescription)], dtype=np.uint64)
+		check_fallback_obs_ids([obsId for sourceClass, events, instrumentKey, obsId in listDescription],
+							   self.input_urls)
+		# Global position of the first event of each file
+		self._fileOffset = np.zeros(len(self.input_urls) + 1, dtype=np.int64)
+		np.cumsum([len(events) for events in self._events], out=self._fileOffset[1:])
+		self._sources = OrderedDict()
+		self._pinnedFiles = dict()
+
+	def _read_file_descriptions(self, nbWorker, indexCacheDir):
+		if nbWorker is None:
+			nbWorker = os.cpu_count() or 1
+		nbWorker = max(1, min(int(nbWorker), len(self.input_urls)))
+		listArgs = [(fileName, self._config, self._sourceOptions, indexCacheDir) for fileName in self.input_urls]
+		if nbWorker == 1:
+			return [read_file_description(*args) for args in listArgs]
+		with ProcessPoolExecutor(nbWorker) as executor:
+			return list(executor.map(read_file_description, *zip(*listArgs)))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def close(self):
+		"""
+		Close the opened files
+		"""
+		for source in self._sources.values():
+			source.close()
+		self._sources.clear()
+
+	def __len__(self):
+		"""
+		Number of events of the chain (limited by max_events)
+		"""
+		nbEvent = int(self._fileOffset[-1])
+		if self.max_events:
+			return min(nbEvent, self.max_events)
+		return nbEvent
+
+	def get_source(self, file_index):
+		"""
+		Get the source of a file of the chain, opened if needed. Its event
+		index, obs_id and subarray are the ones of the chain
+		Parameters
+		----------
+		file_index: position of the file in input_urls
+
+		Returns
+		-------
+		event source of the file
+		"""
+		source = self._sources.get(file_index)
+		if source is not None:
+			self._sources.move_to_end(file_index)
+			return source
+		source = self._sourceClass[file_index](config=self._config, input_url=self.input_urls[file_index],
+											   **self._sourceOptions)
+		source.set_run_description(self._events[file_index], self.obs_ids[file_index], self._instrumentKey[file_index])
+		self._sources[file_index] = source
+		self._close_unused_sources()
+		return source
+
+	def _close_unused_sources(self):
+		"""
+		Close the least recently used files above max_open_files, except the files being iterated
+		"""
+		for fileIndex in list(self._sources.keys()):
+			if len(self._sources) <= self.max_open_files:
+				return
+			if self._pinnedFiles.get(fileIndex, 0) == 0:
+				self._sources.pop(fileIndex).close()
+
+	def __iter__(self):
+		counter = 0
+		for fileIndex in range(len(self.input_urls)):
+			if len(self._events[fileIndex]) == 0:
+				continue
+			# The file stays open during its iteration
+			self._pinnedFiles[fileIndex] = self._pinnedFiles.get(fileIndex, 0) + 1
+			try:
+				for event in self.get_source(fileIndex):
+					if self.max_events and counter >= self.max_events:
+						return
+					event.count = counter
+					yield event
+					counter += 1
+			finally:
+				self._pinnedFiles[fileIndex] -= 1
+				self._close_unused_sources()
+
+	def __getitem__(self, position):
+		"""
+		Get the event at the given global position, without reading the previous ones
+		Parameters
+		----------
+		position: position of the event in the chain (negative values count from the end)
+
+		Returns
+		-------
+		DataContainer of the event (a new container for each call)
+		"""
+		nbEvent = len(self)
+		if position < 0:
+			position += nbEvent
+		if position < 0 or position >= nbEvent:
+			raise IndexError("Event position {} out of range [0, {})".format(position, nbEvent))
+		fileIndex = int(np.searchsorted(self._fileOffset, position, side='right')) - 1
+		data = self.get_source(fileIndex)[position - int(self._fileOffset[fileIndex])]
+		data.count = position
+		return data
+
+	def find_event(self, obs_id, event_id):
+		"""
+		Find the global position of an event
+		Parameters
+		----------
+		obs_id: id of the observation of the event
+		event_id: id of the event
+
+		Returns
+		-------
+		position of the event in the chain
+
+		Raises
+		------
+		KeyError if the event is not in the chain
+		"""
+		for fileIndex in np.flatnonzero(self.obs_ids == obs_id).tolist():
+			try:
+				position = int(self._fileOffset[fileIndex]) + self._events[fileIndex].find_event(event_id)
+			except KeyError:
+				continue
+			if position < len(self):
+				return position
+		raise KeyError("Event ({}, {}) is not in the files".format(obs_id, event_id))
+
+	def get_event(self, obs_id, event_id):
+		"""
+		Get the event with the given (obs_id, event_id), without reading the previous ones
+		Returns
+		-------
+		DataContainer of the event (a new container for each call)
+		"""
+		return self[self.find_event(obs_id, event_id)]
+
+	def get_event_keys(self):
+		"""
+		Keys of the events of the chain, in iteration order
+		Returns
+		-------
+		(obs_id, event_id) tables of the events
+		"""
+		tabNbEvent = np.diff(self._fileOffset)
+		tabObsId = np.repeat(self.obs_ids, tabNbEvent)
+		tabEventId = np.concatenate([np.asarray(events.event_id, dtype=np.uint64) for events in self._events] +
+									[np.zeros(0, dtype=np.uint64)])
+		nbEvent = len(self)
+		return tabObsId[:nbEvent], tabEventId[:nbEvent]
@@ -9,6 +9,7 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.copy_sort import create_all_telescope_sorted
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
 
 
 def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName, isStoreSlicePixel, injunctionTable):
@@ -124,8 +125,10 @@ def main():
 	parser.add_argument('-p', '--pixelslice', help="store data by (pixel, slice)", required=False)
 	parser.add_argument('-s', '--slicepixel', help="store data by (slice, pixel) default", required=False)
 	parser.add_argument('-t', '--injtab', help="injunction table file containing uint16", required=True)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
@@ -9,8 +9,10 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.chunk_policy import get_table_options, add_chunk_policy_arguments, \
+	set_chunk_policy_from_arguments, DATASET_WAVEFORM
 
-def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=0):
 	'''
 	Create the table to store the signal
 	Parameters:
@@ -19,42 +21,46 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
+		expectedrows : expected number of waveforms (0 if unknown)
 	'''
 	image_shape = (nbPixel, nbSlice)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
+					   **get_table_options(DATASET_WAVEFORM, description_waveformHi, expectedrows, chunkshape))
 
 
-def create_telescope_sorted(outFile, telNode, chunkshape=1):
+def create_telescope_sorted(outFile, telNode, chunkshape=None):
 	'''
 	Create the telescope group and table
 	Parameters:
 	-----------
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
 	
-	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape,
+								 expectedrows=telNode.waveformHi.nrows)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+									 expectedrows=telNode.waveformHi.nrows)
 
 
-def create_all_telescope_sorted(outFile, inFile, chunkshape=1):
+def create_all_telescope_sorted(outFile, inFile, chunkshape=None):
 	'''
 	Create all the telescope ready for pixels sorting
 	Parameters:
 	-----------
 		outFile : output file
 		inFile : input file
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
 	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
 	for telNode in inFile.walk_nodes("/r1", "Group"):
@@ -179,8 +185,10 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
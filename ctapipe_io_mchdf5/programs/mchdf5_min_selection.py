@@ -9,6 +9,8 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.min_selection_utils import create_all_telescope_min_selected
+from ctapipe_io_mchdf5.tools.r1_layout import set_file_layout, LAYOUT_MIN_SELECTION, NB_EVENT_PER_MIN_ATTRIBUTE
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
 
 
 def processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, tabWaveformPart):
@@ -37,7 +39,10 @@ def processMinSelectionChannel(tableWaveformMin, keyWaveformMin, tableMin, keyMi
 		keyMin : key to get the data into the tableMin table
 		waveformInput : input waveform signal table for a channel
 		keyWaveform : key to access the data into the waveformInput channel
+		nbEventPerMin : number of events to be used to compute one minimum
 	'''
+	#The readers need the number of events per minimum to find the minimum of an event
+	setattr(tableMin.attrs, NB_EVENT_PER_MIN_ATTRIBUTE, nbEventPerMin)
 	waveformHi = waveformInput.read()
 	waveformHi = waveformHi[keyWaveform]
 	
@@ -45,26 +50,16 @@ def processMinSelectionChannel(tableWaveformMin, keyWaveformMin, tableMin, keyMi
 	
 	if nbEvent == 0:
 		return
-	elif nbEvent >= nbEventPerMin:
-		nbMinStep = int(nbEvent/nbEventPerMin)
-		lastPosition = nbMinStep*nbEventPerMin
-		lastminValue = nbEvent - lastPosition
-		lastPosition -= 1
-		_nbEventPerMin = nbEventPerMin
-	else:
-		nbMinStep = 1
-		lastminValue = 0
-		_nbEventPerMin = nbEvent
 	
 	tabWaveformMin = tableWaveformMin.row
 	tabMin = tableMin.row
+	nbMinStep = -(-nbEvent // nbEventPerMin)
 	print("\n")
-	for i in range(0, nbMinStep):
-		processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, waveformHi[i:i + _nbEventPerMin])
+	#The last block gets the remaining events
+	for i, firstEvent in enumerate(range(0, nbEvent, nbEventPerMin)):
+		processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, waveformHi[firstEvent:firstEvent + nbEventPerMin])
 		print("\r\r\r\r\r\r\r\r\r\r\r\r",i,"/",nbMinStep, end="")
 	
-	if lastminValue != 0:
-		processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, waveformHi[lastPosition:-1])
 	tableWaveformMin.flush()
 	tableMin.flush()
 	print("\nDone for",keyWaveformMin)
@@ -104,7 +99,7 @@ def processMinSelectionAllTelescope(outFile, inFile, nbEventPerMin):
 			pass
 
 
-def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=1):
+def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=None):
 	'''
 	Process the minimum selection
 	Parameters:
@@ -112,11 +107,12 @@ def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape
 		inputFileName : name of the input file
 		outputFileName : name of the output file
 		nbEventPerMin : number of events to be used to compute one minimum
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
 	outFile.title = inFile.title
+	set_file_layout(outFile, LAYOUT_MIN_SELECTION)
 	#Copy the instrument and simulation groups
 	try:
 		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
@@ -142,7 +138,9 @@ def main():
 						required=True)
 	parser.add_argument('-n', '--nbeventpermin', help="Number of event to be used to compute the minimum",
 						required=True, type=int)
+	add_chunk_policy_arguments(parser)
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
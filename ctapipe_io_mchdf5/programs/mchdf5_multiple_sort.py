@@ -9,6 +9,7 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.copy_sort import create_all_telescope_sorted
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
 
 MODE_RANGE = 0
 MODE_MEAN = 1
@@ -330,8 +331,10 @@ def main():
 	parser.add_argument('-r', '--order', help="order to store data. slicepixel : (slice, pixel) default, or pixelslice (pixel, slice)", required=False)
 	parser.add_argument('-n', '--nbeventperInjTab', help="number of events per injunction table (0 mean all the events)", required=True, type=int)
 	parser.add_argument('-m', '--selectionmode', help="mode of the pixels selection (RANGE, MEAN, SIGMA, MIN, MAX)", required=True)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
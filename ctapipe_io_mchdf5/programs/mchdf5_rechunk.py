@@ -0,0 +1,98 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import time
+import argparse
+
+import tables
+
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
+from ctapipe_io_mchdf5.tools.compression_policy import create_filters, add_compression_policy_arguments, \
+	set_compression_policy_from_arguments, format_filters_selection
+from ctapipe_io_mchdf5.tools.file_rechunk import rechunk_file, measure_read_throughput, DEFAULT_NB_BYTE_PER_BLOCK
+
+
+def printReadThroughput(label, fileName, listTablePath, nbBytePerBlock):
+	'''
+	Print the read throughput of the waveform like tables of a file
+	Parameters:
+		label : label of the file in the output
+		fileName : name of the file to be read
+		listTablePath : paths of the tables to be read
+		nbBytePerBlock : size in bytes of the blocks of rows
+	Return:
+		read throughput in MB/s
+	'''
+	nbByte, elapsedTime = measure_read_throughput(fileName, listTablePath, nbBytePerBlock)
+	throughput = nbByte / max(elapsedTime, 1e-9) / 1000000.0
+	print("{} : read {} MB in {:.3f} s : {:.1f} MB/s".format(label, nbByte / 1000000.0, elapsedTime, throughput))
+	return throughput
+
+
+def processRechunk(inputFileName, outputFileName, compressionLevel, complib, shuffle, nbWorker, nbBloscThread,
+				   nbBytePerBlock):
+	'''
+	Rewrite a file with the chunk shapes of the chunk policy and a new compression, then compare the sizes and the read
+	throughputs of the input and output files
+	Parameters:
+		inputFileName : name of the input file
+		outputFileName : name of the output file
+		compressionLevel : compression level of the output file (0 for no compression)
+		complib : compression library of the output file
+		shuffle : shuffle of the output file (none, byte or bit)
+		nbWorker : number of processes which read the input file
+		nbBloscThread : maximum number of threads used by blosc to compress the output file
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	'''
+	tables.parameters.MAX_BLOSC_THREADS = max(1, nbBloscThread)
+	filters = create_filters(compressionLevel, complib, shuffle)
+	timeBegin = time.perf_counter()
+	dicoSelection = dict()
+	listTablePath = rechunk_file(outputFileName, inputFileName, filters, nbWorker, nbBytePerBlock, dicoSelection)
+	print("Rechunk done in {:.3f} s".format(time.perf_counter() - timeBegin))
+	for tablePath, (selectedFilters, compressionRatio) in dicoSelection.items():
+		print(format_filters_selection(tablePath, selectedFilters, compressionRatio))
+
+	inputSize = os.path.getsize(inputFileName)
+	outputSize = os.path.getsize(outputFileName)
+	print("Input file : {} bytes ({} MB)".format(inputSize, inputSize / 1000000.0))
+	print("Output file : {} bytes ({} MB), ratio {:.3f}".format(outputSize, outputSize / 1000000.0,
+																 outputSize / max(inputSize, 1)))
+	inputThroughput = printReadThroughput("Input file", inputFileName, listTablePath, nbBytePerBlock)
+	outputThroughput = printReadThroughput("Output file", outputFileName, listTablePath, nbBytePerBlock)
+	print("Read speed up : {:.2f}".format(outputThroughput / max(inputThroughput, 1e-9)))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Rewrite a MCHDF5 file (R0-V2, R1-V2, DL0) with tuned chunk shapes "
+									 "and a new compression")
+	parser.add_argument('-i', '--input', help="hdf5 input file", required=True)
+	parser.add_argument('-o', '--output', help="hdf5 output file", required=True)
+	parser.add_argument('-c', '--compression', help="Compression level of the output file [0 (No compression), 1 - 9]."
+						" Default = 6", required=False, type=int, default=6)
+	parser.add_argument('-l', '--complib', help="Compression library of the output file. Default = blosc:zstd",
+						required=False, default="blosc:zstd")
+	parser.add_argument('-s', '--shuffle', help="Shuffle of the output file (none, byte or bit). Default = byte",
+						required=False, choices=["none", "byte", "bit"], default="byte")
+	parser.add_argument('-j', '--nbworker', help="Number of processes which read the input file. Default = number of "
+						"CPUs", required=False, type=int, default=os.cpu_count() or 1)
+	parser.add_argument('-t', '--nbbloscthread', help="Number of threads used by blosc to compress. Default = number "
+						"of CPUs", required=False, type=int, default=os.cpu_count() or 1)
+	parser.add_argument('-b', '--blocksize', help="Size in bytes of the blocks of rows copied at once. Default = " +
+						str(DEFAULT_NB_BYTE_PER_BLOCK), required=False, type=int, default=DEFAULT_NB_BYTE_PER_BLOCK)
+	add_chunk_policy_arguments(parser)
+	add_compression_policy_arguments(parser)
+	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
+	set_compression_policy_from_arguments(args)
+
+	processRechunk(args.input, args.output, args.compression, args.complib, args.shuffle, args.nbworker,
+				   args.nbbloscthread, args.blocksize)
+
+
+if __name__ == '__main__':
+	main()
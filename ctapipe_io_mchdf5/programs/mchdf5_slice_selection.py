@@ -10,8 +10,11 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.r1_layout import set_file_layout, LAYOUT_SLICE_SELECTION
+from ctapipe_io_mchdf5.tools.chunk_policy import get_table_options, add_chunk_policy_arguments, \
+	set_chunk_policy_from_arguments, DATASET_WAVEFORM
 
-def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=0):
 	'''
 	Create the table to store the signal without the minimum value and it minimum in an other table
 	Parameters:
@@ -20,15 +23,17 @@ def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
+		expectedrows : expected number of waveforms (0 if unknown)
 	'''
 	image_shape = (nbSlice, nbPixel)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
+					   **get_table_options(DATASET_WAVEFORM, description_waveformHi, expectedrows, chunkshape))
 
 
-def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=1):
+def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=None):
 	'''
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -37,19 +42,21 @@ def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=1):
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
 		nbSlice : number of slices to be expected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	
-	createMWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	nbEvent = telNode.waveformHi.nrows
+	createMWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape, expectedrows=nbEvent)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		createMWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		createMWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+							 expectedrows=nbEvent)
 
 
-def create_all_telescope_min_selected(outFile, inFile, nbSlice, chunkshape=1):
+def create_all_telescope_min_selected(outFile, inFile, nbSlice, chunkshape=None):
 	'''
 	Create all the telescope with the minimum selection
 	Parameters:
@@ -57,7 +64,7 @@ def create_all_telescope_min_selected(outFile, inFile, nbSlice, chunkshape=1):
 		outFile : output file
 		inFile : input file
 		nbSlice : number of slices to be expected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
 	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
 	for telNode in inFile.walk_nodes("/r1", "Group"):
@@ -127,7 +134,7 @@ def copySelectedSlicesR1(outFile, inFile, firstSliceIndex, lastSliceIndex):
 	
 
 
-def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=1):
+def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=None):
 	'''
 	Do the slice selection on the input file and create the output file
 	Parameters:
@@ -136,11 +143,13 @@ def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, la
 		outputFileName : name of the output file
 		firstSliceIndex : Index of the first slice to be selected
 		lastSliceIndex : Index of the last slice no to be selected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
 	outFile.title = inFile.title
+	#nbSlice of the telescopes is the number of slices of the input file, used to calibrate the selected slices
+	set_file_layout(outFile, LAYOUT_SLICE_SELECTION)
 	#Copy the instrument and simulation groups
 	try:
 		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
@@ -164,8 +173,10 @@ def main():
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-f', '--first', help="Index of the first slice to be selected", required=True, type=int)
 	parser.add_argument('-l', '--last', help="Index of the first last no to be selected", required=True, type=int)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
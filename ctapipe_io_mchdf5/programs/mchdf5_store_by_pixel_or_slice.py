@@ -10,6 +10,7 @@ import argparse
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_all_tel_without_waveform
 from ctapipe_io_mchdf5.tools.copy_sort import create_sorted_waveform_table_shape
+from ctapipe_io_mchdf5.tools.chunk_policy import add_chunk_policy_arguments, set_chunk_policy_from_arguments
 
 MODE_PES = 0
 MODE_PSE = 1
@@ -197,8 +198,10 @@ def main():
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
 	parser.add_argument('-r', '--order', help="order to store data. PES, PSE, EPS, ESP, SEP, SPE", required=True)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
@@ -9,9 +9,11 @@ import numpy as np
 import argparse
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.chunk_policy import get_table_options, add_chunk_policy_arguments, \
+	set_chunk_policy_from_arguments, DATASET_WAVEFORM
 
 
-def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=0):
 	'''
 	Create the table to store the signal without the minimum value and it minimum in an other table
 	Parameters:
@@ -20,15 +22,17 @@ def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
+		expectedrows : expected number of waveforms (0 if unknown)
 	'''
 	image_shape = (nbPixel, nbSlice)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
+					   **get_table_options(DATASET_WAVEFORM, description_waveformHi, expectedrows, chunkshape))
 
 
-def createTelescopeTransposed(outFile, telNode, chunkshape=1):
+def createTelescopeTransposed(outFile, telNode, chunkshape=None):
 	'''
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -36,27 +40,29 @@ def createTelescopeTransposed(outFile, telNode, chunkshape=1):
 	-----------
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	print("createTelescopeTransposed : base of telescope copied")
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
 	
-	createTransposedWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	createTransposedWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape,
+								  expectedrows=telNode.waveformHi.nrows)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		createTransposedWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		createTransposedWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+									  expectedrows=telNode.waveformHi.nrows)
 
 
-def createAllTelescopeTransposed(outFile, inFile, chunkshape=1):
+def createAllTelescopeTransposed(outFile, inFile, chunkshape=None):
 	'''
 	Create all the telescope with the minimum selection
 	Parameters:
 	-----------
 		outFile : output file
 		inFile : input file
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	'''
 	print("createAllTelescopeTransposed : create r1 group")
 	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
@@ -150,8 +156,10 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (tranposed)", required=True)
+	add_chunk_policy_arguments(parser)
 	
 	args = parser.parse_args()
+	set_chunk_policy_from_arguments(args)
 
 	inputFileName = args.input
 	outputFileName = args.output
@@ -0,0 +1,124 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.mchdf5eventsource_V2 import MCHDF5EventSourceV2
+
+
+#Events of each telescope, walk_nodes gives Tel_1, Tel_10 then Tel_2
+TEL_EVENT_ID = {1: [3, 5, 9, 20], 10: [2, 3, 9, 11, 40], 2: [5, 20, 31]}
+NB_PIXEL, NB_SLICE = 4, 3
+
+
+class Trigger(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	obs_id = tables.UInt64Col()
+	time_s = tables.UInt32Col()
+	time_qns = tables.UInt32Col()
+
+
+def create_r1_file(fileName):
+	'''
+	Create a small R1-V2 file with the telescopes of TEL_EVENT_ID, the waveform of an event is filled with its id
+	'''
+	nbTel = max(TEL_EVENT_ID)
+	listEventId = sorted(set(eventId for tabEventId in TEL_EVENT_ID.values() for eventId in tabEventId))
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		hfile.create_group("/", "r1")
+		camera = hfile.create_group("/instrument/subarray/telescope", "camera", createparents=True)
+		for telId, tabEventId in TEL_EVENT_ID.items():
+			telNode = hfile.create_group("/r1", "Tel_" + str(telId))
+			for name, value in [("telId", telId), ("telIndex", telId - 1), ("telType", 0), ("nbGain", 1),
+								("nbPixel", NB_PIXEL), ("nbSlice", NB_SLICE)]:
+				hfile.create_array(telNode, name, np.uint64(value))
+			hfile.create_array(telNode, "tabGain", np.ones((1, NB_PIXEL), dtype=np.float32))
+			hfile.create_array(telNode, "tabRefShape", np.ones((1, 10), dtype=np.float32))
+			pedestal = hfile.create_table(telNode, "pedestal", np.dtype([("first_event_id", np.uint64),
+																		 ("last_event_id", np.uint64),
+																		 ("pedestal", np.float32, (1, NB_PIXEL))]))
+			pedestal.append(np.zeros(1, dtype=pedestal.dtype))
+			trigger = hfile.create_table(telNode, "trigger", Trigger)
+			trigger.append([(eventId, 0, 0, 0) for eventId in tabEventId])
+			waveform = hfile.create_table(telNode, "waveformHi",
+										  np.dtype([("waveformHi", np.uint16, (NB_SLICE, NB_PIXEL))]))
+			tabWaveform = np.zeros(len(tabEventId), dtype=waveform.dtype)
+			tabWaveform["waveformHi"] = np.asarray(tabEventId)[:, np.newaxis, np.newaxis]
+			waveform.append(tabWaveform)
+			camNode = hfile.create_group(camera, "Cam_" + str(telId))
+			hfile.create_array(camNode, "pix_x", np.arange(NB_PIXEL, dtype=np.float64))
+			hfile.create_array(camNode, "pix_y", np.zeros(NB_PIXEL, dtype=np.float64))
+		optics = hfile.create_table("/instrument/subarray/telescope", "optics",
+									np.dtype([("equivalent_focal_length", np.float32)]))
+		optics.append(np.full(nbTel, 16.0, dtype=optics.dtype))
+		layout = hfile.create_table("/instrument/subarray", "layout", np.dtype([("pos_x", np.float32),
+																			   ("pos_y", np.float32),
+																			   ("pos_z", np.float32)]))
+		layout.append(np.zeros(nbTel, dtype=layout.dtype))
+		mcEvent = hfile.create_table("/simulation", "mc_event", np.dtype([("event_id", np.uint64),
+																		  ("mc_energy", np.float32),
+																		  ("mc_alt", np.float32),
+																		  ("mc_az", np.float32),
+																		  ("mc_core_x", np.float32),
+																		  ("mc_core_y", np.float32),
+																		  ("mc_h_first_int", np.float32),
+																		  ("mc_x_max", np.float32),
+																		  ("mc_shower_primary_id", np.uint8)]),
+									 createparents=True)
+		tabMcEvent = np.zeros(len(listEventId), dtype=mcEvent.dtype)
+		tabMcEvent["event_id"] = listEventId
+		mcEvent.append(tabMcEvent)
+		runConfig = hfile.create_table("/simulation", "run_config", np.dtype([("run_array_direction", np.float32,
+																			   (2,))]))
+		runConfig.append(np.zeros(1, dtype=runConfig.dtype))
+
+
+def read_events(fileName, **kwargs):
+	source = MCHDF5EventSourceV2(input_url=fileName, **kwargs)
+	try:
+		return [(int(event.r0.event_id), sorted(event.r0.tels_with_data), sorted(event.trig.tels_with_trigger.tolist()),
+				 {telId: int(event.r0.tel[telId].waveform[0, 0, 0]) for telId in event.r0.tels_with_data})
+				for event in source]
+	finally:
+		source.close()
+
+
+@pytest.mark.parametrize("allowedTelId", [{2, 10}, {10}, {1}])
+def test_allowed_telescopes_keep_the_order_of_the_run(tmp_path, allowedTelId):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	listReference = [(eventId, sorted(set(listTelId) & allowedTelId)) for eventId, listTelId, _, _ in
+					 read_events(fileName) if len(set(listTelId) & allowedTelId) > 0]
+	listEvent = read_events(fileName, allowed_tels=allowedTelId)
+	assert [(eventId, listTelId) for eventId, listTelId, _, _ in listEvent] == listReference
+	assert all(dicoWaveform == {telId: eventId for telId in listTelId}
+			   for eventId, listTelId, _, dicoWaveform in listEvent)
+	for nbMaxEvent in [1, 2, 4]:
+		assert read_events(fileName, allowed_tels=allowedTelId, max_events=nbMaxEvent) == listEvent[:nbMaxEvent]
+
+
+def test_allowed_telescopes_index_only_the_selected_telescopes(tmp_path, monkeypatch):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	listCall = []
+	createEventIndex = MCHDF5EventSourceV2._create_event_index
+
+	def create_counted_event_index(self, allowedTelId, nbMaxEvent=None):
+		listCall.append((allowedTelId, nbMaxEvent))
+		return createEventIndex(self, allowedTelId, nbMaxEvent)
+
+	monkeypatch.setattr(MCHDF5EventSourceV2, "_create_event_index", create_counted_event_index)
+	#The trigger pattern only has the allowed telescopes of the event
+	assert read_events(fileName, allowed_tels={10}, max_events=1) == [(3, [10], [10], {10: 3})]
+	assert listCall == [({10}, 1)]
+	del listCall[:]
+	assert read_events(fileName, allowed_tels={10}, max_events=1, full_trigger_pattern=True) == \
+		[(3, [10], [1, 10], {10: 3})]
+	assert listCall == [({10}, 1), (None, None)]
@@ -0,0 +1,71 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ctapipe_io_mchdf5.tools.async_reader import ExecutorReader, ReadAheadIterator
+
+
+def run_coroutine(coroutine):
+	loop = asyncio.new_event_loop()
+	try:
+		return loop.run_until_complete(coroutine)
+	finally:
+		loop.close()
+
+
+class ConcurrencyCounter(object):
+	'''
+	Blocking read function which records the maximum number of concurrent calls
+	'''
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.nbRunning = 0
+		self.nbRunningMax = 0
+		self.listRead = []
+
+	def read(self, item):
+		with self.lock:
+			self.nbRunning += 1
+			self.nbRunningMax = max(self.nbRunningMax, self.nbRunning)
+		#The first items are the slowest ones
+		time.sleep(0.001 * (5 - item % 5))
+		with self.lock:
+			self.nbRunning -= 1
+			self.listRead.append(item)
+		return 10 * item
+
+
+def test_read_ahead_order_and_close():
+	counter = ConcurrencyCounter()
+	reader = ExecutorReader()
+
+	async def read_item(item):
+		return await reader.run(counter.read, item)
+
+	async def consume(nbItemMax):
+		readAhead = ReadAheadIterator(range(20), read_item, 3)
+		listItem = []
+		async for item, value in readAhead:
+			assert value == 10 * item
+			listItem.append(item)
+			if len(listItem) == nbItemMax:
+				break
+		await readAhead.aclose()
+		return listItem, readAhead
+
+	listItem, readAhead = run_coroutine(consume(None))
+	assert listItem == list(range(20))
+	listItem, readAhead = run_coroutine(consume(5))
+	assert listItem == list(range(5))
+	#The reads in advance are cancelled and no other item is read
+	assert len(readAhead.pending) == 0
+	with pytest.raises(StopAsyncIteration):
+		run_coroutine(readAhead.__anext__())
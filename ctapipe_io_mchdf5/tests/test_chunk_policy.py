@@ -0,0 +1,48 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import argparse
+
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools import chunk_policy
+from ctapipe_io_mchdf5.tools.chunk_policy import ChunkPolicy, get_table_options, parse_chunk_rows, \
+	add_chunk_policy_arguments, set_chunk_policy_from_arguments, DATASET_WAVEFORM, DATASET_MINIMUM
+from ctapipe_io_mchdf5.tools.min_selection_utils import create_min_waveform_table
+
+
+@pytest.fixture
+def restore_chunk_policy():
+	policy = chunk_policy.get_chunk_policy()
+	yield
+	chunk_policy.set_chunk_policy(policy)
+
+
+def test_chunk_rows_from_byte_target_and_expected_rows():
+	policy = ChunkPolicy(1000, {DATASET_MINIMUM: 7})
+	assert policy.get_nb_row_per_chunk(DATASET_WAVEFORM, 100) == 10
+	assert policy.get_nb_row_per_chunk(DATASET_WAVEFORM, 100, expectedrows=4) == 4
+	#A row bigger than the target still gets one row per chunk
+	assert policy.get_nb_row_per_chunk(DATASET_WAVEFORM, 5000) == 1
+	assert policy.get_nb_row_per_chunk(DATASET_MINIMUM, 100, expectedrows=4) == 7
+
+
+def test_table_options_and_command_line(tmp_path, restore_chunk_policy):
+	parser = argparse.ArgumentParser()
+	add_chunk_policy_arguments(parser)
+	args = parser.parse_args(["--chunk-size", "4000", "--chunk-rows", "minimum=3"])
+	set_chunk_policy_from_arguments(args)
+	description = {"waveformHi": tables.UInt16Col(shape=(10, 20))}
+	assert get_table_options(DATASET_WAVEFORM, description, 50) == {"chunkshape": (10,), "expectedrows": 50}
+	assert get_table_options(DATASET_WAVEFORM, description, chunkshape=(2,)) == {"chunkshape": (2,)}
+	with pytest.raises(ValueError):
+		parse_chunk_rows("unknown=3")
+	with tables.open_file(str(tmp_path / "chunk.h5"), "w") as hfile:
+		create_min_waveform_table(hfile, hfile.root, "waveformHi", "minHi", 10, 20, expectedrows=50,
+								  expectedMinRows=5)
+		assert hfile.root.waveformHi.chunkshape == (10,)
+		assert hfile.root.minHi.chunkshape == (3,)
@@ -0,0 +1,108 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import argparse
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools import compression_policy
+from ctapipe_io_mchdf5.tools.compression_policy import CompressionPolicy, create_filters, parse_filters, \
+	format_filters, select_filters, apply_auto_filters, append_table_rows, add_compression_policy_arguments, \
+	set_compression_policy_from_arguments, AUTO, OBJECTIVE_RATIO, SHUFFLE_BIT, DATASET_METADATA
+from ctapipe_io_mchdf5.tools.chunk_policy import DATASET_WAVEFORM, DATASET_PE_IMAGE
+
+
+@pytest.fixture
+def restore_compression_policy():
+	policy = compression_policy.get_compression_policy()
+	yield
+	compression_policy.set_compression_policy(policy)
+
+
+def create_waveform_rows(nbRow):
+	tabRow = np.zeros(nbRow, dtype=[("event_id", np.uint64), ("waveformHi", np.uint16, (10, 20))])
+	tabRow["event_id"] = np.arange(nbRow)
+	tabRow["waveformHi"] = (np.arange(nbRow * 200) % 7 + 300).reshape(nbRow, 10, 20)
+	return tabRow
+
+
+def test_parse_filters():
+	filters = parse_filters("blosc:lz4, 5, bit")
+	assert (filters.complib, filters.complevel, filters.shuffle, filters.bitshuffle) == ("blosc:lz4", 5, False, True)
+	assert format_filters(filters) == "blosc:lz4,5,bit"
+	for text in ["blosc:lz4,5", "unknown,5,bit", "blosc:lz4,12,bit", "blosc:lz4,5,word"]:
+		with pytest.raises(ValueError):
+			parse_filters(text)
+
+
+def test_policy_filters_and_threads():
+	zstdFilters = create_filters(6, "blosc:zstd", SHUFFLE_BIT)
+	policy = CompressionPolicy({DATASET_WAVEFORM: AUTO, DATASET_PE_IMAGE: zstdFilters}, {DATASET_METADATA: 1})
+	assert policy.get_filters(DATASET_WAVEFORM) is None
+	assert policy.is_auto(DATASET_WAVEFORM)
+	assert policy.get_filters(DATASET_PE_IMAGE) is zstdFilters
+	assert not policy.is_auto(DATASET_PE_IMAGE)
+	assert policy.get_filters(None) is None
+	assert policy.get_nb_blosc_thread(None) == 1
+	assert policy.get_nb_blosc_thread(DATASET_WAVEFORM) == 0
+
+
+def test_select_filters_for_the_ratio_objective():
+	listCandidate = [create_filters(1, "blosc:lz4"), create_filters(9, "blosc:zstd", SHUFFLE_BIT)]
+	policy = CompressionPolicy(objective=OBJECTIVE_RATIO, listCandidate=listCandidate)
+	filters, listMeasure = select_filters(create_waveform_rows(50), (10,), policy)
+	assert len(listMeasure) == 2
+	assert min(listMeasure, key=lambda measure: measure[1])[0] is filters
+
+
+def test_auto_filters_recreate_the_table(tmp_path, restore_compression_policy, capsys):
+	compression_policy.set_compression_policy(CompressionPolicy({DATASET_WAVEFORM: AUTO},
+																{DATASET_WAVEFORM: 2}))
+	tabRow = create_waveform_rows(30)
+	with tables.open_file(str(tmp_path / "auto.h5"), "w") as hfile:
+		table = hfile.create_table("/r0/event/telescope/waveform", "tel_001", tabRow.dtype, "Table of waveform",
+								   createparents=True, chunkshape=(8,))
+		table.attrs.NB_GAIN = 1
+		other = hfile.create_table("/r0/event/subarray", "trigger", {"event_id": tables.UInt64Col()},
+								   createparents=True)
+		assert apply_auto_filters(other, np.zeros(3, dtype=other.dtype)) is other
+		dicoSelection = dict()
+		table = apply_auto_filters(table, tabRow, dicoSelection)
+		assert table.filters.complevel > 0
+		#The selection is returned to the program, nothing is printed
+		assert list(dicoSelection.keys()) == ["/r0/event/telescope/waveform/tel_001"]
+		assert format_filters(dicoSelection["/r0/event/telescope/waveform/tel_001"][0]) == format_filters(table.filters)
+		assert dicoSelection["/r0/event/telescope/waveform/tel_001"][1] > 1.0
+		assert capsys.readouterr().out == ""
+		assert table.chunkshape == (8,)
+		assert table.title == "Table of waveform"
+		assert table.attrs.NB_GAIN == 1
+		previousNbThread = tables.set_blosc_max_threads(3)
+		append_table_rows(table, tabRow)
+		assert tables.set_blosc_max_threads(previousNbThread) == 3
+		assert apply_auto_filters(table, tabRow) is table
+		assert table.read().tobytes() == tabRow.tobytes()
+
+
+def test_command_line(restore_compression_policy):
+	parser = argparse.ArgumentParser()
+	add_compression_policy_arguments(parser)
+	args = parser.parse_args(["--codec", "waveform=auto", "--codec", "metadata=blosc:lz4,1,none",
+							  "--codec-threads", "waveform=4", "--auto-objective", "ratio",
+							  "--auto-candidate", "blosc:zstd,3,bit"])
+	policy = set_compression_policy_from_arguments(args)
+	assert compression_policy.get_compression_policy() is policy
+	assert policy.is_auto(DATASET_WAVEFORM)
+	assert format_filters(compression_policy.get_file_filters(None)) == "blosc:lz4,1,none"
+	assert policy.get_nb_blosc_thread(DATASET_WAVEFORM) == 4
+	assert policy.objective == OBJECTIVE_RATIO
+	assert [format_filters(filters) for filters in policy.listCandidate] == ["blosc:zstd,3,bit"]
+	parser = argparse.ArgumentParser()
+	add_compression_policy_arguments(parser, isAutoAllowed=False)
+	with pytest.raises(ValueError):
+		set_compression_policy_from_arguments(parser.parse_args(["--codec", "waveform=auto"]))
@@ -0,0 +1,92 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.dl0_reader import DL0TelescopeReader, DL0WaveformReconstruction, DL0TelescopeR1Calibration, \
+	iter_dl0_telescope_batches
+
+
+NB_PIXEL = 5
+NB_SLICE = 4
+#Pixels with a waveform and pixels in low gain of each event
+LIST_PIXEL = [[0, 3], [], [1, 2, 4], [2]]
+LIST_PIXEL_LO = [[], [1], [4], []]
+
+
+def create_dl0_telescope(fileName):
+	'''
+	Create a DL0-V2 like telescope group where the waveform of the pixel p of the event i is filled with 100 * i + p
+	'''
+	with tables.open_file(fileName, "w") as hfile:
+		telNode = hfile.create_group("/", "Tel_1")
+		hfile.create_array(telNode, "nbPixel", np.uint64(NB_PIXEL))
+		hfile.create_array(telNode, "nbSlice", np.uint64(NB_SLICE))
+		trigger = hfile.create_table(telNode, "trigger", np.dtype([("event_id", np.uint64)]))
+		trigger.append(np.array([(10 * i,) for i in range(len(LIST_PIXEL))], dtype=trigger.dtype))
+		pixelWaveform = hfile.create_vlarray(telNode, "pixelWaveform", tables.UInt16Atom(shape=()))
+		pixelLo = hfile.create_vlarray(telNode, "pixelLo", tables.UInt16Atom(shape=()))
+		waveform = hfile.create_table(telNode, "waveform", np.dtype([("waveform", np.uint16, (NB_SLICE,))]))
+		signal = hfile.create_table(telNode, "signal", np.dtype([("signal", np.int16, (NB_PIXEL,)),
+																 ("waveformoffset", np.uint64)]), chunkshape=(2,))
+		offset = 0
+		for i, (listPixel, listPixelLo) in enumerate(zip(LIST_PIXEL, LIST_PIXEL_LO)):
+			pixelWaveform.append(np.array(listPixel, dtype=np.uint16))
+			pixelLo.append(np.array(listPixelLo, dtype=np.uint16))
+			for pixel in listPixel:
+				waveform.append(np.array([(np.full(NB_SLICE, 100 * i + pixel),)], dtype=waveform.dtype))
+			signal.append(np.array([(np.full(NB_PIXEL, 8 * (i + 1)), offset)], dtype=signal.dtype))
+			offset += len(listPixel)
+
+
+def test_sparse_read_and_reconstruction(tmp_path):
+	fileName = str(tmp_path / "dl0.h5")
+	create_dl0_telescope(fileName)
+	dc_to_pe = np.array([np.full(NB_PIXEL, 2.0), np.full(NB_PIXEL, 0.5)])
+	pedestal = np.array([np.full(NB_PIXEL, 40.0), np.full(NB_PIXEL, 80.0)])
+	reconstruction = DL0WaveformReconstruction(dc_to_pe, pedestal, NB_PIXEL, NB_SLICE)
+	with tables.open_file(fileName, "r") as hfile:
+		reader = DL0TelescopeReader(hfile.root.Tel_1, 2)
+		listDense = []
+		for i in [0, 1, 2, 3, 1]:
+			tabPixel, tabWaveform, tabSignal, tabPixelLo = reader.read_sparse(i)
+			assert tabPixel.tolist() == LIST_PIXEL[i]
+			assert tabPixelLo.tolist() == LIST_PIXEL_LO[i]
+			assert np.all(tabWaveform == 100 * i + tabPixel[:, np.newaxis])
+			tabDense, tabGainSelection = reconstruction.reconstruct_event(tabPixel, tabWaveform, tabSignal, tabPixelLo)
+			assert np.all(tabDense[tabPixel] == tabWaveform)
+			#The pixels without waveform are calibrated back to their integrated signal
+			tabR1 = reconstruction.calibrate(tabDense, tabGainSelection)
+			isUnselected = np.ones(NB_PIXEL, dtype=bool)
+			isUnselected[tabPixel] = False
+			assert np.allclose(tabR1[isUnselected].sum(axis=1), 8 * (i + 1))
+			listDense.append(tabDense)
+		listBatch = list(iter_dl0_telescope_batches(hfile.root.Tel_1, reconstruction, 3))
+	assert [tabEventId.tolist() for tabEventId, _, _ in listBatch] == [[0, 10], [20, 30]]
+	tabBatchDense = np.concatenate([tabDense for _, tabDense, _ in listBatch])
+	assert np.allclose(tabBatchDense, np.array(listDense[:4]))
+
+
+def test_r1_calibration_interface():
+	dc_to_pe = np.array([np.full(NB_PIXEL, 2.0), np.full(NB_PIXEL, 0.5)])
+	pedestal = np.array([np.full(NB_PIXEL, 40.0), np.full(NB_PIXEL, 80.0)])
+	reconstruction = DL0WaveformReconstruction(dc_to_pe, pedestal, NB_PIXEL, NB_SLICE)
+	calibration = DL0TelescopeR1Calibration(reconstruction)
+	tabWaveform = np.arange(NB_PIXEL * NB_SLICE, dtype=np.float32).reshape(1, NB_PIXEL, NB_SLICE)
+	tabGainSelection = np.array([0, 1, 0, 0, 1])
+	tabRef = reconstruction.calibrate(tabWaveform, tabGainSelection)
+	assert np.array_equal(calibration.calibrate(tabWaveform, None, tabGainSelection), tabRef)
+	buffer = calibration.calibrate_in_buffer(tabWaveform, tabGainSelection)
+	assert np.array_equal(buffer, tabRef)
+	assert calibration.calibrate_in_buffer(tabWaveform) is buffer
+	assert np.array_equal(buffer, (tabWaveform - 10.0) * 2.0)
+	#Block of waveforms with the gain of each pixel of each event
+	tabBlock = np.stack([tabWaveform, tabWaveform + 1])
+	tabBlockGain = np.stack([tabGainSelection, 1 - tabGainSelection])[:, np.newaxis]
+	tabBlockR1 = calibration.calibrate(tabBlock, None, tabBlockGain)
+	assert tabBlockR1.shape == (2, 1, NB_PIXEL, NB_SLICE)
+	assert np.array_equal(tabBlockR1[1], reconstruction.calibrate(tabWaveform + 1, 1 - tabGainSelection))
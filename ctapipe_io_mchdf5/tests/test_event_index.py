@@ -0,0 +1,288 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools import event_index
+from ctapipe_io_mchdf5.tools.event_index import create_event_index_r1, get_shard_range, iter_telescope_groups, \
+	create_event_index_r0, save_event_index, load_event_index
+
+
+TEL_EVENT_ID = {1: [10, 12, 13, 20], 3: [12, 13, 14], 2: [11, 12, 20, 21]}
+
+
+class Trigger(tables.IsDescription):
+	event_id = tables.UInt64Col()
+
+
+def create_r1_file(fileName):
+	'''
+	Create a minimal R1-V2 file with only the trigger tables of the telescopes
+	'''
+	hfile = tables.open_file(fileName, "w")
+	hfile.title = "R1-V2"
+	hfile.create_group("/", "r1")
+	for telId, tabEventId in TEL_EVENT_ID.items():
+		telNode = hfile.create_group("/r1", "Tel_" + str(telId))
+		hfile.create_array(telNode, "telId", np.uint64(telId))
+		hfile.create_array(telNode, "telIndex", np.uint64(telId - 1))
+		trigger = hfile.create_table(telNode, "trigger", Trigger)
+		trigger.append([(eventId,) for eventId in tabEventId])
+	hfile.create_group("/r1", "NotATelescope")
+	hfile.close()
+
+
+def reference_events(hfile):
+	'''
+	Dictionary of the events built as the event sources used to do
+	'''
+	events = dict()
+	for telNode in hfile.walk_nodes('/r1', 'Group'):
+		try:
+			tabEventId = telNode.trigger.col("event_id")
+			telescopeIndex = np.uint64(telNode.telIndex.read())
+			telescopeId = np.uint64(telNode.telId.read())
+		except tables.exceptions.NoSuchNodeError:
+			continue
+		for i, eventId in enumerate(tabEventId):
+			events.setdefault(eventId, []).append((telescopeId, telescopeIndex, i))
+	return events
+
+
+def test_event_index_same_order_as_dictionary(tmp_path):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		reference = reference_events(hfile)
+		index = create_event_index_r1(hfile)
+
+	assert len(index) == len(reference)
+	assert index.event_offset[-1] == sum(len(TEL_EVENT_ID[telId]) for telId in TEL_EVENT_ID)
+	for (event_id, tabTelId, tabTelIndex, tabRow), (refEventId, refList) in zip(index.iter_events(), reference.items()):
+		assert event_id == refEventId
+		assert list(zip(tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())) == [tuple(int(v) for v in item) for item in refList]
+
+
+def test_event_index_empty_file(tmp_path):
+	fileName = str(tmp_path / "empty.h5")
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.create_group("/", "r1")
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile)
+	assert len(index) == 0
+	assert list(index.iter_events()) == []
+
+
+def test_shards_cover_the_run(tmp_path):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile)
+	listAllEvent = list((event_id, tabTelId.tolist(), tabRow.tolist()) for event_id, tabTelId, _, tabRow in index.iter_events())
+	for nbShard in [1, 2, 4, 7]:
+		listEvent = []
+		for shardIndex in range(nbShard):
+			first, last = get_shard_range(len(index), shardIndex, nbShard)
+			shard = index.select(first, last)
+			assert shard.event_offset[0] == 0
+			listEvent += list((event_id, tabTelId.tolist(), tabRow.tolist()) for event_id, tabTelId, _, tabRow in shard.iter_events())
+		assert listEvent == listAllEvent
+	assert len(index.select(3, 100)) == len(index) - 3
+	with pytest.raises(ValueError):
+		get_shard_range(len(index), 2, 2)
+
+
+def test_event_index_of_allowed_telescopes(tmp_path):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		allTelNode = list(iter_telescope_groups(hfile, "/r1"))
+		listTelNode = list(iter_telescope_groups(hfile, "/r1", "Tel_", {3, 2, 5}))
+		assert [telNode._v_name for telNode in listTelNode] == ["Tel_2", "Tel_3"]
+		assert len(allTelNode) == len(TEL_EVENT_ID) + 2
+		index = create_event_index_r1(hfile, "/r1", {3, 2})
+	#Same order as without allowed telescopes : the event 13 of the telescope 1 is before the event 11
+	assert index.event_id.tolist() == [12, 13, 20, 11, 21, 14]
+	assert set(index.tel_id.tolist()) == {2, 3}
+	assert index.event_offset[-1] == len(TEL_EVENT_ID[2]) + len(TEL_EVENT_ID[3])
+
+
+def test_take_and_select_event_ids(tmp_path):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile)
+	listAllEvent = [(event_id, tabTelId.tolist(), tabRow.tolist()) for event_id, tabTelId, _, tabRow in index.iter_events()]
+	selected = index.take([4, 0, 2])
+	assert [(event_id, tabTelId.tolist(), tabRow.tolist()) for event_id, tabTelId, _, tabRow in selected.iter_events()] == \
+		[listAllEvent[4], listAllEvent[0], listAllEvent[2]]
+	selected = index.select_event_ids([21, 12, 99])
+	assert selected.event_id.tolist() == [12, 21]
+	assert len(index.take([])) == 0
+
+
+def test_saved_event_index(tmp_path):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile).select(1, 5)
+	indexName = str(tmp_path / "index.npz")
+	save_event_index(indexName, index)
+	loaded = load_event_index(indexName)
+	assert [(event_id, tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())
+			for event_id, tabTelId, tabTelIndex, tabRow in loaded.iter_events()] == \
+		[(event_id, tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())
+		 for event_id, tabTelId, tabTelIndex, tabRow in index.iter_events()]
+	assert loaded.find_event(index.event_id[2]) == 2
+
+
+def create_r0_file(fileName, listTriggerEventId):
+	'''
+	Create a minimal R0-V2 file with only the event ids of the telescope tables and the trigger table
+	'''
+	hfile = tables.open_file(fileName, "w")
+	hfile.title = "R0-V2"
+	hfile.create_group("/", "r0")
+	hfile.create_group("/r0", "event")
+	hfile.create_group("/r0/event", "telescope")
+	hfile.create_group("/r0/event/telescope", "waveform")
+	hfile.create_group("/r0/event", "subarray")
+	for telId, tabEventId in TEL_EVENT_ID.items():
+		table = hfile.create_table("/r0/event/telescope/waveform", "tel_{0:0=3d}".format(telId), Trigger)
+		table.append([(eventId,) for eventId in tabEventId])
+	trigger = hfile.create_table("/r0/event/subarray", "trigger", Trigger)
+	trigger.append([(eventId,) for eventId in listTriggerEventId])
+	hfile.close()
+
+
+def test_event_index_r0_in_trigger_order(tmp_path):
+	fileName = str(tmp_path / "r0.h5")
+	#The event 10 is missing in the trigger table and the event 99 has no telescope event
+	create_r0_file(fileName, [21, 13, 99, 12, 11, 20, 14, 13])
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r0(hfile)
+		allowedIndex = create_event_index_r0(hfile, allowedTelId={3})
+	assert index.event_id.tolist() == [21, 13, 12, 11, 20, 14, 10]
+	assert index.event_offset[-1] == sum(len(tabEventId) for tabEventId in TEL_EVENT_ID.values())
+	tabTelId, tabTelIndex, tabRow = index.get_event_telescopes(2)
+	assert list(zip(tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())) == [(1, 0, 1), (2, 1, 1), (3, 2, 0)]
+	assert allowedIndex.event_id.tolist() == [13, 12, 14]
+	assert allowedIndex.tel_id.tolist() == [3, 3, 3]
+
+
+def list_index_events(index):
+	return [(event_id, tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())
+			for event_id, tabTelId, tabTelIndex, tabRow in index.iter_events()]
+
+
+@pytest.mark.parametrize("allowedTelId", [None, {3, 2}, {3}])
+def test_limited_event_index_r1(tmp_path, allowedTelId):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile, "/r1", allowedTelId)
+		for nbMaxEvent in range(len(index) + 2):
+			limitedIndex = create_event_index_r1(hfile, "/r1", allowedTelId, nbMaxEvent)
+			assert list_index_events(limitedIndex) == list_index_events(index.select(0, nbMaxEvent))
+
+
+@pytest.mark.parametrize("allowedTelId", [None, {3}])
+def test_limited_event_index_r0(tmp_path, allowedTelId):
+	fileName = str(tmp_path / "r0.h5")
+	create_r0_file(fileName, [21, 13, 99, 12, 11, 20, 14, 13])
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r0(hfile, allowedTelId=allowedTelId)
+		for nbMaxEvent in range(len(index) + 2):
+			limitedIndex = create_event_index_r0(hfile, allowedTelId=allowedTelId, nbMaxEvent=nbMaxEvent)
+			assert list_index_events(limitedIndex.select(0, nbMaxEvent)) == list_index_events(index.select(0, nbMaxEvent))
+
+
+def test_limited_event_index_stops_reading(tmp_path, monkeypatch):
+	fileName = str(tmp_path / "r1.h5")
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.create_group("/", "r1")
+		for telId in [1, 2]:
+			telNode = hfile.create_group("/r1", "Tel_" + str(telId))
+			hfile.create_array(telNode, "telId", np.uint64(telId))
+			hfile.create_array(telNode, "telIndex", np.uint64(telId - 1))
+			trigger = hfile.create_table(telNode, "trigger", Trigger, chunkshape=(100,))
+			trigger.append([(eventId,) for eventId in range(telId, 100000, 2)])
+	listReadRow = []
+	iterEventIdBlocks = event_index.iter_event_id_blocks
+
+	def iter_counted_blocks(table, columnName, nbRowPerBlock):
+		for firstRow, tabEventId in iterEventIdBlocks(table, columnName, nbRowPerBlock):
+			listReadRow.append(tabEventId.size)
+			yield firstRow, tabEventId
+
+	monkeypatch.setattr(event_index, "iter_event_id_blocks", iter_counted_blocks)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile, "/r1", None, 150)
+	assert index.event_id.tolist() == list(range(1, 300, 2))
+	assert index.tel_id.tolist() == [1] * 150
+	assert sum(listReadRow) < 1000
+
+
+def create_trigger_file(fileName, dicoTelEventId):
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.create_group("/", "r1")
+		for telId, tabEventId in dicoTelEventId.items():
+			telNode = hfile.create_group("/r1", "Tel_" + str(telId))
+			hfile.create_array(telNode, "telId", np.uint64(telId))
+			hfile.create_array(telNode, "telIndex", np.uint64(telId - 1))
+			trigger = hfile.create_table(telNode, "trigger", Trigger)
+			trigger.append([(eventId,) for eventId in tabEventId])
+
+
+def reference_allowed_events(hfile, allowedTelId):
+	'''
+	Events of the allowed telescopes, in the order of the dictionary of all the events
+	'''
+	listEvent = []
+	for eventId, listTelEvent in reference_events(hfile).items():
+		listTelEvent = [tuple(int(v) for v in item) for item in listTelEvent if int(item[0]) in allowedTelId]
+		if len(listTelEvent) > 0:
+			listEvent.append((int(eventId), listTelEvent))
+	return listEvent
+
+
+@pytest.mark.parametrize("allowedTelId", [{2, 10}, {10}, {2}, {1, 2, 10}])
+def test_allowed_telescopes_keep_the_order_of_the_run(tmp_path, allowedTelId):
+	fileName = str(tmp_path / "r1.h5")
+	#walk_nodes gives Tel_1, Tel_10 then Tel_2
+	create_trigger_file(fileName, {1: [3, 5, 9, 20], 10: [2, 3, 9, 11, 40], 2: [5, 20, 31]})
+	with tables.open_file(fileName, "r") as hfile:
+		reference = reference_allowed_events(hfile, allowedTelId)
+		index = create_event_index_r1(hfile, "/r1", allowedTelId)
+		listEvent = [(int(event_id), list(zip(tabTelId.tolist(), tabTelIndex.tolist(), tabRow.tolist())))
+					 for event_id, tabTelId, tabTelIndex, tabRow in index.iter_events()]
+		assert listEvent == reference
+		for nbMaxEvent in range(1, len(reference) + 2):
+			limitedIndex = create_event_index_r1(hfile, "/r1", allowedTelId, nbMaxEvent)
+			assert list_index_events(limitedIndex.select(0, nbMaxEvent)) == list_index_events(index.select(0, nbMaxEvent))
+	if allowedTelId == {2, 10}:
+		assert [eventId for eventId, listTelEvent in reference] == [3, 5, 9, 20, 2, 11, 40, 31]
+	if allowedTelId == {10}:
+		assert reference[0][0] == 3
+
+
+def test_allowed_telescopes_do_not_read_the_next_groups(tmp_path, monkeypatch):
+	fileName = str(tmp_path / "r1.h5")
+	create_trigger_file(fileName, {1: [3, 5], 2: [5, 7], 3: [7, 8]})
+	listReadTable = []
+	readEventOrder = event_index.read_event_order
+
+	def read_counted_event_order(listTableColumn):
+		listReadTable.extend(table._v_parent._v_name for table, columnName in listTableColumn)
+		return readEventOrder(listTableColumn)
+
+	monkeypatch.setattr(event_index, "read_event_order", read_counted_event_order)
+	with tables.open_file(fileName, "r") as hfile:
+		index = create_event_index_r1(hfile, "/r1", {2})
+	assert index.event_id.tolist() == [5, 7]
+	assert listReadTable == ["Tel_1", "Tel_2"]
@@ -0,0 +1,57 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.file_rechunk import rechunk_file, iter_interleaved_blocks
+
+
+def create_chunkshape_one_file(fileName):
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.title = "R1-V2"
+		hfile.root._v_attrs.WAVEFORM_LAYOUT = "min_selection"
+		for telId in [1, 2]:
+			telNode = hfile.create_group("/r1", "Tel_" + str(telId), "Data of telescopes", createparents=True)
+			hfile.create_array(telNode, "nbPixel", np.array([3], dtype=np.uint64))
+			table = hfile.create_table(telNode, "waveformHi", {"waveformHi": tables.UInt16Col(shape=(4, 3))},
+									   "Table of waveform", chunkshape=1)
+			tabRow = np.zeros(50 * telId, dtype=table.dtype)
+			tabRow["waveformHi"] = np.arange(tabRow.size * 12).reshape(-1, 4, 3)
+			table.append(tabRow)
+			tableMin = hfile.create_table(telNode, "minHi", {"minHi": tables.UInt16Col(shape=3)}, chunkshape=1)
+			tableMin.append(np.zeros(5, dtype=tableMin.dtype))
+			tableMin.attrs.NB_EVENT_PER_MIN = 10 * telId
+
+
+def test_interleaved_blocks_keep_table_order():
+	listBlock = list(iter_interleaved_blocks([("a", [(0, 2), (2, 4), (4, 5)]), ("b", [(0, 3)])]))
+	assert listBlock == [("a", 0, 2), ("b", 0, 3), ("a", 2, 4), ("a", 4, 5)]
+
+
+def test_rechunk_keeps_data_titles_and_attributes(tmp_path):
+	inputFileName = str(tmp_path / "input.h5")
+	create_chunkshape_one_file(inputFileName)
+	filters = tables.Filters(complevel=3, complib="blosc:zstd", shuffle=True)
+	for nbWorker, outputName in [(1, "output.h5"), (2, "output_parallel.h5")]:
+		outputFileName = str(tmp_path / outputName)
+		#Blocks of 480 bytes : 20 rows per block, so a table is copied in several blocks
+		listTablePath = rechunk_file(outputFileName, inputFileName, filters, nbWorker, 480)
+		assert sorted(listTablePath) == ["/r1/Tel_1/minHi", "/r1/Tel_1/waveformHi", "/r1/Tel_2/minHi",
+										 "/r1/Tel_2/waveformHi"]
+		with tables.open_file(inputFileName, "r") as inFile, tables.open_file(outputFileName, "r") as outFile:
+			assert outFile.title == "R1-V2"
+			assert outFile.root._v_attrs.WAVEFORM_LAYOUT == "min_selection"
+			assert outFile.root.r1.Tel_1._v_title == "Data of telescopes"
+			for telId in [1, 2]:
+				telIn = inFile.get_node("/r1/Tel_" + str(telId))
+				telOut = outFile.get_node("/r1/Tel_" + str(telId))
+				assert telOut.waveformHi.chunkshape[0] == 100 * telId // 2
+				assert telOut.waveformHi.filters.complevel == 3
+				assert telOut.waveformHi.read().tobytes() == telIn.waveformHi.read().tobytes()
+				assert telOut.waveformHi.title == "Table of waveform"
+				assert telOut.minHi.attrs.NB_EVENT_PER_MIN == 10 * telId
+				assert telOut.nbPixel.read()[0] == 3
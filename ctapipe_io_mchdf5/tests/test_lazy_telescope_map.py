@@ -0,0 +1,39 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import pytest
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.tools.lazy_telescope_map import LazyTelescopeMap
+
+
+def test_lazy_telescope_map_loads_on_first_access():
+	telMap = LazyTelescopeMap(dict)
+	listLoadedTel = []
+
+	def load(telId):
+		listLoadedTel.append(telId)
+		telMap[telId]["waveform"] = telId * 10
+
+	telMap.set_loader(1, load)
+	telMap.set_loader(4, load)
+	assert sorted(telMap.keys()) == [1, 4]
+	assert 4 in telMap and 2 not in telMap
+	assert len(telMap) == 2
+	assert listLoadedTel == []
+
+	assert telMap[4]["waveform"] == 40
+	assert telMap[4]["waveform"] == 40
+	assert listLoadedTel == [4]
+	assert dict(telMap.items()) == {1: {"waveform": 10}, 4: {"waveform": 40}}
+	assert listLoadedTel == [4, 1]
+
+	telMap.set_loader(2, load)
+	telMap.clear()
+	assert len(telMap) == 0
+	assert telMap[2] == {}
+	assert listLoadedTel == [4, 1]
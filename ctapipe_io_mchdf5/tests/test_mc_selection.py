@@ -0,0 +1,81 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import stat
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.mc_selection import get_condition_columns, create_condition_index, read_selected_event_ids
+
+
+class McEvent(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	mc_energy = tables.Float32Col()
+	mc_core_x = tables.Float32Col()
+
+
+def create_mc_file(fileName):
+	'''
+	Create a file with a Monte-Carlo event table
+	'''
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.create_group("/", "simulation")
+		table = hfile.create_table("/simulation", "mc_event", McEvent)
+		tabMcEvent = np.zeros(30, dtype=table.dtype)
+		tabMcEvent["event_id"] = 100 - np.arange(30)
+		tabMcEvent["mc_energy"] = 0.1 * np.arange(30)
+		tabMcEvent["mc_core_x"] = np.arange(30) % 3
+		table.append(tabMcEvent)
+
+
+def test_selection_with_index(tmp_path):
+	fileName = str(tmp_path / "mc.h5")
+	create_mc_file(fileName)
+	condition = "(mc_energy > 1.05) & (mc_core_x == 0)"
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.root.simulation.mc_event
+		assert sorted(get_condition_columns(table, condition)) == ["mc_core_x", "mc_energy"]
+		tabRefEventId = read_selected_event_ids(table, condition, "event_id")
+	assert create_condition_index(fileName, "/simulation/mc_event", condition)
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.root.simulation.mc_event
+		assert table.cols.mc_energy.is_indexed and table.cols.mc_core_x.is_indexed
+		assert not table.cols.event_id.is_indexed
+		tabEventId = read_selected_event_ids(table, condition, "event_id")
+	assert tabEventId.tolist() == tabRefEventId.tolist()
+	assert tabEventId.tolist() == sorted(100 - i for i in range(12, 30, 3))
+
+
+def test_indexed_file_not_modified(tmp_path):
+	fileName = str(tmp_path / "mc.h5")
+	create_mc_file(fileName)
+	condition = "mc_energy > 1.05"
+	assert create_condition_index(fileName, "/simulation/mc_event", condition)
+	mtime = os.stat(fileName).st_mtime_ns
+	os.chmod(fileName, stat.S_IRUSR)
+	try:
+		#The columns are already indexed, the file is only read
+		assert create_condition_index(fileName, "/simulation/mc_event", condition)
+	finally:
+		os.chmod(fileName, stat.S_IRUSR | stat.S_IWUSR)
+	assert os.stat(fileName).st_mtime_ns == mtime
+
+
+def test_selection_in_file_which_cannot_be_modified(tmp_path):
+	fileName = str(tmp_path / "mc.h5")
+	create_mc_file(fileName)
+	condition = "(mc_energy > 1.05) & (mc_core_x == 0)"
+	mtime = os.stat(fileName).st_mtime_ns
+	#The file opened in read mode by another object cannot be opened in append mode
+	with tables.open_file(fileName, "r") as hfile:
+		assert not create_condition_index(fileName, "/simulation/mc_event", condition)
+		table = hfile.root.simulation.mc_event
+		assert not table.cols.mc_energy.is_indexed
+		tabEventId = read_selected_event_ids(table, condition, "event_id")
+	assert tabEventId.tolist() == sorted(100 - i for i in range(12, 30, 3))
+	assert os.stat(fileName).st_mtime_ns == mtime
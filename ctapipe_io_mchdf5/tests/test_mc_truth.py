@@ -0,0 +1,29 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+
+from ctapipe_io_mchdf5.tools.mc_truth import find_event_rows, create_mc_truth_columns
+
+
+def test_find_event_rows():
+	tabEventId = np.array([40, 10, 30, 20], dtype=np.uint64)
+	tabRow = find_event_rows(tabEventId, np.array([10, 20, 25, 40, 50], dtype=np.uint64))
+	assert tabRow.tolist() == [1, 3, -1, 0, -1]
+	assert find_event_rows(np.zeros(0, dtype=np.uint64), np.array([1], dtype=np.uint64)).tolist() == [-1]
+
+
+def test_create_mc_truth_columns():
+	tabMcEvent = np.zeros(3, dtype=[("event_id", np.uint64), ("mc_energy", np.float32),
+									("mc_shower_primary_id", np.uint8)])
+	tabMcEvent["event_id"] = [7, 5, 9]
+	tabMcEvent["mc_energy"] = [0.7, 0.5, 0.9]
+	tabMcEvent["mc_shower_primary_id"] = [1, 2, 3]
+	mcEvent = create_mc_truth_columns(tabMcEvent, "event_id", ["mc_energy", "mc_shower_primary_id"],
+									  np.array([9, 8, 5], dtype=np.uint64))
+	assert np.allclose(mcEvent["mc_energy"][[0, 2]], [0.9, 0.5])
+	assert np.isnan(mcEvent["mc_energy"][1])
+	assert mcEvent["mc_shower_primary_id"].tolist() == [3, 0, 2]
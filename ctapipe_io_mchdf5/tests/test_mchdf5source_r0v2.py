@@ -0,0 +1,267 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.mchdf5eventsource_R0V2 import MCHDF5EventSourceR0V2
+from ctapipe_io_mchdf5.tools.get_telescope_info import *
+from ctapipe_io_mchdf5.tools.r0_file import open_output_file, create_file_structure
+from ctapipe_io_mchdf5.tools.instrument_utils import fill_subarray_layout, fill_optic_description
+from ctapipe_io_mchdf5.tools.r0_utils import R0EventWriter, set_mon_tel_pedestal_event_range
+from ctapipe_io_mchdf5.tools.r0_merge import merge_r0_files
+
+
+#Telescope id : (telescope type, number of gains, number of pixels, number of slices)
+DICO_TELESCOPE = {1: (0, 2, 7, 5), 4: (4, 1, 5, 4), 5: (0, 2, 7, 5)}
+NB_TELESCOPE = 6
+#Events in the order of the trigger table, with the telescopes which have triggered
+LIST_EVENT = [(12, [1, 4]), (3, [5]), (40, [1, 4, 5]), (7, [4]), (25, [1, 5])]
+OBS_ID = 17
+
+
+def create_telescope_info(telId, pedestalOffset=0.0):
+	'''
+	Create the telescope information the converter gets from the subarray description and the first event
+	'''
+	telType, nbGain, nbPixel, nbSlice = DICO_TELESCOPE[telId]
+	telInfo = [None] * (TELINFO_TIME_FIRST_EV + 1)
+	#The reference pulse shape is stored once per camera type
+	telInfo[TELINFO_REFSHAPE] = np.full((nbGain, 10), telType + 1, dtype=np.float32)
+	telInfo[TELINFO_REF_PULSE_TIME] = np.arange(10, dtype=np.float32)
+	telInfo[TELINFO_NBSLICE] = nbSlice
+	telInfo[TELINFO_PEDESTAL] = pedestalOffset + 100.0 * telId + np.arange(nbGain * nbPixel, dtype=np.float32).reshape(nbGain, nbPixel)
+	telInfo[TELINFO_GAIN] = np.full((nbGain, nbPixel), 0.5, dtype=np.float32) / (1.0 + np.arange(nbGain))[:, np.newaxis]
+	telInfo[TELINFO_TELTYPE] = telType
+	telInfo[TELINFO_FOCLEN] = 10.0 + telId
+	telInfo[TELINFO_TABPIXELX] = 0.1 * np.arange(nbPixel)
+	telInfo[TELINFO_TABPIXELY] = np.zeros(nbPixel)
+	telInfo[TELINFO_PIX_AREA] = np.ones(nbPixel)
+	telInfo[TELINFO_NBMIRROR] = 1
+	telInfo[TELINFO_NBMIRRORTILES] = 1
+	telInfo[TELINFO_MIRRORAREA] = 1.0
+	telInfo[TELINFO_TELPOSX] = float(telId)
+	telInfo[TELINFO_TELPOSY] = 2.0 * telId
+	telInfo[TELINFO_TELPOSZ] = 3.0 * telId
+	telInfo[TELINFO_NBGAIN] = nbGain
+	telInfo[TELINFO_NBPIXEL] = nbPixel
+	telInfo[TELINFO_NBEVENT] = 0
+	telInfo[TEL_INFOR_CAMERA_ROTATION] = 0.0
+	telInfo[TEL_INFOR_PIX_ROTATION] = 0.0
+	telInfo[TELINFO_TEL_NAME] = "T" + str(telId)
+	telInfo[TELINFO_ARRAY_ALT] = 1.2
+	telInfo[TELINFO_ARRAY_AZ] = 0.1
+	telInfo[TELINFO_ARRAY_RA] = 0.0
+	telInfo[TELINFO_ARRAY_DEC] = 0.0
+	telInfo[TELINFO_TIME_FIRST_EV] = 0.0
+	return telInfo
+
+
+def get_waveform(eventId, telId):
+	'''
+	Waveform of a telescope event with shape (nb_gain, nb_pixel, nb_slice), as given by the simtel source
+	'''
+	telType, nbGain, nbPixel, nbSlice = DICO_TELESCOPE[telId]
+	return (1000 * eventId + np.arange(nbGain * nbPixel * nbSlice)).reshape(nbGain, nbPixel, nbSlice).astype(np.uint16)
+
+
+def create_event(eventId, listTelId, obsId):
+	'''
+	Create the part of a simtel event written by the converter
+	'''
+	event = SimpleNamespace(index=SimpleNamespace(event_id=eventId, obs_id=obsId),
+							trigger=SimpleNamespace(time=SimpleNamespace(to_value=lambda fmt: 0.0),
+													event_type=SimpleNamespace(value=32)),
+							r0=SimpleNamespace(tels_with_data=listTelId, tel=dict()),
+							mc=SimpleNamespace(tel=dict()))
+	for telId in listTelId:
+		event.r0.tel[telId] = SimpleNamespace(waveform=get_waveform(eventId, telId))
+		event.mc.tel[telId] = SimpleNamespace(true_image=np.zeros(DICO_TELESCOPE[telId][2], dtype=np.float32))
+	return event
+
+
+def get_shower_direction(eventId):
+	'''
+	(altitude, azimuth) of the shower of an event in degrees
+	'''
+	return 60.0 + eventId / 10.0, 180.0 - eventId
+
+
+def create_r0_file(fileName, obsId=OBS_ID, eventIdOffset=0, pedestalOffset=0.0):
+	'''
+	Create a R0-V2 file with the functions of the converter, the event ids of LIST_EVENT are shifted by eventIdOffset
+	'''
+	dicoTelInfo = {telId: create_telescope_info(telId, pedestalOffset) for telId in DICO_TELESCOPE}
+	hfile = open_output_file(fileName)
+	try:
+		tableMcEvent = create_file_structure(hfile, dicoTelInfo)
+		fill_subarray_layout(hfile, dicoTelInfo, NB_TELESCOPE)
+		fill_optic_description(hfile, dicoTelInfo, NB_TELESCOPE)
+		runRow = hfile.root.configuration.simulation.run.row
+		runRow["obs_id"] = obsId
+		runRow["run_array_direction"] = (0.1, 1.2)
+		runRow.append()
+		writer = R0EventWriter(hfile)
+		listEventId = []
+		for eventId, listTelId in LIST_EVENT:
+			eventId += eventIdOffset
+			listEventId.append(eventId)
+			writer.append_event(create_event(eventId, listTelId, obsId))
+			mcRow = tableMcEvent.row
+			mcRow["event_id"] = eventId
+			mcRow["obs_id"] = obsId
+			mcRow["true_energy"] = eventId / 100.0
+			mcRow["true_alt"], mcRow["true_az"] = get_shower_direction(eventId)
+			mcRow.append()
+		writer.flush()
+		tableMcEvent.flush()
+		#Set by the writer of the converter at the end of the run
+		set_mon_tel_pedestal_event_range(hfile, obsId, min(listEventId), max(listEventId))
+	finally:
+		hfile.close()
+
+
+def get_r1_waveform(telId, tabWaveform, pedestalOffset=0.0):
+	telInfo = create_telescope_info(telId, pedestalOffset)
+	nbSlice = DICO_TELESCOPE[telId][3]
+	return (tabWaveform - telInfo[TELINFO_PEDESTAL][..., np.newaxis] / nbSlice) * telInfo[TELINFO_GAIN][..., np.newaxis]
+
+
+@pytest.fixture
+def r0_file(tmp_path):
+	fileName = str(tmp_path / "r0.h5")
+	create_r0_file(fileName)
+	return fileName
+
+
+def test_is_compatible(r0_file):
+	assert MCHDF5EventSourceR0V2.is_compatible(r0_file)
+
+
+def test_events_in_trigger_order(r0_file):
+	with tables.open_file(r0_file, "r") as hfile:
+		tabTriggerEventId = hfile.root.r0.event.subarray.trigger.col("event_id")
+	source = MCHDF5EventSourceR0V2(input_url=r0_file)
+	try:
+		listEventId = []
+		for event in source:
+			eventId = int(event.r0.event_id)
+			listTelId = dict(LIST_EVENT)[eventId]
+			listEventId.append(eventId)
+			assert int(event.r0.obs_id) == OBS_ID
+			assert sorted(event.r0.tels_with_data) == listTelId
+			assert sorted(event.trig.tels_with_trigger.tolist()) == listTelId
+			for telId in listTelId:
+				tabWaveform = get_waveform(eventId, telId)
+				np.testing.assert_array_equal(event.r0.tel[telId].waveform, tabWaveform)
+				if DICO_TELESCOPE[telId][1] == 2:
+					np.testing.assert_allclose(event.r1.tel[telId].waveform, get_r1_waveform(telId, tabWaveform),
+											   rtol=1e-5)
+				else:
+					#The R1 waveform is computed only for the cameras with two gains
+					assert telId not in event.r1.tel
+			showerAlt, showerAz = get_shower_direction(eventId)
+			assert event.mc.alt.deg == pytest.approx(showerAlt, rel=1e-5)
+			assert event.mc.az.deg == pytest.approx(showerAz, rel=1e-5)
+			assert event.mc.energy.value == pytest.approx(eventId / 100.0, rel=1e-5)
+	finally:
+		source.close()
+	assert listEventId == tabTriggerEventId.tolist() == [eventId for eventId, listTelId in LIST_EVENT]
+
+
+def test_tels_with_trigger_from_the_trigger_array(r0_file):
+	#The trigger pattern is read with the event, even if the index only has the allowed telescopes
+	source = MCHDF5EventSourceR0V2(input_url=r0_file, allowed_tels={4})
+	try:
+		listEvent = [(int(event.r0.event_id), sorted(event.r0.tels_with_data),
+					  sorted(event.trig.tels_with_trigger.tolist())) for event in source]
+	finally:
+		source.close()
+	assert listEvent == [(eventId, [4], listTelId) for eventId, listTelId in LIST_EVENT if 4 in listTelId]
+
+
+def test_monitoring_of_the_telescopes(r0_file):
+	source = MCHDF5EventSourceR0V2(input_url=r0_file)
+	try:
+		event = source[0]
+		for telId, (telType, nbGain, nbPixel, nbSlice) in DICO_TELESCOPE.items():
+			telInfo = create_telescope_info(telId)
+			np.testing.assert_allclose(event.mc.tel[telId].dc_to_pe, telInfo[TELINFO_GAIN])
+			np.testing.assert_allclose(event.mc.tel[telId].pedestal, telInfo[TELINFO_PEDESTAL])
+			np.testing.assert_allclose(event.mc.tel[telId].reference_pulse_shape, telInfo[TELINFO_REFSHAPE])
+	finally:
+		source.close()
+
+
+def test_subarray_from_the_instrument_configuration(r0_file):
+	source = MCHDF5EventSourceR0V2(input_url=r0_file)
+	try:
+		subarray = source.subarray_info
+	finally:
+		source.close()
+	#The telescopes which are not in the run are not in the subarray
+	assert sorted(int(telId) for telId in subarray.tels) == sorted(DICO_TELESCOPE)
+	for telId, (telType, nbGain, nbPixel, nbSlice) in DICO_TELESCOPE.items():
+		telescope = subarray.tels[telId]
+		np.testing.assert_allclose(subarray.positions[telId].to_value("m"), [telId, 2.0 * telId, 3.0 * telId])
+		assert telescope.optics.equivalent_focal_length.to_value("m") == pytest.approx(10.0 + telId)
+		np.testing.assert_allclose(telescope.camera.pix_x.to_value("m"), 0.1 * np.arange(nbPixel), rtol=1e-6)
+
+
+def test_pedestal_of_the_merged_runs(tmp_path):
+	listInputFileName = [str(tmp_path / "run_a.h5"), str(tmp_path / "run_b.h5")]
+	#(obs_id, event id offset, pedestal offset) of each run
+	listRun = [(OBS_ID, 0, 0.0), (OBS_ID + 1, 100, 50.0)]
+	for fileName, (obsId, eventIdOffset, pedestalOffset) in zip(listInputFileName, listRun):
+		create_r0_file(fileName, obsId, eventIdOffset, pedestalOffset)
+	mergedFileName = str(tmp_path / "merged.h5")
+	assert merge_r0_files(mergedFileName, listInputFileName) == [0, 0]
+	with tables.open_file(mergedFileName, "r") as hfile:
+		pedestal = hfile.root.r0.monitoring.telescope.pedestal.tel_001.read()
+	assert pedestal["obs_id"].tolist() == [OBS_ID, OBS_ID + 1]
+	assert pedestal["first_event_id"].tolist() == [3, 103] and pedestal["last_event_id"].tolist() == [40, 140]
+	source = MCHDF5EventSourceR0V2(input_url=mergedFileName)
+	try:
+		nbEvent = 0
+		for event, (obsId, eventIdOffset, pedestalOffset) in zip(source, [run for run in listRun for _ in LIST_EVENT]):
+			eventId = int(event.r0.event_id)
+			assert dict(LIST_EVENT)[eventId - eventIdOffset] == sorted(event.r0.tels_with_data)
+			for telId in event.r0.tels_with_data:
+				telInfo = create_telescope_info(telId, pedestalOffset)
+				np.testing.assert_allclose(event.mc.tel[telId].pedestal, telInfo[TELINFO_PEDESTAL])
+				if DICO_TELESCOPE[telId][1] == 2:
+					np.testing.assert_allclose(event.r1.tel[telId].waveform,
+											   get_r1_waveform(telId, get_waveform(eventId, telId), pedestalOffset),
+											   rtol=1e-5)
+			nbEvent += 1
+		assert nbEvent == 2 * len(LIST_EVENT)
+		#The random access uses the pedestal of the run of the event
+		event = source[len(LIST_EVENT)]
+		assert int(event.r0.event_id) == LIST_EVENT[0][0] + 100
+		np.testing.assert_allclose(event.r1.tel[1].waveform,
+								   get_r1_waveform(1, get_waveform(int(event.r0.event_id), 1), 50.0), rtol=1e-5)
+	finally:
+		source.close()
+
+
+def test_merged_runs_with_the_same_event_ids(tmp_path):
+	listInputFileName = [str(tmp_path / "run_a.h5"), str(tmp_path / "run_b.h5")]
+	create_r0_file(listInputFileName[0], OBS_ID)
+	create_r0_file(listInputFileName[1], OBS_ID + 1)
+	mergedFileName = str(tmp_path / "merged.h5")
+	#The (obs_id, event_id) are unique without shift
+	assert merge_r0_files(mergedFileName, listInputFileName) == [0, 0]
+	source = MCHDF5EventSourceR0V2(input_url=mergedFileName)
+	try:
+		with pytest.raises(ValueError, match="merged_input"):
+			len(source)
+	finally:
+		source.close()
@@ -0,0 +1,212 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import time
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5 import mchdf5eventsource_multifile
+from ctapipe_io_mchdf5.mchdf5eventsource_multifile import MCHDF5MultiFileEventSource, expand_input_urls
+from ctapipe_io_mchdf5.mchdf5eventsource_V2 import MCHDF5EventSourceV2
+
+
+#Telescope id : (telescope type, number of pixels, number of slices)
+DICO_TELESCOPE = {1: (0, 7, 5), 2: (1, 9, 6)}
+NB_TELESCOPE = 3
+
+
+class Trigger(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	obs_id = tables.UInt64Col()
+	time_s = tables.UInt32Col()
+	time_qns = tables.UInt32Col()
+
+
+class McEvent(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	mc_energy = tables.Float32Col()
+	mc_alt = tables.Float32Col()
+	mc_az = tables.Float32Col()
+	mc_core_x = tables.Float32Col()
+	mc_core_y = tables.Float32Col()
+	mc_h_first_int = tables.Float32Col()
+	mc_x_max = tables.Float32Col()
+	mc_shower_primary_id = tables.UInt8Col()
+
+
+def create_r1_file(fileName, listEventId, obsId=None, waveformOffset=0):
+	'''
+	Create a small R1-V2 file whose telescope 1 has all the events and telescope 2 one event out of two.
+	The waveform of the event i of a telescope is filled with waveformOffset + i
+	'''
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		hfile.create_group("/", "r1")
+		hfile.create_group("/", "instrument")
+		hfile.create_group("/instrument", "subarray")
+		hfile.create_group("/instrument/subarray", "telescope")
+		hfile.create_group("/instrument/subarray/telescope", "camera")
+		for telId, (telType, nbPixel, nbSlice) in DICO_TELESCOPE.items():
+			telNode = hfile.create_group("/r1", "Tel_" + str(telId))
+			hfile.create_array(telNode, "telId", np.uint64(telId))
+			hfile.create_array(telNode, "telIndex", np.uint64(telId - 1))
+			hfile.create_array(telNode, "telType", np.uint64(telType))
+			hfile.create_array(telNode, "nbGain", np.uint64(1))
+			hfile.create_array(telNode, "nbPixel", np.uint64(nbPixel))
+			hfile.create_array(telNode, "nbSlice", np.uint64(nbSlice))
+			hfile.create_array(telNode, "tabGain", np.ones((1, nbPixel), dtype=np.float32))
+			hfile.create_array(telNode, "tabRefShape", np.ones((1, 10), dtype=np.float32))
+			pedestal = hfile.create_table(telNode, "pedestal", np.dtype([("first_event_id", np.uint64),
+																		 ("last_event_id", np.uint64),
+																		 ("pedestal", np.float32, (1, nbPixel))]))
+			pedestal.append(np.zeros(1, dtype=pedestal.dtype))
+			tabEventId = np.asarray(listEventId, dtype=np.uint64)[::telId]
+			trigger = hfile.create_table(telNode, "trigger", Trigger)
+			trigger.append([(eventId, 0, 0, 0) for eventId in tabEventId])
+			waveform = hfile.create_table(telNode, "waveformHi", np.dtype([("waveformHi", np.uint16, (nbSlice, nbPixel))]))
+			tabWaveform = np.zeros(tabEventId.size, dtype=waveform.dtype)
+			tabWaveform["waveformHi"] = (waveformOffset + np.arange(tabEventId.size))[:, np.newaxis, np.newaxis]
+			waveform.append(tabWaveform)
+			camNode = hfile.create_group("/instrument/subarray/telescope/camera", "Cam_" + str(telId))
+			hfile.create_array(camNode, "pix_x", np.arange(nbPixel, dtype=np.float64))
+			hfile.create_array(camNode, "pix_y", np.zeros(nbPixel, dtype=np.float64))
+		optics = hfile.create_table("/instrument/subarray/telescope", "optics",
+									np.dtype([("equivalent_focal_length", np.float32)]))
+		optics.append(np.full(NB_TELESCOPE, 16.0, dtype=optics.dtype))
+		layout = hfile.create_table("/instrument/subarray", "layout", np.dtype([("pos_x", np.float32),
+																			   ("pos_y", np.float32),
+																			   ("pos_z", np.float32)]))
+		layout.append(np.zeros(NB_TELESCOPE, dtype=layout.dtype))
+		hfile.create_group("/", "simulation")
+		mcEvent = hfile.create_table("/simulation", "mc_event", McEvent)
+		tabMcEvent = np.zeros(len(listEventId), dtype=mcEvent.dtype)
+		tabMcEvent["event_id"] = listEventId
+		tabMcEvent["mc_energy"] = 0.1 * np.arange(len(listEventId))
+		mcEvent.append(tabMcEvent)
+		listRunColumn = [("run_array_direction", np.float32, (2,))]
+		if obsId is not None:
+			listRunColumn.append(("obs_id", np.uint64))
+		runConfig = hfile.create_table("/simulation", "run_config", np.dtype(listRunColumn))
+		tabRunConfig = np.zeros(1, dtype=runConfig.dtype)
+		if obsId is not None:
+			tabRunConfig["obs_id"] = obsId
+		runConfig.append(tabRunConfig)
+
+
+def create_production(tmp_path):
+	'''
+	Create two files with the same event ids, the first one without obs_id (its obs_id is its position in the
+	chain) and the second one with the obs_id 7
+	'''
+	listFileName = [str(tmp_path / "run_a.h5"), str(tmp_path / "run_b.h5")]
+	create_r1_file(listFileName[0], [5, 8, 9, 12, 20], None, 0)
+	create_r1_file(listFileName[1], [5, 8, 9], 7, 100)
+	return listFileName
+
+
+def get_event_key(event):
+	return int(event.r0.obs_id), int(event.r0.event_id), int(event.r0.tel[1].waveform[0, 0, 0])
+
+
+def test_global_iteration_order(tmp_path):
+	listFileName = create_production(tmp_path)
+	listRef = []
+	for fileName in listFileName:
+		source = MCHDF5EventSourceV2(input_url=fileName)
+		listRef += [get_event_key(event)[1:] for event in source]
+		source.close()
+	with MCHDF5MultiFileEventSource(str(tmp_path / "run_*.h5"), nb_worker=1) as source:
+		assert source.input_urls == listFileName
+		assert source.obs_ids.tolist() == [0, 7]
+		listEvent = []
+		for counter, event in enumerate(source):
+			assert event.count == counter
+			listEvent.append(get_event_key(event))
+		tabObsId, tabEventId = source.get_event_keys()
+	assert len(listEvent) == len(source) == 8
+	assert [key[1:] for key in listEvent] == listRef
+	assert [key[0] for key in listEvent] == [0] * 5 + [7] * 3
+	assert list(zip(tabObsId.tolist(), tabEventId.tolist())) == [key[:2] for key in listEvent]
+
+
+def test_position_across_file_boundary(tmp_path):
+	listFileName = create_production(tmp_path)
+	with MCHDF5MultiFileEventSource(listFileName, nb_worker=1, max_open_files=1) as source:
+		assert get_event_key(source[4]) == (0, 20, 4)
+		assert get_event_key(source[5]) == (7, 5, 100)
+		assert get_event_key(source[-1]) == (7, 9, 102)
+		assert source[5].count == 5
+		#Only the last used file stays open
+		assert len(source._sources) == 1
+		with pytest.raises(IndexError):
+			source[8]
+
+
+def test_find_event_with_colliding_event_ids(tmp_path):
+	listFileName = create_production(tmp_path)
+	with MCHDF5MultiFileEventSource(listFileName, nb_worker=1) as source:
+		assert source.find_event(0, 8) == 1
+		assert source.find_event(7, 8) == 6
+		assert get_event_key(source.get_event(7, 9)) == (7, 9, 102)
+		assert get_event_key(source.get_event(0, 9)) == (0, 9, 2)
+		with pytest.raises(KeyError):
+			source.find_event(7, 20)
+		with pytest.raises(KeyError):
+			source.find_event(3, 5)
+
+
+def test_fallback_obs_id_collision(tmp_path):
+	listFileName = create_production(tmp_path)
+	#The file without obs_id gets 1 in this chain, it is the obs_id of the other file
+	fileName = str(tmp_path / "run_c.h5")
+	create_r1_file(fileName, [5, 8], 1, 200)
+	with pytest.raises(ValueError, match="run_a.h5"):
+		MCHDF5MultiFileEventSource([fileName, listFileName[0]], nb_worker=1)
+	with MCHDF5MultiFileEventSource([listFileName[0], fileName], nb_worker=1) as source:
+		assert source.obs_ids.tolist() == [0, 1]
+
+
+def test_index_cache_hit(tmp_path, monkeypatch):
+	listFileName = create_production(tmp_path)
+	indexCacheDir = str(tmp_path / "index")
+	listLoaded = []
+	loadEventIndex = mchdf5eventsource_multifile.load_event_index
+
+	def load_counted_event_index(fileName):
+		listLoaded.append(fileName)
+		return loadEventIndex(fileName)
+
+	monkeypatch.setattr(mchdf5eventsource_multifile, "load_event_index", load_counted_event_index)
+	#The selection creates the index of the mc_energy column in the first construction only
+	with MCHDF5MultiFileEventSource(listFileName, nb_worker=1, index_cache_dir=indexCacheDir,
+									mc_selection="mc_energy > 0.15") as source:
+		listRef = source.get_event_keys()
+	assert listLoaded == []
+	listCacheFile = sorted(os.listdir(indexCacheDir))
+	assert len(listCacheFile) == len(listFileName)
+	listMtime = [os.stat(fileName).st_mtime_ns for fileName in listFileName]
+	time.sleep(0.05)
+	with MCHDF5MultiFileEventSource(listFileName, nb_worker=1, index_cache_dir=indexCacheDir,
+									mc_selection="mc_energy > 0.15") as source:
+		tabObsId, tabEventId = source.get_event_keys()
+		assert get_event_key(source[0]) == (0, 9, 2)
+	assert len(listLoaded) == len(listFileName)
+	assert sorted(os.listdir(indexCacheDir)) == listCacheFile
+	assert [os.stat(fileName).st_mtime_ns for fileName in listFileName] == listMtime
+	assert tabObsId.tolist() == listRef[0].tolist() and tabEventId.tolist() == listRef[1].tolist()
+	assert tabEventId.tolist() == [9, 12, 20, 9]
+
+
+def test_expand_input_urls(tmp_path):
+	listFileName = create_production(tmp_path)
+	assert expand_input_urls(str(tmp_path / "run_*.h5")) == listFileName
+	assert expand_input_urls([listFileName[1], str(tmp_path / "run_a*")]) == [listFileName[1], listFileName[0]]
+	with pytest.raises(FileNotFoundError):
+		expand_input_urls(str(tmp_path / "missing_*.h5"))
@@ -0,0 +1,50 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import time
+
+import numpy as np
+import pytest
+
+from ctapipe_io_mchdf5.tools.prefetch import PrefetchReader, get_nb_byte
+
+
+def test_prefetch_order_and_bounds():
+	reader = PrefetchReader(range(50), lambda item: [np.full(10, item, dtype=np.uint8), None], nbItemMax=3,
+							nbByteMax=25)
+	listItem = []
+	for item, value in reader:
+		#Let the background thread fill the buffer
+		time.sleep(0.001)
+		assert np.all(value[0] == item)
+		#Two items of 10 bytes fit in 25 bytes
+		assert len(reader.buffer) <= 2
+		assert reader.nbByte <= 25
+		listItem.append(item)
+	reader.close()
+	assert listItem == list(range(50))
+	assert get_nb_byte({"a": np.zeros(4, dtype=np.uint16), "b": (np.zeros(3, dtype=np.uint8), None)}) == 11
+
+
+def test_prefetch_close_and_error():
+	reader = PrefetchReader(range(1000), lambda item: np.zeros(100), nbItemMax=2)
+	for item, value in reader:
+		if item == 5:
+			break
+	reader.close()
+	assert not reader.thread.is_alive()
+
+	def read(item):
+		if item == 3:
+			raise ValueError("bad item")
+		return item
+	reader = PrefetchReader(range(10), read, nbItemMax=2)
+	listItem = []
+	with pytest.raises(ValueError):
+		for item, value in reader:
+			listItem.append(item)
+	assert listItem == [0, 1, 2]
+	reader.close()
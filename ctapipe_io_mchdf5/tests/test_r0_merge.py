@@ -0,0 +1,107 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools import r0_merge
+from ctapipe_io_mchdf5.tools.r0_merge import merge_r0_files, get_event_id_offset
+
+
+def create_r0_file(fileName, listTelId, tabEventId, obsId, layoutPosition=1.0, pedestal=5.0):
+	with tables.open_file(fileName, "w") as hfile:
+		hfile.title = "R0-V2"
+		layout = hfile.create_table("/configuration/instrument/subarray", "layout",
+									{"tel_id": tables.UInt64Col(), "pos_x": tables.Float32Col()}, createparents=True)
+		layout.append(np.array([(1, layoutPosition), (2, 2.0 * layoutPosition)], dtype=layout.dtype))
+		trigger = hfile.create_table("/r0/event/subarray", "trigger", {"obs_id": tables.UInt64Col(),
+									 "event_id": tables.UInt64Col()}, createparents=True)
+		tabTrigger = np.zeros(tabEventId.size, dtype=trigger.dtype)
+		tabTrigger["obs_id"] = obsId
+		tabTrigger["event_id"] = tabEventId
+		trigger.append(tabTrigger)
+		telsWithTrigger = hfile.create_vlarray("/r0/event/subarray", "tels_with_trigger", tables.UInt16Atom(shape=()))
+		for eventId in tabEventId:
+			telsWithTrigger.append(listTelId)
+		hfile.create_group("/r0", "service")
+		for telId in listTelId:
+			tableName = "tel_{0:0=3d}".format(telId)
+			hfile.create_array("/r0/monitoring/telescope/gain", tableName, np.full(3, telId, dtype=np.float32),
+							   createparents=True)
+			tablePedestal = hfile.create_table("/r0/monitoring/telescope/pedestal", tableName,
+											   {"obs_id": tables.UInt64Col(), "first_event_id": tables.UInt64Col(),
+												"last_event_id": tables.UInt64Col(),
+												"pedestal": tables.Float32Col(shape=(1, 3))}, createparents=True)
+			tabPedestal = np.zeros(1, dtype=tablePedestal.dtype)
+			tabPedestal["obs_id"] = obsId
+			tabPedestal["first_event_id"] = tabEventId.min()
+			tabPedestal["last_event_id"] = tabEventId.max()
+			tabPedestal["pedestal"] = pedestal
+			tablePedestal.append(tabPedestal)
+			waveform = hfile.create_table("/r0/event/telescope/waveform", tableName, {"event_id": tables.UInt64Col(),
+										  "waveformHi": tables.UInt16Col(shape=(4, 3))}, createparents=True,
+										  chunkshape=2)
+			tabRow = np.zeros(tabEventId.size, dtype=waveform.dtype)
+			tabRow["event_id"] = tabEventId
+			tabRow["waveformHi"] = (tabEventId + telId).reshape(-1, 1, 1)
+			waveform.append(tabRow)
+
+
+def test_event_id_offset():
+	tabMerged = np.array([1, 5, 9], dtype=np.uint64)
+	assert get_event_id_offset(np.array([10, 12], dtype=np.uint64), tabMerged) == 0
+	assert get_event_id_offset(np.array([2, 3], dtype=np.uint64), tabMerged) == 0
+	assert get_event_id_offset(np.array([3, 5], dtype=np.uint64), tabMerged) == 7
+	assert get_event_id_offset(np.array([3, 5], dtype=np.uint64), np.zeros(0, dtype=np.uint64)) == 0
+
+
+def test_merge_r0_files(tmp_path, monkeypatch):
+	#Blocks of 2 rows of the variable length arrays
+	monkeypatch.setattr(r0_merge, "NB_ROW_PER_VLARRAY_BLOCK", 2)
+	listInputFileName = [str(tmp_path / "run{}.h5".format(i)) for i in range(1, 5)]
+	create_r0_file(listInputFileName[0], [1], np.array([1, 2, 3], dtype=np.uint64), 10)
+	create_r0_file(listInputFileName[1], [1, 2], np.array([2, 4], dtype=np.uint64), 11)
+	create_r0_file(listInputFileName[2], [2], np.array([100], dtype=np.uint64), 12)
+	#The event 4 of the obs_id 11 is already in the merged file
+	create_r0_file(listInputFileName[3], [1], np.array([4, 5], dtype=np.uint64), 11, pedestal=7.0)
+	outputFileName = str(tmp_path / "merged.h5")
+	#Blocks of 32 bytes : 1 row per block
+	assert merge_r0_files(outputFileName, listInputFileName, 32) == [0, 0, 0, 1]
+	with tables.open_file(outputFileName, "r") as hfile:
+		assert hfile.title == "R0-V2"
+		trigger = hfile.root.r0.event.subarray.trigger.read()
+		assert trigger["event_id"].tolist() == [1, 2, 3, 2, 4, 100, 5, 6]
+		assert trigger["obs_id"].tolist() == [10, 10, 10, 11, 11, 12, 11, 11]
+		tabTelsWithTrigger = hfile.root.r0.event.subarray.tels_with_trigger.read()
+		assert [row.tolist() for row in tabTelsWithTrigger] == [[1], [1], [1], [1, 2], [1, 2], [2], [1], [1]]
+		assert hfile.root.configuration.instrument.subarray.layout.nrows == 2
+		tel1 = hfile.root.r0.event.telescope.waveform.tel_001
+		assert tel1.chunkshape == (2,)
+		assert tel1.col("event_id").tolist() == [1, 2, 3, 2, 4, 5, 6]
+		assert tel1.col("waveformHi")[:, 0, 0].tolist() == [2, 3, 4, 3, 5, 5, 6]
+		tel2 = hfile.root.r0.event.telescope.waveform.tel_002
+		assert tel2.col("event_id").tolist() == [2, 4, 100]
+		assert hfile.root.r0.monitoring.telescope.gain.tel_002.read().tolist() == [2.0, 2.0, 2.0]
+		#The pedestal of each file is appended with the shifted event ids of the file
+		pedestal = hfile.root.r0.monitoring.telescope.pedestal.tel_001.read()
+		assert pedestal["obs_id"].tolist() == [10, 11, 11]
+		assert pedestal["first_event_id"].tolist() == [1, 2, 5]
+		assert pedestal["last_event_id"].tolist() == [3, 4, 6]
+		assert pedestal["pedestal"][:, 0, 0].tolist() == [5.0, 5.0, 7.0]
+		assert hfile.root.r0.monitoring.telescope.pedestal.tel_002.nrows == 2
+		mergedInput = hfile.root.r0.service.merged_input.read()
+		assert mergedInput["event_id_offset"].tolist() == [0, 0, 0, 1]
+		assert mergedInput["first_event"].tolist() == [0, 3, 5, 6]
+		assert mergedInput["obs_id"].tolist() == [10, 11, 12, 11]
+
+
+def test_merge_r0_files_with_different_instruments(tmp_path):
+	listInputFileName = [str(tmp_path / "run1.h5"), str(tmp_path / "run2.h5")]
+	create_r0_file(listInputFileName[0], [1], np.array([1], dtype=np.uint64), 10)
+	create_r0_file(listInputFileName[1], [1], np.array([2], dtype=np.uint64), 11, layoutPosition=3.0)
+	with pytest.raises(ValueError):
+		merge_r0_files(str(tmp_path / "merged.h5"), listInputFileName)
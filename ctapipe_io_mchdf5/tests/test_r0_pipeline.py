@@ -0,0 +1,122 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.tools.r0_pipeline import QueuedTable, QueuedVLArray, MessageQueue, R0PipelineWriter, \
+	write_queued_messages, MSG_ROWS, MSG_VLROWS, MSG_END
+from ctapipe_io_mchdf5.tools.table_buffer import TableBuffer
+from ctapipe_io_mchdf5.tools.r0_utils import create_table_pedestal
+
+
+class ListQueue(object):
+	def __init__(self):
+		self.listMessage = []
+
+	def put(self, message):
+		self.listMessage.append(message)
+
+
+class PipelineRow(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	energy = tables.Float32Col(dflt=-1.0)
+
+
+def test_queued_table_sends_copied_blocks():
+	queue = ListQueue()
+	buffer = TableBuffer(QueuedTable(queue, "/table", PipelineRow), 2, 0)
+	for i in range(5):
+		row = buffer.row
+		row["event_id"] = i
+		if i % 2 == 0:
+			row["energy"] = 2.0 * i
+		row.append()
+	buffer.flush()
+	assert [message[0] for message in queue.listMessage] == [MSG_ROWS] * 3
+	tabRow = np.concatenate([message[2] for message in queue.listMessage])
+	assert tabRow["event_id"].tolist() == list(range(5))
+	assert tabRow["energy"].tolist() == [0.0, -1.0, 4.0, -1.0, 8.0]
+	vlarray = QueuedVLArray(queue, "/vlarray", 2)
+	vlarray.append([1, 2])
+	vlarray.append([3])
+	vlarray.append([4])
+	vlarray.flush()
+	assert [message[2] for message in queue.listMessage if message[0] == MSG_VLROWS] == [[[1, 2], [3]], [[4]]]
+
+
+def test_message_queue_and_writer(tmp_path):
+	queue = MessageQueue(4)
+	tabRow = np.zeros(3, dtype=[("event_id", np.uint64), ("energy", np.float32)])
+	queue.put((MSG_ROWS, "/table", tabRow))
+	#The message is pickled by put : the buffer can be reused
+	tabRow["event_id"] = 7
+	message = queue.get()
+	assert message[2]["event_id"].tolist() == [0, 0, 0]
+	writer = R0PipelineWriter(str(tmp_path / "pipeline.h5"))
+	writer.process_message((MSG_END, 0, {}, None))
+	assert writer.isDone
+	writer.hfile.create_table("/", "table", PipelineRow)
+	writer.process_message(message)
+	writer.close()
+	with tables.open_file(str(tmp_path / "pipeline.h5"), "r") as hfile:
+		assert hfile.title == "R0-V2"
+		assert hfile.root.table.nrows == 3
+
+
+def test_writer_sets_the_pedestal_event_range(tmp_path):
+	writer = R0PipelineWriter(str(tmp_path / "pipeline.h5"))
+	hfile = writer._open()
+	pedestalGroup = hfile.create_group("/r0/monitoring/telescope", "pedestal", createparents=True)
+	for telId in [1, 3]:
+		table = create_table_pedestal(hfile, pedestalGroup, 2, 4, telId)
+		table.append(np.array([(0, 0, 1, np.full((2, 4), telId))], dtype=table.dtype))
+	create_table_pedestal(hfile, pedestalGroup, 1, 4, 5)
+	#The pedestal of the run is valid for all its events
+	writer.process_message((MSG_END, 3, {1: 3, 3: 1}, (42, 7, 29)))
+	assert writer.isDone
+	writer.close()
+	with tables.open_file(str(tmp_path / "pipeline.h5"), "r") as hfile:
+		for telId in [1, 3]:
+			tabPedestal = hfile.get_node("/r0/monitoring/telescope/pedestal", "tel_{0:0=3d}".format(telId)).read()
+			assert tabPedestal[["obs_id", "first_event_id", "last_event_id"]].tolist() == [(42, 7, 29)]
+			assert (tabPedestal["pedestal"] == telId).all()
+		assert hfile.root.r0.monitoring.telescope.pedestal.tel_005.nrows == 0
+
+
+def send_end_and_exit(queue):
+	queue.put((MSG_END, 2, {1: 2}, None))
+	queue.queue.close()
+	queue.queue.join_thread()
+	os._exit(0)
+
+
+def test_writer_stops_when_decode_process_dies(tmp_path):
+	queue = MessageQueue(4)
+	process = multiprocessing.Process(target=os._exit, args=(3,))
+	process.start()
+	writer = R0PipelineWriter(str(tmp_path / "pipeline.h5"))
+	try:
+		with pytest.raises(RuntimeError, match="exit code 3"):
+			write_queued_messages(writer, queue, process, 0.05)
+	finally:
+		process.join()
+		writer.close()
+	#The last message of a process which has stopped is still written
+	queue = MessageQueue(4)
+	process = multiprocessing.Process(target=send_end_and_exit, args=(queue,))
+	process.start()
+	process.join()
+	writer = R0PipelineWriter(str(tmp_path / "pipeline.h5"))
+	write_queued_messages(writer, queue, process, 0.05)
+	writer.close()
+	assert writer.isDone and writer.nbEvent == 2
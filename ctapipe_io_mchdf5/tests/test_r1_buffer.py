@@ -0,0 +1,104 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.mchdf5eventsource_V2 import MCHDF5EventSourceV2
+
+
+LIST_EVENT_ID = [4, 7, 11]
+TEL_ID, NB_GAIN, NB_PIXEL, NB_SLICE = 1, 2, 4, 3
+
+
+class Trigger(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	obs_id = tables.UInt64Col()
+	time_s = tables.UInt32Col()
+	time_qns = tables.UInt32Col()
+
+
+def create_r1_file(fileName):
+	'''
+	Create a small R1-V2 file with one telescope with two gains, the waveform of an event is filled with its id
+	'''
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		camera = hfile.create_group("/instrument/subarray/telescope", "camera", createparents=True)
+		telNode = hfile.create_group("/r1", "Tel_" + str(TEL_ID), createparents=True)
+		for name, value in [("telId", TEL_ID), ("telIndex", TEL_ID - 1), ("telType", 0), ("nbGain", NB_GAIN),
+							("nbPixel", NB_PIXEL), ("nbSlice", NB_SLICE)]:
+			hfile.create_array(telNode, name, np.uint64(value))
+		hfile.create_array(telNode, "tabGain", np.ones((NB_GAIN, NB_PIXEL), dtype=np.float32))
+		hfile.create_array(telNode, "tabRefShape", np.ones((NB_GAIN, 10), dtype=np.float32))
+		pedestal = hfile.create_table(telNode, "pedestal", np.dtype([("first_event_id", np.uint64),
+																	 ("last_event_id", np.uint64),
+																	 ("pedestal", np.float32, (NB_GAIN, NB_PIXEL))]))
+		pedestal.append(np.zeros(1, dtype=pedestal.dtype))
+		trigger = hfile.create_table(telNode, "trigger", Trigger)
+		trigger.append([(eventId, 0, 0, 0) for eventId in LIST_EVENT_ID])
+		for columnName in ["waveformHi", "waveformLo"]:
+			waveform = hfile.create_table(telNode, columnName, np.dtype([(columnName, np.uint16, (NB_SLICE, NB_PIXEL))]))
+			tabWaveform = np.zeros(len(LIST_EVENT_ID), dtype=waveform.dtype)
+			tabWaveform[columnName] = np.asarray(LIST_EVENT_ID)[:, np.newaxis, np.newaxis]
+			waveform.append(tabWaveform)
+		camNode = hfile.create_group(camera, "Cam_" + str(TEL_ID))
+		hfile.create_array(camNode, "pix_x", np.arange(NB_PIXEL, dtype=np.float64))
+		hfile.create_array(camNode, "pix_y", np.zeros(NB_PIXEL, dtype=np.float64))
+		optics = hfile.create_table("/instrument/subarray/telescope", "optics",
+									np.dtype([("equivalent_focal_length", np.float32)]))
+		optics.append(np.full(1, 16.0, dtype=optics.dtype))
+		layout = hfile.create_table("/instrument/subarray", "layout", np.dtype([("pos_x", np.float32),
+																			   ("pos_y", np.float32),
+																			   ("pos_z", np.float32)]))
+		layout.append(np.zeros(1, dtype=layout.dtype))
+		mcEvent = hfile.create_table("/simulation", "mc_event", np.dtype([("event_id", np.uint64),
+																		  ("mc_energy", np.float32),
+																		  ("mc_alt", np.float32),
+																		  ("mc_az", np.float32),
+																		  ("mc_core_x", np.float32),
+																		  ("mc_core_y", np.float32),
+																		  ("mc_h_first_int", np.float32),
+																		  ("mc_x_max", np.float32),
+																		  ("mc_shower_primary_id", np.uint8)]),
+									 createparents=True)
+		tabMcEvent = np.zeros(len(LIST_EVENT_ID), dtype=mcEvent.dtype)
+		tabMcEvent["event_id"] = LIST_EVENT_ID
+		mcEvent.append(tabMcEvent)
+		runConfig = hfile.create_table("/simulation", "run_config", np.dtype([("run_array_direction", np.float32,
+																			   (2,))]))
+		runConfig.append(np.zeros(1, dtype=runConfig.dtype))
+
+
+def read_r1_waveforms(fileName, **kwargs):
+	'''
+	Keep the R1 waveform of each event of the iteration, without copy
+	'''
+	source = MCHDF5EventSourceV2(input_url=fileName, **kwargs)
+	try:
+		return [event.r1.tel[TEL_ID].waveform for event in source]
+	finally:
+		source.close()
+
+
+@pytest.mark.parametrize("reuseBuffer", [True, False])
+def test_reuse_r1_buffer(tmp_path, reuseBuffer):
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName)
+	listWaveform = read_r1_waveforms(fileName, reuse_r1_buffer=reuseBuffer)
+	assert len(listWaveform) == len(LIST_EVENT_ID)
+	if reuseBuffer:
+		#All the events share the buffer, it holds the last event
+		assert all(waveform is listWaveform[0] for waveform in listWaveform)
+		listExpected = [LIST_EVENT_ID[-1]] * len(LIST_EVENT_ID)
+	else:
+		assert len(set(id(waveform) for waveform in listWaveform)) == len(LIST_EVENT_ID)
+		listExpected = LIST_EVENT_ID
+	for waveform, eventId in zip(listWaveform, listExpected):
+		assert waveform.shape == (NB_GAIN, NB_PIXEL, NB_SLICE)
+		np.testing.assert_allclose(waveform, eventId)
@@ -0,0 +1,69 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+
+from ctapipe_io_mchdf5.tools.r1_calibration import TelescopeR1Calibration, R1CalibrationCache, PedestalSelection
+
+
+NB_GAIN = 2
+NB_PIXEL = 6
+NB_SLICE = 5
+
+
+def create_calibration_data():
+	'''
+	Create random calibration factors and waveforms
+	'''
+	rng = np.random.RandomState(42)
+	dc_to_pe = rng.uniform(0.01, 0.1, (NB_GAIN, NB_PIXEL)).astype(np.float32)
+	pedestal = rng.uniform(1000.0, 2000.0, (NB_GAIN, NB_PIXEL)).astype(np.float32)
+	tabWaveform = rng.randint(200, 600, (3, NB_GAIN, NB_PIXEL, NB_SLICE)).astype(np.uint16)
+	return dc_to_pe, pedestal, tabWaveform
+
+
+def test_calibration_values_and_buffer():
+	dc_to_pe, pedestal, tabWaveform = create_calibration_data()
+	calibration = TelescopeR1Calibration(dc_to_pe, pedestal, NB_SLICE, np.float64)
+	tabExpected = (tabWaveform[0] - pedestal[..., np.newaxis].astype(np.float64) / NB_SLICE) * dc_to_pe[..., np.newaxis]
+	assert np.allclose(calibration.calibrate(tabWaveform[0]), tabExpected)
+	buffer = calibration.calibrate_in_buffer(tabWaveform[0])
+	assert buffer.dtype == np.float64
+	assert np.allclose(buffer, tabExpected)
+	assert calibration.calibrate_in_buffer(tabWaveform[1]) is buffer
+	#A whole block of events is calibrated at once
+	tabBlock = calibration.calibrate(tabWaveform)
+	assert tabBlock.shape == tabWaveform.shape
+	assert np.allclose(tabBlock[0], tabExpected)
+
+
+def test_calibration_cache():
+	dc_to_pe, pedestal, tabWaveform = create_calibration_data()
+	cache = R1CalibrationCache({1: (dc_to_pe, pedestal, None)})
+	calibration = cache.get_calibration(1, NB_SLICE)
+	assert cache.get_calibration(1, NB_SLICE) is calibration
+	assert calibration.calibrate(tabWaveform[0]).dtype == np.float32
+
+
+def test_pedestal_selection():
+	tabPedestal = np.zeros(3, dtype=[("obs_id", np.uint64), ("first_event_id", np.uint64),
+									 ("last_event_id", np.uint64), ("pedestal", np.float32, (NB_GAIN, NB_PIXEL))])
+	#Two runs whose event ids overlap and a third one after them
+	tabPedestal["obs_id"] = [10, 11, 11]
+	tabPedestal["first_event_id"] = [1, 2, 5]
+	tabPedestal["last_event_id"] = [3, 4, 6]
+	tabPedestal["pedestal"] = np.arange(3)[:, np.newaxis, np.newaxis]
+	selection = PedestalSelection(tabPedestal)
+	assert [selection.find_row(eventId, 10) for eventId in [1, 2, 3]] == [0, 0, 0]
+	assert [selection.find_row(eventId, 11) for eventId in [2, 3, 4, 5, 6]] == [1, 1, 1, 2, 2]
+	#Without obs_id the first run of the event is used, the first row if there is none
+	assert selection.find_row(2) == 0 and selection.find_row(5) == 2
+	assert selection.find_row(50, 11) == 0 and selection.find_row(2, 12) == 0
+	assert [selection.get_row(pedestal) for pedestal in selection.listPedestal] == [0, 1, 2]
+	assert selection.get_row(selection.listPedestal[2].copy()) == 0
+	#The pedestal tables written before the obs_id column are selected on the event ids only
+	selection = PedestalSelection(tabPedestal[["first_event_id", "last_event_id", "pedestal"]])
+	assert selection.tabObsId is None and selection.find_row(4, 10) == 1
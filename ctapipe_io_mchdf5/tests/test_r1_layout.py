@@ -0,0 +1,82 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.programs.mchdf5_min_selection import processMinSelection
+from ctapipe_io_mchdf5.programs.mchdf5_slice_selection import processSliceSelectionFile
+from ctapipe_io_mchdf5.tools.r1_layout import get_file_layout, MinSelectedWaveformReader, \
+	iter_min_selected_waveform_batches, LAYOUT_RAW, LAYOUT_MIN_SELECTION, LAYOUT_SLICE_SELECTION
+
+
+NB_EVENT = 10
+NB_SLICE = 4
+NB_PIXEL = 3
+
+
+def create_r1_file(fileName):
+	'''
+	Create a R1-V2 file with one telescope with two gains and random waveforms
+	Return:
+	-------
+		high and low gain waveforms with shape (NB_EVENT, NB_SLICE, NB_PIXEL)
+	'''
+	randomState = np.random.RandomState(42)
+	tabWaveformHi = randomState.randint(200, 400, size=(NB_EVENT, NB_SLICE, NB_PIXEL)).astype(np.uint16)
+	tabWaveformLo = randomState.randint(100, 200, size=(NB_EVENT, NB_SLICE, NB_PIXEL)).astype(np.uint16)
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		hfile.create_group("/", "r1")
+		telNode = hfile.create_group("/r1", "Tel_1")
+		for name, value in (("nbPixel", NB_PIXEL), ("nbSlice", NB_SLICE), ("nbGain", 2), ("telIndex", 0),
+							("telType", 0), ("telId", 1)):
+			hfile.create_array(telNode, name, np.uint64(value))
+		trigger = hfile.create_table(telNode, "trigger", np.dtype([("event_id", np.uint64)]))
+		trigger.append(np.array([(10 * i,) for i in range(NB_EVENT)], dtype=trigger.dtype))
+		pedestal = hfile.create_table(telNode, "pedestal", np.dtype([("pedestal", np.float32, (2, NB_PIXEL))]))
+		pedestal.append(np.zeros(1, dtype=pedestal.dtype))
+		for columnName, tabWaveform in (("waveformHi", tabWaveformHi), ("waveformLo", tabWaveformLo)):
+			table = hfile.create_table(telNode, columnName, np.dtype([(columnName, np.uint16, (NB_SLICE, NB_PIXEL))]))
+			tabRow = np.zeros(NB_EVENT, dtype=table.dtype)
+			tabRow[columnName] = tabWaveform
+			table.append(tabRow)
+	return tabWaveformHi, tabWaveformLo
+
+
+def test_min_selection_reconstruction(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	outputFileName = str(tmp_path / "r1_min.h5")
+	tabWaveformHi, tabWaveformLo = create_r1_file(inputFileName)
+	#4 events per minimum, the last block has only 2 events
+	processMinSelection(inputFileName, outputFileName, 4)
+	with tables.open_file(outputFileName, "r") as hfile:
+		assert get_file_layout(hfile) == LAYOUT_MIN_SELECTION
+		telNode = hfile.root.r1.Tel_1
+		assert telNode.minHi.nrows == 3
+		assert telNode.waveformHi.nrows == NB_EVENT
+		reader = MinSelectedWaveformReader(telNode, 3)
+		for row in [0, 5, 9, 4, 3]:
+			assert np.all(reader.read_hi(row) == tabWaveformHi[row])
+			assert np.all(reader.read_lo(row) == tabWaveformLo[row])
+		listBatch = list(iter_min_selected_waveform_batches(telNode, 3))
+		assert np.concatenate([tabEventId for tabEventId, _ in listBatch]).tolist() == list(range(0, 10 * NB_EVENT, 10))
+		tabWaveform = np.concatenate([tabWaveform for _, tabWaveform in listBatch])
+		assert np.all(tabWaveform[:, 0] == tabWaveformHi.swapaxes(1, 2))
+		assert np.all(tabWaveform[:, 1] == tabWaveformLo.swapaxes(1, 2))
+
+
+def test_slice_selection_layout(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	outputFileName = str(tmp_path / "r1_slice.h5")
+	create_r1_file(inputFileName)
+	processSliceSelectionFile(inputFileName, outputFileName, 1, 3)
+	with tables.open_file(inputFileName, "r") as hfile:
+		assert get_file_layout(hfile) == LAYOUT_RAW
+	with tables.open_file(outputFileName, "a") as hfile:
+		assert get_file_layout(hfile) == LAYOUT_SLICE_SELECTION
+		#The files written without the layout attribute are recognized from their number of slices
+		del hfile.root._v_attrs.WAVEFORM_LAYOUT
+		assert get_file_layout(hfile) == LAYOUT_SLICE_SELECTION
@@ -0,0 +1,46 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.tools import simtel_batch
+from ctapipe_io_mchdf5.tools.simtel_batch import get_r0_file_name, split_merge_groups, get_merged_file_name
+from ctapipe_io_mchdf5.tools.chunk_policy import get_chunk_policy
+from ctapipe_io_mchdf5.tools.compression_policy import get_compression_policy
+
+
+def test_r0_file_name():
+	assert get_r0_file_name("/data/gamma_run1.simtel.gz", "/out") == os.path.join("/out", "gamma_run1.h5")
+	assert get_r0_file_name("proton_run2.simtel.zst", "out") == os.path.join("out", "proton_run2.h5")
+	assert get_r0_file_name("run3.sim", "out") == os.path.join("out", "run3.h5")
+
+
+def test_merge_groups():
+	listFileName = ["a", "b", "c", "d", "e"]
+	assert split_merge_groups(listFileName, 1) == [listFileName]
+	assert split_merge_groups(listFileName, 2) == [["a", "b", "c"], ["d", "e"]]
+	assert split_merge_groups(listFileName, 10) == [["a"], ["b"], ["c"], ["d"], ["e"]]
+	assert get_merged_file_name("merged.h5", 0, 1) == "merged.h5"
+	assert get_merged_file_name("merged.h5", 2, 3) == "merged_002.h5"
+
+
+def test_worker_conversion_without_progress(monkeypatch):
+	listCall = []
+
+	def convert_recorded(*args, **kwargs):
+		listCall.append(kwargs)
+		return SimpleNamespace(nbEvent=3)
+
+	monkeypatch.setattr(simtel_batch, "convert_simtel_to_r0", convert_recorded)
+	#The progress counters of the workers would overwrite each other
+	assert simtel_batch._convert_simtel_file("run.simtel.gz", "run.h5", 0, None, 1024, 1, get_chunk_policy(),
+											 get_compression_policy()) == ("run.h5", 3)
+	assert listCall == [{"isProgress": False}]
@@ -0,0 +1,78 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+
+from ctapipe_io_mchdf5.tools.subarray_cache import TelescopeDescriptionCache, get_cached_subarray, \
+	get_instrument_key, get_shared_subarray
+
+
+def test_subarray_built_once_per_file(tmp_path):
+	fileName = tmp_path / "run.h5"
+	fileName.write_bytes(b"run")
+	listBuild = []
+
+	def build():
+		listBuild.append(1)
+		return object()
+
+	subarray = get_cached_subarray(str(fileName), build)
+	assert get_cached_subarray(str(fileName), build) is subarray
+	assert len(listBuild) == 1
+	#A modified file is read again
+	fileName.write_bytes(b"modified run")
+	assert get_cached_subarray(str(fileName), build) is not subarray
+	assert len(listBuild) == 2
+
+
+def test_geometry_shared_per_camera_type():
+	listRead = []
+
+	def read_pixel_position():
+		listRead.append(1)
+		return np.zeros(1855), np.ones(1855)
+
+	cache = TelescopeDescriptionCache()
+	lst1 = cache.get_telescope(0, 28.0, read_pixel_position)
+	lst2 = cache.get_telescope(0, 28.0, read_pixel_position)
+	lst3 = cache.get_telescope(0, 29.0, read_pixel_position)
+	assert lst1 is lst2
+	assert lst3.camera is lst1.camera
+	assert lst3.optics.equivalent_focal_length.value == 29.0
+	assert lst1.optics.equivalent_focal_length.value == 28.0
+	assert len(listRead) == 1
+
+
+def create_instrument_file(fileName, focalLength):
+	with tables.open_file(fileName, "w") as hfile:
+		group = hfile.create_group("/", "instrument")
+		hfile.create_array(group, "focal", np.array([28.0, focalLength]))
+		hfile.create_array("/", "telId", np.uint64(1))
+
+
+def test_subarray_shared_per_instrument(tmp_path):
+	listKey = []
+	for name, focalLength in (("a.h5", 16.0), ("b.h5", 16.0), ("c.h5", 5.6)):
+		fileName = str(tmp_path / name)
+		create_instrument_file(fileName, focalLength)
+		with tables.open_file(fileName, "r") as hfile:
+			listKey.append(get_instrument_key(hfile, ["/instrument", hfile.root.telId]))
+	assert listKey[0] == listKey[1]
+	assert listKey[0] != listKey[2]
+	listBuild = []
+
+	def build():
+		listBuild.append(1)
+		return object()
+
+	subarray = get_shared_subarray(listKey[0], build)
+	assert get_shared_subarray(listKey[1], build) is subarray
+	assert get_shared_subarray(listKey[2], build) is not subarray
+	assert len(listBuild) == 2
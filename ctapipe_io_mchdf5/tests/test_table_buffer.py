@@ -0,0 +1,44 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.table_buffer import TableBuffer
+
+
+class BufferedRow(tables.IsDescription):
+	event_id = tables.UInt64Col()
+	name = tables.StringCol(5, dflt=b'none')
+	focal_length = tables.Float32Col(dflt=1.0)
+	waveformHi = tables.UInt16Col(shape=(3, 2))
+
+
+def test_buffered_rows_match_row_by_row_writing(tmp_path):
+	with tables.open_file(str(tmp_path / "buffer.h5"), "w") as hfile:
+		tableRow = hfile.create_table("/", "row", BufferedRow)
+		tableBuffer = hfile.create_table("/", "buffer", BufferedRow)
+		#Blocks of 4 rows
+		buffer = TableBuffer(tableBuffer, 4, 0)
+		for writer in [tableRow, buffer]:
+			for i in range(10):
+				row = writer.row
+				row["event_id"] = 10 * i
+				if i % 3 == 0:
+					row["name"] = "tel" + str(i)
+					row["focal_length"] = 28.0
+				row["waveformHi"] = np.full((3, 2), i)
+				row.append()
+		#Only the full blocks are written before the flush
+		assert tableBuffer.nrows == 8
+		assert len(buffer) == 10
+		tableRow.flush()
+		buffer.flush()
+		assert tableBuffer.nrows == 10
+		assert tableBuffer.read().tobytes() == tableRow.read().tobytes()
+		assert tableBuffer.col("name").tolist()[:2] == [b'tel0', b'none']
+		buffer.append_rows(tableRow.read(0, 2))
+		assert np.all(tableBuffer.col("event_id")[10:] == [0, 10])
@@ -0,0 +1,181 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.waveform_reader import WaveformBlockReader, get_block_size, get_chunk_aligned_batch_size, \
+	iter_telescope_waveform_batches, iter_telescope_table_waveform_batches, TelescopeTableReaderCache, \
+	TelescopeReaderCache, DecodedBlockCache
+
+
+NB_EVENT = 25
+IMAGE_SHAPE = (4, 3)
+
+
+def create_waveform_table(fileName):
+	'''
+	Create a file with a waveform table where each waveform is filled with its row number
+	'''
+	description = type('description waveformHi', (tables.IsDescription,),
+					   {"waveformHi": tables.UInt16Col(shape=IMAGE_SHAPE)})
+	with tables.open_file(fileName, "w") as hfile:
+		table = hfile.create_table("/", "waveformHi", description, chunkshape=1)
+		tabWaveform = np.zeros(NB_EVENT, dtype=table.dtype)
+		tabWaveform["waveformHi"] = np.arange(NB_EVENT, dtype=np.uint16)[:, np.newaxis, np.newaxis]
+		table.append(tabWaveform)
+
+
+def test_block_reader_values_and_number_of_reads(tmp_path):
+	fileName = str(tmp_path / "waveform.h5")
+	create_waveform_table(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		reader = WaveformBlockReader(hfile.root.waveformHi, "waveformHi", 10)
+		nbRead = 0
+		lastBlock = None
+		for row in list(range(NB_EVENT)) + [3, 24]:
+			waveform = reader.read(row)
+			assert waveform.shape == IMAGE_SHAPE
+			assert np.all(waveform == row)
+			if reader.block is not lastBlock:
+				nbRead += 1
+				lastBlock = reader.block
+		assert nbRead == 5
+
+
+def test_block_size_in_bytes(tmp_path):
+	fileName = str(tmp_path / "waveform.h5")
+	create_waveform_table(fileName)
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.root.waveformHi
+		rowSize = 2 * IMAGE_SHAPE[0] * IMAGE_SHAPE[1]
+		assert get_block_size(table, "waveformHi", nbEventPerBlock=7) == 7
+		assert get_block_size(table, "waveformHi", nbBytePerBlock=5 * rowSize) == 5
+		assert get_block_size(table, "waveformHi", nbBytePerBlock=1) == 1
+
+
+def create_telescope_group(fileName, nbGain):
+	'''
+	Create a file with a R1-V2 like telescope group where each waveform is filled with its row number
+	'''
+	with tables.open_file(fileName, "w") as hfile:
+		telNode = hfile.create_group("/", "Tel_1")
+		trigger = hfile.create_table(telNode, "trigger", np.dtype([("event_id", np.uint64)]), chunkshape=(4,))
+		trigger.append(np.array([(10 * i,) for i in range(NB_EVENT)], dtype=trigger.dtype))
+		for gain, columnName in enumerate(["waveformHi", "waveformLo"][:nbGain]):
+			dtype = np.dtype([(columnName, np.uint16, IMAGE_SHAPE)])
+			table = hfile.create_table(telNode, columnName, dtype, chunkshape=(4,))
+			tabWaveform = np.zeros(NB_EVENT, dtype=dtype)
+			tabWaveform[columnName] = (np.arange(NB_EVENT, dtype=np.uint16) + 100 * gain)[:, np.newaxis, np.newaxis]
+			tabWaveform[columnName][:, 0, 1] += 1000
+			table.append(tabWaveform)
+
+
+def test_chunk_aligned_batch_size(tmp_path):
+	fileName = str(tmp_path / "telescope.h5")
+	create_telescope_group(fileName, 1)
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.root.Tel_1.waveformHi
+		assert get_chunk_aligned_batch_size(table, 10) == 8
+		assert get_chunk_aligned_batch_size(table, 2) == 4
+		assert get_chunk_aligned_batch_size(table, 12) == 12
+
+
+def test_telescope_waveform_batches(tmp_path):
+	for nbGain in [1, 2]:
+		fileName = str(tmp_path / "telescope_{}.h5".format(nbGain))
+		create_telescope_group(fileName, nbGain)
+		with tables.open_file(fileName, "r") as hfile:
+			listBatch = list(iter_telescope_waveform_batches(hfile.root.Tel_1, 10, True))
+			assert [tabEventId.size for tabEventId, _ in listBatch] == [8, 8, 8, 1]
+			tabEventId = np.concatenate([tabEventId for tabEventId, _ in listBatch])
+			tabWaveform = np.concatenate([tabWaveform for _, tabWaveform in listBatch])
+			assert np.all(tabEventId == 10 * np.arange(NB_EVENT))
+			assert tabWaveform.shape == (NB_EVENT, nbGain, IMAGE_SHAPE[1], IMAGE_SHAPE[0])
+			for gain in range(nbGain):
+				assert np.all(tabWaveform[:, gain, 0, 0] == np.arange(NB_EVENT) + 100 * gain)
+				#The pixel 1 of the slice 0 is at [1, 0] once transposed
+				assert np.all(tabWaveform[:, gain, 1, 0] == np.arange(NB_EVENT) + 100 * gain + 1000)
+			tabWaveform = np.concatenate([tabWaveform for _, tabWaveform in
+										  iter_telescope_waveform_batches(hfile.root.Tel_1, 10, False)])
+			assert tabWaveform.shape == (NB_EVENT, nbGain) + IMAGE_SHAPE
+			assert np.all(tabWaveform[:, 0, 0, 1] == np.arange(NB_EVENT) + 1000)
+
+
+def create_telescope_table(fileName, nbGain):
+	'''
+	Create a file with a R0-V2 like telescope table where each waveform is filled with its row number
+	'''
+	listColumn = [("event_id", np.uint64)] + [(columnName, np.uint16, IMAGE_SHAPE) for columnName in
+											  ["waveformHi", "waveformLo"][:nbGain]]
+	with tables.open_file(fileName, "w") as hfile:
+		table = hfile.create_table("/", "tel_001", np.dtype(listColumn), chunkshape=(4,))
+		tabRow = np.zeros(NB_EVENT, dtype=table.dtype)
+		tabRow["event_id"] = 10 * np.arange(NB_EVENT)
+		for gain, columnName in enumerate(["waveformHi", "waveformLo"][:nbGain]):
+			tabRow[columnName] = (np.arange(NB_EVENT, dtype=np.uint16) + 100 * gain)[:, np.newaxis, np.newaxis]
+		table.append(tabRow)
+
+
+def test_telescope_table_reader_and_batches(tmp_path):
+	for nbGain in [1, 2]:
+		fileName = str(tmp_path / "tel_{}.h5".format(nbGain))
+		create_telescope_table(fileName, nbGain)
+		with tables.open_file(fileName, "r") as hfile:
+			table = hfile.root.tel_001
+			assert get_block_size(table, None, nbBytePerBlock=3 * table.rowsize) == 3
+			reader = TelescopeTableReaderCache(hfile, "/", 10).get_reader(1)
+			assert (reader.waveformLo is None) == (nbGain == 1)
+			for row in [0, 9, 10, 24, 3]:
+				assert np.all(reader.read_hi(row) == row)
+				if nbGain == 2:
+					assert np.all(reader.read_lo(row) == row + 100)
+			#The gains share the block of rows
+			assert reader.waveformHi.rowReader is getattr(reader.waveformLo, "rowReader", reader.waveformHi.rowReader)
+			listBatch = list(iter_telescope_table_waveform_batches(table, 10, True))
+			assert [tabEventId.size for tabEventId, _ in listBatch] == [8, 8, 8, 1]
+			tabWaveform = np.concatenate([tabWaveform for _, tabWaveform in listBatch])
+			assert tabWaveform.shape == (NB_EVENT, nbGain, IMAGE_SHAPE[1], IMAGE_SHAPE[0])
+			assert np.all(tabWaveform[:, nbGain - 1, 0, 0] == np.arange(NB_EVENT) + 100 * (nbGain - 1))
+
+
+def test_decoded_block_cache_lru_and_budget():
+	blockCache = DecodedBlockCache(100)
+	assert blockCache.get("a") is None
+	blockA = blockCache.put("a", np.zeros(40, dtype=np.uint8))
+	assert not blockA.flags.writeable
+	blockCache.put("b", np.zeros(40, dtype=np.uint8))
+	assert blockCache.get("a") is blockA
+	#b is the least recently used block
+	blockCache.put("c", [np.zeros(10, dtype=np.uint8), np.zeros(20, dtype=np.uint8)])
+	assert blockCache.get("b") is None
+	#A block larger than the budget is not cached
+	assert blockCache.put("d", np.zeros(101, dtype=np.uint8)).flags.writeable
+	assert blockCache.get("d") is None
+	statistics = blockCache.get_statistics()
+	assert (statistics["hit"], statistics["miss"], statistics["eviction"]) == (1, 3, 1)
+	assert (statistics["nb_block"], statistics["nb_byte"]) == (2, 70)
+
+
+def test_block_cache_shared_by_telescope_readers(tmp_path):
+	fileName = str(tmp_path / "telescope.h5")
+	create_telescope_group(fileName, 2)
+	with tables.open_file(fileName, "r") as hfile:
+		blockCache = DecodedBlockCache(1 << 20)
+		#One chunk of 4 rows per block
+		readerCache = TelescopeReaderCache(hfile, "/", "Tel_", 0, 0, blockCache)
+		otherReaderCache = TelescopeReaderCache(hfile, "/", "Tel_", 0, 0, blockCache)
+		reader = readerCache.get_reader(1)
+		assert reader.waveformHi.blockSize == 4
+		for row in [5, 0, 6, 1]:
+			assert np.all(reader.read_hi(row)[1:] == row)
+			assert np.all(reader.read_lo(row)[1:] == row + 100)
+		#The chunks read by the other readers are not decompressed again
+		otherReader = otherReaderCache.get_reader(1)
+		for row in [7, 2]:
+			assert np.all(otherReader.read_hi(row)[1:] == row)
+		statistics = blockCache.get_statistics()
+		assert (statistics["miss"], statistics["hit"]) == (4, 6)
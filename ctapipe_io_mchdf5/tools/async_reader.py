@@ -0,0 +1,93 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from collections import deque
+import asyncio
+
+
+class ExecutorReader(object):
+	'''
+	Run blocking read functions in an executor from coroutines, so the event loop is never blocked by the reads.
+	Attributes:
+	-----------
+		executor : concurrent.futures.Executor to be used (None for the default executor of the event loop)
+	'''
+	def __init__(self, executor=None):
+		self.executor = executor
+
+
+	async def run(self, function, *args):
+		'''
+		Run a function in the executor
+		Parameters:
+		-----------
+			function : blocking function to be called
+			args : arguments of the function
+		Return:
+		-------
+			value returned by the function
+		'''
+		return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+
+class ReadAheadIterator(object):
+	'''
+	Asynchronous iterator over items whose values are read by tasks started in advance, so the reading of the next
+	items overlaps the processing of the current one. The values are returned in the order of the items.
+	Attributes:
+	-----------
+		iterator : iterator over the items to be read
+		readCoroutine : coroutine function which reads the value of an item
+		nbItemAhead : maximum number of items read in advance
+		pending : (item, task) of the items read in advance
+	'''
+	def __init__(self, iterItem, readCoroutine, nbItemAhead=4):
+		self.iterator = iter(iterItem)
+		self.readCoroutine = readCoroutine
+		self.nbItemAhead = max(1, int(nbItemAhead))
+		self.pending = deque()
+
+
+	def __aiter__(self):
+		return self
+
+
+	async def __anext__(self):
+		'''
+		Get the next item and its value
+		Return:
+		-------
+			(item, value)
+		Raise:
+		------
+			StopAsyncIteration at the end of the items, the exception of the read of the item otherwise (the other
+			reads are cancelled)
+		'''
+		for item in self.iterator:
+			self.pending.append((item, asyncio.ensure_future(self.readCoroutine(item))))
+			if len(self.pending) >= self.nbItemAhead:
+				break
+		if len(self.pending) == 0:
+			raise StopAsyncIteration
+		item, task = self.pending.popleft()
+		try:
+			return item, await task
+		except BaseException:
+			await self.aclose()
+			raise
+
+
+	async def aclose(self):
+		'''
+		Cancel the reads in advance and stop the iteration
+		'''
+		self.iterator = iter(())
+		listTask = [task for item, task in self.pending]
+		self.pending.clear()
+		for task in listTask:
+			task.cancel()
+		if len(listTask) > 0:
+			await asyncio.gather(*listTask, return_exceptions=True)
@@ -0,0 +1,183 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+
+# Default size in bytes of the chunks of the waveform tables
+DEFAULT_CHUNK_NB_BYTE = 1024 * 1024
+
+# Datasets whose number of rows per chunk can be overridden
+# waveform : waveform tables with one row per event (R0 tel_XXX, R1 waveformHi and waveformLo, DL0-V1, ...)
+DATASET_WAVEFORM = "waveform"
+# photo_electron_image : tables of the true photo electron images of the telescopes
+DATASET_PE_IMAGE = "photo_electron_image"
+# minimum : tables of the minimum of the blocks of events of the min selected files (minHi, minLo)
+DATASET_MINIMUM = "minimum"
+# dl0_waveform : waveform tables of the DL0-V2 files, with one row per selected pixel
+DATASET_DL0_WAVEFORM = "dl0_waveform"
+# dl0_signal : integrated signal tables of the DL0-V2 files
+DATASET_DL0_SIGNAL = "dl0_signal"
+LIST_DATASET = [DATASET_WAVEFORM, DATASET_PE_IMAGE, DATASET_MINIMUM, DATASET_DL0_WAVEFORM, DATASET_DL0_SIGNAL]
+
+# Dataset of the tables of the existing files, from the name of their group (R0-V2 tel_XXX tables)
+DICO_GROUP_DATASET = {"waveform": DATASET_WAVEFORM, "photo_electron_image": DATASET_PE_IMAGE}
+# Dataset of the tables of the existing files, from their name (R1-V2 and DL0 Tel_X groups)
+DICO_TABLE_DATASET = {"waveformHi": DATASET_WAVEFORM, "waveformLo": DATASET_WAVEFORM,
+					  "photo_electron_image": DATASET_PE_IMAGE, "minHi": DATASET_MINIMUM, "minLo": DATASET_MINIMUM,
+					  "waveform": DATASET_DL0_WAVEFORM, "signal": DATASET_DL0_SIGNAL}
+
+
+class ChunkPolicy(object):
+	'''
+	Sizing of the chunks of the tables : a chunk holds as many rows as fit in the target chunk size, at least one and
+	at most the expected number of rows of the table
+	Attributes:
+	-----------
+		chunkNbByte : target size of a chunk in bytes
+		dicoChunkRow : number of rows per chunk of the overridden datasets
+	'''
+	def __init__(self, chunkNbByte=DEFAULT_CHUNK_NB_BYTE, dicoChunkRow=None):
+		self.chunkNbByte = max(1, int(chunkNbByte))
+		self.dicoChunkRow = dict(dicoChunkRow) if dicoChunkRow is not None else dict()
+
+
+	def get_nb_row_per_chunk(self, dataset, rowSize, expectedrows=0):
+		'''
+		Get the number of rows of the chunks of a table
+		Parameters:
+		-----------
+			dataset : kind of dataset of the table (DATASET_WAVEFORM, ...)
+			rowSize : size of a row in bytes
+			expectedrows : expected number of rows of the table (0 if unknown)
+		Return:
+		-------
+			number of rows per chunk
+		'''
+		if dataset in self.dicoChunkRow:
+			return max(1, int(self.dicoChunkRow[dataset]))
+		nbRow = max(1, self.chunkNbByte // max(1, int(rowSize)))
+		if expectedrows > 0:
+			nbRow = min(nbRow, int(expectedrows))
+		return nbRow
+
+
+# Chunk policy used by the table creators (set by the programs from their command line)
+CHUNK_POLICY = ChunkPolicy()
+
+
+def set_chunk_policy(policy):
+	'''
+	Set the chunk policy used by the table creators
+	Parameters:
+	-----------
+		policy : ChunkPolicy to be used
+	'''
+	global CHUNK_POLICY
+	CHUNK_POLICY = policy
+
+
+def get_chunk_policy():
+	'''
+	Get the chunk policy used by the table creators
+	Return:
+	-------
+		current ChunkPolicy
+	'''
+	return CHUNK_POLICY
+
+
+def get_table_options(dataset, description, expectedrows=0, chunkshape=None):
+	'''
+	Get the chunk options of a table to be created
+	Parameters:
+	-----------
+		dataset : kind of dataset of the table (DATASET_WAVEFORM, ...)
+		description : description of the table (IsDescription class, Description, dictionary of columns or numpy dtype)
+		expectedrows : expected number of rows of the table (0 if unknown)
+		chunkshape : chunk shape to be used (None to use the chunk policy)
+	Return:
+	-------
+		dictionary of the chunkshape and expectedrows arguments of File.create_table
+	'''
+	dicoOption = dict()
+	if expectedrows > 0:
+		dicoOption["expectedrows"] = int(expectedrows)
+	if chunkshape is None:
+		if isinstance(description, np.dtype):
+			rowSize = description.itemsize
+		else:
+			rowSize = tables.description.dtype_from_descr(description).itemsize
+		chunkshape = (CHUNK_POLICY.get_nb_row_per_chunk(dataset, rowSize, expectedrows),)
+	dicoOption["chunkshape"] = chunkshape
+	return dicoOption
+
+
+def get_table_dataset(table):
+	'''
+	Get the dataset of a table of an existing file
+	Parameters:
+	-----------
+		table : table to be used
+	Return:
+	-------
+		dataset of the table (DATASET_WAVEFORM, ...) or None if the table is not sized by the chunk policy
+	'''
+	dataset = DICO_GROUP_DATASET.get(table._v_parent._v_name)
+	if dataset is not None:
+		return dataset
+	return DICO_TABLE_DATASET.get(table._v_name)
+
+
+def parse_chunk_rows(text):
+	'''
+	Parse a chunk override of the command line
+	Parameters:
+	-----------
+		text : override DATASET=ROWS
+	Return:
+	-------
+		(dataset, number of rows per chunk)
+	Raise:
+	------
+		ValueError if the override is not valid
+	'''
+	dataset, sep, nbRow = text.partition("=")
+	dataset = dataset.strip()
+	if sep == "" or dataset not in LIST_DATASET:
+		raise ValueError("Invalid chunk override '{}', expected DATASET=ROWS with DATASET in {}".format(
+			text, ", ".join(LIST_DATASET)))
+	return dataset, int(nbRow)
+
+
+def add_chunk_policy_arguments(parser):
+	'''
+	Add the chunk options to the parser of a program
+	Parameters:
+	-----------
+		parser : argparse.ArgumentParser to be completed
+	'''
+	parser.add_argument('--chunk-size', help="Target size of the chunks of the waveform tables in bytes. Default = " +
+						str(DEFAULT_CHUNK_NB_BYTE), required=False, type=int, default=DEFAULT_CHUNK_NB_BYTE)
+	parser.add_argument('--chunk-rows', help="Number of rows per chunk of a dataset (" + ", ".join(LIST_DATASET) +
+						"), overrides --chunk-size for this dataset. Can be repeated", metavar="DATASET=ROWS",
+						required=False, action='append', default=[])
+
+
+def set_chunk_policy_from_arguments(args):
+	'''
+	Set the chunk policy from the parsed command line
+	Parameters:
+	-----------
+		args : arguments parsed by a parser completed with add_chunk_policy_arguments
+	Return:
+	-------
+		ChunkPolicy which is used
+	'''
+	policy = ChunkPolicy(args.chunk_size, dict(parse_chunk_rows(text) for text in args.chunk_rows))
+	set_chunk_policy(policy)
+	return policy
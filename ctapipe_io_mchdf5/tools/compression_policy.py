@@ -0,0 +1,461 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import time
+
+import numpy as np
+import tables
+
+from .chunk_policy import LIST_DATASET, get_table_dataset
+
+
+# Dataset of the tables and arrays which are not in the datasets of the chunk policy (trigger, monitoring,
+# instrument, simulation, ...), its filters are the default filters of the file
+DATASET_METADATA = "metadata"
+LIST_COMPRESSION_DATASET = LIST_DATASET + [DATASET_METADATA]
+
+# Shuffles applied before the compression
+SHUFFLE_NONE = "none"
+SHUFFLE_BYTE = "byte"
+SHUFFLE_BIT = "bit"
+LIST_SHUFFLE = [SHUFFLE_NONE, SHUFFLE_BYTE, SHUFFLE_BIT]
+
+# Filters of a dataset chosen on the first rows of each table
+AUTO = "auto"
+
+# Objectives of the automatic selection of the filters
+# ratio : smallest compressed size
+OBJECTIVE_RATIO = "ratio"
+# speed : fastest compression and decompression
+OBJECTIVE_SPEED = "speed"
+# balanced : fastest write and read back of the compressed data through a storage of a given bandwidth
+OBJECTIVE_BALANCED = "balanced"
+LIST_OBJECTIVE = [OBJECTIVE_RATIO, OBJECTIVE_SPEED, OBJECTIVE_BALANCED]
+
+# Default bandwidth of the storage in bytes per second, used by the balanced objective
+DEFAULT_IO_BANDWIDTH = 200 * 1000 * 1000
+# Default maximum size in bytes of the rows compressed with each candidate filters
+DEFAULT_NB_SAMPLE_BYTE = 4 * 1024 * 1024
+# Default candidate filters of the automatic selection (complib, complevel, shuffle)
+LIST_DEFAULT_CANDIDATE = [("blosc:lz4", 5, SHUFFLE_BYTE), ("blosc:lz4", 5, SHUFFLE_BIT), ("blosc:zstd", 1, SHUFFLE_BIT),
+						  ("blosc:zstd", 3, SHUFFLE_BYTE), ("blosc:zstd", 6, SHUFFLE_NONE),
+						  ("blosc:zstd", 6, SHUFFLE_BIT)]
+
+
+def create_filters(complevel, complib="blosc:zstd", shuffle=SHUFFLE_NONE):
+	'''
+	Create the filters of a table
+	Parameters:
+	-----------
+		complevel : compression level (0 for no compression)
+		complib : compression library
+		shuffle : shuffle applied before the compression (SHUFFLE_NONE, SHUFFLE_BYTE or SHUFFLE_BIT)
+	Return:
+	-------
+		tables.Filters
+	'''
+	return tables.Filters(complevel=complevel, complib=complib, shuffle=(shuffle == SHUFFLE_BYTE),
+						  bitshuffle=(shuffle == SHUFFLE_BIT), fletcher32=False)
+
+
+def format_filters(filters):
+	'''
+	Format filters as on the command line
+	Parameters:
+	-----------
+		filters : tables.Filters
+	Return:
+	-------
+		COMPLIB,LEVEL,SHUFFLE
+	'''
+	shuffle = SHUFFLE_BIT if filters.bitshuffle else (SHUFFLE_BYTE if filters.shuffle else SHUFFLE_NONE)
+	return "{},{},{}".format(filters.complib, filters.complevel, shuffle)
+
+
+def parse_filters(text):
+	'''
+	Parse filters of the command line
+	Parameters:
+	-----------
+		text : COMPLIB,LEVEL,SHUFFLE (blosc:zstd,6,bit for example)
+	Return:
+	-------
+		tables.Filters
+	Raise:
+	------
+		ValueError if the filters are not valid
+	'''
+	listField = [field.strip() for field in text.split(",")]
+	if len(listField) != 3 or listField[0] not in tables.filters.all_complibs or listField[2] not in LIST_SHUFFLE \
+			or not listField[1].isdigit() or int(listField[1]) > 9:
+		raise ValueError("Invalid filters '{}', expected COMPLIB,LEVEL,SHUFFLE with COMPLIB in {}, LEVEL in [0, 9] "
+						 "and SHUFFLE in {}".format(text, ", ".join(tables.filters.all_complibs),
+													", ".join(LIST_SHUFFLE)))
+	return create_filters(int(listField[1]), listField[0], listField[2])
+
+
+class CompressionPolicy(object):
+	'''
+	Compression of the tables : filters and number of blosc threads of each dataset, and automatic selection of the
+	filters of the datasets in AUTO mode
+	Attributes:
+	-----------
+		dicoFilters : filters (tables.Filters or AUTO) of the overridden datasets, the other ones keep the filters of
+			the program
+		dicoNbBloscThread : number of blosc threads of the overridden datasets
+		objective : objective of the automatic selection (OBJECTIVE_BALANCED, ...)
+		listCandidate : candidate tables.Filters of the automatic selection
+		ioBandwidth : bandwidth of the storage in bytes per second (used by OBJECTIVE_BALANCED)
+		nbSampleByte : maximum size in bytes of the rows compressed with each candidate
+	'''
+	def __init__(self, dicoFilters=None, dicoNbBloscThread=None, objective=OBJECTIVE_BALANCED, listCandidate=None,
+				 ioBandwidth=DEFAULT_IO_BANDWIDTH, nbSampleByte=DEFAULT_NB_SAMPLE_BYTE):
+		self.dicoFilters = dict(dicoFilters) if dicoFilters is not None else dict()
+		self.dicoNbBloscThread = dict(dicoNbBloscThread) if dicoNbBloscThread is not None else dict()
+		self.objective = objective
+		if listCandidate is None:
+			listCandidate = [create_filters(complevel, complib, shuffle)
+							 for complib, complevel, shuffle in LIST_DEFAULT_CANDIDATE]
+		self.listCandidate = list(listCandidate)
+		self.ioBandwidth = max(1.0, float(ioBandwidth))
+		self.nbSampleByte = max(1, int(nbSampleByte))
+
+
+	def get_filters(self, dataset):
+		'''
+		Get the filters of the tables of a dataset when they are created
+		Parameters:
+		-----------
+			dataset : dataset of the table (DATASET_WAVEFORM, ..., None for DATASET_METADATA)
+		Return:
+		-------
+			tables.Filters or None to keep the filters of the program (and for the datasets in AUTO mode, whose
+			filters are chosen when their first rows are written)
+		'''
+		filters = self.dicoFilters.get(DATASET_METADATA if dataset is None else dataset)
+		return None if filters == AUTO else filters
+
+
+	def is_auto(self, dataset):
+		'''
+		Say if the filters of a dataset are chosen on the first rows of each table
+		Parameters:
+		-----------
+			dataset : dataset of the table (None for DATASET_METADATA)
+		Return:
+		-------
+			True if the dataset is in AUTO mode
+		'''
+		return self.dicoFilters.get(DATASET_METADATA if dataset is None else dataset) == AUTO
+
+
+	def get_nb_blosc_thread(self, dataset):
+		'''
+		Get the number of blosc threads which compress the tables of a dataset
+		Parameters:
+		-----------
+			dataset : dataset of the table (None for DATASET_METADATA)
+		Return:
+		-------
+			number of threads (0 to keep tables.parameters.MAX_BLOSC_THREADS)
+		'''
+		return self.dicoNbBloscThread.get(DATASET_METADATA if dataset is None else dataset, 0)
+
+
+	def get_filters_cost(self, nbByte, compressTime, decompressTime):
+		'''
+		Get the cost of filters for the objective of the policy
+		Parameters:
+		-----------
+			nbByte : size of the compressed sample in bytes
+			compressTime : time to compress the sample in seconds
+			decompressTime : time to decompress the sample in seconds
+		Return:
+		-------
+			cost (the smaller the better)
+		'''
+		if self.objective == OBJECTIVE_RATIO:
+			return nbByte
+		if self.objective == OBJECTIVE_SPEED:
+			return compressTime + decompressTime
+		return compressTime + decompressTime + 2.0 * nbByte / self.ioBandwidth
+
+
+# Compression policy used by the table creators (set by the programs from their command line)
+COMPRESSION_POLICY = CompressionPolicy()
+
+
+def set_compression_policy(policy):
+	'''
+	Set the compression policy used by the table creators
+	Parameters:
+	-----------
+		policy : CompressionPolicy to be used
+	'''
+	global COMPRESSION_POLICY
+	COMPRESSION_POLICY = policy
+
+
+def get_compression_policy():
+	'''
+	Get the compression policy used by the table creators
+	Return:
+	-------
+		current CompressionPolicy
+	'''
+	return COMPRESSION_POLICY
+
+
+def get_dataset_filters(dataset):
+	'''
+	Get the filters of a table to be created
+	Parameters:
+	-----------
+		dataset : dataset of the table (DATASET_WAVEFORM, ...)
+	Return:
+	-------
+		tables.Filters, or None to inherit the filters of the parent group
+	'''
+	return COMPRESSION_POLICY.get_filters(dataset)
+
+
+def get_file_filters(defaultFilters):
+	'''
+	Get the filters of a file to be created, which are the filters of the tables of DATASET_METADATA
+	Parameters:
+	-----------
+		defaultFilters : filters of the program
+	Return:
+	-------
+		filters of the DATASET_METADATA override if any, defaultFilters otherwise
+	'''
+	filters = COMPRESSION_POLICY.get_filters(DATASET_METADATA)
+	return defaultFilters if filters is None else filters
+
+
+def measure_filters(tabRow, filters, chunkshape=None):
+	'''
+	Compress rows in memory with filters
+	Parameters:
+	-----------
+		tabRow : structured array of the rows
+		filters : tables.Filters to be measured
+		chunkshape : chunk shape of the table (None if it is chosen by PyTables)
+	Return:
+	-------
+		(size of the compressed rows in bytes, time to compress them, time to decompress them, in seconds)
+	'''
+	hfile = tables.open_file("compression_sample.h5", "w", driver="H5FD_CORE", driver_core_backing_store=0)
+	try:
+		table = hfile.create_table("/", "sample", tabRow.dtype, filters=filters, chunkshape=chunkshape,
+								   expectedrows=max(1, tabRow.size))
+		timeBegin = time.perf_counter()
+		table.append(tabRow)
+		table.flush()
+		compressTime = time.perf_counter() - timeBegin
+		nbByte = table.size_on_disk
+		fileImage = hfile.get_file_image()
+	finally:
+		hfile.close()
+	#The rows are read from a copy of the file, so they are not in the chunk cache
+	hfile = tables.open_file("compression_sample.h5", "r", driver="H5FD_CORE", driver_core_image=fileImage,
+							 driver_core_backing_store=0)
+	try:
+		timeBegin = time.perf_counter()
+		hfile.root.sample.read()
+		decompressTime = time.perf_counter() - timeBegin
+	finally:
+		hfile.close()
+	return nbByte, compressTime, decompressTime
+
+
+def select_filters(tabRow, chunkshape=None, policy=None):
+	'''
+	Select the filters of a table by compressing its first rows with the candidate filters of a policy
+	Parameters:
+	-----------
+		tabRow : structured array of the first rows of the table
+		chunkshape : chunk shape of the table (None if it is chosen by PyTables)
+		policy : CompressionPolicy to be used (None for the current one)
+	Return:
+	-------
+		(filters of the smallest cost for the objective of the policy, list of (filters, compressed size in bytes,
+		compression time, decompression time) of each candidate)
+	'''
+	if policy is None:
+		policy = COMPRESSION_POLICY
+	nbRow = max(1, min(tabRow.size, policy.nbSampleByte // max(1, tabRow.dtype.itemsize)))
+	tabSample = tabRow[:nbRow]
+	if chunkshape is not None:
+		#A sample smaller than a chunk would be measured with the padding of the chunk
+		chunkshape = (max(1, min(int(chunkshape[0]), nbRow)),)
+	listMeasure = [(filters,) + measure_filters(tabSample, filters, chunkshape) for filters in policy.listCandidate]
+	bestMeasure = min(listMeasure, key=lambda measure: policy.get_filters_cost(*measure[1:]))
+	return bestMeasure[0], listMeasure
+
+
+def select_table_filters(tabRow, chunkshape=None):
+	'''
+	Select the filters of a table of a dataset in AUTO mode from its first rows
+	Parameters:
+	-----------
+		tabRow : structured array of the first rows of the table
+		chunkshape : chunk shape of the table (None if it is chosen by PyTables)
+	Return:
+	-------
+		(selected tables.Filters, compression ratio of the sample with these filters)
+	'''
+	tabRow = np.asarray(tabRow)
+	filters, listMeasure = select_filters(tabRow, chunkshape)
+	nbRow = max(1, min(tabRow.size, COMPRESSION_POLICY.nbSampleByte // max(1, tabRow.dtype.itemsize)))
+	nbByte = [measure[1] for measure in listMeasure if measure[0] is filters][0]
+	return filters, tabRow[:nbRow].nbytes / max(1, nbByte)
+
+
+def format_filters_selection(tablePath, filters, compressionRatio):
+	'''
+	Format the filters selected for a table, to be printed by the programs
+	Parameters:
+	-----------
+		tablePath : path of the table
+		filters : selected tables.Filters
+		compressionRatio : compression ratio of the sample of the table with these filters
+	Return:
+	-------
+		description of the selection
+	'''
+	return "{} : filters {} selected (compression ratio {:.2f})".format(tablePath, format_filters(filters),
+																		compressionRatio)
+
+
+def apply_auto_filters(table, tabRow, dicoSelection=None):
+	'''
+	Choose the filters of an empty table of a dataset in AUTO mode from its first rows. The table is created again
+	with the selected filters (same description, title, chunk shape and attributes)
+	Parameters:
+	-----------
+		table : table to be written
+		tabRow : structured array of the first rows of the table
+		dicoSelection : dictionary completed with (selected filters, compression ratio) by path of table (None to
+			ignore the selection)
+	Return:
+	-------
+		table to be written (the given one if its filters are not chosen automatically)
+	'''
+	if table.nrows != 0 or len(tabRow) == 0 or not COMPRESSION_POLICY.is_auto(get_table_dataset(table)):
+		return table
+	filters, compressionRatio = select_table_filters(tabRow, table.chunkshape)
+	if dicoSelection is not None:
+		dicoSelection[table._v_pathname] = (filters, compressionRatio)
+	parent, name, title = table._v_parent, table._v_name, table._v_title
+	description, chunkshape = table.description, table.chunkshape
+	attrs = {attrName: table.attrs[attrName] for attrName in table.attrs._v_attrnamesuser}
+	table._f_remove()
+	newTable = parent._v_file.create_table(parent, name, description, title, filters=filters, chunkshape=chunkshape)
+	for attrName, value in attrs.items():
+		newTable.attrs[attrName] = value
+	return newTable
+
+
+def append_table_rows(table, tabRow):
+	'''
+	Append rows to a table, compressed with the number of blosc threads of the dataset of the table
+	Parameters:
+	-----------
+		table : table to be written
+		tabRow : structured array of the rows
+	'''
+	nbBloscThread = COMPRESSION_POLICY.get_nb_blosc_thread(get_table_dataset(table))
+	if nbBloscThread <= 0:
+		table.append(tabRow)
+		return
+	previousNbThread = tables.set_blosc_max_threads(nbBloscThread)
+	try:
+		table.append(tabRow)
+	finally:
+		tables.set_blosc_max_threads(previousNbThread)
+
+
+def parse_dataset_value(text, isAutoAllowed=False):
+	'''
+	Parse an override DATASET=VALUE of the command line
+	Parameters:
+	-----------
+		text : override DATASET=VALUE
+		isAutoAllowed : True if the value can be AUTO
+	Return:
+	-------
+		(dataset, value)
+	Raise:
+	------
+		ValueError if the override is not valid
+	'''
+	dataset, sep, value = text.partition("=")
+	dataset, value = dataset.strip(), value.strip()
+	if sep == "" or dataset not in LIST_COMPRESSION_DATASET:
+		raise ValueError("Invalid override '{}', expected DATASET=VALUE with DATASET in {}".format(
+			text, ", ".join(LIST_COMPRESSION_DATASET)))
+	if value == AUTO and not isAutoAllowed:
+		raise ValueError("The automatic selection of the filters ('{}') is not available in this program".format(text))
+	return dataset, value
+
+
+def add_compression_policy_arguments(parser, isAutoAllowed=True):
+	'''
+	Add the compression options to the parser of a program
+	Parameters:
+	-----------
+		parser : argparse.ArgumentParser to be completed
+		isAutoAllowed : True if the filters of a dataset can be chosen automatically (the program writes the tables
+			with apply_auto_filters)
+	'''
+	parser.set_defaults(compression_auto_allowed=isAutoAllowed)
+	parser.add_argument('--codec', help="Filters of a dataset (" + ", ".join(LIST_COMPRESSION_DATASET) + ") as "
+						"COMPLIB,LEVEL,SHUFFLE (blosc:zstd,6,bit for example)" +
+						(", or auto to choose them on the first rows of each table" if isAutoAllowed else "") +
+						". Can be repeated", metavar="DATASET=FILTERS", required=False, action='append', default=[])
+	parser.add_argument('--codec-threads', help="Number of blosc threads which compress a dataset. Can be repeated",
+						metavar="DATASET=THREADS", required=False, action='append', default=[])
+	if isAutoAllowed:
+		parser.add_argument('--auto-objective', help="Objective of the automatic selection of the filters (" +
+							", ".join(LIST_OBJECTIVE) + "). Default = " + OBJECTIVE_BALANCED, required=False,
+							choices=LIST_OBJECTIVE, default=OBJECTIVE_BALANCED)
+		parser.add_argument('--auto-candidate', help="Candidate filters COMPLIB,LEVEL,SHUFFLE of the automatic "
+							"selection. Can be repeated. Default = " +
+							" ".join("{},{},{}".format(*candidate) for candidate in LIST_DEFAULT_CANDIDATE),
+							metavar="FILTERS", required=False, action='append', default=[])
+		parser.add_argument('--auto-bandwidth', help="Bandwidth of the storage in MB/s, used by the balanced "
+							"objective. Default = " + str(DEFAULT_IO_BANDWIDTH // 1000000), required=False,
+							type=float, default=DEFAULT_IO_BANDWIDTH / 1000000)
+
+
+def set_compression_policy_from_arguments(args):
+	'''
+	Set the compression policy from the parsed command line
+	Parameters:
+	-----------
+		args : arguments parsed by a parser completed with add_compression_policy_arguments
+	Return:
+	-------
+		CompressionPolicy which is used
+	'''
+	isAutoAllowed = getattr(args, "compression_auto_allowed", False)
+	dicoFilters = dict()
+	for text in args.codec:
+		dataset, value = parse_dataset_value(text, isAutoAllowed)
+		dicoFilters[dataset] = AUTO if value == AUTO else parse_filters(value)
+	dicoNbBloscThread = dict()
+	for text in args.codec_threads:
+		dataset, value = parse_dataset_value(text)
+		dicoNbBloscThread[dataset] = int(value)
+	if isAutoAllowed:
+		listCandidate = [parse_filters(text) for text in args.auto_candidate]
+		policy = CompressionPolicy(dicoFilters, dicoNbBloscThread, args.auto_objective,
+								   listCandidate if len(listCandidate) > 0 else None, args.auto_bandwidth * 1000000)
+	else:
+		policy = CompressionPolicy(dicoFilters, dicoNbBloscThread)
+	set_compression_policy(policy)
+	return policy
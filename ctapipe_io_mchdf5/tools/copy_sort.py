@@ -8,10 +8,11 @@ import tables
 import numpy as np
 
 from .telescope_copy import copy_telescope_without_waveform
+from .chunk_policy import get_table_options, DATASET_WAVEFORM
 
 
 def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, isStoreSlicePixel,
-								 chunkshape=1):
+								 chunkshape=None, expectedrows=0):
 	"""
 	Create the table to store the signal
 	Parameters:
@@ -21,7 +22,8 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
+		expectedrows : expected number of waveforms (0 if unknown)
 	"""
 	image_shape = (nbPixel, nbSlice)
 	if isStoreSlicePixel:
@@ -30,39 +32,40 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,),
 								  columns_dict_waveformHi)
 	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
-					   chunkshape=chunkshape)
+					   **get_table_options(DATASET_WAVEFORM, description_waveformHi, expectedrows, chunkshape))
 
 
-def create_telescope_sorted(outFile, telNode, isStoreSlicePixel, chunkshape=1):
+def create_telescope_sorted(outFile, telNode, isStoreSlicePixel, chunkshape=None):
 	"""
 	Create the telescope group and table
 	Parameters:
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	"""
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, r1NodeName="r0", chunkshape=chunkshape)
 
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
 
+	nbEvent = telNode.waveformHi.nrows
 	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, isStoreSlicePixel,
-								 chunkshape=chunkshape)
+								 chunkshape=chunkshape, expectedrows=nbEvent)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
 		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, isStoreSlicePixel,
-									 chunkshape=chunkshape)
+									 chunkshape=chunkshape, expectedrows=nbEvent)
 
 
-def create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel, chunkshape=1):
+def create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel, chunkshape=None):
 	"""
 	Create all the telescope ready for pixels sorting
 	Parameters:
 		outFile : output file
 		inFile : input file
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
 	"""
 	outFile.create_group("/", 'r0', 'Raw data waveform information of the run')
 	for telNode in inFile.walk_nodes("/r0", "Group"):
@@ -72,7 +75,8 @@ def create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel, chunkshape=1
 			pass
 
 
-def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dataEntryShape, chunkshape=1):
+def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dataEntryShape, chunkshape=None,
+									   expectedrows=0):
 	"""
 	Create the table to store the signal
 	Parameters:
@@ -80,7 +84,8 @@ def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dat
 		cam_tel_group : telescope group in which to put the tables
 		nameWaveformHi : name of the table to store the waveform
 		dataEntryShape : shape of the entries to be stored
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None to use the chunk policy)
+		expectedrows : expected number of entries (0 if unknown)
 	Return:
 		create table
 	"""
@@ -88,7 +93,7 @@ def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dat
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,),
 								  columns_dict_waveformHi)
 	return hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
-							  chunkshape=chunkshape)
+							  **get_table_options(DATASET_WAVEFORM, description_waveformHi, expectedrows, chunkshape))
 
 
 
@@ -0,0 +1,280 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .waveform_reader import WaveformBlockReader, TelescopeReaderCache, get_block_size, get_chunk_aligned_batch_size
+
+
+class DL0TelescopeReader(object):
+	'''
+	Read-ahead reader of the sparse waveforms of a telescope of a DL0-V2 file.
+	The signal table stores, for each telescope event, the integrated signal of all the pixels and the offset of
+	the first waveform of the event in the waveform table. The pixelWaveform VLArray stores the pixels whose waveform
+	is kept (in the order of the waveform table) and the pixelLo VLArray the pixels recorded in low gain.
+	The signal rows, the pixel lists and the waveforms are read by blocks of consecutive events.
+	Attributes:
+	-----------
+		telNode : group of the telescope
+		nbPixel : number of pixels of the camera
+		nbSlice : number of slices of the waveforms
+		signal : reader of the signal rows (signal and waveformoffset)
+		pixelWaveform : reader of the pixels with a waveform
+		pixelLo : reader of the pixels in low gain (None if the camera has only one gain)
+		waveform : reader of the waveforms of the selected pixels
+	'''
+	def __init__(self, telNode, nbEventPerBlock=100, nbBytePerBlock=0, blockCache=None):
+		self.telNode = telNode
+		self.nbPixel = int(telNode.nbPixel.read())
+		self.nbSlice = int(telNode.nbSlice.read())
+		signalTable = telNode.signal
+		waveformTable = telNode.waveform
+		blockSize = get_block_size(signalTable, None, nbEventPerBlock, nbBytePerBlock)
+		self.signal = WaveformBlockReader(signalTable, None, blockSize, blockCache)
+		self.pixelWaveform = WaveformBlockReader(telNode.pixelWaveform, None, blockSize, blockCache)
+		try:
+			self.pixelLo = WaveformBlockReader(telNode.pixelLo, None, blockSize, blockCache)
+		except tables.exceptions.NoSuchNodeError as e:
+			self.pixelLo = None
+		#Number of waveforms of the selected pixels of blockSize events on average
+		nbWaveformPerBlock = -(-blockSize * waveformTable.nrows // max(1, signalTable.nrows))
+		self.waveform = WaveformBlockReader(waveformTable, "waveform", max(1, nbWaveformPerBlock), blockCache)
+
+
+	def read_sparse(self, row):
+		'''
+		Read the sparse waveform of a telescope event
+		Parameters:
+		-----------
+			row : row of the telescope event
+		Return:
+		-------
+			(tabPixel, tabWaveform, tabSignal, tabPixelLo) with tabPixel the pixels with a waveform, tabWaveform their
+			waveforms with shape (nbSelectedPixel, nbSlice), tabSignal the integrated signal of all the pixels and
+			tabPixelLo the pixels in low gain
+		'''
+		signalRow = self.signal.read(row)
+		tabPixel = self.pixelWaveform.read(row)
+		offset = int(signalRow["waveformoffset"])
+		tabWaveform = self.waveform.read_range(offset, offset + tabPixel.size)
+		if self.pixelLo is None:
+			tabPixelLo = np.zeros(0, dtype=np.uint16)
+		else:
+			tabPixelLo = self.pixelLo.read(row)
+		return tabPixel, tabWaveform, signalRow["signal"], tabPixelLo
+
+
+class DL0TelescopeReaderCache(TelescopeReaderCache):
+	'''
+	Cache of the sparse waveform readers of the telescopes of a DL0-V2 file (/dl0/Tel_<id> groups)
+	'''
+	def __init__(self, hfile, where='/dl0', nbEventPerBlock=100, nbBytePerBlock=0, blockCache=None):
+		super().__init__(hfile, where, 'Tel_', nbEventPerBlock, nbBytePerBlock, blockCache)
+
+
+	def _create_reader(self, telId):
+		telNode = self.hfile.get_node(self.where, self.groupPrefix + str(telId))
+		return DL0TelescopeReader(telNode, self.nbEventPerBlock, self.nbBytePerBlock, self.blockCache)
+
+
+class DL0WaveformReconstruction(object):
+	'''
+	Reconstruction of the dense waveforms of a telescope from its sparse waveforms.
+	A pixel without waveform gets a flat waveform whose R1 calibration integrates to its stored signal :
+	waveform = (signal / dc_to_pe + pedestal) / nbSlice on each slice, with the dc_to_pe and pedestal of the gain
+	of the pixel. The pixels of all the events of a batch are filled in one vectorized step.
+	Attributes:
+	-----------
+		nbSlice : number of slices of the waveforms
+		dtype : type of the reconstructed waveforms
+		offset : pedestal per slice of each gain and pixel, shape (nbGain, nbPixel)
+		gain : dc_to_pe of each gain and pixel, shape (nbGain, nbPixel)
+		fillScale : 1 / (dc_to_pe * nbSlice) of each gain and pixel (0 if dc_to_pe is 0), shape (nbGain, nbPixel)
+	'''
+	def __init__(self, dc_to_pe, pedestal, nbPixel, nbSlice, dtype=np.float32):
+		self.nbSlice = nbSlice
+		self.dtype = np.dtype(dtype)
+		if dc_to_pe is None:
+			dc_to_pe = np.ones((1, nbPixel))
+		if pedestal is None:
+			pedestal = np.zeros(np.shape(dc_to_pe))
+		self.gain = np.asarray(dc_to_pe, dtype=np.float64).reshape(-1, nbPixel)
+		self.offset = np.asarray(pedestal, dtype=np.float64).reshape(-1, nbPixel) / nbSlice
+		self.fillScale = np.zeros_like(self.gain)
+		np.divide(1.0, self.gain * nbSlice, out=self.fillScale, where=self.gain != 0)
+
+
+	def get_gain_selection(self, listPixelLo, nbPixel):
+		'''
+		Get the gain of each pixel of the events
+		Parameters:
+		-----------
+			listPixelLo : pixels in low gain of each event
+			nbPixel : number of pixels of the camera
+		Return:
+		-------
+			gain of each pixel of each event, shape (nbEvent, nbPixel)
+		'''
+		tabGainSelection = np.zeros((len(listPixelLo), nbPixel), dtype=np.intp)
+		if self.gain.shape[0] < 2:
+			return tabGainSelection
+		tabNbPixelLo = np.fromiter((tabPixelLo.size for tabPixelLo in listPixelLo), dtype=np.intp,
+								   count=len(listPixelLo))
+		if tabNbPixelLo.sum() > 0:
+			tabGainSelection[np.repeat(np.arange(len(listPixelLo)), tabNbPixelLo),
+							 np.concatenate(listPixelLo).astype(np.intp)] = 1
+		return tabGainSelection
+
+
+	def reconstruct(self, tabSignal, listPixel, tabWaveform, tabGainSelection):
+		'''
+		Reconstruct the dense waveforms of consecutive events
+		Parameters:
+		-----------
+			tabSignal : integrated signal of the pixels of each event, shape (nbEvent, nbPixel)
+			listPixel : pixels with a waveform of each event
+			tabWaveform : waveforms of the selected pixels of all the events, in the order of listPixel,
+				shape (nbSelectedPixel, nbSlice)
+			tabGainSelection : gain of each pixel of each event, shape (nbEvent, nbPixel)
+		Return:
+		-------
+			dense waveforms with shape (nbEvent, nbPixel, nbSlice)
+		'''
+		nbEvent, nbPixel = tabSignal.shape
+		tabPixelIndex = np.arange(nbPixel)
+		tabFill = tabSignal * self.fillScale[tabGainSelection, tabPixelIndex] + \
+			self.offset[tabGainSelection, tabPixelIndex]
+		tabDense = np.empty((nbEvent, nbPixel, self.nbSlice), dtype=self.dtype)
+		tabDense[...] = tabFill[..., np.newaxis]
+		tabNbPixel = np.fromiter((tabPixel.size for tabPixel in listPixel), dtype=np.intp, count=len(listPixel))
+		if tabNbPixel.sum() > 0:
+			tabDense[np.repeat(np.arange(nbEvent), tabNbPixel), np.concatenate(listPixel).astype(np.intp)] = \
+				tabWaveform
+		return tabDense
+
+
+	def reconstruct_event(self, tabPixel, tabWaveform, tabSignal, tabPixelLo):
+		'''
+		Reconstruct the dense waveform of a telescope event read by DL0TelescopeReader.read_sparse
+		Return:
+		-------
+			(dense waveform with shape (nbPixel, nbSlice), gain of each pixel)
+		'''
+		tabGainSelection = self.get_gain_selection([tabPixelLo], tabSignal.size)
+		tabDense = self.reconstruct(tabSignal[np.newaxis], [tabPixel], tabWaveform, tabGainSelection)
+		return tabDense[0], tabGainSelection[0]
+
+
+	def calibrate(self, tabWaveform, tabGainSelection):
+		'''
+		Calibrate waveforms with the gain of each pixel : r1 = (waveform - pedestal / nbSlice) * dc_to_pe
+		Parameters:
+		-----------
+			tabWaveform : waveforms with shape (..., nbPixel, nbSlice)
+			tabGainSelection : gain of each pixel, shape (..., nbPixel)
+		Return:
+		-------
+			calibrated waveforms
+		'''
+		tabPixelIndex = np.arange(tabWaveform.shape[-2])
+		tabOffset = self.offset[tabGainSelection, tabPixelIndex][..., np.newaxis]
+		tabGain = self.gain[tabGainSelection, tabPixelIndex][..., np.newaxis]
+		return ((tabWaveform - tabOffset) * tabGain).astype(self.dtype)
+
+
+class DL0TelescopeR1Calibration(object):
+	'''
+	R1 calibration of the dense waveforms of a telescope of a DL0-V2 file, with the interface of
+	TelescopeR1Calibration. The waveforms have one gain selected per pixel, each pixel is calibrated with the dc_to_pe
+	and the pedestal of its gain : r1 = (waveform - pedestal / nbSlice) * dc_to_pe
+	Attributes:
+	-----------
+		reconstruction : DL0WaveformReconstruction of the telescope
+		dtype : type of the calibrated waveforms
+		buffer : buffer of the calibrated waveform, reused by calibrate_in_buffer
+	'''
+	def __init__(self, reconstruction):
+		self.reconstruction = reconstruction
+		self.dtype = reconstruction.dtype
+		self.buffer = None
+
+
+	def calibrate(self, tabWaveform, out=None, tabGainSelection=None):
+		'''
+		Calibrate waveforms
+		Parameters:
+		-----------
+			tabWaveform : waveforms with shape (1, nbPixel, nbSlice) or a block of waveforms with shape
+				(nbEvent, 1, nbPixel, nbSlice)
+			out : array where to write the calibrated waveforms (allocated if None)
+			tabGainSelection : gain of each pixel, shape (nbPixel,) or (nbEvent, 1, nbPixel) for a block of waveforms
+				(None if all the pixels are in high gain)
+		Return:
+		-------
+			calibrated waveforms
+		'''
+		if tabGainSelection is None:
+			tabGainSelection = np.zeros(tabWaveform.shape[-2], dtype=np.intp)
+		if out is None:
+			out = np.empty(tabWaveform.shape, dtype=self.dtype)
+		out[...] = self.reconstruction.calibrate(tabWaveform, tabGainSelection)
+		return out
+
+
+	def calibrate_in_buffer(self, tabWaveform, tabGainSelection=None):
+		'''
+		Calibrate waveforms in the buffer of the telescope (the previous content of the buffer is overwritten)
+		Parameters:
+		-----------
+			tabWaveform : waveforms with shape (1, nbPixel, nbSlice)
+			tabGainSelection : gain of each pixel, shape (nbPixel,) (None if all the pixels are in high gain)
+		Return:
+		-------
+			buffer of the telescope which contains the calibrated waveforms
+		'''
+		if self.buffer is None or self.buffer.shape != tabWaveform.shape:
+			self.buffer = np.empty(tabWaveform.shape, dtype=self.dtype)
+		return self.calibrate(tabWaveform, self.buffer, tabGainSelection)
+
+
+def iter_dl0_telescope_batches(telNode, reconstruction, batchSize=1000):
+	'''
+	Iterate over the dense waveforms of a telescope of a DL0-V2 file by batches of consecutive events, without any
+	event container. The signal rows, the pixel lists and the waveforms of a batch are read at once
+	Parameters:
+	-----------
+		telNode : group of the telescope
+		reconstruction : DL0WaveformReconstruction of the telescope
+		batchSize : expected number of events per batch (rounded to a multiple of the chunk size)
+	Return:
+	-------
+		generator of (tabEventId, tabWaveform, tabGainSelection) with tabEventId the id of the events of the batch,
+		tabWaveform the dense waveforms with shape (nbEvent, nbPixel, nbSlice) and tabGainSelection the gain of each
+		pixel with shape (nbEvent, nbPixel)
+	'''
+	signalTable = telNode.signal
+	try:
+		pixelLo = telNode.pixelLo
+	except tables.exceptions.NoSuchNodeError as e:
+		pixelLo = None
+	batchSize = get_chunk_aligned_batch_size(signalTable, batchSize)
+	nbRow = signalTable.nrows
+	for firstRow in range(0, nbRow, batchSize):
+		lastRow = min(firstRow + batchSize, nbRow)
+		tabEventId = telNode.trigger.read(firstRow, lastRow, field="event_id")
+		tabSignalRow = signalTable.read(firstRow, lastRow)
+		listPixel = telNode.pixelWaveform.read(firstRow, lastRow)
+		firstWaveform = int(tabSignalRow["waveformoffset"][0])
+		lastWaveform = int(tabSignalRow["waveformoffset"][-1]) + listPixel[-1].size
+		tabWaveform = telNode.waveform.read(firstWaveform, lastWaveform, field="waveform")
+		if pixelLo is None:
+			listPixelLo = [np.zeros(0, dtype=np.uint16)] * len(listPixel)
+		else:
+			listPixelLo = pixelLo.read(firstRow, lastRow)
+		tabGainSelection = reconstruction.get_gain_selection(listPixelLo, tabSignalRow["signal"].shape[1])
+		yield tabEventId, reconstruction.reconstruct(tabSignalRow["signal"], listPixel, tabWaveform,
+													 tabGainSelection), tabGainSelection
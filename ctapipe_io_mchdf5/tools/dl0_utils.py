@@ -9,9 +9,11 @@ import tables
 import numpy as np
 
 from .r0_utils import create_mon_tel_pointing, TELINFO_NBGAIN, TELINFO_NBPIXEL, TELINFO_NBSLICE
+from .chunk_policy import get_table_options, DATASET_DL0_WAVEFORM, DATASET_DL0_SIGNAL
+from .compression_policy import get_dataset_filters
 
 
-def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1):
+def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=None, expectedrows=0):
 	"""
 	Create the waveform tables into the given telescope node
 	Parameters:
@@ -20,7 +22,8 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 		nbGain : number of gains of the camera
 		nbPixel : number of pixels
 		nbSlice : number of slices
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
+		expectedrows : expected number of events of the telescope (0 if unknown)
 	"""
 	if nbGain > 1:
 		pixelLo = hfile.create_vlarray(telNode, "pixelLo", tables.UInt16Atom(shape=()), "table of the index of the pixels which are in low gain mode",)
@@ -32,7 +35,9 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 	
 	columns_dict_waveform  = {"waveform": tables.UInt16Col(shape=nbSlice)}
 	description_waveform = type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
-	hfile.create_table(telNode, 'waveform', description_waveform, "Table of waveform of the pixel with waveform", chunkshape=chunkshape)
+	hfile.create_table(telNode, 'waveform', description_waveform, "Table of waveform of the pixel with waveform",
+					   filters=get_dataset_filters(DATASET_DL0_WAVEFORM),
+					   **get_table_options(DATASET_DL0_WAVEFORM, description_waveform, 0, chunkshape))
 	
 	columns_dict_signal  = {
 				#"signal": tables.Float32Col(shape=(nbPixel)),
@@ -40,10 +45,12 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 				"waveformoffset": tables.UInt64Col(shape=())
 			 }
 	description_signal = type('description columns_dict_signal', (tables.IsDescription,), columns_dict_signal)
-	hfile.create_table(telNode, 'signal', description_signal, "Calibrated and integrated signal", chunkshape=chunkshape)
+	hfile.create_table(telNode, 'signal', description_signal, "Calibrated and integrated signal",
+					   filters=get_dataset_filters(DATASET_DL0_SIGNAL),
+					   **get_table_options(DATASET_DL0_SIGNAL, description_signal, expectedrows, chunkshape))
 
 
-def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
+def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=None):
 	"""
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -52,7 +59,7 @@ def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
 		hfile : HDF5 file to be used
 		telId : id of the telescope
 		telInfo : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
 	"""
 	cam_tel_group = create_mon_tel_pointing(hfile, telId, telInfo, chunkshape=chunkshape)
 	
@@ -0,0 +1,673 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .mc_truth import find_event_rows
+
+
+class EventIndex(object):
+	'''
+	Compact index of the events of a run which is stored per telescope.
+	The telescope events of the event at position i are stored in [event_offset[i], event_offset[i + 1])
+	in the tel_id, tel_index and row tables (CSR storage).
+	Attributes:
+	-----------
+		event_id : id of the events, in iteration order
+		event_offset : offset of the first telescope event of each event (size = number of events + 1)
+		tel_id : id of the telescope of each telescope event
+		tel_index : index of the telescope of each telescope event
+		row : row of each telescope event in the tables of its telescope
+	'''
+	def __init__(self, event_id, event_offset, tel_id, tel_index, row):
+		self.event_id = event_id
+		self.event_offset = event_offset
+		self.tel_id = tel_id
+		self.tel_index = tel_index
+		self.row = row
+		self._sortedEventPosition = None
+		self._sortedEventId = None
+
+
+	def __len__(self):
+		return self.event_id.size
+
+
+	def get_event_telescopes(self, position):
+		'''
+		Get the telescope events of the event at the given position
+		Parameters:
+		-----------
+			position : position of the event in the index
+		Return:
+		-------
+			tuple of (tel_id, tel_index, row) tables of the telescope events
+		'''
+		first = self.event_offset[position]
+		last = self.event_offset[position + 1]
+		return self.tel_id[first:last], self.tel_index[first:last], self.row[first:last]
+
+
+	def find_event(self, event_id):
+		'''
+		Find the position of an event in the index
+		Parameters:
+		-----------
+			event_id : id of the event
+		Return:
+		-------
+			position of the event
+		Raise:
+		------
+			KeyError if the event is not in the index
+		'''
+		if self._sortedEventId is None:
+			#Sort the event ids only once, for the following searches
+			self._sortedEventPosition = np.argsort(self.event_id, kind='stable')
+			self._sortedEventId = self.event_id[self._sortedEventPosition]
+		sortedPosition = np.searchsorted(self._sortedEventId, event_id)
+		if sortedPosition >= self._sortedEventId.size or self._sortedEventId[sortedPosition] != event_id:
+			raise KeyError("Event {} is not in the file".format(event_id))
+		return int(self._sortedEventPosition[sortedPosition])
+
+
+	def select(self, first, last):
+		'''
+		Create the index of the events at the positions [first, last)
+		Parameters:
+		-----------
+			first : position of the first selected event
+			last : position of the last selected event (excluded)
+		Return:
+		-------
+			EventIndex of the selected events
+		'''
+		first = max(0, min(first, len(self)))
+		last = max(first, min(last, len(self)))
+		firstTelEvent = self.event_offset[first]
+		lastTelEvent = self.event_offset[last]
+		return EventIndex(self.event_id[first:last].copy(), self.event_offset[first:last + 1] - firstTelEvent,
+						  self.tel_id[firstTelEvent:lastTelEvent].copy(),
+						  self.tel_index[firstTelEvent:lastTelEvent].copy(),
+						  self.row[firstTelEvent:lastTelEvent].copy())
+
+
+	def take(self, tabPosition):
+		'''
+		Create the index of the events at the given positions
+		Parameters:
+		-----------
+			tabPosition : positions of the selected events, in the order of the new index
+		Return:
+		-------
+			EventIndex of the selected events
+		'''
+		tabPosition = np.asarray(tabPosition, dtype=np.int64)
+		tabFirst = self.event_offset[tabPosition].astype(np.int64)
+		tabNbTel = self.event_offset[tabPosition + 1].astype(np.int64) - tabFirst
+		eventOffset = np.zeros(tabPosition.size + 1, dtype=np.uint64)
+		np.cumsum(tabNbTel, out=eventOffset[1:])
+		#Position of each selected telescope event in the current tables
+		tabTelPosition = np.repeat(tabFirst - eventOffset[:-1].astype(np.int64), tabNbTel) + \
+			np.arange(int(eventOffset[-1]), dtype=np.int64)
+		return EventIndex(self.event_id[tabPosition], eventOffset, self.tel_id[tabTelPosition],
+						  self.tel_index[tabTelPosition], self.row[tabTelPosition])
+
+
+	def select_event_ids(self, tabEventId):
+		'''
+		Create the index of the events whose id is in tabEventId (the order of the events is kept)
+		Parameters:
+		-----------
+			tabEventId : ids of the events to be kept
+		Return:
+		-------
+			EventIndex of the selected events
+		'''
+		return self.take(np.flatnonzero(np.isin(self.event_id, tabEventId)))
+
+
+	def iter_events(self):
+		'''
+		Iterate over the events of the index
+		Return:
+		-------
+			generator of (event_id, tel_id, tel_index, row) for each event
+		'''
+		for position in range(len(self)):
+			tabTelId, tabTelIndex, tabRow = self.get_event_telescopes(position)
+			yield self.event_id[position], tabTelId, tabTelIndex, tabRow
+
+
+def save_event_index(fileName, events):
+	'''
+	Save an event index in a numpy file, so it can be loaded without reading the telescope tables again
+	Parameters:
+	-----------
+		fileName : name of the numpy file (.npz)
+		events : EventIndex to be saved
+	'''
+	np.savez(fileName, event_id=events.event_id, event_offset=events.event_offset, tel_id=events.tel_id,
+			 tel_index=events.tel_index, row=events.row)
+
+
+def load_event_index(fileName):
+	'''
+	Load an event index saved by save_event_index
+	Parameters:
+	-----------
+		fileName : name of the numpy file (.npz)
+	Return:
+	-------
+		EventIndex
+	'''
+	with np.load(fileName) as indexFile:
+		return EventIndex(indexFile["event_id"], indexFile["event_offset"], indexFile["tel_id"],
+						  indexFile["tel_index"], indexFile["row"])
+
+
+def get_shard_range(nbEvent, shardIndex, nbShard):
+	'''
+	Get the positions of the events of a shard. The shards are consecutive ranges of events whose union is the whole run
+	Parameters:
+	-----------
+		nbEvent : number of events of the run
+		shardIndex : index of the shard (in [0, nbShard))
+		nbShard : number of shards
+	Return:
+	-------
+		(first, last) positions of the events of the shard (last excluded)
+	Raise:
+	------
+		ValueError if the shard does not exist
+	'''
+	if nbShard < 1 or shardIndex < 0 or shardIndex >= nbShard:
+		raise ValueError("Shard {} does not exist in {} shards".format(shardIndex, nbShard))
+	return (shardIndex * nbEvent) // nbShard, ((shardIndex + 1) * nbEvent) // nbShard
+
+
+def create_event_index(tabEventId, tabTelId, tabTelIndex, tabRow):
+	'''
+	Create the event index from the concatenation of the telescope events of all the telescopes
+	The events are in the order of their first appearance in tabEventId and the telescope events of an event keep
+	their order in tabEventId
+	Parameters:
+	-----------
+		tabEventId : event id of each telescope event
+		tabTelId : telescope id of each telescope event
+		tabTelIndex : telescope index of each telescope event
+		tabRow : row of each telescope event in the tables of its telescope
+	Return:
+	-------
+		EventIndex of the run
+	'''
+	if tabEventId.size == 0:
+		return EventIndex(np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.uint64), tabTelId, tabTelIndex, tabRow)
+	uniqueEventId, firstPosition, inverse = np.unique(tabEventId, return_index=True, return_inverse=True)
+	inverse = inverse.reshape(-1)
+	#Rank of each event in the order of first appearance
+	eventOrder = np.argsort(firstPosition, kind='stable')
+	eventRank = np.empty_like(eventOrder)
+	eventRank[eventOrder] = np.arange(eventOrder.size)
+	telEventRank = eventRank[inverse]
+	#The stable sort keeps the order of the telescopes inside an event
+	sortIndex = np.argsort(telEventRank, kind='stable')
+	eventOffset = np.zeros(uniqueEventId.size + 1, dtype=np.uint64)
+	np.cumsum(np.bincount(telEventRank, minlength=uniqueEventId.size), out=eventOffset[1:])
+	return EventIndex(uniqueEventId[eventOrder], eventOffset, tabTelId[sortIndex], tabTelIndex[sortIndex],
+					  tabRow[sortIndex])
+
+
+def iter_telescope_groups(hfile, where, groupPrefix='Tel_', allowedTelId=None):
+	'''
+	Iterate over the telescope groups named groupPrefix + telescope id, in the order of walk_nodes.
+	The groups of the telescopes which are not allowed are not opened
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+		groupPrefix : prefix of the name of the telescope groups
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes)
+	Return:
+	-------
+		generator of the telescope groups (and of the other groups if allowedTelId is None)
+	'''
+	if allowedTelId is None:
+		for telNode in hfile.walk_nodes(where, 'Group'):
+			yield telNode
+		return
+	node = hfile.get_node(where)
+	for name in sorted(node._v_groups):
+		telId = name[len(groupPrefix):]
+		if name.startswith(groupPrefix) and telId.isdigit() and int(telId) in allowedTelId:
+			yield node._v_groups[name]
+
+
+def iter_event_id_blocks(table, columnName, nbRowPerBlock):
+	'''
+	Iterate over the event ids of a table by blocks of rows
+	Parameters:
+	-----------
+		table : table which contains the event ids
+		columnName : name of the event id column
+		nbRowPerBlock : number of rows read at once
+	Return:
+	-------
+		generator of (first row of the block, event ids of the block)
+	'''
+	for firstRow in range(0, table.nrows, nbRowPerBlock):
+		yield firstRow, np.asarray(table.read(firstRow, min(firstRow + nbRowPerBlock, table.nrows), field=columnName),
+								   dtype=np.uint64)
+
+
+def get_event_id_block_size(table, nbMaxEvent):
+	'''
+	Get the number of rows of event ids read at once when only the first events of a run are used
+	Parameters:
+	-----------
+		table : table which contains the event ids
+		nbMaxEvent : number of events to be found
+	Return:
+	-------
+		number of rows read at once (at least one chunk of the table)
+	'''
+	return max(1, nbMaxEvent, table.chunkshape[0] if table.chunkshape is not None else 0)
+
+
+def read_first_event_ids(listTableColumn, nbMaxEvent):
+	'''
+	Read the ids of the first events in the order of their first appearance in the concatenation of event id columns.
+	The tables are read by blocks and the reading stops once nbMaxEvent events are found
+	Parameters:
+	-----------
+		listTableColumn : list of (table, name of the event id column)
+		nbMaxEvent : number of events to be found
+	Return:
+	-------
+		ids of the first nbMaxEvent events (less if the tables have less events)
+	'''
+	tabSelectedId = np.zeros(0, dtype=np.uint64)
+	for table, columnName in listTableColumn:
+		for firstRow, tabEventId in iter_event_id_blocks(table, columnName, get_event_id_block_size(table, nbMaxEvent)):
+			uniqueEventId, firstPosition = np.unique(tabEventId, return_index=True)
+			tabNewId = uniqueEventId[np.argsort(firstPosition, kind='stable')]
+			tabNewId = tabNewId[~np.isin(tabNewId, tabSelectedId)]
+			tabSelectedId = np.concatenate((tabSelectedId, tabNewId[:nbMaxEvent - tabSelectedId.size]))
+			if tabSelectedId.size >= nbMaxEvent:
+				return tabSelectedId
+	return tabSelectedId
+
+
+def read_selected_event_rows(table, columnName, tabSelectedId, nbRowPerBlock):
+	'''
+	Read the rows of a table whose event id is selected. The table is read by blocks and, as long as its event ids are
+	sorted (the converters write the events in order), the reading stops after the last selected event id. The whole
+	table is read if its event ids are not sorted
+	Parameters:
+	-----------
+		table : table which contains the event ids
+		columnName : name of the event id column
+		tabSelectedId : ids of the selected events
+		nbRowPerBlock : number of rows read at once
+	Return:
+	-------
+		tuple of (event id, row) tables of the selected rows
+	'''
+	listEventId, listRow = [np.zeros(0, dtype=np.uint64)], [np.zeros(0, dtype=np.uint64)]
+	if tabSelectedId.size == 0:
+		return listEventId[0], listRow[0]
+	maxSelectedId = tabSelectedId.max()
+	isSorted, lastEventId = True, None
+	for firstRow, tabEventId in iter_event_id_blocks(table, columnName, nbRowPerBlock):
+		isSelected = np.isin(tabEventId, tabSelectedId)
+		listEventId.append(tabEventId[isSelected])
+		listRow.append(np.flatnonzero(isSelected).astype(np.uint64) + np.uint64(firstRow))
+		isSorted = isSorted and bool(np.all(tabEventId[1:] >= tabEventId[:-1])) and \
+			(lastEventId is None or tabEventId[0] >= lastEventId)
+		lastEventId = tabEventId[-1]
+		if isSorted and lastEventId > maxSelectedId:
+			break
+	return np.concatenate(listEventId), np.concatenate(listRow)
+
+
+def _read_telescope_tables(listTelNode, getTelescopeEventTable, allowedTelId=None):
+	'''
+	Get the event id tables of the telescope groups
+	Parameters:
+	-----------
+		listTelNode : telescope groups (the other groups are skipped)
+		getTelescopeEventTable : function which returns the (table, name of the event id column) of a telescope group
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes)
+	Return:
+	-------
+		list of (telescope id, telescope index, table, name of the event id column)
+	'''
+	listTelescope = []
+	for telNode in listTelNode:
+		try:
+			telescopeId = np.uint64(telNode.telId.read())
+			if allowedTelId is not None and int(telescopeId) not in allowedTelId:
+				continue
+			telescopeIndex = np.uint64(telNode.telIndex.read())
+			table, columnName = getTelescopeEventTable(telNode)
+		except tables.exceptions.NoSuchNodeError as e:
+			#For the telescope groups only
+			continue
+		listTelescope.append((telescopeId, telescopeIndex, table, columnName))
+	return listTelescope
+
+
+def _create_event_index_from_telescopes(listTelescope, tabSelectedId=None):
+	'''
+	Create the event index of telescope tables, the events are in the order of their first appearance in the tables
+	Parameters:
+	-----------
+		listTelescope : list of (telescope id, telescope index, table, name of the event id column)
+		tabSelectedId : ids of the events to be read (None for all the events)
+	Return:
+	-------
+		EventIndex of the telescope tables
+	'''
+	listEventId, listTelId, listTelIndex, listRow = [], [], [], []
+	for telescopeId, telescopeIndex, table, columnName in listTelescope:
+		if tabSelectedId is None:
+			tabEventId = np.asarray(table.col(columnName), dtype=np.uint64)
+			tabRow = np.arange(tabEventId.size, dtype=np.uint64)
+		else:
+			tabEventId, tabRow = read_selected_event_rows(table, columnName, tabSelectedId,
+														  get_event_id_block_size(table, tabSelectedId.size))
+		nbTelEvent = tabEventId.size
+		listEventId.append(tabEventId)
+		listTelId.append(np.full(nbTelEvent, telescopeId, dtype=np.uint16))
+		listTelIndex.append(np.full(nbTelEvent, telescopeIndex, dtype=np.uint16))
+		listRow.append(tabRow)
+	if len(listEventId) == 0:
+		return create_event_index(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint16),
+								  np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint64))
+	return create_event_index(np.concatenate(listEventId), np.concatenate(listTelId),
+							  np.concatenate(listTelIndex), np.concatenate(listRow))
+
+
+def _create_event_index_from_groups(listTelNode, getTelescopeEventTable, allowedTelId=None, nbMaxEvent=None):
+	'''
+	Create the event index of the telescope groups
+	Parameters:
+	-----------
+		listTelNode : telescope groups (the other groups are skipped)
+		getTelescopeEventTable : function which returns the (table, name of the event id column) of a telescope group
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes)
+		nbMaxEvent : number of events of the index (None for all the events), the event ids are read only until
+			these events are found
+	Return:
+	-------
+		EventIndex of the run
+	'''
+	listTelescope = _read_telescope_tables(listTelNode, getTelescopeEventTable, allowedTelId)
+	tabSelectedId = None
+	if nbMaxEvent is not None:
+		tabSelectedId = read_first_event_ids([(table, columnName) for telescopeId, telescopeIndex, table, columnName in
+											  listTelescope], nbMaxEvent)
+	return _create_event_index_from_telescopes(listTelescope, tabSelectedId)
+
+
+def read_event_order(listTableColumn):
+	'''
+	Read the ids of all the events in the order of their first appearance in the concatenation of event id columns
+	Parameters:
+	-----------
+		listTableColumn : list of (table, name of the event id column)
+	Return:
+	-------
+		unique event ids in the order of their first appearance
+	'''
+	if len(listTableColumn) == 0:
+		return np.zeros(0, dtype=np.uint64)
+	tabEventId = np.concatenate([np.asarray(table.col(columnName), dtype=np.uint64)
+								 for table, columnName in listTableColumn])
+	uniqueEventId, firstPosition = np.unique(tabEventId, return_index=True)
+	return uniqueEventId[np.argsort(firstPosition, kind='stable')]
+
+
+def get_event_order_tables(hfile, where, groupPrefix, allowedTelId, getTelescopeEventTable):
+	'''
+	Get the event id tables which give the order of the events of the run : the ones of the telescope groups, in the
+	order of walk_nodes, until the last allowed telescope. The events of the allowed telescopes are so iterated in the
+	same order as without allowed telescopes. Only the event ids of the other telescopes are read
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+		groupPrefix : prefix of the name of the telescope groups
+		allowedTelId : ids of the telescopes to be used
+		getTelescopeEventTable : function which returns the (table, name of the event id column) of a telescope group
+	Return:
+	-------
+		list of (table, name of the event id column)
+	'''
+	node = hfile.get_node(where)
+	listTableColumn, nbOrderTable = [], 0
+	for name in sorted(node._v_groups):
+		telId = name[len(groupPrefix):]
+		if not name.startswith(groupPrefix) or not telId.isdigit():
+			continue
+		try:
+			listTableColumn.append(getTelescopeEventTable(node._v_groups[name]))
+		except tables.exceptions.NoSuchNodeError:
+			continue
+		if int(telId) in allowedTelId:
+			nbOrderTable = len(listTableColumn)
+	return listTableColumn[:nbOrderTable]
+
+
+def _create_ordered_event_index(listTelescope, listOrderTableColumn, nbMaxEvent=None):
+	'''
+	Create the event index of telescope tables with the events in the order of their first appearance in other event
+	id tables
+	Parameters:
+	-----------
+		listTelescope : list of (telescope id, telescope index, table, name of the event id column)
+		listOrderTableColumn : list of (table, name of the event id column) which give the order of the events (they
+			contain all the events of listTelescope)
+		nbMaxEvent : number of events of the index (None for all the events). The tables are read only for the first
+			events in order
+	Return:
+	-------
+		EventIndex of the telescope tables
+	'''
+	if nbMaxEvent is not None:
+		#The first events may not have any of the telescopes, more of them are read until enough events are found
+		nbOrderEvent = max(1, nbMaxEvent)
+		while True:
+			tabOrderEventId = read_first_event_ids(listOrderTableColumn, nbOrderEvent)
+			if tabOrderEventId.size < nbOrderEvent:
+				#All the events are in tabOrderEventId
+				events = _create_event_index_from_telescopes(listTelescope, None)
+				return sort_event_index_by_trigger(events, tabOrderEventId).select(0, nbMaxEvent)
+			events = _create_event_index_from_telescopes(listTelescope, tabOrderEventId)
+			if len(events) >= nbMaxEvent:
+				return sort_event_index_by_trigger(events, tabOrderEventId).select(0, nbMaxEvent)
+			nbOrderEvent *= 2
+	events = _create_event_index_from_telescopes(listTelescope, None)
+	return sort_event_index_by_trigger(events, read_event_order(listOrderTableColumn))
+
+
+def create_event_index_r1(hfile, where='/r1', allowedTelId=None, nbMaxEvent=None):
+	'''
+	Create the event index of a R1-V2 (or R1-V2-PixelSlice) file.
+	The events are in the order of their first appearance in the trigger tables of the telescopes, in the order of
+	walk_nodes, with or without allowed telescopes
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes), the groups of the other
+			telescopes are not indexed : only the event ids of the ones before the last allowed telescope are read,
+			to get the order of the events
+		nbMaxEvent : number of events of the index (None for all the events), the trigger tables are read only until
+			the first nbMaxEvent events are found
+	Return:
+	-------
+		EventIndex of the run
+	'''
+	getTelescopeEventTable = lambda telNode: (telNode.trigger, "event_id")
+	if allowedTelId is None:
+		return _create_event_index_from_groups(iter_telescope_groups(hfile, where), getTelescopeEventTable, None,
+											   nbMaxEvent)
+	listTelescope = _read_telescope_tables(iter_telescope_groups(hfile, where, 'Tel_', allowedTelId),
+										   getTelescopeEventTable, allowedTelId)
+	listOrderTableColumn = get_event_order_tables(hfile, where, 'Tel_', allowedTelId, getTelescopeEventTable)
+	return _create_ordered_event_index(listTelescope, listOrderTableColumn, nbMaxEvent)
+
+
+def create_event_index_tel(hfile, where='/Tel', allowedTelId=None, nbMaxEvent=None):
+	'''
+	Create the event index of a hiPeHDF5 (version 1) file
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes). The groups are named after
+			the telescope index, so only the event ids of the other telescopes are not read
+		nbMaxEvent : number of events of the index (None for all the events), the event id tables are read only until
+			the first nbMaxEvent events are found
+	Return:
+	-------
+		EventIndex of the run
+	'''
+	return _create_event_index_from_groups(hfile.walk_nodes(where, 'Group'),
+										   lambda telNode: (telNode.eventId, "eventId"), allowedTelId, nbMaxEvent)
+
+
+def get_telescope_table_name(telId):
+	'''
+	Get the name of the table of a telescope in a R0-V2 file
+	Parameters:
+	-----------
+		telId : id of the telescope
+	Return:
+	-------
+		name of the table of the telescope (tel_XXX)
+	'''
+	return 'tel_{0:0=3d}'.format(telId)
+
+
+def iter_telescope_tables(hfile, where='/r0/event/telescope/waveform', allowedTelId=None):
+	'''
+	Iterate over the telescope tables (tel_XXX) of a R0-V2 group, sorted by telescope id.
+	The tables of the telescopes which are not allowed are not opened
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope tables
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes)
+	Return:
+	-------
+		generator of (telescope id, table)
+	'''
+	node = hfile.get_node(where)
+	listTelId = []
+	for name in node._v_leaves:
+		telId = name[len('tel_'):]
+		if name.startswith('tel_') and telId.isdigit():
+			listTelId.append(int(telId))
+	for telId in sorted(listTelId):
+		if allowedTelId is None or telId in allowedTelId:
+			yield telId, node._f_get_child(get_telescope_table_name(telId))
+
+
+def _create_event_index_r0_tables(hfile, where, allowedTelId, tabSelectedId):
+	'''
+	Create the event index of the telescope tables of a R0-V2 file, in the order of the telescope events
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope tables
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes)
+		tabSelectedId : ids of the events to be read (None for all the events)
+	Return:
+	-------
+		EventIndex of the telescope tables
+	'''
+	listEventId, listTelId, listTelIndex, listRow = [], [], [], []
+	for telId, table in iter_telescope_tables(hfile, where, allowedTelId):
+		if tabSelectedId is None:
+			tabEventId = np.asarray(table.col("event_id"), dtype=np.uint64)
+			tabRow = np.arange(tabEventId.size, dtype=np.uint64)
+		else:
+			tabEventId, tabRow = read_selected_event_rows(table, "event_id", tabSelectedId,
+														  get_event_id_block_size(table, tabSelectedId.size))
+		nbTelEvent = tabEventId.size
+		listEventId.append(tabEventId)
+		listTelId.append(np.full(nbTelEvent, telId, dtype=np.uint16))
+		#mchdf5_simtel2r0 stores the telescope index as telId - 1
+		listTelIndex.append(np.full(nbTelEvent, telId - 1, dtype=np.uint16))
+		listRow.append(tabRow)
+	if len(listEventId) == 0:
+		return create_event_index(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint16),
+								  np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint64))
+	return create_event_index(np.concatenate(listEventId), np.concatenate(listTelId),
+							  np.concatenate(listTelIndex), np.concatenate(listRow))
+
+
+def sort_event_index_by_trigger(events, tabTriggerEventId):
+	'''
+	Sort the events of an index in the order of the subarray trigger table (the events which are not in the trigger
+	table are at the end)
+	Parameters:
+	-----------
+		events : EventIndex to be sorted
+		tabTriggerEventId : event ids of the trigger table (or of any reference order of the events)
+	Return:
+	-------
+		sorted EventIndex
+	'''
+	if len(events) == 0:
+		return events
+	tabPosition = find_event_rows(events.event_id, tabTriggerEventId)
+	tabPosition = tabPosition[tabPosition >= 0]
+	#An event is kept only once, even if it is several times in the trigger table
+	tabPosition = tabPosition[np.sort(np.unique(tabPosition, return_index=True)[1])]
+	isTriggered = np.zeros(len(events), dtype=bool)
+	isTriggered[tabPosition] = True
+	return events.take(np.concatenate((tabPosition, np.flatnonzero(~isTriggered))))
+
+
+def create_event_index_r0(hfile, where='/r0/event/telescope/waveform', triggerWhere='/r0/event/subarray/trigger',
+						  allowedTelId=None, nbMaxEvent=None):
+	'''
+	Create the event index of a R0-V2 file.
+	The telescope events are read from the event_id column of the telescope tables and the events are in the order
+	of the subarray trigger table (the events which are not in the trigger table are at the end)
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope tables
+		triggerWhere : subarray trigger table
+		allowedTelId : ids of the telescopes to be used (None for all the telescopes), the tables of the other
+			telescopes are not opened
+		nbMaxEvent : number of events needed (None for all the events). The telescope tables are read only for the
+			first triggered events, the index can have more than nbMaxEvent events
+	Return:
+	-------
+		EventIndex of the run
+	'''
+	triggerTable = hfile.get_node(triggerWhere)
+	if nbMaxEvent is not None:
+		#The first triggered events may not have any of the allowed telescopes, more of them are read until enough
+		#events are found
+		nbTriggerEvent = max(1, nbMaxEvent)
+		while True:
+			tabTriggerEventId = read_first_event_ids([(triggerTable, "event_id")], nbTriggerEvent)
+			if tabTriggerEventId.size < nbTriggerEvent:
+				#Less triggered events than needed : the events which are not triggered may be needed too
+				break
+			events = _create_event_index_r0_tables(hfile, where, allowedTelId, tabTriggerEventId)
+			if len(events) >= nbMaxEvent:
+				return sort_event_index_by_trigger(events, tabTriggerEventId)
+			nbTriggerEvent *= 2
+	events = _create_event_index_r0_tables(hfile, where, allowedTelId, None)
+	return sort_event_index_by_trigger(events, triggerTable.col("event_id"))
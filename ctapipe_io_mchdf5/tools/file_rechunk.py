@@ -0,0 +1,276 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import time
+
+import tables
+
+from .chunk_policy import get_table_dataset, get_table_options
+from .compression_policy import get_compression_policy, get_dataset_filters, get_file_filters, select_table_filters
+from .waveform_reader import get_block_size, get_chunk_aligned_batch_size
+
+
+# Default size in bytes of the blocks of rows copied at once
+DEFAULT_NB_BYTE_PER_BLOCK = 16 * 1024 * 1024
+
+# Files opened by the worker processes which read the blocks of rows
+_WORKER_FILE = dict()
+
+
+def _read_table_rows(fileName, tablePath, firstRow, lastRow):
+	'''
+	Read consecutive rows of a table (called in the worker processes, which keep their input file opened)
+	Parameters:
+	-----------
+		fileName : name of the file to be read
+		tablePath : path of the table in the file
+		firstRow : first row to be read
+		lastRow : last row to be read (excluded)
+	Return:
+	-------
+		structured array of the rows
+	'''
+	hfile = _WORKER_FILE.get(fileName)
+	if hfile is None:
+		hfile = tables.open_file(fileName, "r")
+		_WORKER_FILE[fileName] = hfile
+	return hfile.get_node(tablePath).read(firstRow, lastRow)
+
+
+def get_rechunked_table_options(table):
+	'''
+	Get the chunk options of the copy of a table : the waveform like tables are sized by the chunk policy, the other
+	ones by PyTables from their number of rows
+	Parameters:
+	-----------
+		table : table to be copied
+	Return:
+	-------
+		dictionary of the chunkshape and expectedrows arguments of File.create_table
+	'''
+	dataset = get_table_dataset(table)
+	if dataset is not None:
+		return get_table_options(dataset, table.description, table.nrows)
+	return {"expectedrows": max(1, table.nrows)}
+
+
+def get_rechunked_table_filters(table, filters, chunkshape, dicoSelection=None):
+	'''
+	Get the filters of the copy of a table from the compression policy : the filters of its dataset, or the ones
+	selected on its first rows if its dataset is in auto mode
+	Parameters:
+	-----------
+		table : table to be copied
+		filters : filters of the copy if the compression policy does not override them
+		chunkshape : chunk shape of the copy
+		dicoSelection : dictionary completed with (selected filters, compression ratio) by path of table in auto mode
+			(None to ignore the selection)
+	Return:
+	-------
+		filters of the copy
+	'''
+	dataset = get_table_dataset(table)
+	policy = get_compression_policy()
+	if policy.is_auto(dataset) and table.nrows > 0:
+		nbRow = max(1, policy.nbSampleByte // table.rowsize)
+		selectedFilters, compressionRatio = select_table_filters(table.read(0, min(nbRow, table.nrows)), chunkshape)
+		if dicoSelection is not None:
+			dicoSelection[table._v_pathname] = (selectedFilters, compressionRatio)
+		return selectedFilters
+	datasetFilters = get_dataset_filters(dataset)
+	return filters if datasetFilters is None else datasetFilters
+
+
+def create_rechunked_table(outFile, outGroup, table, filters, dicoSelection=None):
+	'''
+	Create the empty copy of a table with new chunk shape and filters, and with the title and attributes of the table
+	Parameters:
+	-----------
+		outFile : output file
+		outGroup : group of the copy
+		table : table to be copied
+		filters : filters of the copy if the compression policy does not override them
+		dicoSelection : dictionary completed with the filters selected in auto mode (see get_rechunked_table_filters)
+	Return:
+	-------
+		created table
+	'''
+	dicoOption = get_rechunked_table_options(table)
+	outTable = outFile.create_table(outGroup, table._v_name, table.description, table._v_title,
+									filters=get_rechunked_table_filters(table, filters, dicoOption.get("chunkshape"),
+																		dicoSelection),
+									**dicoOption)
+	table.attrs._f_copy(outTable)
+	return outTable
+
+
+def get_table_block_ranges(table, outTable, nbBytePerBlock):
+	'''
+	Get the ranges of rows of the blocks to be copied, aligned on the chunks of the copy
+	Parameters:
+	-----------
+		table : table to be copied
+		outTable : copy of the table
+		nbBytePerBlock : size in bytes of a block
+	Return:
+	-------
+		list of (firstRow, lastRow)
+	'''
+	nbRowPerBlock = get_chunk_aligned_batch_size(outTable, get_block_size(table, None, 0, nbBytePerBlock))
+	return [(firstRow, min(firstRow + nbRowPerBlock, table.nrows))
+			for firstRow in range(0, table.nrows, nbRowPerBlock)]
+
+
+def iter_interleaved_blocks(listTableBlock):
+	'''
+	Iterate over the blocks of several tables, one block of each table in turn, so the telescopes are read in parallel
+	Parameters:
+	-----------
+		listTableBlock : list of (tablePath, list of (firstRow, lastRow))
+	Return:
+	-------
+		generator of (tablePath, firstRow, lastRow), with the blocks of a table in order
+	'''
+	listIter = [[(tablePath, firstRow, lastRow) for firstRow, lastRow in listBlock]
+				for tablePath, listBlock in listTableBlock]
+	for listBlock in itertools.zip_longest(*listIter):
+		for block in listBlock:
+			if block is not None:
+				yield block
+
+
+def iter_read_blocks(inFile, listBlock, executor=None, nbBlockInFlight=1):
+	'''
+	Read blocks of rows, in the worker processes of an executor if any. At most nbBlockInFlight blocks are read
+	ahead, which bounds the memory used
+	Parameters:
+	-----------
+		inFile : input file
+		listBlock : iterable of (tablePath, firstRow, lastRow)
+		executor : executor of the worker processes (None to read in the current process)
+		nbBlockInFlight : maximum number of blocks read ahead
+	Return:
+	-------
+		generator of (tablePath, firstRow, lastRow, rows), in the order of listBlock
+	'''
+	if executor is None:
+		for tablePath, firstRow, lastRow in listBlock:
+			yield tablePath, firstRow, lastRow, inFile.get_node(tablePath).read(firstRow, lastRow)
+		return
+	queueBlock = deque()
+	for tablePath, firstRow, lastRow in listBlock:
+		queueBlock.append((tablePath, firstRow, lastRow,
+						   executor.submit(_read_table_rows, inFile.filename, tablePath, firstRow, lastRow)))
+		if len(queueBlock) >= nbBlockInFlight:
+			tablePath, firstRow, lastRow, future = queueBlock.popleft()
+			yield tablePath, firstRow, lastRow, future.result()
+	while len(queueBlock) > 0:
+		tablePath, firstRow, lastRow, future = queueBlock.popleft()
+		yield tablePath, firstRow, lastRow, future.result()
+
+
+def copy_file_structure(outFile, inFile, filters, dicoSelection=None):
+	'''
+	Copy the groups, the arrays and the attributes of a file and create the empty copies of its tables
+	Parameters:
+	-----------
+		outFile : output file
+		inFile : input file
+		filters : filters of the copied leaves
+		dicoSelection : dictionary completed with the filters selected in auto mode (see get_rechunked_table_filters)
+	Return:
+	-------
+		list of (table, copied table)
+	'''
+	outFile.title = inFile.title
+	inFile.root._v_attrs._f_copy(outFile.root)
+	listTable = []
+	for group in inFile.walk_groups("/"):
+		if group._v_pathname == "/":
+			outGroup = outFile.root
+		else:
+			outGroup = outFile.create_group(group._v_parent._v_pathname, group._v_name, group._v_title)
+			group._v_attrs._f_copy(outGroup)
+		for leaf in group._f_iter_nodes("Leaf"):
+			if isinstance(leaf, tables.Table):
+				listTable.append((leaf, create_rechunked_table(outFile, outGroup, leaf, filters, dicoSelection)))
+			else:
+				leaf.copy(outGroup, leaf._v_name, filters=filters, chunkshape="auto")
+	return listTable
+
+
+def rechunk_file(outputFileName, inputFileName, filters, nbWorker=1, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK,
+				 dicoSelection=None):
+	'''
+	Rewrite a file with the chunk shapes of the chunk policy and new filters (overridden per dataset by the compression
+	policy). The tables are copied by blocks of rows which are read by worker processes, the blocks of the telescopes in
+	turn
+	Parameters:
+	-----------
+		outputFileName : name of the output file
+		inputFileName : name of the input file
+		filters : filters of the output file
+		nbWorker : number of worker processes which read the blocks (1 to read them in the current process)
+		nbBytePerBlock : size in bytes of the blocks of rows
+		dicoSelection : dictionary completed with (selected filters, compression ratio) by path of table in auto mode
+			(None to ignore the selection)
+	Return:
+	-------
+		list of the paths of the tables sized by the chunk policy
+	'''
+	filters = get_file_filters(filters)
+	inFile = tables.open_file(inputFileName, "r")
+	outFile = tables.open_file(outputFileName, "w", filters=filters)
+	try:
+		listTable = copy_file_structure(outFile, inFile, filters, dicoSelection)
+		dicoOutTable = {table._v_pathname: outTable for table, outTable in listTable}
+		listTableBlock = [(table._v_pathname, get_table_block_ranges(table, outTable, nbBytePerBlock))
+						  for table, outTable in listTable]
+		listBlock = iter_interleaved_blocks(listTableBlock)
+		if nbWorker > 1:
+			with ProcessPoolExecutor(nbWorker) as executor:
+				for tablePath, firstRow, lastRow, tabRow in iter_read_blocks(inFile, listBlock, executor, 2*nbWorker):
+					dicoOutTable[tablePath].append(tabRow)
+		else:
+			for tablePath, firstRow, lastRow, tabRow in iter_read_blocks(inFile, listBlock):
+				dicoOutTable[tablePath].append(tabRow)
+		for outTable in dicoOutTable.values():
+			outTable.flush()
+		return [table._v_pathname for table, outTable in listTable if get_table_dataset(table) is not None]
+	finally:
+		outFile.close()
+		inFile.close()
+
+
+def measure_read_throughput(fileName, listTablePath, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Measure the read throughput of tables, read by blocks of rows aligned on their chunks
+	Parameters:
+	-----------
+		fileName : name of the file to be read
+		listTablePath : paths of the tables to be read
+		nbBytePerBlock : size in bytes of the blocks of rows
+	Return:
+	-------
+		(number of bytes read, elapsed time in seconds)
+	'''
+	nbByte = 0
+	hfile = tables.open_file(fileName, "r")
+	try:
+		timeBegin = time.perf_counter()
+		for tablePath in listTablePath:
+			table = hfile.get_node(tablePath)
+			nbRowPerBlock = get_chunk_aligned_batch_size(table, get_block_size(table, None, 0, nbBytePerBlock))
+			for firstRow in range(0, table.nrows, nbRowPerBlock):
+				nbByte += table.read(firstRow, min(firstRow + nbRowPerBlock, table.nrows)).nbytes
+		elapsedTime = time.perf_counter() - timeBegin
+	finally:
+		hfile.close()
+	return nbByte, elapsedTime
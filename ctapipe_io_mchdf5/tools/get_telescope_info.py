@@ -46,6 +46,102 @@ TELINFO_TEL_CAMERA_GEOMETRY = TELINFO_TEL_CAMERA_NAME
 TELINFO_TEL_CAMERA_READOUT = TELINFO_TEL_CAMERA_NAME
 
 
+def get_telescope_description_info(subarray, tel_id):
+	"""
+	Get the information of a telescope which is given by the subarray description (the information which depend on
+	the events are None, see fill_telescope_info_from_event)
+	Parameters:
+	-----------
+		subarray : SubarrayDescription of the run
+		tel_id : id of the telescope
+	Return:
+	-------
+		table of the telescope information (indexed by TELINFO_*)
+	"""
+	telInfo = subarray.tel[tel_id]
+	ref_shape = telInfo.camera.readout.reference_pulse_shape
+	cameraRotation = telInfo.camera.geometry.pix_rotation.value
+	pixRotation = telInfo.camera.geometry.cam_rotation.value
+
+	telType = np.uint64(get_camera_type_from_name(telInfo.camera.camera_name))
+	tel_name = telInfo.name
+	camera_name = telInfo.camera.camera_name
+	ref_pulse_time = telInfo.camera.readout.reference_pulse_sample_time.value
+
+	pix_area = telInfo.camera.geometry.pix_area.value
+
+	focalLen = np.float32(telInfo.optics.equivalent_focal_length.value)
+
+	tabPixelX = np.asarray(telInfo.camera.geometry.pix_x.value, dtype=np.float32)
+	tabPixelY = np.asarray(telInfo.camera.geometry.pix_y.value, dtype=np.float32)
+
+	nbMirror = np.uint64(telInfo.optics.num_mirrors)
+	nbMirrorTiles = np.uint64(telInfo.optics.num_mirror_tiles)
+	mirrorArea = np.uint64(telInfo.optics.mirror_area.value)
+
+	telX = np.float32(subarray.positions[tel_id][0].value)
+	telY = np.float32(subarray.positions[tel_id][1].value)
+	telZ = np.float32(subarray.positions[tel_id][2].value)
+
+	return [ref_shape, None, None, None, telType, focalLen, tabPixelX, tabPixelY, nbMirror, telX, telY, telZ,
+			nbMirrorTiles, mirrorArea, None, None, 0, cameraRotation, pixRotation, tel_name, camera_name, pix_area,
+			ref_pulse_time, None, None, None, None, None]
+
+
+def get_subarray_telescope_info(subarray):
+	"""
+	Get the information of all the telescopes of the subarray, without reading any event
+	Parameters:
+	-----------
+		subarray : SubarrayDescription of the run
+	Return:
+	-------
+		dictionnary of the telescope information given by the subarray (see get_telescope_description_info) with
+		telescope id as key
+	"""
+	return {tel_id: get_telescope_description_info(subarray, tel_id) for tel_id in subarray.tel.keys()}
+
+
+def fill_telescope_info_from_event(telescope_info, evt, tel_id):
+	"""
+	Complete the information of a telescope with the first event where it has data
+	Parameters:
+	-----------
+		telescope_info : table of the telescope information (from get_telescope_description_info)
+		evt : first event of the telescope
+		tel_id : id of the telescope
+	"""
+	telescope_info[TELINFO_NBSLICE] = evt.r0.tel[tel_id].waveform.shape[2]
+	telescope_info[TELINFO_NBGAIN] = evt.r0.tel[tel_id].waveform.shape[0]
+	telescope_info[TELINFO_NBPIXEL] = evt.r0.tel[tel_id].waveform.shape[1]
+	telescope_info[TELINFO_PEDESTAL] = evt.mc.tel[tel_id].pedestal
+	telescope_info[TELINFO_GAIN] = evt.mc.tel[tel_id].dc_to_pe
+
+	telescope_info[TELINFO_ARRAY_ALT] = np.float32(evt.pointing.array_altitude.value)
+	telescope_info[TELINFO_ARRAY_AZ] = np.float32(evt.pointing.array_azimuth.value)
+	telescope_info[TELINFO_ARRAY_RA] = np.float32(evt.pointing.array_ra.value)
+	telescope_info[TELINFO_ARRAY_DEC] = np.float32(evt.pointing.array_dec.value)
+
+	telescope_info[TELINFO_TIME_FIRST_EV] = np.float64(evt.trigger.time.to_value('unix'))
+
+
+def get_telescope_info_from_first_event(subarray, evt, tel_id):
+	"""
+	Get the information of a telescope from the subarray description and its first event
+	Parameters:
+	-----------
+		subarray : SubarrayDescription of the run
+		evt : first event of the telescope
+		tel_id : id of the telescope
+	Return:
+	-------
+		table of the telescope information (indexed by TELINFO_*)
+	"""
+	telescope_info = get_telescope_description_info(subarray, tel_id)
+	fill_telescope_info_from_event(telescope_info, evt, tel_id)
+	return telescope_info
+
+
 def get_telescope_info_from_event(inputFileName, max_nb_tel):
 	"""
 	Get the telescope information from the event
@@ -60,61 +156,11 @@ def get_telescope_info_from_event(inputFileName, max_nb_tel):
 	telescope_info = dict()  # Key is tel id, value (ref_shape, slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY, nbMirror)
 	nbEvent = 0
 	with event_source(inputFileName) as source:
-		dicoTelInfo = None
-		posTelX = None
-		posTelY = None
-		posTelZ = None
 		for evt in source:
 			nbEvent += 1
-			if dicoTelInfo is None:
-				dicoTelInfo = source.subarray.tel
-				posTelX = np.asarray(source.subarray.tel_coords.x, dtype=np.float32)
-				posTelY = np.asarray(source.subarray.tel_coords.y, dtype=np.float32)
-				posTelZ = np.asarray(source.subarray.tel_coords.z, dtype=np.float32)
 			for tel_id in evt.r0.tels_with_data:
 				if not tel_id in telescope_info:
-					ref_shape = source.subarray.tel[tel_id].camera.readout.reference_pulse_shape
-					nb_slice = evt.r0.tel[tel_id].waveform.shape[2]
-					nbGain = evt.r0.tel[tel_id].waveform.shape[0]
-					nbPixel = evt.r0.tel[tel_id].waveform.shape[1]
-					ped = evt.mc.tel[tel_id].pedestal
-					gain = evt.mc.tel[tel_id].dc_to_pe
-					cameraRotation = source.subarray.tel[tel_id].camera.geometry.pix_rotation.value
-					pixRotation = source.subarray.tel[tel_id].camera.geometry.cam_rotation.value
-					
-					telInfo = dicoTelInfo[tel_id]
-					telType = np.uint64(get_camera_type_from_name(telInfo.camera.camera_name))
-					tel_name = telInfo.name
-					camera_name = telInfo.camera.camera_name
-					ref_pulse_time = telInfo.camera.readout.reference_pulse_sample_time.value
-
-					pix_area = telInfo.camera.geometry.pix_area.value
-
-					focalLen = np.float32(telInfo.optics.equivalent_focal_length.value)
-					
-					tabPixelX = np.asarray(telInfo.camera.geometry.pix_x.value, dtype=np.float32)
-					tabPixelY = np.asarray(telInfo.camera.geometry.pix_y.value, dtype=np.float32)
-					
-					nbMirror = np.uint64(telInfo.optics.num_mirrors)
-					nbMirrorTiles = np.uint64(telInfo.optics.num_mirror_tiles)
-					mirrorArea = np.uint64(telInfo.optics.mirror_area.value)
-
-					array_alt = np.float32(evt.pointing.array_altitude.value)
-					array_az = np.float32(evt.pointing.array_azimuth.value)
-					array_ra = np.float32(evt.pointing.array_ra.value)
-					array_dec = np.float32(evt.pointing.array_dec.value)
-
-					time_first_event = np.float64(evt.trigger.time.to_value('unix'))
-
-					telX = posTelX[int(tel_id - 1)]
-					telY = posTelY[int(tel_id - 1)]
-					telZ = posTelZ[int(tel_id - 1)]
-					
-					telescope_info[tel_id] = [ref_shape, nb_slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY,
-											  nbMirror, telX, telY, telZ, nbMirrorTiles, mirrorArea, nbGain, nbPixel, 0,
-											  cameraRotation, pixRotation, tel_name, camera_name, pix_area,
-											  ref_pulse_time, array_alt, array_az, array_ra, array_dec,
-											  time_first_event]
+					telescope_info[tel_id] = get_telescope_info_from_first_event(source.subarray, evt, tel_id)
 				else:
 					telescope_info[tel_id][TELINFO_NBEVENT] += 1
 	return telescope_info, nbEvent
@@ -150,33 +150,29 @@ def create_camera_table(hfile, telInfo):
 		camera_telescope_table = hfile.create_table("/configuration/instrument/telescope/camera", geometry_camera_name,
 													CameraGeometry, "Geometry of " + camera_name)
 
-		camera_tel_row = camera_telescope_table.row
-		for item in zip(pix_x, pix_y, pix_id, pix_area):
-			camera_tel_row["pix_x"] = item[0]
-			camera_tel_row["pix_y"] = item[1]
-			camera_tel_row["pix_id"] = item[2]
-			camera_tel_row["pix_area"] = item[3]
-
-			camera_tel_row.append()
+		tabGeometry = np.zeros(pix_x.size, dtype=camera_telescope_table.dtype)
+		tabGeometry["pix_x"] = pix_x
+		tabGeometry["pix_y"] = pix_y
+		tabGeometry["pix_id"] = pix_id
+		tabGeometry["pix_area"] = pix_area
+		camera_telescope_table.append(tabGeometry)
 
 		info_ref_shape = telInfo[TELINFO_REFSHAPE]
 		info_ref_pulse_time = telInfo[TELINFO_REF_PULSE_TIME]
 		if info_ref_shape is not None:
 			camera_readout_table = hfile.create_table("/configuration/instrument/telescope/camera", readout_camera_name,
 													  CameraReadOut, "Reference shape of " + camera_name)
-			camera_readout_table_row = camera_readout_table.row
 
 			tab_ref_shape = np.asarray(info_ref_shape, dtype=np.float32)
 			nb_sample = np.uint64(tab_ref_shape.shape[1])  # in cols
 
 			tab_ref_pulse_time = np.asarray(info_ref_pulse_time, dtype=np.float32)
-			for i in range(nb_sample):
-				camera_readout_table_row['reference_pulse_shape_channel0'] = np.float32(tab_ref_shape[0, i])
-				camera_readout_table_row['reference_pulse_sample_time'] = tab_ref_pulse_time[i]
-				if telInfo[TELINFO_NBGAIN] == 2:
-					camera_readout_table_row['reference_pulse_shape_channel1'] = np.float32(tab_ref_shape[1, i])
-
-				camera_readout_table_row.append()
+			tabReadout = np.zeros(int(nb_sample), dtype=camera_readout_table.dtype)
+			tabReadout['reference_pulse_shape_channel0'] = tab_ref_shape[0]
+			tabReadout['reference_pulse_sample_time'] = tab_ref_pulse_time[:int(nb_sample)]
+			if telInfo[TELINFO_NBGAIN] == 2:
+				tabReadout['reference_pulse_shape_channel1'] = tab_ref_shape[1]
+			camera_readout_table.append(tabReadout)
 
 	except tables.exceptions.NodeError:
 		pass
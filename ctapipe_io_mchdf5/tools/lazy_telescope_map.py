@@ -0,0 +1,73 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.core.container import Map
+
+
+class LazyTelescopeMap(Map):
+	'''
+	Map of telescope containers whose content is loaded on the first access.
+	A telescope is registered with a loader, which is called with the telescope id the first time the telescope
+	is accessed (data.r0.tel[telId], items(), values(), ...) and has to fill the telescope container.
+	The registered telescopes are listed by keys(), len() and in even if they are not loaded yet.
+	Attributes:
+	-----------
+		pending : loader of each registered telescope which is not loaded yet (telescope id as key)
+	'''
+	def __init__(self, default_factory=None):
+		super().__init__(default_factory)
+		self.pending = dict()
+
+
+	def set_loader(self, telId, loader):
+		'''
+		Register a telescope to be loaded on the first access
+		Parameters:
+		-----------
+			telId : id of the telescope
+			loader : function called with telId which fills the telescope container
+		'''
+		self.pending[telId] = loader
+
+
+	def __missing__(self, telId):
+		loader = self.pending.pop(telId, None)
+		if loader is not None:
+			loader(telId)
+			if dict.__contains__(self, telId):
+				return dict.__getitem__(self, telId)
+		return super().__missing__(telId)
+
+
+	def __contains__(self, telId):
+		return telId in self.pending or dict.__contains__(self, telId)
+
+
+	def __len__(self):
+		return len(self.keys())
+
+
+	def __iter__(self):
+		return iter(self.keys())
+
+
+	def keys(self):
+		listTelId = list(dict.keys(self))
+		listTelId += [telId for telId in self.pending if not dict.__contains__(self, telId)]
+		return listTelId
+
+
+	def values(self):
+		return [self[telId] for telId in self.keys()]
+
+
+	def items(self):
+		return [(telId, self[telId]) for telId in self.keys()]
+
+
+	def clear(self):
+		self.pending.clear()
+		super().clear()
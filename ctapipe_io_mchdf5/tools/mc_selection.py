@@ -0,0 +1,88 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import re
+
+import numpy as np
+import tables
+
+
+def get_condition_columns(table, condition):
+	'''
+	Get the columns of a table used in a condition
+	Parameters:
+	-----------
+		table : table to be used
+		condition : PyTables condition (ex : "(mc_energy > 1.0) & (mc_alt < 1.2)")
+	Return:
+	-------
+		list of the names of the columns used in the condition
+	'''
+	setName = set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", condition))
+	return [columnName for columnName in table.colnames if columnName in setName]
+
+
+def is_condition_indexed(table, condition):
+	'''
+	Say if all the columns used in a condition are indexed
+	Parameters:
+	-----------
+		table : table to be used
+		condition : PyTables condition on the columns of the table
+	Return:
+	-------
+		True if all the columns used in the condition are indexed
+	'''
+	return all(table.cols._f_col(columnName).is_indexed for columnName in get_condition_columns(table, condition))
+
+
+def create_condition_index(fileName, tablePath, condition):
+	'''
+	Create the completely sorted index of the columns used in a condition, if they are not already indexed.
+	The file is opened in read mode to check the indexes, and in append mode only if an index is missing,
+	so a file whose columns are indexed is never modified
+	Parameters:
+	-----------
+		fileName : name of the file
+		tablePath : path of the table in the file
+		condition : PyTables condition on the columns of the table
+	Return:
+	-------
+		True if all the columns are indexed, False if an index is missing and the file cannot be modified (the
+		condition is then evaluated without index)
+	'''
+	with tables.open_file(fileName, "r") as hfile:
+		if is_condition_indexed(hfile.get_node(tablePath), condition):
+			return True
+	try:
+		hfile = tables.open_file(fileName, "a")
+	except (OSError, ValueError):
+		#Read-only file (or already opened by another object)
+		return False
+	try:
+		table = hfile.get_node(tablePath)
+		for columnName in get_condition_columns(table, condition):
+			column = table.cols._f_col(columnName)
+			if not column.is_indexed:
+				column.create_csindex()
+	finally:
+		hfile.close()
+	return True
+
+
+def read_selected_event_ids(table, condition, eventIdName):
+	'''
+	Read the ids of the events which match a condition, with the column indexes if they exist
+	Parameters:
+	-----------
+		table : table of the Monte-Carlo events
+		condition : PyTables condition on the columns of the table
+		eventIdName : name of the event id column
+	Return:
+	-------
+		sorted ids of the selected events
+	'''
+	return np.unique(table.read_where(condition, field=eventIdName))
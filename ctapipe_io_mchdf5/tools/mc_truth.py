@@ -0,0 +1,59 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+
+
+def find_event_rows(tabEventId, tabSearchedEventId):
+	'''
+	Find the rows of the searched events with one sort and one binary search (instead of one np.where per event)
+	Parameters:
+	-----------
+		tabEventId : event id of each row of the table
+		tabSearchedEventId : id of the events to be found
+	Return:
+	-------
+		row of each searched event in tabEventId (-1 if the event is not in the table)
+	'''
+	tabEventId = np.asarray(tabEventId)
+	tabSearchedEventId = np.asarray(tabSearchedEventId)
+	tabRow = np.full(tabSearchedEventId.size, -1, dtype=np.int64)
+	if tabEventId.size == 0 or tabSearchedEventId.size == 0:
+		return tabRow
+	sortIndex = np.argsort(tabEventId, kind='stable')
+	tabSortedEventId = tabEventId[sortIndex]
+	position = np.searchsorted(tabSortedEventId, tabSearchedEventId)
+	position = np.minimum(position, tabSortedEventId.size - 1)
+	isFound = tabSortedEventId[position] == tabSearchedEventId
+	tabRow[isFound] = sortIndex[position[isFound]]
+	return tabRow
+
+
+def create_mc_truth_columns(tabMcEvent, eventIdName, listColumnName, tabSearchedEventId):
+	'''
+	Create the columns of the Monte-Carlo truth in the order of the searched events
+	Parameters:
+	-----------
+		tabMcEvent : content of the table of the Monte-Carlo events
+		eventIdName : name of the column of the event id in tabMcEvent
+		listColumnName : names of the columns to be kept
+		tabSearchedEventId : id of the events (in the iteration order of the event source)
+	Return:
+	-------
+		dictionary of the columns (column name as key), the value of the event i is at position i.
+		Events without Monte-Carlo truth get NaN (or 0 for integer columns)
+	'''
+	tabRow = find_event_rows(tabMcEvent[eventIdName], tabSearchedEventId)
+	isFound = tabRow >= 0
+	tabFoundRow = tabRow[isFound]
+	dicoColumn = dict()
+	for columnName in listColumnName:
+		tabColumn = tabMcEvent[columnName]
+		fillValue = np.nan if tabColumn.dtype.kind == 'f' else 0
+		tabValue = np.full((tabRow.size,) + tabColumn.shape[1:], fillValue, dtype=tabColumn.dtype)
+		tabValue[isFound] = tabColumn[tabFoundRow]
+		dicoColumn[columnName] = tabValue
+	return dicoColumn
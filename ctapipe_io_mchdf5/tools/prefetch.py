@@ -0,0 +1,122 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from collections import deque
+import threading
+
+import numpy as np
+
+
+def get_nb_byte(value):
+	'''
+	Get the number of bytes of the arrays of a value
+	Parameters:
+	-----------
+		value : array, or list, tuple or dictionary of values (None is allowed)
+	Return:
+	-------
+		total number of bytes of the arrays of the value
+	'''
+	if isinstance(value, np.ndarray):
+		return value.nbytes
+	if isinstance(value, (list, tuple)):
+		return sum(get_nb_byte(element) for element in value)
+	if isinstance(value, dict):
+		return sum(get_nb_byte(element) for element in value.values())
+	return 0
+
+
+class PrefetchReader(object):
+	'''
+	Read items in advance in a background thread.
+	The read values are stored in a bounded buffer (number of items and number of bytes) until the consumer takes
+	them, so the reading of the next items overlaps the processing of the current one.
+	The read function is called only by the background thread.
+	Attributes:
+	-----------
+		nbItemMax : maximum number of items in the buffer
+		nbByteMax : maximum number of bytes in the buffer (0 for no limit). One item is always accepted
+		buffer : (item, value, number of bytes) read in advance
+		nbByte : number of bytes in the buffer
+	'''
+	def __init__(self, iterItem, readFunction, nbItemMax=10, nbByteMax=0):
+		self.nbItemMax = max(1, int(nbItemMax))
+		self.nbByteMax = max(0, int(nbByteMax))
+		self.buffer = deque()
+		self.nbByte = 0
+		self.condition = threading.Condition()
+		self.isStopped = False
+		self.isFinished = False
+		self.error = None
+		self.thread = threading.Thread(target=self._run, args=(iterItem, readFunction), daemon=True)
+		self.thread.start()
+
+
+	def _is_full(self, nbByte):
+		if len(self.buffer) == 0:
+			return False
+		if len(self.buffer) >= self.nbItemMax:
+			return True
+		return self.nbByteMax > 0 and self.nbByte + nbByte > self.nbByteMax
+
+
+	def _run(self, iterItem, readFunction):
+		try:
+			for item in iterItem:
+				if self.isStopped:
+					return
+				value = readFunction(item)
+				nbByte = get_nb_byte(value)
+				with self.condition:
+					while not self.isStopped and self._is_full(nbByte):
+						self.condition.wait()
+					if self.isStopped:
+						return
+					self.buffer.append((item, value, nbByte))
+					self.nbByte += nbByte
+					self.condition.notify_all()
+		except Exception as e:
+			self.error = e
+		finally:
+			with self.condition:
+				self.isFinished = True
+				self.condition.notify_all()
+
+
+	def __iter__(self):
+		'''
+		Iterate over the read items, in the order of iterItem
+		Return:
+		-------
+			generator of (item, value)
+		Raise:
+		------
+			the exception raised by the read function, once the items read before it are consumed
+		'''
+		while True:
+			with self.condition:
+				while len(self.buffer) == 0 and not self.isFinished:
+					self.condition.wait()
+				if len(self.buffer) == 0:
+					if self.error is not None:
+						raise self.error
+					return
+				item, value, nbByte = self.buffer.popleft()
+				self.nbByte -= nbByte
+				self.condition.notify_all()
+			yield item, value
+
+
+	def close(self):
+		'''
+		Stop the background thread and free the buffer
+		'''
+		with self.condition:
+			self.isStopped = True
+			self.buffer.clear()
+			self.nbByte = 0
+			self.condition.notify_all()
+		self.thread.join()
@@ -7,8 +7,9 @@
 import tables
 
 from .simulation_utils import create_simulation_dataset
-from .instrument_utils import create_instrument_dataset
-from .r0_utils import create_r0_dataset
+from .instrument_utils import create_instrument_dataset, create_camera_table
+from .r0_utils import create_r0_dataset, create_tel_group_and_table
+from .compression_policy import create_filters, get_file_filters, SHUFFLE_NONE
 
 
 def open_output_file(fileName, compressionLevel=0):
@@ -16,19 +17,16 @@ def open_output_file(fileName, compressionLevel=0):
 	Open the output HDF5 file to be used
 	Parameters:
 		fileName : name of the file to be opened
-		compressionLevel : expected compression level (from 0 (no compression, default) to 9)
+		compressionLevel : expected compression level (from 0 (no compression, default) to 9), used with blosc:zstd
+			if the compression policy does not override the filters of the metadata
 	"""
-	if compressionLevel == 0:
-		hfile = tables.open_file(fileName, mode="w")
-		hfile.title = "R0-V2"
-		return hfile
-	else:
-		zstdFilter = tables.Filters(complevel=compressionLevel, complib='blosc:zstd', shuffle=False, bitshuffle=False,
-									fletcher32=False)
-		hfile = tables.open_file(fileName, mode="w", filters=zstdFilter)
-		hfile.title = "R0-V2"
-		return hfile
-	
+	zstdFilter = None
+	if compressionLevel != 0:
+		zstdFilter = create_filters(compressionLevel, 'blosc:zstd', SHUFFLE_NONE)
+	hfile = tables.open_file(fileName, mode="w", filters=get_file_filters(zstdFilter))
+	hfile.title = "R0-V2"
+	return hfile
+
 
 def create_file_structure(hfile, telInfo_from_evt, enableSimulation=True):
 	"""
@@ -49,3 +47,13 @@ def create_file_structure(hfile, telInfo_from_evt, enableSimulation=True):
 		return None
 
 
+def add_telescope_structure(hfile, telId, telInfo):
+	"""
+	Add the tables of a telescope (camera, monitoring and waveform) to a file created by create_file_structure
+	Parameters:
+		hfile : HDF5 file to be used
+		telId : id of the telescope
+		telInfo : information of the telescope
+	"""
+	create_tel_group_and_table(hfile, telId, telInfo)
+	create_camera_table(hfile, telInfo)
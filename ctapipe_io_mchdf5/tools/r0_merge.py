@@ -0,0 +1,305 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .event_index import iter_telescope_tables
+from .waveform_reader import get_block_size
+
+
+# Default size in bytes of the blocks of rows copied at once
+DEFAULT_NB_BYTE_PER_BLOCK = 16 * 1024 * 1024
+# Number of rows of the variable length arrays (telescopes which have triggered) copied at once
+NB_ROW_PER_VLARRAY_BLOCK = 1024
+
+# Groups whose leaves describe the instrument : they are written once in the merged file and have to be the same in
+# all the input files (the R0-V2 source reads the gain of a telescope once per file). The pedestal of each run is
+# appended, with the events it is valid for
+LIST_SHARED_GROUP = ["/configuration/instrument", "/r0/monitoring/telescope/information",
+					 "/r0/monitoring/telescope/gain"]
+# Columns of event ids, shifted by the event id offset of their input file
+LIST_EVENT_ID_COLUMN = ["event_id", "first_event_id", "last_event_id"]
+
+TRIGGER_PATH = "/r0/event/subarray/trigger"
+SHOWER_PATH = "/simulation/event/subarray/shower"
+MERGED_INPUT_PATH = "/r0/service/merged_input"
+
+
+class MergedInput(tables.IsDescription):
+	'''
+	Describe the input files of a merged R0-V2 file
+	Attributes:
+	-----------
+		file_name : name of the input file
+		obs_id : id of the observation of the first event of the input file
+		event_id_offset : offset added to the event ids of the input file
+		first_event : row of the first event of the input file in the subarray trigger table
+		nb_event : number of events of the input file in the subarray trigger table
+	'''
+	file_name = tables.StringCol(1024)
+	obs_id = tables.UInt64Col()
+	event_id_offset = tables.UInt64Col()
+	first_event = tables.UInt64Col()
+	nb_event = tables.UInt64Col()
+
+
+def is_shared_node(pathname):
+	'''
+	Say if a node describes the instrument, and so is written once in the merged file
+	Parameters:
+	-----------
+		pathname : path of the node
+	Return:
+	-------
+		True if the node is in a group of LIST_SHARED_GROUP
+	'''
+	return any(pathname == group or pathname.startswith(group + "/") for group in LIST_SHARED_GROUP)
+
+
+def get_file_event_id(hfile):
+	'''
+	Get the event ids of a R0-V2 file (trigger, shower and telescope tables)
+	Parameters:
+	-----------
+		hfile : R0-V2 file
+	Return:
+	-------
+		sorted unique event ids of the file
+	'''
+	listEventId = [hfile.get_node(TRIGGER_PATH).col("event_id")]
+	if SHOWER_PATH in hfile:
+		listEventId.append(hfile.get_node(SHOWER_PATH).col("event_id"))
+	for telId, table in iter_telescope_tables(hfile):
+		listEventId.append(table.col("event_id"))
+	return np.unique(np.concatenate([np.asarray(tabEventId, dtype=np.uint64) for tabEventId in listEventId]))
+
+
+def get_file_obs_id(hfile):
+	'''
+	Get the observation ids of a R0-V2 file
+	Parameters:
+	-----------
+		hfile : R0-V2 file
+	Return:
+	-------
+		sorted unique obs_id of the subarray trigger table (0 if the file has no event)
+	'''
+	tabObsId = np.unique(np.asarray(hfile.get_node(TRIGGER_PATH).col("obs_id"), dtype=np.uint64))
+	if tabObsId.size == 0:
+		return np.zeros(1, dtype=np.uint64)
+	return tabObsId
+
+
+def get_event_id_offset(tabFileEventId, tabMergedEventId):
+	'''
+	Get the offset of the event ids of an input file, so the (obs_id, event_id) of the merged file are unique. The
+	event ids are kept if none of them is already in the merged file, otherwise they are shifted after the last one
+	Parameters:
+	-----------
+		tabFileEventId : sorted unique event ids of the input file
+		tabMergedEventId : sorted unique event ids already in the merged file with the obs_id of the input file
+	Return:
+	-------
+		offset to be added to the event ids of the input file
+	'''
+	if tabFileEventId.size == 0 or tabMergedEventId.size == 0:
+		return 0
+	tabPosition = np.searchsorted(tabMergedEventId, tabFileEventId)
+	tabPosition = np.minimum(tabPosition, tabMergedEventId.size - 1)
+	if not np.any(tabMergedEventId[tabPosition] == tabFileEventId):
+		return 0
+	return int(tabMergedEventId[-1]) + 1 - int(tabFileEventId[0])
+
+
+def create_merged_group(outFile, group):
+	'''
+	Get the group of the merged file which corresponds to a group of an input file, it is created if needed
+	Parameters:
+	-----------
+		outFile : merged file
+		group : group of the input file
+	Return:
+	-------
+		group of the merged file
+	'''
+	if group._v_pathname in outFile:
+		return outFile.get_node(group._v_pathname)
+	outGroup = outFile.create_group(group._v_parent._v_pathname, group._v_name, group._v_title)
+	group._v_attrs._f_copy(outGroup)
+	return outGroup
+
+
+def create_merged_leaf(outFile, outGroup, leaf):
+	'''
+	Create the empty copy of an appended leaf, with the chunk shape and the filters of the leaf
+	Parameters:
+	-----------
+		outFile : merged file
+		outGroup : group of the copy
+		leaf : table or variable length array of the input file
+	Return:
+	-------
+		created leaf
+	'''
+	if isinstance(leaf, tables.Table):
+		outLeaf = outFile.create_table(outGroup, leaf._v_name, leaf.description, leaf._v_title, filters=leaf.filters,
+									   chunkshape=leaf.chunkshape)
+	else:
+		outLeaf = outFile.create_vlarray(outGroup, leaf._v_name, leaf.atom, leaf._v_title, filters=leaf.filters,
+										 chunkshape=leaf.chunkshape)
+	leaf.attrs._f_copy(outLeaf)
+	return outLeaf
+
+
+def check_shared_leaf(outLeaf, leaf):
+	'''
+	Check the leaf of an input file which describes the instrument is the same as the one of the merged file
+	Parameters:
+	-----------
+		outLeaf : leaf of the merged file
+		leaf : leaf of the input file
+	Raise:
+	------
+		ValueError if the leaves are different
+	'''
+	outData, data = outLeaf.read(), leaf.read()
+	if outData.dtype != data.dtype or outData.shape != data.shape or outData.tobytes() != data.tobytes():
+		raise ValueError("The node {} of {} is not the same as in the previous files : files with different "
+						 "instruments cannot be merged".format(leaf._v_pathname, leaf._v_file.filename))
+
+
+def append_merged_leaf(outLeaf, leaf, eventIdOffset, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Append the rows of a leaf of an input file to the leaf of the merged file, with shifted event ids
+	Parameters:
+	-----------
+		outLeaf : table or variable length array of the merged file
+		leaf : table or variable length array of the input file
+		eventIdOffset : offset added to the event ids
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	Raise:
+	------
+		ValueError if the rows of the leaves are different (telescopes with different cameras for example)
+	'''
+	if isinstance(leaf, tables.VLArray):
+		for firstRow in range(0, leaf.nrows, NB_ROW_PER_VLARRAY_BLOCK):
+			for row in leaf.read(firstRow, min(firstRow + NB_ROW_PER_VLARRAY_BLOCK, leaf.nrows)):
+				outLeaf.append(row)
+		return
+	if outLeaf.description._v_dtype != leaf.description._v_dtype:
+		raise ValueError("The table {} of {} does not have the same columns as in the previous files".format(
+			leaf._v_pathname, leaf._v_file.filename))
+	listColumn = [columnName for columnName in LIST_EVENT_ID_COLUMN if columnName in leaf.colnames]
+	nbRowPerBlock = get_block_size(leaf, None, 0, nbBytePerBlock)
+	for firstRow in range(0, leaf.nrows, nbRowPerBlock):
+		tabRow = leaf.read(firstRow, min(firstRow + nbRowPerBlock, leaf.nrows))
+		if eventIdOffset != 0:
+			for columnName in listColumn:
+				tabRow[columnName] += np.uint64(eventIdOffset)
+		outLeaf.append(tabRow)
+
+
+def merge_r0_input(outFile, hfile, eventIdOffset, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Merge an input file in the merged file : the instrument description is written once, the telescope tables are
+	created on the first file where the telescope appears and the rows of the events are appended
+	Parameters:
+	-----------
+		outFile : merged file
+		hfile : R0-V2 input file
+		eventIdOffset : offset added to the event ids of the input file
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	'''
+	for group in hfile.walk_groups("/"):
+		if group._v_pathname == "/":
+			outGroup = outFile.root
+		else:
+			outGroup = create_merged_group(outFile, group)
+		for leaf in group._f_iter_nodes("Leaf"):
+			if leaf._v_pathname == MERGED_INPUT_PATH:
+				continue
+			isNewLeaf = leaf._v_pathname not in outFile
+			if is_shared_node(leaf._v_pathname) or not isinstance(leaf, (tables.Table, tables.VLArray)):
+				if isNewLeaf:
+					leaf.copy(outGroup, leaf._v_name)
+				else:
+					check_shared_leaf(outFile.get_node(leaf._v_pathname), leaf)
+				continue
+			if isNewLeaf:
+				outLeaf = create_merged_leaf(outFile, outGroup, leaf)
+			else:
+				outLeaf = outFile.get_node(leaf._v_pathname)
+			append_merged_leaf(outLeaf, leaf, eventIdOffset, nbBytePerBlock)
+
+
+def merge_r0_files(outputFileName, listInputFileName, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Merge R0-V2 files of a production (converted by mchdf5_simtel2r0) into one R0-V2 file. The instrument description
+	is written once, the tables of each telescope (and its pedestal) hold the events of all the files and the event ids
+	of a file are shifted if one of its (obs_id, event_id) is already used by the previous files, so the
+	(obs_id, event_id) of the merged file are unique. The input files and their event id offsets are stored in the
+	table /r0/service/merged_input
+	Parameters:
+	-----------
+		outputFileName : name of the merged file
+		listInputFileName : names of the R0-V2 files to be merged, in the order of their events in the merged file
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	Return:
+	-------
+		list of the event id offset of each input file
+	Raise:
+	------
+		ValueError if a file is not a R0-V2 file or if the files have different instruments
+	'''
+	listEventIdOffset = []
+	# Event ids already in the merged file, with the obs_id as key
+	dicoMergedEventId = dict()
+	outFile = None
+	try:
+		for inputFileName in listInputFileName:
+			hfile = tables.open_file(inputFileName, "r")
+			try:
+				if hfile.title != "R0-V2":
+					raise ValueError("{} is not a R0-V2 file (title '{}')".format(inputFileName, hfile.title))
+				if outFile is None:
+					tables.parameters.NODE_CACHE_SLOTS = max(tables.parameters.NODE_CACHE_SLOTS,
+															 len(list(hfile.walk_nodes("/", "Leaf"))) + 20)
+					outFile = tables.open_file(outputFileName, "w", title=hfile.title, filters=hfile.filters)
+					hfile.root._v_attrs._f_copy(outFile.root)
+				tabFileEventId = get_file_event_id(hfile)
+				listObsId = get_file_obs_id(hfile).tolist()
+				tabMergedEventId = np.zeros(0, dtype=np.uint64)
+				for obsId in listObsId:
+					if obsId in dicoMergedEventId:
+						tabMergedEventId = np.union1d(tabMergedEventId, dicoMergedEventId[obsId])
+				eventIdOffset = get_event_id_offset(tabFileEventId, tabMergedEventId)
+				for obsId in listObsId:
+					dicoMergedEventId[obsId] = np.union1d(dicoMergedEventId.get(obsId, np.zeros(0, dtype=np.uint64)),
+														  tabFileEventId + np.uint64(eventIdOffset))
+				firstEvent = outFile.get_node(TRIGGER_PATH).nrows if TRIGGER_PATH in outFile else 0
+
+				merge_r0_input(outFile, hfile, eventIdOffset, nbBytePerBlock)
+
+				if MERGED_INPUT_PATH not in outFile:
+					outFile.create_table("/r0/service", "merged_input", MergedInput, "Input files of the merged file")
+				triggerTable = hfile.get_node(TRIGGER_PATH)
+				mergedInputTable = outFile.get_node(MERGED_INPUT_PATH)
+				mergedInput = mergedInputTable.row
+				mergedInput["file_name"] = inputFileName
+				mergedInput["obs_id"] = triggerTable[0]["obs_id"] if triggerTable.nrows > 0 else 0
+				mergedInput["event_id_offset"] = eventIdOffset
+				mergedInput["first_event"] = firstEvent
+				mergedInput["nb_event"] = triggerTable.nrows
+				mergedInput.append()
+				mergedInputTable.flush()
+				listEventIdOffset.append(eventIdOffset)
+			finally:
+				hfile.close()
+	finally:
+		if outFile is not None:
+			outFile.close()
+	return listEventIdOffset
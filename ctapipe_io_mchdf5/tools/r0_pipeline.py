@@ -0,0 +1,469 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import multiprocessing
+import pickle
+import queue as queue_module
+import traceback
+
+import numpy as np
+import tables
+from ctapipe.io import event_source
+
+from .r0_file import create_file_structure, add_telescope_structure, open_output_file
+from .r0_utils import (R0EventWriter,
+					   EventSubarrayTrigger,
+					   set_mon_tel_pedestal_event_range,
+					   get_event_tel_waveform_description,
+					   get_photo_electron_image_description)
+from .table_buffer import TableBuffer, DEFAULT_NB_BYTE_PER_BLOCK
+from .chunk_policy import get_table_options, DATASET_WAVEFORM, DATASET_PE_IMAGE
+from .compression_policy import apply_auto_filters, append_table_rows
+from .get_telescope_info import (get_telescope_info_from_first_event,
+								 get_subarray_telescope_info,
+								 check_is_simulation_file,
+								 TELINFO_NBEVENT,
+								 TELINFO_NBGAIN,
+								 TELINFO_NBPIXEL,
+								 TELINFO_NBSLICE)
+from .simulation_utils import append_corsika_event, append_simulation_header, MCEvent, RunConfigEvent
+from .instrument_utils import fill_subarray_layout, fill_optic_description
+
+
+# Default number of messages (blocks of rows) in the queue between the decode process and the writer
+DEFAULT_QUEUE_DEPTH = 8
+# Time in seconds the writer waits for a message before it checks the decode process is still running
+DEFAULT_QUEUE_TIMEOUT = 1.0
+# Number of rows of the telescopes which have triggered sent at once
+NB_ROW_PER_VLARRAY_BLOCK = 1024
+
+# Messages sent by the decode process to the writer
+# run : (MSG_RUN, number of telescopes, information of the subarray telescopes, information of the telescopes of the
+# first event)
+MSG_RUN = "run"
+# telescope : (MSG_TELESCOPE, telescope id, information of the telescope), sent on the first event of a telescope
+MSG_TELESCOPE = "telescope"
+# rows : (MSG_ROWS, path of the table, structured array of the rows)
+MSG_ROWS = "rows"
+# vlrows : (MSG_VLROWS, path of the variable length array, list of rows)
+MSG_VLROWS = "vlrows"
+# end : (MSG_END, number of events, number of events of each telescope id, (obs_id, first event id, last event id) of
+# the run or None if there is no event)
+MSG_END = "end"
+# error : (MSG_ERROR, traceback of the error of the decode process)
+MSG_ERROR = "error"
+
+# Tables of the output file which are filled by the decode process
+SIMULATION_RUN_PATH = "/configuration/simulation/run"
+SIMULATION_SHOWER_PATH = "/simulation/event/subarray/shower"
+TRIGGER_PATH = "/r0/event/subarray/trigger"
+TELS_WITH_TRIGGER_PATH = "/r0/event/subarray/tels_with_trigger"
+
+
+class QueuedTable(object):
+	"""
+	Table of the output file seen from the decode process : it has the attributes of a table used by TableBuffer and
+	the blocks of rows appended to it are sent to the writer
+	Attributes:
+		queue : queue of the messages to the writer
+		pathname : path of the table in the output file
+		dtype : type of the rows
+		coldflts : default value of each column
+		chunkshape : chunk shape of the table in the output file (None if it is chosen by PyTables)
+		rowsize : size of a row in bytes
+		nrows : number of rows sent
+	"""
+	def __init__(self, queue, pathname, description, chunkshape=None):
+		"""
+		Parameters:
+			queue : queue of the messages to the writer
+			pathname : path of the table in the output file
+			description : IsDescription class of the table
+			chunkshape : chunk shape of the table in the output file (None if it is chosen by PyTables)
+		"""
+		columnDescription = tables.Description(description.columns)
+		self.queue = queue
+		self.pathname = pathname
+		self.dtype = columnDescription._v_dtype
+		self.coldflts = dict(columnDescription._v_dflts)
+		self.chunkshape = chunkshape
+		self.rowsize = self.dtype.itemsize
+		self.nrows = 0
+
+
+	def append(self, rows):
+		"""
+		Send a block of rows to the writer
+		Parameters:
+			rows : structured array of the rows
+		"""
+		self.queue.put((MSG_ROWS, self.pathname, np.array(rows, dtype=self.dtype)))
+		self.nrows += len(rows)
+
+
+	def flush(self):
+		pass
+
+
+class QueuedVLArray(object):
+	"""
+	Variable length array of the output file seen from the decode process : its rows are sent to the writer by blocks
+	Attributes:
+		queue : queue of the messages to the writer
+		pathname : path of the array in the output file
+		nbRowPerBlock : number of rows sent at once
+		listRow : rows which are not sent yet
+	"""
+	def __init__(self, queue, pathname, nbRowPerBlock=NB_ROW_PER_VLARRAY_BLOCK):
+		self.queue = queue
+		self.pathname = pathname
+		self.nbRowPerBlock = nbRowPerBlock
+		self.listRow = []
+
+
+	def append(self, row):
+		"""
+		Append a row, the rows are sent once a block is full
+		Parameters:
+			row : row to be appended
+		"""
+		self.listRow.append(row)
+		if len(self.listRow) >= self.nbRowPerBlock:
+			self.flush()
+
+
+	def flush(self):
+		"""
+		Send the rows which are not sent yet
+		"""
+		if len(self.listRow) > 0:
+			self.queue.put((MSG_VLROWS, self.pathname, self.listRow))
+			self.listRow = []
+
+
+class QueuedR0EventWriter(R0EventWriter):
+	"""
+	Writer of the R0 events in the decode process : the rows are formatted (and the waveforms transposed) in the
+	buffers of R0EventWriter and the full blocks are sent to the writer
+	Attributes:
+		queue : queue of the messages to the writer
+		telInfo_from_evt : information of the telescopes, to get the description of their tables
+	"""
+	def __init__(self, queue, telInfo_from_evt, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+		self.queue = queue
+		self.telInfo_from_evt = telInfo_from_evt
+		super().__init__(None, nbBytePerBlock)
+
+
+	def _create_subarray_buffers(self):
+		return (TableBuffer(QueuedTable(self.queue, TRIGGER_PATH, EventSubarrayTrigger),
+							nbBytePerBlock=self.nbBytePerBlock),
+				QueuedVLArray(self.queue, TELS_WITH_TRIGGER_PATH))
+
+
+	def _create_telescope_buffers(self, telId):
+		telInfo = self.telInfo_from_evt[telId]
+		nb_gain = np.uint64(telInfo[TELINFO_NBGAIN])
+		nb_pixel = np.uint64(telInfo[TELINFO_NBPIXEL])
+		nb_slice = np.uint64(telInfo[TELINFO_NBSLICE])
+		tableName = 'tel_{0:0=3d}'.format(telId)
+		# Same chunks as the tables created by the writer, so the blocks are made of whole chunks
+		description_waveform = get_event_tel_waveform_description(nb_gain, (nb_slice, nb_pixel))
+		tel_waveform_table = QueuedTable(self.queue, "/r0/event/telescope/waveform/" + tableName, description_waveform,
+										 get_table_options(DATASET_WAVEFORM, description_waveform)["chunkshape"])
+		description_pe_image = get_photo_electron_image_description(nb_pixel)
+		tel_pe_image_table = QueuedTable(self.queue, "/r0/event/telescope/photo_electron_image/" + tableName,
+										 description_pe_image,
+										 get_table_options(DATASET_PE_IMAGE, description_pe_image)["chunkshape"])
+		return (TableBuffer(tel_waveform_table, nbBytePerBlock=self.nbBytePerBlock),
+				TableBuffer(tel_pe_image_table, nbBytePerBlock=self.nbBytePerBlock))
+
+
+class MessageQueue(object):
+	"""
+	Bounded queue of the messages between the decode process and the writer. The messages are pickled by put, in the
+	decode process, because the buffers they contain are modified once they are sent
+	Attributes:
+		queue : multiprocessing queue of the pickled messages
+	"""
+	def __init__(self, queueDepth=DEFAULT_QUEUE_DEPTH):
+		self.queue = multiprocessing.Queue(max(1, queueDepth))
+
+
+	def put(self, message):
+		self.queue.put(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+	def get(self, timeout=None):
+		return pickle.loads(self.queue.get(timeout=timeout))
+
+
+class WriterQueue(object):
+	"""
+	Queue which gives the messages of the decode function directly to the writer, to convert a file in one process
+	Attributes:
+		writer : R0PipelineWriter which writes the messages
+	"""
+	def __init__(self, writer):
+		self.writer = writer
+
+
+	def put(self, message):
+		self.writer.process_message(message)
+
+
+def decode_simtel_events(inputFileName, queue, maxEvent=None, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK,
+						 isProgress=True):
+	"""
+	Decode the events of a simtel file and send the structure of the output file and the blocks of rows of its tables
+	to the writer (run in the decode process). An error is sent to the writer as a MSG_ERROR message
+	Parameters:
+		inputFileName : name of the simtel file
+		queue : queue of the messages to the writer
+		maxEvent : maximum number of events to be converted (None for all the events)
+		nbBytePerBlock : size in bytes of the blocks of rows of each table
+		isProgress : True to print the number of decoded events after each event
+	"""
+	try:
+		# The source stops after maxEvent events, the event which follows the last one is not decoded
+		source = event_source(inputFileName, max_events=maxEvent)
+		try:
+			decode_source_events(source, queue, nbBytePerBlock, isProgress)
+		finally:
+			source.close()
+	except Exception:
+		queue.put((MSG_ERROR, traceback.format_exc()))
+
+
+def decode_source_events(source, queue, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK, isProgress=True):
+	"""
+	Decode the events of an event source and send them to the writer
+	Parameters:
+		source : event source of the simtel file (its max_events limits the number of converted events)
+		queue : queue of the messages to the writer
+		nbBytePerBlock : size in bytes of the blocks of rows of each table
+		isProgress : True to print the number of decoded events after each event
+	"""
+	maxEvent = source.max_events
+	telInfo_from_evt = dict()
+	tableMcCorsikaEvent = None
+	eventWriter = None
+	isSimulationMode = False
+	nb_event = 0
+	runEventRange = None
+	for event in source:
+		listNewTelId = [telId for telId in event.r0.tels_with_data if telId not in telInfo_from_evt]
+		for telId in listNewTelId:
+			telInfo_from_evt[telId] = get_telescope_info_from_first_event(source.subarray, event, telId)
+		if nb_event == 0:
+			queue.put((MSG_RUN, source.subarray.num_tels, get_subarray_telescope_info(source.subarray),
+					   telInfo_from_evt))
+			isSimulationMode = check_is_simulation_file(telInfo_from_evt)
+			if isSimulationMode:
+				tableSimulationConfig = TableBuffer(QueuedTable(queue, SIMULATION_RUN_PATH, RunConfigEvent), 1, 0)
+				append_simulation_header(tableSimulationConfig, event)
+				tableSimulationConfig.flush()
+				tableMcCorsikaEvent = TableBuffer(QueuedTable(queue, SIMULATION_SHOWER_PATH, MCEvent),
+												  nbBytePerBlock=nbBytePerBlock)
+			eventWriter = QueuedR0EventWriter(queue, telInfo_from_evt, nbBytePerBlock)
+		else:
+			for telId in listNewTelId:
+				queue.put((MSG_TELESCOPE, telId, telInfo_from_evt[telId]))
+		for telId in event.r0.tels_with_data:
+			telInfo_from_evt[telId][TELINFO_NBEVENT] += 1
+
+		if isSimulationMode:
+			append_corsika_event(tableMcCorsikaEvent, event)
+		eventWriter.append_event(event)
+		nb_event += 1
+		eventId = int(event.index.event_id)
+		if runEventRange is None:
+			runEventRange = (int(event.index.obs_id), eventId, eventId)
+		else:
+			runEventRange = (runEventRange[0], min(runEventRange[1], eventId), max(runEventRange[2], eventId))
+		if not isProgress:
+			continue
+		if maxEvent:
+			print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r{} / {}".format(nb_event, maxEvent), end="")
+		else:
+			print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r{}".format(nb_event), end="")
+	if tableMcCorsikaEvent is not None:
+		tableMcCorsikaEvent.flush()
+	if eventWriter is not None:
+		eventWriter.flush()
+	queue.put((MSG_END, nb_event, {telId: telInfo[TELINFO_NBEVENT] for telId, telInfo in telInfo_from_evt.items()},
+			   runEventRange))
+
+
+def create_run_structure(hfile, nbTel, subarrayInfo, telInfo_from_evt):
+	"""
+	Create the structure of the output file with the telescopes of the first event of the run
+	Parameters:
+		hfile : HDF5 file to be used
+		nbTel : number of telescopes of the subarray
+		subarrayInfo : information of all the telescopes of the subarray (from get_subarray_telescope_info)
+		telInfo_from_evt : information of the telescopes of the first event
+	"""
+	print('Create file structure')
+	create_file_structure(hfile, telInfo_from_evt)
+
+	# The layout and the optics of all the telescopes are given by the subarray, without any event
+	print('Fill the subarray layout information')
+	fill_subarray_layout(hfile, subarrayInfo, nbTel)
+	if check_is_simulation_file(telInfo_from_evt):
+		print('Fill the optic description of the telescopes')
+		fill_optic_description(hfile, subarrayInfo, nbTel)
+
+
+class R0PipelineWriter(object):
+	"""
+	Writer of the messages of the decode process in the output file. The file is opened on the first message, when
+	the number of telescopes is known
+	Attributes:
+		outputFileName : name of the output file
+		compressionLevel : compression level of the output file
+		hfile : output file (None before the first message)
+		dicoNode : nodes of the output file by path
+		isDone : True once all the events are written
+		nbEvent : number of events written
+		dicoNbEvent : number of events of each telescope id
+		dicoAutoFilters : (selected filters, compression ratio) of each table of a dataset in auto mode, by path
+	"""
+	def __init__(self, outputFileName, compressionLevel=0):
+		self.outputFileName = outputFileName
+		self.compressionLevel = compressionLevel
+		self.hfile = None
+		self.dicoNode = dict()
+		self.isDone = False
+		self.nbEvent = 0
+		self.dicoNbEvent = dict()
+		self.dicoAutoFilters = dict()
+
+
+	def _open(self, nbTel=0):
+		if self.hfile is None:
+			# Increase the number of nodes in cache if necessary (avoid warning about nodes reopening)
+			tables.parameters.NODE_CACHE_SLOTS = max(tables.parameters.NODE_CACHE_SLOTS, 3*nbTel + 20)
+			self.hfile = open_output_file(self.outputFileName, compressionLevel=self.compressionLevel)
+		return self.hfile
+
+
+	def _get_node(self, pathname):
+		node = self.dicoNode.get(pathname)
+		if node is None:
+			node = self.hfile.get_node(pathname)
+			self.dicoNode[pathname] = node
+		return node
+
+
+	def process_message(self, message):
+		"""
+		Write a message of the decode process
+		Parameters:
+			message : message (MSG_RUN, MSG_ROWS, ...)
+		Raise:
+			RuntimeError if the decode process failed
+		"""
+		kind = message[0]
+		if kind == MSG_ROWS:
+			table = self._get_node(message[1])
+			if table.nrows == 0:
+				# The filters of the datasets in auto mode are chosen on the first block of each table
+				table = apply_auto_filters(table, message[2], self.dicoAutoFilters)
+				self.dicoNode[message[1]] = table
+			append_table_rows(table, message[2])
+		elif kind == MSG_VLROWS:
+			node = self._get_node(message[1])
+			for row in message[2]:
+				node.append(row)
+		elif kind == MSG_TELESCOPE:
+			add_telescope_structure(self.hfile, message[1], message[2])
+		elif kind == MSG_RUN:
+			create_run_structure(self._open(message[1]), *message[1:])
+		elif kind == MSG_END:
+			self._open()
+			self.nbEvent = message[1]
+			self.dicoNbEvent = message[2]
+			if message[3] is not None:
+				# The pedestal of the telescopes is valid for all the events of the run
+				set_mon_tel_pedestal_event_range(self.hfile, *message[3])
+			self.isDone = True
+		elif kind == MSG_ERROR:
+			raise RuntimeError("The decode of the simtel file failed :\n" + message[1])
+
+
+	def close(self):
+		"""
+		Flush the tables and close the output file
+		"""
+		if self.hfile is not None:
+			for node in self.dicoNode.values():
+				node.flush()
+			self.hfile.close()
+			self.hfile = None
+
+
+def write_queued_messages(writer, queue, process, timeout=DEFAULT_QUEUE_TIMEOUT):
+	"""
+	Write the messages of the decode process until its last one
+	Parameters:
+		writer : R0PipelineWriter which writes the messages
+		queue : MessageQueue of the messages of the decode process
+		process : decode process
+		timeout : time in seconds to wait for a message before checking the decode process is still running
+	Raise:
+		RuntimeError if the decode process failed or stopped before sending its last message
+	"""
+	isProcessStopped = False
+	while not writer.isDone:
+		try:
+			message = queue.get(timeout)
+		except queue_module.Empty:
+			# The messages sent just before the end of the process are read before raising the error
+			if isProcessStopped:
+				raise RuntimeError("The decode process of the simtel file stopped without sending all its messages "
+								   "(exit code {})".format(process.exitcode))
+			isProcessStopped = not process.is_alive()
+			continue
+		writer.process_message(message)
+
+
+def convert_simtel_to_r0(inputFileName, outputFileName, compressionLevel=0, maxEvent=None,
+						 queueDepth=DEFAULT_QUEUE_DEPTH, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK, isProgress=True):
+	"""
+	Convert a simtel file into a R0-V2 file with a pipeline : a decode process reads the simtel file, formats the rows
+	of the tables and sends them by blocks, through a bounded queue, to the current process which compresses and writes
+	them (with tables.parameters.MAX_BLOSC_THREADS threads)
+	Parameters:
+		inputFileName : name of the simtel file
+		outputFileName : name of the output file
+		compressionLevel : compression level of the output file (0 for no compression)
+		maxEvent : maximum number of events to be converted (None for all the events)
+		queueDepth : maximum number of messages in the queue (0 to decode and write in the current process)
+		nbBytePerBlock : size in bytes of the blocks of rows of each table
+		isProgress : True to print the number of decoded events after each event (False for the conversions run in
+			parallel, whose counters would overwrite each other)
+	Return:
+		R0PipelineWriter which has written the file (with the number of events of the run and of each telescope)
+	"""
+	writer = R0PipelineWriter(outputFileName, compressionLevel)
+	try:
+		if queueDepth <= 0:
+			decode_simtel_events(inputFileName, WriterQueue(writer), maxEvent, nbBytePerBlock, isProgress)
+		else:
+			queue = MessageQueue(queueDepth)
+			process = multiprocessing.Process(target=decode_simtel_events,
+											  args=(inputFileName, queue, maxEvent, nbBytePerBlock, isProgress))
+			process.start()
+			try:
+				write_queued_messages(writer, queue, process)
+			finally:
+				if not writer.isDone:
+					process.terminate()
+				process.join()
+	finally:
+		writer.close()
+	return writer
@@ -9,6 +9,9 @@ try:
 	from .get_telescope_info import *
 except:
 	pass
+from .table_buffer import TableBuffer, DEFAULT_NB_BYTE_PER_BLOCK
+from .chunk_policy import get_table_options, DATASET_WAVEFORM, DATASET_PE_IMAGE
+from .compression_policy import get_dataset_filters
 
 
 class TriggerInfo(tables.IsDescription):
@@ -72,16 +75,14 @@ class TelescopeInformation(tables.IsDescription):
 	nb_slice = tables.UInt64Col()
 
 
-def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chunkshape=1):
+def get_event_tel_waveform_description(nb_gain, image_shape):
 	"""
-	Create the waveform tables into the given telescope node
+	Get the description of the waveform table of a telescope
 	Parameters:
-		hfile : HDF5 file to be used
-		tel_node : telescope to be completed
 		nb_gain : number of gains of the camera
 		image_shape : shape of the camera images (number of slices, number of pixels)
-		telId : id of the telescope
-		chunkshape : shape of the chunk to be used to store the data
+	Return:
+		IsDescription class of the table
 	"""
 	if nb_gain > 1:
 		columns_dict_waveform = {'event_id': tables.UInt64Col(),
@@ -90,10 +91,39 @@ def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chun
 	else:
 		columns_dict_waveform = {'event_id': tables.UInt64Col(),
 								 "waveformHi": tables.UInt16Col(shape=image_shape)}
+	return type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
+
+
+def get_photo_electron_image_description(nb_pixel):
+	"""
+	Get the description of the photo electron image table of a telescope
+	Parameters:
+		nb_pixel : number of pixel of the camera
+	Return:
+		IsDescription class of the table
+	"""
+	columns_dict_photo_electron_image = {'event_id': tables.UInt64Col(),
+										 "photo_electron_image": tables.Float32Col(shape=nb_pixel)}
+	return type('description columns_dict_photo_electron_image', (tables.IsDescription,),
+				columns_dict_photo_electron_image)
+
 
-	description_waveform = type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
+def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chunkshape=None, expectedrows=0):
+	"""
+	Create the waveform tables into the given telescope node
+	Parameters:
+		hfile : HDF5 file to be used
+		tel_node : telescope to be completed
+		nb_gain : number of gains of the camera
+		image_shape : shape of the camera images (number of slices, number of pixels)
+		telId : id of the telescope
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
+		expectedrows : expected number of events of the telescope (0 if unknown)
+	"""
+	description_waveform = get_event_tel_waveform_description(nb_gain, image_shape)
 	hfile.create_table(tel_node, 'tel_{0:0=3d}'.format(telId), description_waveform,
-					   "Table of waveform of the high gain signal", chunkshape=chunkshape)
+					   "Table of waveform of the high gain signal", filters=get_dataset_filters(DATASET_WAVEFORM),
+					   **get_table_options(DATASET_WAVEFORM, description_waveform, expectedrows, chunkshape))
 
 
 def create_table_pedestal(hfile, cam_tel_group, nbGain, nbPixel, telId):
@@ -110,6 +140,7 @@ def create_table_pedestal(hfile, cam_tel_group, nbGain, nbPixel, telId):
 	"""
 	ped_shape = (nbGain, nbPixel)
 	columns_dict_pedestal = {
+		"obs_id":  tables.UInt64Col(),
 		"first_event_id":  tables.UInt64Col(),
 		"last_event_id":  tables.UInt64Col(),
 		"pedestal": tables.Float32Col(shape=ped_shape)
@@ -122,7 +153,8 @@ def create_table_pedestal(hfile, cam_tel_group, nbGain, nbPixel, telId):
 
 def create_mon_tel_pedestal(hfile, telInfo, nb_gain, nb_pixel, telId):
 	"""
-	Create the r0/monitoring/telescope/pedestal table information for a single telescope
+	Create the r0/monitoring/telescope/pedestal table information for a single telescope. The observation and the
+	events of the pedestal are set at the end of the run by set_mon_tel_pedestal_event_range
 	Parameters:
 		hfile: HDF5 file to be used
 		telInfo : table of some information related to the telescope
@@ -144,6 +176,27 @@ def create_mon_tel_pedestal(hfile, telInfo, nb_gain, nb_pixel, telId):
 		table_pedestal.flush()
 
 
+def set_mon_tel_pedestal_event_range(hfile, obsId, firstEventId, lastEventId):
+	"""
+	Set the observation and the events of the pedestal of all the telescopes (the pedestal of a run is valid for all
+	its events)
+	Parameters:
+		hfile: HDF5 file to be used
+		obsId : id of the observation of the run
+		firstEventId : smallest event id of the run
+		lastEventId : largest event id of the run
+	"""
+	for table_pedestal in hfile.root.r0.monitoring.telescope.pedestal._f_iter_nodes("Table"):
+		if table_pedestal.nrows == 0:
+			continue
+		tabPedestal = table_pedestal.read()
+		tabPedestal["obs_id"] = obsId
+		tabPedestal["first_event_id"] = firstEventId
+		tabPedestal["last_event_id"] = lastEventId
+		table_pedestal.modify_rows(0, table_pedestal.nrows, rows=tabPedestal)
+		table_pedestal.flush()
+
+
 def create_mon_tel_gain(hfile, telInfo, telId):
 	"""
 	Create the r0/monitoring/telescope/gain table information for a single telescope
@@ -191,7 +244,7 @@ def create_mon_tel_info(hfile, telId, telInfo, nb_gain, nb_pixel, nb_slice):
 	tel_info_table_row.append()
 
 
-def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
+def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=None, expectedrows=0):
 	"""
 	Create the base of the telescope structure without waveform
 	Parameters:
@@ -200,7 +253,8 @@ def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
 		telId : id of the telescope
 		nb_pixel : number of pixel of the camera
 		tel_info : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
+		expectedrows : expected number of events of the telescope (0 if unknown)
 	Return:
 	-------
 		Created camera group
@@ -215,18 +269,16 @@ def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
 
 	cam_tel_table_row.append()
 
-	columns_dict_photo_electron_image = {'event_id': tables.UInt64Col(),
-										 "photo_electron_image": tables.Float32Col(shape=nb_pixel)}
-	description_photo_electron_image = type('description columns_dict_photo_electron_image', (tables.IsDescription,),
-											columns_dict_photo_electron_image)
+	description_photo_electron_image = get_photo_electron_image_description(nb_pixel)
 	hfile.create_table(hfile.root.r0.event.telescope.photo_electron_image, 'tel_{0:0=3d}'.format(telId),
 					   description_photo_electron_image, "Table of real signal in the camera (for simulation only)",
-					   chunkshape=chunkshape)
+					   filters=get_dataset_filters(DATASET_PE_IMAGE),
+					   **get_table_options(DATASET_PE_IMAGE, description_photo_electron_image, expectedrows, chunkshape))
 
 	return cam_tel_table
 
 
-def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
+def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=None):
 	"""
 	Create the telescope group and table inside r0:
 	/r0/event/telescope/waveform
@@ -238,22 +290,23 @@ def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
 	-----------
 		hfile : HDF5 file to be used
 		telId : id of the telescope
-		telInfo : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		telInfo : table of some informations related to the telescope (its number of events is 0 if it is not known yet)
+		chunkshape : shape of the chunk to be used to store the data (None to use the chunk policy)
 	"""
 	nb_gain = np.uint64(telInfo[TELINFO_NBGAIN])
 	nb_pixel = np.uint64(telInfo[TELINFO_NBPIXEL])
 	nb_slice = np.uint64(telInfo[TELINFO_NBSLICE])
 	image_shape = (nb_slice, nb_pixel)
+	nb_event = int(telInfo[TELINFO_NBEVENT])
 
-	create_mon_tel_pointing(hfile, telId, nb_pixel, telInfo, chunkshape=chunkshape)
+	create_mon_tel_pointing(hfile, telId, nb_pixel, telInfo, chunkshape=chunkshape, expectedrows=nb_event)
 
 	create_mon_tel_pedestal(hfile, telInfo, nb_gain, nb_pixel, telId)
 	create_mon_tel_gain(hfile, telInfo, telId)
 	create_mon_tel_info(hfile, telId, telInfo, nb_gain, nb_pixel, nb_slice)
 
 	create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, nb_gain, image_shape, telId,
-							  chunkshape=chunkshape)
+							  chunkshape=chunkshape, expectedrows=nb_event)
 
 
 def fill_monitoring_subarray(hfile, mon_subarray_pointing_group, telInfo_from_evt):
@@ -367,19 +420,17 @@ def append_waveform_in_telescope(tel_wf_table, waveform, eventId):
 	tel_wf_table_row.append()
 
 
-def append_event_telescope_data(hfile, event):
+def append_subarray_trigger(tableTrigger, vlarrayTelsWithTrigger, event):
 	"""
-	Append data from event in telescopes
-	--------------
+	Append the trigger of an event of the subarray
 	Parameters :
-		hfile : HDF5 file to be used
+		tableTrigger : trigger table of the subarray (or its TableBuffer)
+		vlarrayTelsWithTrigger : array of the telescopes which have triggered
 		event : current event
 	"""
-	tab_tel_with_data = list(event.r0.tels_with_data)
-	event_subarray_tel_w_trigger_row = hfile.root.r0.event.subarray.tels_with_trigger
-	event_subarray_tel_w_trigger_row.append(tab_tel_with_data)
+	vlarrayTelsWithTrigger.append(list(event.r0.tels_with_data))
 
-	event_subarray_trigger_row = hfile.root.r0.event.subarray.trigger.row
+	event_subarray_trigger_row = tableTrigger.row
 	event_subarray_trigger_row['event_id'] = event.index.event_id
 	event_subarray_trigger_row['time'] = np.float64(event.trigger.time.to_value('unix'))
 	event_subarray_trigger_row['event_type'] = event.trigger.event_type.value
@@ -387,15 +438,118 @@ def append_event_telescope_data(hfile, event):
 
 	event_subarray_trigger_row.append()
 
-	dicoTel = event.r0.tel
-	for telId in tab_tel_with_data:
-		waveform = dicoTel[telId].waveform
+
+def append_telescope_event(tel_waveform_table, tel_pe_image_table, event, telId):
+	"""
+	Append the waveform and the photo electron image of a telescope event
+	Parameters :
+		tel_waveform_table : waveform table of the telescope (or its TableBuffer)
+		tel_pe_image_table : photo electron image table of the telescope (or its TableBuffer)
+		event : current event
+		telId : id of the telescope
+	"""
+	append_waveform_in_telescope(tel_waveform_table, event.r0.tel[telId].waveform, event.index.event_id)
+	append_photo_electron_image_in_telescope(tel_pe_image_table, event.mc.tel[telId].true_image, event.index.event_id)
+
+
+def append_event_telescope_data(hfile, event):
+	"""
+	Append data from event in telescopes
+	--------------
+	Parameters :
+		hfile : HDF5 file to be used
+		event : current event
+	"""
+	append_subarray_trigger(hfile.root.r0.event.subarray.trigger, hfile.root.r0.event.subarray.tels_with_trigger,
+							event)
+	for telId in event.r0.tels_with_data:
 		tel_waveform_table = hfile.get_node("/r0/event/telescope/waveform", 'tel_{0:0=3d}'.format(telId))
 		tel_pe_image_table = hfile.get_node('/r0/event/telescope/photo_electron_image', 'tel_{0:0=3d}'.format(telId))
-		photo_electron_image = event.mc.tel[telId].true_image
+		append_telescope_event(tel_waveform_table, tel_pe_image_table, event, telId)
 
-		append_waveform_in_telescope(tel_waveform_table, waveform, event.index.event_id)
-		append_photo_electron_image_in_telescope(tel_pe_image_table, photo_electron_image, event.index.event_id)
+
+class R0EventWriter(object):
+	"""
+	Buffered writer of the R0 events : the rows of the trigger, waveform and photo electron image tables are
+	accumulated in TableBuffer and written by blocks, the tables of the telescopes are got once. The buffers are
+	created by _create_subarray_buffers and _create_telescope_buffers, which can be overloaded to write the blocks
+	somewhere else than in the tables of hfile
+	Attributes:
+		hfile : HDF5 file to be used
+		nbBytePerBlock : size in bytes of the block of rows of each table
+		trigger : TableBuffer of the trigger table of the subarray
+		tels_with_trigger : array of the telescopes which have triggered
+		telescopes : (waveform, photo electron image) TableBuffer of each telescope id
+	"""
+	def __init__(self, hfile, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+		self.hfile = hfile
+		self.nbBytePerBlock = nbBytePerBlock
+		self.trigger, self.tels_with_trigger = self._create_subarray_buffers()
+		self.telescopes = dict()
+
+
+	def _create_subarray_buffers(self):
+		"""
+		Create the buffers of the subarray trigger
+		Return :
+			(TableBuffer of the trigger table, array of the telescopes which have triggered)
+		"""
+		return (TableBuffer(self.hfile.root.r0.event.subarray.trigger, nbBytePerBlock=self.nbBytePerBlock),
+				self.hfile.root.r0.event.subarray.tels_with_trigger)
+
+
+	def _create_telescope_buffers(self, telId):
+		"""
+		Create the buffers of a telescope
+		Parameters :
+			telId : id of the telescope
+		Return :
+			(TableBuffer of the waveform table, TableBuffer of the photo electron image table)
+		"""
+		tableName = 'tel_{0:0=3d}'.format(telId)
+		tel_waveform_table = self.hfile.get_node("/r0/event/telescope/waveform", tableName)
+		tel_pe_image_table = self.hfile.get_node('/r0/event/telescope/photo_electron_image', tableName)
+		return (TableBuffer(tel_waveform_table, nbBytePerBlock=self.nbBytePerBlock),
+				TableBuffer(tel_pe_image_table, nbBytePerBlock=self.nbBytePerBlock))
+
+
+	def get_telescope_buffers(self, telId):
+		"""
+		Get the buffers of a telescope, created on its first event
+		Parameters :
+			telId : id of the telescope
+		Return :
+			(TableBuffer of the waveform table, TableBuffer of the photo electron image table)
+		"""
+		try:
+			return self.telescopes[telId]
+		except KeyError:
+			buffers = self._create_telescope_buffers(telId)
+			self.telescopes[telId] = buffers
+			return buffers
+
+
+	def append_event(self, event):
+		"""
+		Append the data of an event
+		Parameters :
+			event : current event
+		"""
+		append_subarray_trigger(self.trigger, self.tels_with_trigger, event)
+		for telId in event.r0.tels_with_data:
+			tel_waveform_buffer, tel_pe_image_buffer = self.get_telescope_buffers(telId)
+			append_telescope_event(tel_waveform_buffer, tel_pe_image_buffer, event, telId)
+
+
+	def flush(self):
+		"""
+		Write the rows which are still in the buffers and flush the tables
+		"""
+		self.trigger.flush()
+		self.tels_with_trigger.flush()
+		for buffers in self.telescopes.values():
+			for tableBuffer in buffers:
+				tableBuffer.flush()
 
 
 def flush_r0_tables(hfile):
@@ -0,0 +1,151 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+
+
+class TelescopeR1Calibration(object):
+	'''
+	R1 calibration of a telescope : r1 = (waveform - pedestal / nbSlice) * dc_to_pe
+	The calibration factors are computed once and the calibrated waveforms can be written in a preallocated buffer
+	Attributes:
+	-----------
+		offset : pedestal per slice of each gain and pixel, shape (nbGain, nbPixel, 1)
+		gain : dc_to_pe of each gain and pixel, shape (nbGain, nbPixel, 1)
+		dtype : type of the calibrated waveforms
+		buffer : buffer of the calibrated waveform, reused by calibrate_in_buffer
+	'''
+	def __init__(self, dc_to_pe, pedestal, nbSlice, dtype=np.float32):
+		self.dtype = np.dtype(dtype)
+		self.offset = (np.asarray(pedestal, dtype=np.float64) / nbSlice)[..., np.newaxis].astype(self.dtype)
+		self.gain = np.asarray(dc_to_pe)[..., np.newaxis].astype(self.dtype)
+		self.buffer = None
+
+
+	def calibrate(self, tabWaveform, out=None):
+		'''
+		Calibrate waveforms
+		Parameters:
+		-----------
+			tabWaveform : waveforms with shape (nbGain, nbPixel, nbSlice) or a block of waveforms with shape
+				(nbEvent, nbGain, nbPixel, nbSlice)
+			out : array where to write the calibrated waveforms (allocated if None)
+		Return:
+		-------
+			calibrated waveforms
+		'''
+		if out is None:
+			out = np.empty(tabWaveform.shape, dtype=self.dtype)
+		np.subtract(tabWaveform, self.offset, out=out, casting='unsafe')
+		np.multiply(out, self.gain, out=out)
+		return out
+
+
+	def calibrate_in_buffer(self, tabWaveform):
+		'''
+		Calibrate waveforms in the buffer of the telescope (the previous content of the buffer is overwritten)
+		Parameters:
+		-----------
+			tabWaveform : waveforms with shape (nbGain, nbPixel, nbSlice)
+		Return:
+		-------
+			buffer of the telescope which contains the calibrated waveforms
+		'''
+		if self.buffer is None or self.buffer.shape != tabWaveform.shape:
+			self.buffer = np.empty(tabWaveform.shape, dtype=self.dtype)
+		return self.calibrate(tabWaveform, self.buffer)
+
+
+class R1CalibrationCache(object):
+	'''
+	Cache of the R1 calibrations of the telescopes of a run
+	Attributes:
+	-----------
+		dicoMcTel : dictionary of (dc_to_pe, pedestal, ...) with the telescope id as key
+		dtype : type of the calibrated waveforms
+		calibrations : TelescopeR1Calibration of the telescopes already used (telescope id as key)
+	'''
+	def __init__(self, dicoMcTel, dtype=np.float32):
+		self.dicoMcTel = dicoMcTel
+		self.dtype = np.dtype(dtype)
+		self.calibrations = dict()
+
+
+	def get_calibration(self, telId, nbSlice):
+		'''
+		Get the calibration of a telescope
+		Parameters:
+		-----------
+			telId : id of the telescope
+			nbSlice : number of slices of the waveforms of the telescope
+		Return:
+		-------
+			TelescopeR1Calibration of the telescope
+		'''
+		try:
+			return self.calibrations[telId]
+		except KeyError:
+			dc_to_pe, pedestal = self.dicoMcTel[telId][:2]
+			calibration = TelescopeR1Calibration(dc_to_pe, pedestal, nbSlice, self.dtype)
+			self.calibrations[telId] = calibration
+			return calibration
+
+
+class PedestalSelection(object):
+	'''
+	Pedestals of a telescope which are valid for different events (the runs of a merged R0-V2 file)
+	Attributes:
+	-----------
+		tabObsId : obs_id of each pedestal (None if the pedestal table does not store it)
+		tabFirstEventId : first event id of each pedestal
+		tabLastEventId : last event id of each pedestal
+		listPedestal : pedestal of each row, shape (nbGain, nbPixel)
+		dicoRow : row of each pedestal of listPedestal, with the id of the pedestal as key
+	'''
+	def __init__(self, tabPedestal):
+		'''
+		Parameters:
+		-----------
+			tabPedestal : rows of the pedestal table of the telescope (obs_id, first_event_id, last_event_id, pedestal)
+		'''
+		self.tabObsId = tabPedestal["obs_id"] if "obs_id" in tabPedestal.dtype.names else None
+		self.tabFirstEventId = tabPedestal["first_event_id"]
+		self.tabLastEventId = tabPedestal["last_event_id"]
+		self.listPedestal = list(tabPedestal["pedestal"])
+		self.dicoRow = {id(pedestal): row for row, pedestal in enumerate(self.listPedestal)}
+
+
+	def find_row(self, eventId, obsId=None):
+		'''
+		Find the pedestal of an event
+		Parameters:
+		-----------
+			eventId : id of the event
+			obsId : obs_id of the event (None if it is not known)
+		Return:
+		-------
+			first row whose observation and range of event ids contain the event (0 if there is none)
+		'''
+		isSelected = (self.tabFirstEventId <= eventId) & (eventId <= self.tabLastEventId)
+		if self.tabObsId is not None and obsId is not None:
+			isSelected &= self.tabObsId == obsId
+		tabRow = np.flatnonzero(isSelected)
+		if tabRow.size == 0:
+			return 0
+		return int(tabRow[0])
+
+
+	def get_row(self, pedestal):
+		'''
+		Get the row of a pedestal of listPedestal
+		Parameters:
+		-----------
+			pedestal : pedestal given by listPedestal
+		Return:
+		-------
+			row of the pedestal (0 if it is not one of listPedestal)
+		'''
+		return self.dicoRow.get(id(pedestal), 0)
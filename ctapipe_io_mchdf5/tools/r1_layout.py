@@ -0,0 +1,235 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .waveform_reader import WaveformBlockReader, TelescopeWaveformReader, TelescopeReaderCache, get_block_size, \
+	get_chunk_aligned_batch_size, _stack_waveform_gains
+
+
+# Attribute of the root node which stores the layout of the waveforms of a R1-V2 like file
+LAYOUT_ATTRIBUTE = "WAVEFORM_LAYOUT"
+# Attribute of the minimum tables (minHi, minLo) which stores the number of events per minimum
+NB_EVENT_PER_MIN_ATTRIBUTE = "NB_EVENT_PER_MIN"
+
+# Layouts of the waveforms of the telescope groups
+# raw : waveformHi and waveformLo tables (R1-V2 or R1-V2-PixelSlice)
+LAYOUT_RAW = "raw"
+# min_selection : waveforms without the minimum of their block of events (mchdf5_min_selection), the minimum of each
+# block and pixel is stored in the minHi and minLo tables
+LAYOUT_MIN_SELECTION = "min_selection"
+# slice_selection : waveforms with a part of the slices (mchdf5_slice_selection), nbSlice is the number of slices of
+# the input file
+LAYOUT_SLICE_SELECTION = "slice_selection"
+# dl0_v1 : waveforms whose not selected pixels are averaged over the slices (mchdf5_tailcut_dilation_dl0v1)
+LAYOUT_DL0_V1 = "dl0_v1"
+
+
+def set_file_layout(hfile, layout):
+	'''
+	Store the layout of the waveforms of a file
+	Parameters:
+	-----------
+		hfile : HDF5 file to be modified
+		layout : layout of the waveforms (LAYOUT_RAW, LAYOUT_MIN_SELECTION, ...)
+	'''
+	setattr(hfile.root._v_attrs, LAYOUT_ATTRIBUTE, layout)
+
+
+def get_file_layout(hfile, where='/r1'):
+	'''
+	Get the layout of the waveforms of a file, from the attribute stored by set_file_layout or, for the files written
+	without it, from the tables of the telescope groups and the title of the file
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+	Return:
+	-------
+		layout of the waveforms (LAYOUT_RAW, LAYOUT_MIN_SELECTION, LAYOUT_SLICE_SELECTION or LAYOUT_DL0_V1)
+	'''
+	if LAYOUT_ATTRIBUTE in hfile.root._v_attrs._f_list("user"):
+		return str(getattr(hfile.root._v_attrs, LAYOUT_ATTRIBUTE))
+	if hfile.title == "DL0-V1":
+		return LAYOUT_DL0_V1
+	try:
+		for telNode in hfile.walk_nodes(where, 'Group'):
+			if 'minHi' in telNode:
+				return LAYOUT_MIN_SELECTION
+			if 'nbSlice' in telNode and 'waveformHi' in telNode:
+				tabShape = telNode.waveformHi.coldtypes["waveformHi"].shape
+				if int(telNode.nbSlice.read()) not in tabShape:
+					return LAYOUT_SLICE_SELECTION
+				return LAYOUT_RAW
+	except tables.exceptions.NoSuchNodeError as e:
+		pass
+	return LAYOUT_RAW
+
+
+def get_nb_event_per_min(tableWaveform, tableMin):
+	'''
+	Get the number of events of the blocks of a minimum table
+	Parameters:
+	-----------
+		tableWaveform : table of the waveforms without their minimum
+		tableMin : table of the minimum of each block of events
+	Return:
+	-------
+		number of events per minimum
+	Raise:
+	------
+		ValueError if the number of events per minimum is not stored and cannot be deduced from the tables
+	'''
+	if NB_EVENT_PER_MIN_ATTRIBUTE in tableMin.attrs._f_list("user"):
+		return int(getattr(tableMin.attrs, NB_EVENT_PER_MIN_ATTRIBUTE))
+	nbEvent = tableWaveform.nrows
+	nbMin = tableMin.nrows
+	if nbMin <= 1:
+		return max(1, nbEvent)
+	if nbEvent % nbMin == 0:
+		return nbEvent // nbMin
+	raise ValueError("Cannot deduce the number of events per minimum of the table {}".format(tableMin._v_pathname))
+
+
+def read_block_minimum(tableMin, minColumnName, firstRow, lastRow, nbEventPerMin):
+	'''
+	Read the minimum of the blocks of events which contain consecutive rows
+	Parameters:
+	-----------
+		tableMin : table of the minimum of each block of events
+		minColumnName : name of the minimum column
+		firstRow : first row of the waveforms
+		lastRow : last row of the waveforms (excluded)
+		nbEventPerMin : number of events per minimum
+	Return:
+	-------
+		(tabMin, tabMinRow) with tabMin the minimum of the blocks which contain the rows, shape (nbBlock, nbPixel), and
+		tabMinRow the row of the block of each waveform row in tabMin
+	'''
+	tabMinRow = np.arange(firstRow, lastRow) // nbEventPerMin
+	firstMinRow = firstRow // nbEventPerMin
+	lastMinRow = max(lastRow - 1, firstRow) // nbEventPerMin + 1
+	tabMin = tableMin.read(firstMinRow, lastMinRow, field=minColumnName)
+	return tabMin, tabMinRow - firstMinRow
+
+
+def add_waveform_minimum(tabWaveform, tabMin, tabMinRow, isSlicePixel=True):
+	'''
+	Add the minimum of their block to waveforms, in place
+	Parameters:
+	-----------
+		tabWaveform : waveforms without minimum, shape (nbEvent, nbSlice, nbPixel) if isSlicePixel is True and
+			(nbEvent, nbPixel, nbSlice) otherwise
+		tabMin : minimum of each pixel of the blocks, shape (nbBlock, nbPixel)
+		tabMinRow : row of the block of each event in tabMin
+		isSlicePixel : True if the waveforms are stored per slice and pixel
+	Return:
+	-------
+		tabWaveform with the minimum added
+	'''
+	tabEventMin = tabMin[tabMinRow]
+	if isSlicePixel:
+		tabEventMin = tabEventMin[:, np.newaxis, :]
+	else:
+		tabEventMin = tabEventMin[:, :, np.newaxis]
+	tabWaveform += tabEventMin.astype(tabWaveform.dtype, copy=False)
+	return tabWaveform
+
+
+class MinSelectedBlockReader(WaveformBlockReader):
+	'''
+	Read-ahead reader of a column of waveforms without minimum : the minimum of the blocks of events are added back
+	to each block read, with one broadcast addition
+	Attributes:
+	-----------
+		tableMin : table of the minimum of each block of events
+		minColumnName : name of the minimum column
+		nbEventPerMin : number of events per minimum
+		isSlicePixel : True if the waveforms are stored per slice and pixel
+	'''
+	def __init__(self, table, columnName, blockSize, tableMin, minColumnName, isSlicePixel=True, blockCache=None):
+		super().__init__(table, columnName, blockSize, blockCache)
+		self.tableMin = tableMin
+		self.minColumnName = minColumnName
+		self.nbEventPerMin = get_nb_event_per_min(table, tableMin)
+		self.isSlicePixel = isSlicePixel
+
+
+	def _read_block(self):
+		block = super()._read_block()
+		tabMin, tabMinRow = read_block_minimum(self.tableMin, self.minColumnName, self.firstRow, self.lastRow,
+												self.nbEventPerMin)
+		return add_waveform_minimum(block, tabMin, tabMinRow, self.isSlicePixel)
+
+
+class MinSelectedWaveformReader(TelescopeWaveformReader):
+	'''
+	Readers of the high and low gain waveforms of a telescope of a min selected file (waveformHi and minHi,
+	waveformLo and minLo tables)
+	'''
+	def __init__(self, telNode, nbEventPerBlock=100, nbBytePerBlock=0, isSlicePixel=True, blockCache=None):
+		self.isSlicePixel = isSlicePixel
+		super().__init__(telNode, nbEventPerBlock, nbBytePerBlock, blockCache)
+
+
+	def _create_reader(self, columnName, nbEventPerBlock, nbBytePerBlock):
+		table = self.telNode._f_get_child(columnName)
+		minColumnName = columnName.replace("waveform", "min")
+		tableMin = self.telNode._f_get_child(minColumnName)
+		blockSize = get_block_size(table, columnName, nbEventPerBlock, nbBytePerBlock)
+		return MinSelectedBlockReader(table, columnName, blockSize, tableMin, minColumnName, self.isSlicePixel,
+									  self.blockCache)
+
+
+class MinSelectedReaderCache(TelescopeReaderCache):
+	'''
+	Cache of the waveform readers of the telescopes of a min selected file
+	'''
+	def __init__(self, hfile, where='/r1', groupPrefix='Tel_', nbEventPerBlock=100, nbBytePerBlock=0,
+				 isSlicePixel=True, blockCache=None):
+		super().__init__(hfile, where, groupPrefix, nbEventPerBlock, nbBytePerBlock, blockCache)
+		self.isSlicePixel = isSlicePixel
+
+
+	def _create_reader(self, telId):
+		telNode = self.hfile.get_node(self.where, self.groupPrefix + str(telId))
+		return MinSelectedWaveformReader(telNode, self.nbEventPerBlock, self.nbBytePerBlock, self.isSlicePixel,
+										 self.blockCache)
+
+
+def iter_min_selected_waveform_batches(telNode, batchSize=1000, isSlicePixel=True):
+	'''
+	Iterate over the waveforms of a telescope of a min selected file by batches of consecutive events, without any
+	event container. The minimum of the blocks of events of a batch are read at once and added back to the waveforms
+	Parameters:
+	-----------
+		telNode : group of the telescope (with trigger, waveformHi, minHi and optionally waveformLo and minLo tables)
+		batchSize : expected number of events per batch (rounded to a multiple of the chunk size)
+		isSlicePixel : True if the waveforms are stored per slice and pixel
+	Return:
+	-------
+		generator of (tabEventId, tabWaveform) with tabEventId the id of the events of the batch and tabWaveform
+		the waveforms with shape (nbEvent, nbGain, nbPixel, nbSlice)
+	'''
+	listTable = []
+	for columnName, minColumnName in (("waveformHi", "minHi"), ("waveformLo", "minLo")):
+		if columnName in telNode:
+			table = telNode._f_get_child(columnName)
+			tableMin = telNode._f_get_child(minColumnName)
+			listTable.append((table, columnName, tableMin, minColumnName, get_nb_event_per_min(table, tableMin)))
+	tableHi = telNode.waveformHi
+	batchSize = get_chunk_aligned_batch_size(tableHi, batchSize)
+	nbRow = tableHi.nrows
+	for firstRow in range(0, nbRow, batchSize):
+		lastRow = min(firstRow + batchSize, nbRow)
+		tabEventId = telNode.trigger.read(firstRow, lastRow, field="event_id")
+		listGain = []
+		for table, columnName, tableMin, minColumnName, nbEventPerMin in listTable:
+			tabWaveform = table.read(firstRow, lastRow, field=columnName)
+			tabMin, tabMinRow = read_block_minimum(tableMin, minColumnName, firstRow, lastRow, nbEventPerMin)
+			listGain.append(add_waveform_minimum(tabWaveform, tabMin, tabMinRow, isSlicePixel))
+		yield tabEventId, _stack_waveform_gains(listGain, isSlicePixel)
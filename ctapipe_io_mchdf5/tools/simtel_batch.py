@@ -0,0 +1,181 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import tables
+
+from .chunk_policy import get_chunk_policy, set_chunk_policy
+from .compression_policy import get_compression_policy, set_compression_policy
+from .r0_pipeline import convert_simtel_to_r0
+from .r0_merge import merge_r0_files
+from .table_buffer import DEFAULT_NB_BYTE_PER_BLOCK
+
+
+# Extensions removed from the name of a simtel file to get the name of its R0-V2 file
+LIST_SIMTEL_EXTENSION = [".gz", ".zst", ".bz2", ".simtel", ".sim"]
+
+
+def get_r0_file_name(inputFileName, outputDirectory):
+	'''
+	Get the name of the R0-V2 file of a simtel file
+	Parameters:
+	-----------
+		inputFileName : name of the simtel file
+		outputDirectory : directory of the R0-V2 file
+	Return:
+	-------
+		name of the R0-V2 file (name of the simtel file without its extensions, with the .h5 extension)
+	'''
+	baseName = os.path.basename(inputFileName)
+	isExtension = True
+	while isExtension:
+		isExtension = False
+		for extension in LIST_SIMTEL_EXTENSION:
+			if baseName.endswith(extension) and len(baseName) > len(extension):
+				baseName = baseName[:-len(extension)]
+				isExtension = True
+	return os.path.join(outputDirectory, baseName + ".h5")
+
+
+def split_merge_groups(listFileName, nbMergedFile):
+	'''
+	Split files in consecutive groups of the same size, each group is merged in one file
+	Parameters:
+	-----------
+		listFileName : names of the files
+		nbMergedFile : number of groups
+	Return:
+	-------
+		list of the non empty groups of file names
+	'''
+	nbMergedFile = max(1, min(nbMergedFile, len(listFileName)))
+	nbFilePerGroup, nbBiggerGroup = divmod(len(listFileName), nbMergedFile)
+	listGroup, firstFile = [], 0
+	for i in range(nbMergedFile):
+		lastFile = firstFile + nbFilePerGroup + (1 if i < nbBiggerGroup else 0)
+		listGroup.append(listFileName[firstFile:lastFile])
+		firstFile = lastFile
+	return [group for group in listGroup if len(group) > 0]
+
+
+def get_merged_file_name(mergedFileName, indexGroup, nbGroup):
+	'''
+	Get the name of a merged file
+	Parameters:
+	-----------
+		mergedFileName : name of the merged file if there is only one (NAME.h5)
+		indexGroup : index of the group of the merged file
+		nbGroup : number of merged files
+	Return:
+	-------
+		mergedFileName if there is one group, NAME_XXX.h5 otherwise
+	'''
+	if nbGroup <= 1:
+		return mergedFileName
+	baseName, extension = os.path.splitext(mergedFileName)
+	return "{}_{:03d}{}".format(baseName, indexGroup, extension if extension != "" else ".h5")
+
+
+def _convert_simtel_file(inputFileName, outputFileName, compressionLevel, maxEvent, nbBytePerBlock, nbBloscThread,
+						 chunkPolicy, compressionPolicy):
+	'''
+	Convert a simtel file into a R0-V2 file (called in the worker processes, which decode and write in one process)
+	Parameters:
+	-----------
+		inputFileName : name of the simtel file
+		outputFileName : name of the R0-V2 file
+		compressionLevel : compression level of the output file
+		maxEvent : maximum number of events to be converted (None for all the events)
+		nbBytePerBlock : size in bytes of the blocks of rows of each table
+		nbBloscThread : number of threads used by blosc to compress the output file
+		chunkPolicy : chunk policy of the main process
+		compressionPolicy : compression policy of the main process
+	Return:
+	-------
+		(name of the R0-V2 file, number of events)
+	'''
+	set_chunk_policy(chunkPolicy)
+	set_compression_policy(compressionPolicy)
+	tables.parameters.MAX_BLOSC_THREADS = max(1, nbBloscThread)
+	# The progress counters of the processes of the pool would overwrite each other
+	writer = convert_simtel_to_r0(inputFileName, outputFileName, compressionLevel, maxEvent, 0, nbBytePerBlock,
+								  isProgress=False)
+	return outputFileName, writer.nbEvent
+
+
+def _merge_files(outputFileName, listInputFileName, nbBytePerBlock):
+	'''
+	Merge R0-V2 files (called in the worker processes)
+	Parameters:
+	-----------
+		outputFileName : name of the merged file
+		listInputFileName : names of the R0-V2 files to be merged
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	Return:
+	-------
+		name of the merged file
+	'''
+	merge_r0_files(outputFileName, listInputFileName, nbBytePerBlock)
+	return outputFileName
+
+
+def convert_simtel_files(listInputFileName, outputDirectory, compressionLevel=0, maxEvent=None, nbWorker=1,
+						 nbBloscThread=1, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Convert simtel files into R0-V2 files with a pool of processes, each process converts one file at once with the
+	chunk and compression policies of the current process
+	Parameters:
+	-----------
+		listInputFileName : names of the simtel files
+		outputDirectory : directory of the R0-V2 files (one per simtel file, see get_r0_file_name)
+		compressionLevel : compression level of the output files (0 for no compression)
+		maxEvent : maximum number of events to be converted per file (None for all the events)
+		nbWorker : number of processes which convert the files
+		nbBloscThread : number of threads used by blosc to compress each output file
+		nbBytePerBlock : size in bytes of the blocks of rows of each table
+	Return:
+	-------
+		list of (name of the R0-V2 file, number of events), in the order of the simtel files
+	Raise:
+	------
+		ValueError if two simtel files give the same R0-V2 file name
+	'''
+	listOutputFileName = [get_r0_file_name(inputFileName, outputDirectory) for inputFileName in listInputFileName]
+	if len(set(listOutputFileName)) != len(listOutputFileName):
+		raise ValueError("Several simtel files have the same name, their R0-V2 files would be overwritten")
+	os.makedirs(outputDirectory, exist_ok=True)
+	with ProcessPoolExecutor(max(1, nbWorker)) as executor:
+		listFuture = [executor.submit(_convert_simtel_file, inputFileName, outputFileName, compressionLevel, maxEvent,
+									  nbBytePerBlock, nbBloscThread, get_chunk_policy(), get_compression_policy())
+					  for inputFileName, outputFileName in zip(listInputFileName, listOutputFileName)]
+		return [future.result() for future in listFuture]
+
+
+def merge_converted_files(listFileName, mergedFileName, nbMergedFile=1, nbWorker=1,
+						  nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+	'''
+	Merge R0-V2 files into a few files, the groups of consecutive files are merged in parallel
+	Parameters:
+	-----------
+		listFileName : names of the R0-V2 files
+		mergedFileName : name of the merged file (NAME.h5, the files are named NAME_XXX.h5 if there are several)
+		nbMergedFile : number of merged files
+		nbWorker : number of processes which merge the files
+		nbBytePerBlock : size in bytes of the blocks of rows copied at once
+	Return:
+	-------
+		list of (name of the merged file, names of its R0-V2 files)
+	'''
+	listGroup = split_merge_groups(listFileName, nbMergedFile)
+	listMergedFileName = [get_merged_file_name(mergedFileName, i, len(listGroup)) for i in range(len(listGroup))]
+	with ProcessPoolExecutor(max(1, min(nbWorker, len(listGroup)))) as executor:
+		listFuture = [executor.submit(_merge_files, outputFileName, group, nbBytePerBlock)
+					  for outputFileName, group in zip(listMergedFileName, listGroup)]
+		for future in listFuture:
+			future.result()
+	return list(zip(listMergedFileName, listGroup))
@@ -184,49 +184,67 @@ def fill_simulation_header_info(hfile, inputFileName):
     """
     with event_source(inputFileName) as source:
         evt = next(iter(source))
+        fill_simulation_header_from_event(hfile, evt)
 
-        tableSimulationConfig = hfile.root.configuration.simulation.run
-        tabSimConf = tableSimulationConfig.row
 
-        mcHeader = evt.mcheader
-        tabSimConf["atmosphere"] = np.uint64(mcHeader.atmosphere)
-        tabSimConf["core_pos_mode"] = np.uint64(mcHeader.core_pos_mode)
-        tabSimConf["corsika_bunchsize"] = np.float32(mcHeader.corsika_bunchsize)
-        tabSimConf["corsika_high_E_detail"] = np.int32(mcHeader.corsika_high_E_detail)
-        tabSimConf["corsika_high_E_model"] = np.int32(mcHeader.corsika_high_E_model)
-        tabSimConf["corsika_iact_options"] = np.int32(mcHeader.corsika_iact_options)
-        tabSimConf["corsika_low_E_detail"] = np.int32(mcHeader.corsika_low_E_detail)
-        tabSimConf["corsika_low_E_model"] = np.int32(mcHeader.corsika_low_E_model)
-        tabSimConf["corsika_version"] = np.int32(mcHeader.corsika_version)
-        tabSimConf["corsika_wlen_max"] = np.float32(mcHeader.corsika_wlen_max)
-        tabSimConf["corsika_wlen_min"] = np.float32(mcHeader.corsika_wlen_min)
-        tabSimConf["detector_prog_id"] = np.uint64(mcHeader.detector_prog_id)
-        tabSimConf["detector_prog_start"] = np.int32(mcHeader.detector_prog_start)
-        tabSimConf["diffuse"] = np.int32(mcHeader.diffuse)
-        tabSimConf["energy_range_max"] = np.float32(mcHeader.energy_range_max)
-        tabSimConf["energy_range_min"] = np.float32(mcHeader.energy_range_min)
-        tabSimConf["injection_height"] = np.float32(mcHeader.injection_height)
-        tabSimConf["max_alt"] = np.float32(mcHeader.max_alt)
-        tabSimConf["max_az"] = np.float32(mcHeader.max_az)
-        tabSimConf["max_scatter_range"] = np.float32(mcHeader.max_scatter_range)
-        tabSimConf["max_viewcone_radius"] = np.float32(mcHeader.max_viewcone_radius)
-        tabSimConf["min_alt"] = np.float32(mcHeader.min_alt)
-        tabSimConf["min_az"] = np.float32(mcHeader.min_az)
-        tabSimConf["min_scatter_range"] = np.float32(mcHeader.min_scatter_range)
-        tabSimConf["min_viewcone_radius"] = np.float32(mcHeader.min_viewcone_radius)
-        tabSimConf["num_showers"] = np.uint64(mcHeader.num_showers)
-        tabSimConf["obs_id"] = np.uint64(evt.index.obs_id)
-        tabSimConf["prod_site_B_declination"] = np.float32(mcHeader.prod_site_B_declination)
-        tabSimConf["prod_site_B_inclination"] = np.float32(mcHeader.prod_site_B_inclination)
-        tabSimConf["prod_site_B_total"] = np.float32(mcHeader.prod_site_B_total)
-        tabSimConf["prod_site_alt"] = np.float32(mcHeader.prod_site_alt)
-        tabSimConf["run_array_direction"] = np.float32(mcHeader.run_array_direction)
-        tabSimConf["shower_prog_id"] = np.uint64(mcHeader.shower_prog_id)
-        tabSimConf["shower_prog_start"] = np.int32(mcHeader.shower_prog_start)
-        tabSimConf["shower_reuse"] = np.uint64(mcHeader.shower_reuse)
-        tabSimConf["simtel_version"] = np.int32(mcHeader.simtel_version)
-        tabSimConf["spectral_index"] = np.float32(mcHeader.spectral_index)
-        tabSimConf.append()
+def fill_simulation_header_from_event(hfile, evt):
+    """
+    Fill the simulation information in the simulation header (/simulation/run_config) with an event of the run
+    Parameters:
+        hfile : HDF5 file to be used
+        evt : event of the run (the header is the same for all the events)
+    """
+    append_simulation_header(hfile.root.configuration.simulation.run, evt)
+
+
+def append_simulation_header(tableSimulationConfig, evt):
+    """
+    Append the simulation header of the run in the table of the simulation configuration
+    Parameters:
+        tableSimulationConfig : table of the simulation configuration (or its TableBuffer)
+        evt : event of the run (the header is the same for all the events)
+    """
+    tabSimConf = tableSimulationConfig.row
+
+    mcHeader = evt.mcheader
+    tabSimConf["atmosphere"] = np.uint64(mcHeader.atmosphere)
+    tabSimConf["core_pos_mode"] = np.uint64(mcHeader.core_pos_mode)
+    tabSimConf["corsika_bunchsize"] = np.float32(mcHeader.corsika_bunchsize)
+    tabSimConf["corsika_high_E_detail"] = np.int32(mcHeader.corsika_high_E_detail)
+    tabSimConf["corsika_high_E_model"] = np.int32(mcHeader.corsika_high_E_model)
+    tabSimConf["corsika_iact_options"] = np.int32(mcHeader.corsika_iact_options)
+    tabSimConf["corsika_low_E_detail"] = np.int32(mcHeader.corsika_low_E_detail)
+    tabSimConf["corsika_low_E_model"] = np.int32(mcHeader.corsika_low_E_model)
+    tabSimConf["corsika_version"] = np.int32(mcHeader.corsika_version)
+    tabSimConf["corsika_wlen_max"] = np.float32(mcHeader.corsika_wlen_max)
+    tabSimConf["corsika_wlen_min"] = np.float32(mcHeader.corsika_wlen_min)
+    tabSimConf["detector_prog_id"] = np.uint64(mcHeader.detector_prog_id)
+    tabSimConf["detector_prog_start"] = np.int32(mcHeader.detector_prog_start)
+    tabSimConf["diffuse"] = np.int32(mcHeader.diffuse)
+    tabSimConf["energy_range_max"] = np.float32(mcHeader.energy_range_max)
+    tabSimConf["energy_range_min"] = np.float32(mcHeader.energy_range_min)
+    tabSimConf["injection_height"] = np.float32(mcHeader.injection_height)
+    tabSimConf["max_alt"] = np.float32(mcHeader.max_alt)
+    tabSimConf["max_az"] = np.float32(mcHeader.max_az)
+    tabSimConf["max_scatter_range"] = np.float32(mcHeader.max_scatter_range)
+    tabSimConf["max_viewcone_radius"] = np.float32(mcHeader.max_viewcone_radius)
+    tabSimConf["min_alt"] = np.float32(mcHeader.min_alt)
+    tabSimConf["min_az"] = np.float32(mcHeader.min_az)
+    tabSimConf["min_scatter_range"] = np.float32(mcHeader.min_scatter_range)
+    tabSimConf["min_viewcone_radius"] = np.float32(mcHeader.min_viewcone_radius)
+    tabSimConf["num_showers"] = np.uint64(mcHeader.num_showers)
+    tabSimConf["obs_id"] = np.uint64(evt.index.obs_id)
+    tabSimConf["prod_site_B_declination"] = np.float32(mcHeader.prod_site_B_declination)
+    tabSimConf["prod_site_B_inclination"] = np.float32(mcHeader.prod_site_B_inclination)
+    tabSimConf["prod_site_B_total"] = np.float32(mcHeader.prod_site_B_total)
+    tabSimConf["prod_site_alt"] = np.float32(mcHeader.prod_site_alt)
+    tabSimConf["run_array_direction"] = np.float32(mcHeader.run_array_direction)
+    tabSimConf["shower_prog_id"] = np.uint64(mcHeader.shower_prog_id)
+    tabSimConf["shower_prog_start"] = np.int32(mcHeader.shower_prog_start)
+    tabSimConf["shower_reuse"] = np.uint64(mcHeader.shower_reuse)
+    tabSimConf["simtel_version"] = np.int32(mcHeader.simtel_version)
+    tabSimConf["spectral_index"] = np.float32(mcHeader.spectral_index)
+    tabSimConf.append()
 
 
 def append_corsika_event(tableMcCorsikaEvent, event):
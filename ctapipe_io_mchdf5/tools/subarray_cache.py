@@ -0,0 +1,206 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import copy
+import hashlib
+import os
+
+import numpy as np
+import tables
+from astropy import units as u
+from ctapipe.instrument import TelescopeDescription, OpticsDescription
+from ctapipe.instrument.camera import CameraGeometry
+
+
+# Correspance HiPeData.Telscope.Type and camera name
+# 0  LSTCam, 1 NectarCam, 2 FlashCam, 3 SCTCam,
+# 4 ASTRICam, 5 DigiCam, 6 CHEC
+MAPPING_CAMERA = {0: 'LSTCam', 1: 'NectarCam', 2: 'FlashCam', 3: 'SCTCam', 4: 'ASTRICam', 5: 'DigiCam', 6: 'CHEC'}
+
+MAPPING_TEL_NAME = {0: 'LST', 1: 'MST', 2: 'MST', 3: 'MST', 4: 'SST-ASTRI', 5: 'SST-1M', 6: 'SST-2M'}
+
+# Name of the attribute of the root node which can store the pickled SubarrayDescription of the file
+SUBARRAY_BLOB_NAME = "SUBARRAY_DESCRIPTION"
+
+# SubarrayDescription already built, with the key of the file or of its instrument description as key
+SUBARRAY_CACHE = dict()
+
+
+class TelescopeDescriptionCache(object):
+	'''
+	Create the telescope descriptions of a subarray.
+	The camera geometries are shared per camera type and the optics per telescope type and focal length, so
+	CameraGeometry.from_name and OpticsDescription.from_name are called once per type and not per telescope
+	Attributes:
+	-----------
+		cameras : CameraGeometry of each telescope type
+		optics : OpticsDescription of each (telescope type, focal length)
+		telescopes : TelescopeDescription of each (telescope type, focal length)
+	'''
+	def __init__(self):
+		self.cameras = dict()
+		self.optics = dict()
+		self.telescopes = dict()
+
+
+	def get_camera(self, telType, readPixelPosition):
+		'''
+		Get the camera geometry of a telescope type
+		Parameters:
+		-----------
+			telType : type of the telescope
+			readPixelPosition : function which returns the (pix_x, pix_y) of the camera in meters, called only
+				for the first telescope of the type
+		Return:
+		-------
+			CameraGeometry of the telescope type
+		'''
+		try:
+			return self.cameras[telType]
+		except KeyError:
+			cameraName = MAPPING_CAMERA[telType]
+			camera = CameraGeometry.from_name(cameraName)
+			camera.cam_id = cameraName
+			pix_x, pix_y = readPixelPosition()
+			camera.pix_x = pix_x * u.m
+			camera.pix_y = pix_y * u.m
+			self.cameras[telType] = camera
+			return camera
+
+
+	def get_telescope(self, telType, focalLength, readPixelPosition):
+		'''
+		Get the description of a telescope
+		Parameters:
+		-----------
+			telType : type of the telescope
+			focalLength : equivalent focal length of the telescope in meters
+			readPixelPosition : function which returns the (pix_x, pix_y) of the camera in meters
+		Return:
+		-------
+			TelescopeDescription of the telescope
+		'''
+		key = (telType, float(focalLength))
+		try:
+			return self.telescopes[key]
+		except KeyError:
+			telName = MAPPING_TEL_NAME[telType]
+			optic = self.optics.get(telType)
+			if optic is None:
+				optic = OpticsDescription.from_name(telName)
+				self.optics[telType] = optic
+			optic = copy.copy(optic)
+			optic.equivalent_focal_length = focalLength * u.m
+			camera = self.get_camera(telType, readPixelPosition)
+			telescope = TelescopeDescription(telName, telName, optics=optic, camera=camera)
+			self.telescopes[key] = telescope
+			return telescope
+
+
+def get_file_key(fileName):
+	'''
+	Get the key of a file in the subarray cache (the key changes if the file is modified)
+	Parameters:
+	-----------
+		fileName : name of the file
+	Return:
+	-------
+		(real path, size, modification time) of the file
+	'''
+	stat = os.stat(fileName)
+	return (os.path.realpath(fileName), stat.st_size, stat.st_mtime_ns)
+
+
+def get_cached_subarray(fileName, buildSubarray):
+	'''
+	Get the subarray of a file, built only once per file and process
+	Parameters:
+	-----------
+		fileName : name of the file
+		buildSubarray : function which builds the SubarrayDescription of the file
+	Return:
+	-------
+		SubarrayDescription of the file (shared by all the sources of the file)
+	'''
+	key = get_file_key(fileName)
+	subarray = SUBARRAY_CACHE.get(key)
+	if subarray is None:
+		subarray = buildSubarray()
+		SUBARRAY_CACHE[key] = subarray
+	return subarray
+
+
+def get_instrument_key(hfile, listNode):
+	'''
+	Get a key of the instrument description of a file : the files with the same key have the same subarray
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+		listNode : nodes (or paths) used to build the subarray, the leaves of the groups are used recursively
+	Return:
+	-------
+		hexadecimal digest of the names and values of the leaves
+	'''
+	digest = hashlib.sha1()
+	for node in listNode:
+		node = hfile.get_node(node)
+		if isinstance(node, tables.Group):
+			listLeaf = hfile.walk_nodes(node, 'Leaf')
+		else:
+			listLeaf = [node]
+		for leaf in listLeaf:
+			value = np.asarray(leaf.read())
+			digest.update(leaf._v_pathname.encode())
+			digest.update(str(value.dtype).encode() + str(value.shape).encode())
+			digest.update(np.ascontiguousarray(value).tobytes())
+	return digest.hexdigest()
+
+
+def get_shared_subarray(instrumentKey, buildSubarray):
+	'''
+	Get the subarray of an instrument description, built only once per process for all the files with the same
+	instrument
+	Parameters:
+	-----------
+		instrumentKey : key of the instrument description (see get_instrument_key)
+		buildSubarray : function which builds the SubarrayDescription
+	Return:
+	-------
+		SubarrayDescription shared by the files with the same instrument
+	'''
+	key = ("instrument", instrumentKey)
+	subarray = SUBARRAY_CACHE.get(key)
+	if subarray is None:
+		subarray = buildSubarray()
+		SUBARRAY_CACHE[key] = subarray
+	return subarray
+
+
+def read_subarray_blob(hfile):
+	'''
+	Read the subarray stored in a file by write_subarray_blob
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+	Return:
+	-------
+		SubarrayDescription of the file or None if the file does not store it
+	'''
+	if SUBARRAY_BLOB_NAME in hfile.root._v_attrs._f_list("user"):
+		return getattr(hfile.root._v_attrs, SUBARRAY_BLOB_NAME)
+	return None
+
+
+def write_subarray_blob(fileName, subarray):
+	'''
+	Store a subarray in a file (pickled in an attribute of the root node), so it can be read without building it
+	Parameters:
+	-----------
+		fileName : name of the file to be modified
+		subarray : SubarrayDescription of the file
+	'''
+	with tables.open_file(fileName, "a") as hfile:
+		setattr(hfile.root._v_attrs, SUBARRAY_BLOB_NAME, subarray)
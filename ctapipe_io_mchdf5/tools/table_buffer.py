@@ -0,0 +1,122 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+
+from .waveform_reader import get_block_size, get_chunk_aligned_batch_size
+
+
+# Default size in bytes of the block of rows accumulated before each write
+DEFAULT_NB_BYTE_PER_BLOCK = 4 * 1024 * 1024
+
+
+def get_default_row(table):
+	'''
+	Get a row of a table filled with the default values of its columns
+	Parameters:
+	-----------
+		table : table to be used
+	Return:
+	-------
+		structured array of one row
+	'''
+	defaultRow = np.zeros(1, dtype=table.dtype)
+	for columnName, defaultValue in table.coldflts.items():
+		if columnName in defaultRow.dtype.names:
+			defaultRow[columnName] = defaultValue
+	return defaultRow
+
+
+class TableBuffer(object):
+	'''
+	Write buffer of a table : the rows are accumulated in a preallocated structured array and written with one call
+	to Table.append per block of rows (rounded to whole chunks when a block holds at least one chunk). It is filled
+	like a Table.row (row = buffer.row, row["column"] = value, row.append()) and it has to be flushed at the end of
+	the writing.
+	Attributes:
+	-----------
+		table : table to be written
+		tabRow : block of rows to be written
+		defaultRow : row with the default values of the columns, the rows of the block are reset with it
+		nbRow : number of rows of the block which are filled
+	'''
+	def __init__(self, table, nbRowPerBlock=0, nbBytePerBlock=DEFAULT_NB_BYTE_PER_BLOCK):
+		'''
+		Parameters:
+		-----------
+			table : table to be written
+			nbRowPerBlock : number of rows per block (used if nbBytePerBlock is 0)
+			nbBytePerBlock : size in bytes of a block (0 to use nbRowPerBlock)
+		'''
+		self.table = table
+		self.defaultRow = get_default_row(table)
+		nbRow = get_block_size(table, None, nbRowPerBlock, nbBytePerBlock)
+		if table.chunkshape is not None and nbRow >= table.chunkshape[0]:
+			nbRow = get_chunk_aligned_batch_size(table, nbRow)
+		self.tabRow = np.repeat(self.defaultRow, nbRow)
+		self.nbRow = 0
+
+
+	@property
+	def row(self):
+		'''
+		Current row of the buffer (the buffer itself, to be used as a Table.row)
+		'''
+		return self
+
+
+	def __setitem__(self, columnName, value):
+		self.tabRow[columnName][self.nbRow] = value
+
+
+	def __getitem__(self, columnName):
+		return self.tabRow[columnName][self.nbRow]
+
+
+	def append(self):
+		'''
+		Validate the current row, the block is written once it is full
+		'''
+		self.nbRow += 1
+		if self.nbRow == self.tabRow.size:
+			self._write_block()
+
+
+	def append_rows(self, tabRow):
+		'''
+		Append several rows at once
+		Parameters:
+		-----------
+			tabRow : structured array of the rows (with the columns of the table)
+		'''
+		self._write_block()
+		self.table.append(tabRow)
+
+
+	def _write_block(self):
+		'''
+		Write the filled rows of the block
+		'''
+		if self.nbRow == 0:
+			return
+		self.table.append(self.tabRow[:self.nbRow])
+		self.tabRow[:self.nbRow] = self.defaultRow
+		self.nbRow = 0
+
+
+	def flush(self):
+		'''
+		Write the filled rows and flush the table
+		'''
+		self._write_block()
+		self.table.flush()
+
+
+	def __len__(self):
+		'''
+		Number of rows of the table, including the rows which are not written yet
+		'''
+		return self.table.nrows + self.nbRow
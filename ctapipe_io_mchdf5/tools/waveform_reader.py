@@ -0,0 +1,472 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import tables
+
+from .event_index import get_telescope_table_name
+
+
+def get_block_size(table, columnName, nbEventPerBlock=100, nbBytePerBlock=0):
+	'''
+	Get the number of rows to be read at once in a table
+	Parameters:
+	-----------
+		table : table to be read
+		columnName : name of the column to be read (None for whole rows)
+		nbEventPerBlock : number of rows per block (used if nbBytePerBlock is 0, 0 for the rows of one chunk)
+		nbBytePerBlock : size of a block in bytes (0 to use nbEventPerBlock)
+	Return:
+	-------
+		number of rows of a block (at least 1)
+	'''
+	if nbBytePerBlock > 0:
+		rowSize = table.rowsize if columnName is None else table.coldtypes[columnName].itemsize
+		return max(1, int(nbBytePerBlock // rowSize))
+	if nbEventPerBlock <= 0 and table.chunkshape is not None:
+		#A block is decompressed as one chunk
+		return max(1, int(table.chunkshape[0]))
+	return max(1, int(nbEventPerBlock))
+
+
+class DecodedBlockCache(object):
+	'''
+	LRU cache of the decoded blocks of the readers of all the telescopes of a file, under a byte budget, so the blocks
+	accessed again (random access, shuffled sampling) are not decompressed again. The cached blocks are read-only
+	because they are shared by the readers.
+	Attributes:
+	-----------
+		nbByteMax : maximum number of bytes of the cached blocks
+		nbByte : number of bytes of the cached blocks
+		blocks : (block, size in bytes) of the cached blocks, from the least to the most recently used
+		nbHit : number of blocks found in the cache
+		nbMiss : number of blocks not found in the cache
+		nbEviction : number of blocks removed to stay under the budget
+	'''
+	def __init__(self, nbByteMax):
+		self.nbByteMax = max(0, int(nbByteMax))
+		self.nbByte = 0
+		self.blocks = OrderedDict()
+		self.nbHit = 0
+		self.nbMiss = 0
+		self.nbEviction = 0
+		self.lock = threading.Lock()
+
+
+	def get(self, key):
+		'''
+		Get a cached block
+		Parameters:
+		-----------
+			key : key of the block
+		Return:
+		-------
+			block or None if it is not in the cache
+		'''
+		with self.lock:
+			cachedBlock = self.blocks.get(key)
+			if cachedBlock is None:
+				self.nbMiss += 1
+				return None
+			self.blocks.move_to_end(key)
+			self.nbHit += 1
+			return cachedBlock[0]
+
+
+	def put(self, key, block):
+		'''
+		Add a block to the cache, the least recently used blocks are removed to stay under the budget.
+		A block larger than the budget is not cached
+		Parameters:
+		-----------
+			key : key of the block
+			block : decoded block (numpy array, or list of numpy arrays for the rows of a VLArray)
+		Return:
+		-------
+			block (read-only if it is cached)
+		'''
+		listArray = block if isinstance(block, list) else [block]
+		nbByte = sum(tabValue.nbytes for tabValue in listArray)
+		if nbByte > self.nbByteMax:
+			return block
+		for tabValue in listArray:
+			tabValue.flags.writeable = False
+		with self.lock:
+			previousBlock = self.blocks.pop(key, None)
+			if previousBlock is not None:
+				self.nbByte -= previousBlock[1]
+			while len(self.blocks) > 0 and self.nbByte + nbByte > self.nbByteMax:
+				evictedKey, (evictedBlock, evictedNbByte) = self.blocks.popitem(last=False)
+				self.nbByte -= evictedNbByte
+				self.nbEviction += 1
+			self.blocks[key] = (block, nbByte)
+			self.nbByte += nbByte
+		return block
+
+
+	def clear(self):
+		'''
+		Remove all the blocks of the cache (the statistics are kept)
+		'''
+		with self.lock:
+			self.blocks.clear()
+			self.nbByte = 0
+
+
+	def get_statistics(self):
+		'''
+		Get the statistics of the cache
+		Return:
+		-------
+			dictionary with the number of hits, misses and evictions, the hit rate, the number of cached blocks and
+			their size in bytes
+		'''
+		with self.lock:
+			nbAccess = self.nbHit + self.nbMiss
+			return {"hit": self.nbHit, "miss": self.nbMiss, "eviction": self.nbEviction,
+					"hit_rate": self.nbHit / nbAccess if nbAccess > 0 else 0.0,
+					"nb_block": len(self.blocks), "nb_byte": self.nbByte, "nb_byte_max": self.nbByteMax}
+
+
+class WaveformBlockReader(object):
+	'''
+	Read-ahead reader of a column of a table (or of the rows of a VLArray).
+	The rows are read by blocks of consecutive rows with one call to Table.read and the following rows are served
+	from memory. Blocks are aligned on multiples of the block size.
+	Attributes:
+	-----------
+		table : table to be read
+		columnName : name of the column to be read (None to read whole rows)
+		blockSize : number of rows of a block
+		firstRow : first row of the block in memory
+		lastRow : last row (excluded) of the block in memory
+		block : block in memory
+		blockCache : DecodedBlockCache shared with the other readers (None to decode each block read)
+	'''
+	def __init__(self, table, columnName, blockSize, blockCache=None):
+		self.table = table
+		self.columnName = columnName
+		self.blockSize = blockSize
+		self.firstRow = 0
+		self.lastRow = 0
+		self.block = None
+		self.blockCache = blockCache
+		self.cacheKey = (table._v_file.filename, table._v_pathname, columnName)
+
+
+	def read(self, row):
+		'''
+		Read a row of the column
+		Parameters:
+		-----------
+			row : row to be read
+		Return:
+		-------
+			value of the column at the given row (view on the block in memory)
+		'''
+		if row < self.firstRow or row >= self.lastRow:
+			self.firstRow = (row // self.blockSize) * self.blockSize
+			self.lastRow = min(self.firstRow + self.blockSize, self.table.nrows)
+			self.block = self._load_block()
+		return self.block[row - self.firstRow]
+
+
+	def read_range(self, first, last):
+		'''
+		Read consecutive rows of the column. The next block starts at the first row of the range, so the
+		consecutive ranges of an iteration are read with one call to Table.read per block
+		Parameters:
+		-----------
+			first : first row to be read
+			last : last row to be read (excluded)
+		Return:
+		-------
+			values of the column of the rows [first, last) (view on the block in memory)
+		'''
+		if self.block is None or first < self.firstRow or last > self.lastRow:
+			self.firstRow = first
+			self.lastRow = min(max(first + self.blockSize, last), self.table.nrows)
+			self.block = self._load_block()
+		return self.block[first - self.firstRow:last - self.firstRow]
+
+
+	def _load_block(self):
+		'''
+		Get the block [firstRow, lastRow) from the cache, or decode it
+		'''
+		if self.blockCache is None:
+			return self._read_block()
+		key = self.cacheKey + (self.firstRow, self.lastRow)
+		block = self.blockCache.get(key)
+		if block is None:
+			block = self.blockCache.put(key, self._read_block())
+		return block
+
+
+	def _read_block(self):
+		if self.columnName is None:
+			#Whole rows of a table or of a VLArray
+			return self.table.read(self.firstRow, self.lastRow)
+		return self.table.read(self.firstRow, self.lastRow, field=self.columnName)
+
+
+class TelescopeWaveformReader(object):
+	'''
+	Readers of the high and low gain waveforms of a telescope
+	Attributes:
+	-----------
+		telNode : group of the telescope
+		waveformHi : reader of the high gain waveform
+		waveformLo : reader of the low gain waveform (None if the camera has only one gain)
+		blockCache : DecodedBlockCache of the decoded blocks (None to decode each block read)
+	'''
+	def __init__(self, telNode, nbEventPerBlock=100, nbBytePerBlock=0, blockCache=None):
+		self.telNode = telNode
+		self.blockCache = blockCache
+		self.waveformHi = self._create_reader("waveformHi", nbEventPerBlock, nbBytePerBlock)
+		try:
+			self.waveformLo = self._create_reader("waveformLo", nbEventPerBlock, nbBytePerBlock)
+		except tables.exceptions.NoSuchNodeError as e:
+			self.waveformLo = None
+
+
+	def _create_reader(self, columnName, nbEventPerBlock, nbBytePerBlock):
+		table = self.telNode._f_get_child(columnName)
+		blockSize = get_block_size(table, columnName, nbEventPerBlock, nbBytePerBlock)
+		return WaveformBlockReader(table, columnName, blockSize, self.blockCache)
+
+
+	def read_hi(self, row):
+		'''
+		Read the high gain waveform of a telescope event
+		Parameters:
+		-----------
+			row : row of the telescope event
+		Return:
+		-------
+			high gain waveform
+		'''
+		return self.waveformHi.read(row)
+
+
+	def read_lo(self, row):
+		'''
+		Read the low gain waveform of a telescope event
+		Parameters:
+		-----------
+			row : row of the telescope event
+		Return:
+		-------
+			low gain waveform or None if the camera has only one gain
+		'''
+		if self.waveformLo is None:
+			return None
+		return self.waveformLo.read(row)
+
+
+class TableColumnReader(object):
+	'''
+	Reader of a column of the rows read by a WaveformBlockReader of whole rows, so the columns of a table share the
+	same blocks and each block is decompressed only once
+	Attributes:
+	-----------
+		rowReader : WaveformBlockReader of the whole rows of the table
+		table : table to be read
+		columnName : name of the column to be read
+	'''
+	def __init__(self, rowReader, columnName):
+		self.rowReader = rowReader
+		self.table = rowReader.table
+		self.columnName = columnName
+
+
+	def read(self, row):
+		'''
+		Read a row of the column
+		Parameters:
+		-----------
+			row : row to be read
+		Return:
+		-------
+			value of the column at the given row (view on the block in memory)
+		'''
+		return self.rowReader.read(row)[self.columnName]
+
+
+class TelescopeTableWaveformReader(TelescopeWaveformReader):
+	'''
+	Readers of the high and low gain waveforms of a telescope stored in the same table (R0-V2 tel_XXX tables)
+	Attributes:
+	-----------
+		table : table of the telescope
+		waveformHi : reader of the high gain waveform
+		waveformLo : reader of the low gain waveform (None if the camera has only one gain)
+	'''
+	def __init__(self, table, nbEventPerBlock=100, nbBytePerBlock=0, blockCache=None):
+		self.table = table
+		blockSize = get_block_size(table, None, nbEventPerBlock, nbBytePerBlock)
+		rowReader = WaveformBlockReader(table, None, blockSize, blockCache)
+		self.waveformHi = TableColumnReader(rowReader, "waveformHi")
+		if "waveformLo" in table.colnames:
+			self.waveformLo = TableColumnReader(rowReader, "waveformLo")
+		else:
+			self.waveformLo = None
+
+
+class TelescopeReaderCache(object):
+	'''
+	Cache of the telescope waveform readers of a file, so the telescope nodes are looked up only once
+	Attributes:
+	-----------
+		hfile : HDF5 file to be used
+		where : node which contains the telescope groups
+		groupPrefix : prefix of the name of the telescope groups (followed by the telescope id)
+		nbEventPerBlock : number of rows read at once (used if nbBytePerBlock is 0, 0 for the rows of one chunk)
+		nbBytePerBlock : size in bytes of the blocks read at once (0 to use nbEventPerBlock)
+		blockCache : DecodedBlockCache shared by the readers of all the telescopes (None to decode each block read)
+	'''
+	def __init__(self, hfile, where='/r1', groupPrefix='Tel_', nbEventPerBlock=100, nbBytePerBlock=0,
+				 blockCache=None):
+		self.hfile = hfile
+		self.where = where
+		self.groupPrefix = groupPrefix
+		self.nbEventPerBlock = nbEventPerBlock
+		self.nbBytePerBlock = nbBytePerBlock
+		self.blockCache = blockCache
+		self.readers = dict()
+
+
+	def get_reader(self, telId):
+		'''
+		Get the reader of a telescope
+		Parameters:
+		-----------
+			telId : id of the telescope
+		Return:
+		-------
+			TelescopeWaveformReader of the telescope
+		'''
+		try:
+			return self.readers[telId]
+		except KeyError:
+			reader = self._create_reader(telId)
+			self.readers[telId] = reader
+			return reader
+
+
+	def _create_reader(self, telId):
+		telNode = self.hfile.get_node(self.where, self.groupPrefix + str(telId))
+		return TelescopeWaveformReader(telNode, self.nbEventPerBlock, self.nbBytePerBlock, self.blockCache)
+
+
+class TelescopeTableReaderCache(TelescopeReaderCache):
+	'''
+	Cache of the waveform readers of the telescopes of a R0-V2 file (one tel_XXX table per telescope)
+	'''
+	def __init__(self, hfile, where='/r0/event/telescope/waveform', nbEventPerBlock=100, nbBytePerBlock=0,
+				 blockCache=None):
+		super().__init__(hfile, where, 'tel_', nbEventPerBlock, nbBytePerBlock, blockCache)
+
+
+	def _create_reader(self, telId):
+		table = self.hfile.get_node(self.where, get_telescope_table_name(telId))
+		return TelescopeTableWaveformReader(table, self.nbEventPerBlock, self.nbBytePerBlock, self.blockCache)
+
+
+def get_chunk_aligned_batch_size(table, batchSize):
+	'''
+	Round a number of rows to a multiple of the chunk size of the table, so a batch never decompresses a chunk twice
+	Parameters:
+	-----------
+		table : table to be read
+		batchSize : expected number of rows per batch
+	Return:
+	-------
+		number of rows per batch (multiple of the number of rows per chunk)
+	'''
+	nbRowPerChunk = 1
+	if table.chunkshape is not None:
+		nbRowPerChunk = max(1, int(table.chunkshape[0]))
+	return max(1, int(batchSize) // nbRowPerChunk) * nbRowPerChunk
+
+
+def iter_telescope_waveform_batches(telNode, batchSize=1000, isSlicePixel=True):
+	'''
+	Iterate over the waveforms of a telescope by batches of consecutive events, without any event container
+	Parameters:
+	-----------
+		telNode : group of the telescope (with trigger, waveformHi and optionally waveformLo tables)
+		batchSize : expected number of events per batch (rounded to a multiple of the chunk size)
+		isSlicePixel : True if the waveforms are stored per slice and pixel (R1-V2), False if they are stored per
+			pixel and slice (R1-V2-PixelSlice)
+	Return:
+	-------
+		generator of (tabEventId, tabWaveform) with tabEventId the id of the events of the batch and tabWaveform
+		the waveforms with shape (nbEvent, nbGain, nbPixel, nbSlice)
+	'''
+	tableHi = telNode.waveformHi
+	try:
+		tableLo = telNode.waveformLo
+	except tables.exceptions.NoSuchNodeError as e:
+		tableLo = None
+	listTable = [(tableHi, "waveformHi")]
+	if tableLo is not None:
+		listTable.append((tableLo, "waveformLo"))
+	batchSize = get_chunk_aligned_batch_size(tableHi, batchSize)
+	nbRow = tableHi.nrows
+	for firstRow in range(0, nbRow, batchSize):
+		lastRow = min(firstRow + batchSize, nbRow)
+		tabEventId = telNode.trigger.read(firstRow, lastRow, field="event_id")
+		listGain = [table.read(firstRow, lastRow, field=columnName) for table, columnName in listTable]
+		yield tabEventId, _stack_waveform_gains(listGain, isSlicePixel)
+
+
+def iter_telescope_table_waveform_batches(table, batchSize=1000, isSlicePixel=True):
+	'''
+	Iterate over the waveforms of a telescope stored in one table (R0-V2 tel_XXX table) by batches of consecutive
+	events, without any event container. The columns of a batch are read at once
+	Parameters:
+	-----------
+		table : table of the telescope (with event_id, waveformHi and optionally waveformLo columns)
+		batchSize : expected number of events per batch (rounded to a multiple of the chunk size)
+		isSlicePixel : True if the waveforms are stored per slice and pixel
+	Return:
+	-------
+		generator of (tabEventId, tabWaveform) with tabEventId the id of the events of the batch and tabWaveform
+		the waveforms with shape (nbEvent, nbGain, nbPixel, nbSlice)
+	'''
+	listColumnName = [columnName for columnName in ("waveformHi", "waveformLo") if columnName in table.colnames]
+	batchSize = get_chunk_aligned_batch_size(table, batchSize)
+	nbRow = table.nrows
+	for firstRow in range(0, nbRow, batchSize):
+		tabRow = table.read(firstRow, min(firstRow + batchSize, nbRow))
+		listGain = [tabRow[columnName] for columnName in listColumnName]
+		yield tabRow["event_id"], _stack_waveform_gains(listGain, isSlicePixel)
+
+
+def _stack_waveform_gains(listGain, isSlicePixel):
+	'''
+	Stack the waveforms of the gains of a batch
+	Parameters:
+	-----------
+		listGain : waveforms of each gain, with shape (nbEvent, nbSlice, nbPixel) if isSlicePixel is True and
+			(nbEvent, nbPixel, nbSlice) otherwise
+		isSlicePixel : True if the waveforms are stored per slice and pixel
+	Return:
+	-------
+		waveforms with shape (nbEvent, nbGain, nbPixel, nbSlice)
+	'''
+	tabWaveform = None
+	for gain, tabGain in enumerate(listGain):
+		if isSlicePixel:
+			tabGain = tabGain.swapaxes(1, 2)
+		if tabWaveform is None:
+			tabWaveform = np.empty((tabGain.shape[0], len(listGain)) + tabGain.shape[1:], dtype=tabGain.dtype)
+		tabWaveform[:, gain] = tabGain
+	return tabWaveform
@@ -9,8 +9,10 @@ with open(path.join(this_directory, 'README.md'), encoding='utf-8') as f:
 
 entry_points = {}
 entry_points['console_scripts'] = ['mchdf5_simtel2r0 = ctapipe_io_mchdf5.converter.mchdf5_simtel2r0:main',
+					'mchdf5_simtel2r0_batch = ctapipe_io_mchdf5.converter.mchdf5_simtel2r0_batch:main',
 					'mchdf5_tailcut_dilation_dl0v1 = ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v1:main',
 					'mchdf5_tailcut_dilation_dl0v2 = ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2:main',
+					'mchdf5_rechunk = ctapipe_io_mchdf5.programs.mchdf5_rechunk:main',
 					'test_mchdf5v2minselection = ctapipe_io_mchdf5.programs.mchdf5_min_selection:main',
 					'test_mchdf5v2sliceselection = ctapipe_io_mchdf5.programs.mchdf5_slice_selection:main',
 					'test_mchdf5v2extractsignaltensor = ctapipe_io_mchdf5.programs.mchdf5_extract_signal_tensor:main',